@@ -0,0 +1,554 @@
+# Image Backends
+# The same resize, colour conversion and quarter turn rotation can be done
+# with OpenCV, Pillow or NumPy, and which is fastest depends on the machine,
+# the image size and how the libraries were built. Each operation has a set
+# of interchangeable backends. A short calibration run times every backend on
+# a few image sizes, and the ranking for each (operation, size class) is
+# cached on disk for the machine and library versions, so later runs use the
+# tuned choices straight away.
+#
+# Backends are checked against the reference (OpenCV) result while
+# calibrating. Conversions and rotations must give identical pixels. Pillow's
+# resizes weight the source pixels a little differently from OpenCV's, so
+# they are only used for display - saved images are always resized by the
+# reference backend, so they don't depend on the machine.
+#
+# For reproducible benchmarks, the choice can be overridden with the
+# HIT137_BACKENDS environment variable or the --backends option:
+#   HIT137_BACKENDS=reference              OpenCV for everything
+#   HIT137_BACKENDS=shrink=pil,rotate=numpy
+
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+# Incremented when the backends or the calibration change, so old cached
+# rankings are not used
+CALIBRATION_VERSION = 1
+# Size classes by the most pixels in an image of the class, with the size
+# of the image each is calibrated on
+SIZE_CLASSES = (("small", 1_000_000, (800, 600)),
+                ("medium", 4_000_000, (1920, 1440)),
+                ("large", math.inf, (3200, 2400)))
+# Largest mean difference in levels allowed from an approximate backend
+APPROXIMATE_TOLERANCE = 2.0
+# Backends this many times slower than the reference are only timed once
+SLOW_FACTOR = 3.0
+# Environment variable overriding the choice of backends
+OVERRIDE_VARIABLE = "HIT137_BACKENDS"
+
+
+def get_cache_path():
+    """
+    Returns the file the calibration results are cached in, following the
+    XDG base directory convention.
+
+    Returns
+    str: The cache file path.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "hit137-image-editor", "backends.json")
+
+
+def get_machine_key():
+    """
+    Returns a description of the machine and library versions the
+    calibration results are only valid for.
+
+    Returns
+    dict: The machine, CPU count and versions.
+    """
+    return {"calibration": CALIBRATION_VERSION,
+            "node": platform.node(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "pillow": PIL.__version__}
+
+
+def get_size_class(pixels):
+    """
+    Returns the size class of an image.
+
+    Parameters
+    pixels (int): The number of pixels in the image.
+
+    Returns
+    str: "small", "medium" or "large".
+    """
+    for name, most_pixels, size in SIZE_CLASSES:
+        if pixels <= most_pixels:
+            return name
+    return SIZE_CLASSES[-1][0]
+
+
+# Shrinking and enlarging. image is an OpenCV image, size is (width, height).
+
+def shrink_opencv(image, size):
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def enlarge_opencv(image, size):
+    return cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+
+
+def resize_pillow(image, size, resample):
+    # The channels are resized independently, so BGR needs no conversion
+    resized = Image.fromarray(image).resize(size, resample)
+    return np.asarray(resized)
+
+
+def shrink_pillow(image, size):
+    return resize_pillow(image, size, Image.Resampling.BOX)
+
+
+def enlarge_pillow(image, size):
+    return resize_pillow(image, size, Image.Resampling.BILINEAR)
+
+
+def supports_pillow_resize(image):
+    # Pillow resizes 8 bit images, and premultiplies alpha, unlike OpenCV
+    return image.dtype == np.uint8 and \
+        (image.ndim == 2 or image.shape[2] == 3)
+
+
+# Conversion of an 8 bit OpenCV image to an RGB(A) or L PIL image
+
+def to_pil_opencv(image):
+    if image.ndim == 3:
+        conversion = cv2.COLOR_BGRA2RGBA if image.shape[2] == 4 \
+            else cv2.COLOR_BGR2RGB
+        image = cv2.cvtColor(image, conversion)
+    return Image.fromarray(image)
+
+
+def to_pil_numpy(image):
+    if image.ndim == 3:
+        order = [2, 1, 0, 3] if image.shape[2] == 4 else [2, 1, 0]
+        image = image[:, :, order]
+    return Image.fromarray(image)
+
+
+def to_pil_pillow(image):
+    # Pillow's raw decoder swaps the channels while copying the pixels in
+    if image.ndim == 2:
+        return Image.fromarray(image)
+    image = np.ascontiguousarray(image)
+    mode, raw_mode = ("RGBA", "BGRA") if image.shape[2] == 4 \
+        else ("RGB", "BGR")
+    height, width = image.shape[:2]
+    return Image.frombuffer(mode, (width, height), image, "raw", raw_mode,
+                            0, 1)
+
+
+def supports_8bit(image):
+    return image.dtype == np.uint8
+
+
+# Rotation by quarter turns clockwise
+
+ROTATE_CODES = {1: cv2.ROTATE_90_CLOCKWISE, 2: cv2.ROTATE_180,
+                3: cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+
+def rotate_opencv(image, turns):
+    if turns == 0:
+        return image.copy()
+    return cv2.rotate(image, ROTATE_CODES[turns])
+
+
+def rotate_numpy(image, turns):
+    if turns == 0:
+        return image.copy()
+    return np.ascontiguousarray(np.rot90(image, -turns))
+
+
+class Backend:
+    """
+    A class to describe one way of doing an operation.
+
+    Attributes
+    operation (str):
+        The operation, e.g. "shrink".
+    name (str):
+        The backend's name, e.g. "pil".
+    function (callable):
+        Does the operation. Takes the image and the operation's arguments.
+    exact (bool):
+        Whether the result is identical to the reference backend's.
+    supports (callable):
+        Returns True if the backend can process an image.
+    """
+
+    def __init__(self, operation, name, function, exact=True, supports=None):
+        self.operation = operation
+        self.name = name
+        self.function = function
+        self.exact = exact
+        self.supports = supports or (lambda image: True)
+
+
+class BackendRegistry:
+    """
+    A class to choose the fastest backend for each operation and image size.
+
+    Attributes
+    backends (dict):
+        The Backend objects of each operation, by name.
+    reference (dict):
+        The name of the reference backend of each operation.
+    rankings (dict):
+        Backend names of each operation and size class, fastest first,
+        from the calibration. Empty until calibrated or loaded.
+    timings (dict):
+        Seconds taken by each backend in the calibration.
+    overrides (dict):
+        Backend names forced for operations, by operation.
+
+    Methods
+    __init__():
+        Initializes the BackendRegistry object.
+    register(operation, name, function, exact=True, supports=None,
+             reference=False):
+        Adds a backend.
+    set_overrides(text):
+        Forces the backends used, e.g. "reference" or "shrink=pil".
+    choose(operation, image, exact=False):
+        Returns the backend to use for an image.
+    run(operation, image, *args, exact=False):
+        Does an operation with the chosen backend.
+    get_calibration_args(operation, image):
+        Returns the arguments an operation is calibrated with.
+    calibrate(repeat=3):
+        Times every backend and ranks them.
+    is_substitute(backend, result, expected):
+        Checks a backend's result can be used in place of the reference's.
+    load(path=None):
+        Reads cached rankings made on this machine.
+    save(path=None):
+        Writes the rankings to the cache.
+    load_or_calibrate(path=None):
+        Reads the cached rankings, or calibrates and caches them.
+    describe():
+        Returns the backend chosen for each operation and size class.
+    """
+
+    def __init__(self):
+        self.backends = {}
+        self.reference = {}
+        self.rankings = {}
+        self.timings = {}
+        self.overrides = {}
+        self._lock = threading.Lock()
+
+    def register(self, operation, name, function, exact=True, supports=None,
+                 reference=False):
+        """
+        Adds a backend for an operation.
+
+        Parameters
+        operation (str): The operation, e.g. "shrink".
+        name (str): The backend's name.
+        function (callable): Does the operation.
+        exact (bool): Whether the result is identical to the reference's.
+        supports (callable): Returns True if the backend can process an
+            image, or None if it can process any.
+        reference (bool): Whether this is the operation's reference
+            backend, used when there is no other choice.
+
+        Returns
+        None
+        """
+        self.backends.setdefault(operation, {})[name] = Backend(
+            operation, name, function, exact, supports)
+        if reference:
+            self.reference[operation] = name
+
+    def set_overrides(self, text):
+        """
+        Forces the backends used, for reproducible benchmarks.
+
+        Parameters
+        text (str): "reference" for the reference backends, "tuned" or ""
+            for the calibrated choice, or comma separated operation=name
+            pairs, e.g. "shrink=pil,rotate=numpy".
+
+        Returns
+        None
+
+        Raises
+        ValueError: If an operation or backend is unknown.
+        """
+        overrides = {}
+        text = (text or "").strip()
+        if text == "reference":
+            overrides = dict(self.reference)
+        elif text and text != "tuned":
+            for pair in text.split(","):
+                operation, _, name = pair.partition("=")
+                operation, name = operation.strip(), name.strip()
+                if name not in self.backends.get(operation, {}):
+                    raise ValueError(f"Unknown backend {pair.strip()!r}")
+                overrides[operation] = name
+        self.overrides = overrides
+
+    def choose(self, operation, image, exact=False):
+        """
+        Returns the backend to use for an image: the override if there is
+        one, otherwise the fastest calibrated backend for the image's size
+        class that can process it, otherwise the reference.
+
+        Parameters
+        operation (str): The operation.
+        image (ndarray): The OpenCV image to process.
+        exact (bool): Only choose backends identical to the reference.
+
+        Returns
+        Backend: The backend.
+        """
+        backends = self.backends[operation]
+        name = self.overrides.get(operation)
+        if name is not None:
+            backend = backends[name]
+            if backend.supports(image) and (backend.exact or not exact):
+                return backend
+        size_class = get_size_class(image.shape[0] * image.shape[1])
+        for name in self.rankings.get(operation, {}).get(size_class, ()):
+            backend = backends.get(name)
+            if backend is not None and backend.supports(image) and \
+                    (backend.exact or not exact):
+                return backend
+        return backends[self.reference[operation]]
+
+    def run(self, operation, image, *args, exact=False):
+        """
+        Does an operation with the chosen backend.
+
+        Parameters
+        operation (str): The operation.
+        image (ndarray): The OpenCV image to process.
+        *args: The operation's other arguments.
+        exact (bool): Only use backends identical to the reference.
+
+        Returns
+        The operation's result.
+        """
+        backend = self.choose(operation, image, exact)
+        return backend.function(image, *args)
+
+    @staticmethod
+    def get_calibration_args(operation, image):
+        """
+        Returns the arguments an operation is calibrated with, matching its
+        typical use by the ImageModel.
+
+        Parameters
+        operation (str): The operation.
+        image (ndarray): The calibration image.
+
+        Returns
+        tuple: The arguments after the image.
+        """
+        height, width = image.shape[:2]
+        if operation == "shrink":
+            # Display proxies are rarely an exact fraction of the image
+            return ((int(width * 0.37), int(height * 0.37)),)
+        if operation == "enlarge":
+            return ((int(width * 1.5), int(height * 1.5)),)
+        if operation == "rotate":
+            return (1,)
+        return ()
+
+    def calibrate(self, repeat=3):
+        """
+        Times every backend of every operation on an image of each size
+        class, and ranks them fastest first. Backends whose result doesn't
+        match the reference's are left out. Takes a few seconds.
+
+        Parameters
+        repeat (int): Timed runs of each backend, the fastest is used.
+            Backends much slower than the reference are only run once.
+
+        Returns
+        None
+        """
+        rankings = {}
+        timings = {}
+        random = np.random.default_rng(0)
+        for size_class, most_pixels, (width, height) in SIZE_CLASSES:
+            # Smooth detail with some noise, like a photo
+            image = cv2.resize(
+                random.integers(0, 256, (height // 16, width // 16, 3),
+                                dtype=np.uint8),
+                (width, height), interpolation=cv2.INTER_CUBIC)
+            image = cv2.add(image, random.integers(0, 8, image.shape,
+                                                   dtype=np.uint8))
+            for operation, backends in self.backends.items():
+                args = self.get_calibration_args(operation, image)
+                reference = self.reference[operation]
+                expected = None
+                times = {}
+                # The reference is timed first, to compare the others with
+                for name in sorted(backends, key=lambda name: name != reference):
+                    backend = backends[name]
+                    if not backend.supports(image):
+                        continue
+                    # The first run also checks the result
+                    started = time.perf_counter()
+                    result = np.asarray(backend.function(image, *args))
+                    best = time.perf_counter() - started
+                    if expected is None:
+                        expected = result
+                    elif not self.is_substitute(backend, result, expected):
+                        continue  # Not a substitute on this machine
+                    result = None
+                    if best < SLOW_FACTOR * times.get(reference, math.inf):
+                        for _ in range(repeat - 1):
+                            started = time.perf_counter()
+                            backend.function(image, *args)
+                            best = min(best, time.perf_counter() - started)
+                    times[name] = best
+                rankings.setdefault(operation, {})[size_class] = \
+                    sorted(times, key=times.get)
+                timings.setdefault(operation, {})[size_class] = times
+        with self._lock:
+            self.rankings = rankings
+            self.timings = timings
+
+    @staticmethod
+    def is_substitute(backend, result, expected):
+        """
+        Checks a backend's result can be used in place of the reference's.
+
+        Parameters
+        backend (Backend): The backend.
+        result (ndarray): The backend's result.
+        expected (ndarray): The reference backend's result.
+
+        Returns
+        bool: True if the result is identical, or for an approximate
+        backend, close on average.
+        """
+        if result.shape != expected.shape:
+            return False
+        if backend.exact:
+            return np.array_equal(result, expected)
+        difference = cv2.absdiff(result, expected)
+        return float(np.mean(difference)) <= APPROXIMATE_TOLERANCE
+
+    def load(self, path=None):
+        """
+        Reads cached rankings, if they were made on this machine with the
+        same library versions.
+
+        Parameters
+        path (str): The cache file, or None for the default.
+
+        Returns
+        bool: True if the rankings were loaded.
+        """
+        try:
+            with open(path or get_cache_path()) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(cached, dict) or \
+                cached.get("machine") != get_machine_key():
+            return False
+        with self._lock:
+            self.rankings = cached.get("rankings", {})
+            self.timings = cached.get("timings", {})
+        return True
+
+    def save(self, path=None):
+        """
+        Writes the rankings to the cache.
+
+        Parameters
+        path (str): The cache file, or None for the default.
+
+        Returns
+        None
+        """
+        path = path or get_cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump({"machine": get_machine_key(),
+                       "rankings": self.rankings,
+                       "timings": self.timings}, cache_file, indent=2)
+        os.replace(temp_path, path)
+
+    def load_or_calibrate(self, path=None):
+        """
+        Reads the cached rankings, or on the first run on a machine
+        calibrates and caches them, which takes a few seconds.
+
+        Parameters
+        path (str): The cache file, or None for the default.
+
+        Returns
+        bool: True if the backends were calibrated.
+        """
+        if len(self.overrides) == len(self.backends):
+            return False  # Every choice is overridden
+        if self.load(path):
+            return False
+        self.calibrate()
+        try:
+            self.save(path)
+        except OSError as error:
+            print(f"BackendRegistry: Unable to cache calibration: {error}",
+                  file=sys.stderr)
+        return True
+
+    def describe(self):
+        """
+        Returns the backend chosen for each operation and size class, for
+        recording with benchmark results.
+
+        Returns
+        dict: Backend names by operation and size class.
+        """
+        choices = {}
+        for operation in self.backends:
+            choices[operation] = {}
+            for size_class, most_pixels, (width, height) in SIZE_CLASSES:
+                # Only the shape and type are looked at
+                image = np.broadcast_to(np.uint8(0), (height, width, 3))
+                choices[operation][size_class] = \
+                    self.choose(operation, image).name
+        return choices
+
+
+# The backends shared by the whole application
+backends = BackendRegistry()
+backends.register("shrink", "opencv", shrink_opencv, reference=True)
+backends.register("shrink", "pil", shrink_pillow, exact=False,
+                  supports=supports_pillow_resize)
+backends.register("enlarge", "opencv", enlarge_opencv, reference=True)
+backends.register("enlarge", "pil", enlarge_pillow, exact=False,
+                  supports=supports_pillow_resize)
+backends.register("to_pil", "opencv", to_pil_opencv, reference=True,
+                  supports=supports_8bit)
+backends.register("to_pil", "numpy", to_pil_numpy, supports=supports_8bit)
+backends.register("to_pil", "pil", to_pil_pillow, supports=supports_8bit)
+backends.register("rotate", "opencv", rotate_opencv, reference=True)
+backends.register("rotate", "numpy", rotate_numpy)
+try:
+    backends.set_overrides(os.environ.get(OVERRIDE_VARIABLE, ""))
+except ValueError as error:
+    print(f"BackendRegistry: Ignoring {OVERRIDE_VARIABLE}: {error}",
+          file=sys.stderr)
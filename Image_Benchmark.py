@@ -0,0 +1,541 @@
+# Image Benchmark
+# Micro-benchmarks for the ImageModel operations across a range of image
+# sizes. Synthetic images from 1 to 200 megapixels are generated, so no large
+# fixtures need to be kept in the repository.
+# For each operation and size the wall time, peak resident memory (RSS) and
+# bytes allocated are recorded. Results are written as JSON and can be
+# compared with a saved baseline to flag regressions.
+#
+# The --filters mode measures how the strip-parallel filter engine scales
+# from 1 to N threads, and checks its output is identical to a single pass.
+#
+# The --transport mode compares sending images to worker processes by
+# pickling with the shared memory transport.
+#
+# Usage:
+#   python Image_Benchmark.py --output results.json
+#   python Image_Benchmark.py --sizes 1 4 16 --compare baseline.json
+#   python Image_Benchmark.py --filters --sizes 16 50 --max-threads 8
+#   python Image_Benchmark.py --transport --sizes 16 50 --processes 4
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import Image_Model
+from Image_Backends import backends
+from Image_Filters import FILTERS, StripFilterEngine
+from Image_SharedMemory import ProcessImageExecutor, SharedImage
+
+# Image sizes in megapixels benchmarked by default
+DEFAULT_SIZES_MP = (1, 4, 16, 50, 100, 200)
+
+
+class RSSSampler:
+    """
+    A class to measure the peak resident memory (RSS) during a block of code.
+
+    A background thread samples the RSS every few milliseconds, because the
+    process wide ru_maxrss can't be reset between operations. Where
+    /proc/self/statm is not available ru_maxrss is used instead.
+
+    Attributes
+    interval (float):
+        Time between samples in seconds.
+    peak (int):
+        Highest RSS seen, in bytes.
+
+    Methods
+    __enter__():
+        Starts sampling.
+    __exit__():
+        Stops sampling.
+    current_rss():
+        Returns the current RSS in bytes.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current_rss():
+        """
+        Returns the current resident memory of this process in bytes.
+
+        Returns
+        int: The RSS in bytes.
+        """
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+        return False
+
+
+def make_synthetic_image(megapixels, seed=0):
+    """
+    Generates a synthetic 4:3 BGR image of the given size.
+
+    The image is a colour gradient with noise, so that it compresses like a
+    photograph rather than a flat colour.
+
+    Parameters
+    megapixels (float): The number of pixels, in millions.
+    seed (int): Seed for the noise, so runs are repeatable.
+
+    Returns
+    ndarray: The image as an 8 bit, 3 channel OpenCV image.
+    """
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    rng = np.random.default_rng(seed)
+    x_ramp = np.linspace(0, 255, width, dtype=np.float32)
+    y_ramp = np.linspace(0, 255, height, dtype=np.float32)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = x_ramp[np.newaxis, :]
+    image[..., 1] = y_ramp[:, np.newaxis]
+    image[..., 2] = 128
+    # Add noise a row block at a time to keep memory use down
+    for row in range(0, height, 1024):
+        block = image[row:row + 1024]
+        noise = rng.integers(-16, 16, size=block.shape, dtype=np.int16)
+        np.clip(block + noise, 0, 255, out=noise)
+        block[...] = noise
+    return image
+
+
+def get_tk_root():
+    """
+    Creates a hidden Tk root window, needed to create PhotoImages.
+
+    Returns
+    tk.Tk: The hidden root window, or None if there is no display.
+    """
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return root
+    except Exception:
+        return None
+
+
+def benchmark_operations(model, source_path, output_dir, has_tk):
+    """
+    Returns the operations to benchmark on a loaded model.
+
+    Each entry is (name, setup, run). setup() is called once before the run
+    is timed and run() is the operation being measured. Operations are
+    repeatable, so run() can be called several times.
+
+    Parameters
+    model (ImageModel): The model to benchmark.
+    source_path (str): Path of the synthetic source image file.
+    output_dir (str): Directory to save images in.
+    has_tk (bool): Whether PhotoImages can be created.
+
+    Returns
+    list: The (name, setup, run) operations.
+    """
+    def load():
+        model.load_image(source_path)
+
+    def crop():
+        height, width = model.image.shape[:2]
+        model.crop_image(width // 4, height // 4,
+                         3 * width // 4, 3 * height // 4)
+
+    def set_scale(scale_factor):
+        def setup():
+            load()
+            model.set_scale_factor(scale_factor)
+        return setup
+
+    save_path = os.path.join(output_dir, "edited.jpg")
+    operations = [
+        ("load_image", lambda: None, load),
+        ("crop_image", load, crop),
+        ("rotate_image", load, lambda: model.rotate_image(90)),
+        ("opencv_to_pil", load,
+         lambda: model.opencv_to_pil(model.edited_image)),
+        ("get_edited_scaled_image_as_pil", set_scale(0.5),
+         model.get_edited_scaled_image_as_pil),
+        ("save_edited_image", set_scale(1.0),
+         lambda: model.save_edited_image(save_path)),
+    ]
+    if has_tk:
+        operations.insert(5, ("get_edited_scaled_image_as_tk",
+                              set_scale(0.5),
+                              model.get_edited_scaled_image_as_tk))
+    return operations
+
+
+def measure(setup, run, repeat):
+    """
+    Measures the wall time, peak RSS and allocated bytes of an operation.
+
+    Timing runs are made without tracemalloc, which would slow them down.
+    A separate run measures memory.
+
+    Parameters
+    setup (callable): Called before each run, not timed.
+    run (callable): The operation to measure.
+    repeat (int): Number of timed runs.
+
+    Returns
+    dict: The measurements.
+    """
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    setup()
+    tracemalloc.start()
+    with RSSSampler() as sampler:
+        rss_before = RSSSampler.current_rss()
+        run()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "wall_s_min": min(times),
+        "wall_s_median": statistics.median(times),
+        "peak_rss_bytes": sampler.peak,
+        "peak_rss_delta_bytes": max(0, sampler.peak - rss_before),
+        "allocated_bytes": allocated,
+    }
+
+
+def run_benchmarks(sizes, repeat=3, image_format=".jpg"):
+    """
+    Runs the benchmarks for each image size.
+
+    Parameters
+    sizes (list): Image sizes in megapixels.
+    repeat (int): Number of timed runs of each operation.
+    image_format (str): File extension of the synthetic source images.
+
+    Returns
+    dict: The machine description and a list of results.
+    """
+    root = get_tk_root()
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for megapixels in sizes:
+            source_path = os.path.join(temp_dir, f"source{image_format}")
+            image = make_synthetic_image(megapixels)
+            cv2.imwrite(source_path, image)
+            height, width = image.shape[:2]
+            image = None
+            model = Image_Model.ImageModel()
+            for name, setup, run in benchmark_operations(
+                    model, source_path, temp_dir, root is not None):
+                stats = measure(setup, run, repeat)
+                results.append({"operation": name, "megapixels": megapixels,
+                                "width": width, "height": height, **stats})
+                print(f"{name:<32} {megapixels:>5} MP "
+                      f"{stats['wall_s_median'] * 1000:>10.1f} ms "
+                      f"{stats['allocated_bytes'] / 2**20:>9.1f} MB alloc "
+                      f"{stats['peak_rss_bytes'] / 2**20:>9.1f} MB RSS")
+            model = None
+    if root is not None:
+        root.destroy()
+    return {"machine": describe_machine(), "backends": backends.describe(),
+            "repeat": repeat, "format": image_format, "results": results}
+
+
+def run_filter_scaling(sizes, max_threads, repeat=3):
+    """
+    Measures how the strip-parallel filters scale with the number of threads.
+
+    Each filter is run with 1 to max_threads threads on each image size. The
+    output of every run is checked against a single pass of the filter.
+
+    Parameters
+    sizes (list): Image sizes in megapixels.
+    max_threads (int): The highest number of threads to try.
+    repeat (int): Number of timed runs for each thread count.
+
+    Returns
+    dict: The machine description and a list of results.
+    """
+    engine = StripFilterEngine(min_parallel_pixels=0)
+    results = []
+    for megapixels in sizes:
+        image = make_synthetic_image(megapixels)
+        for name in FILTERS:
+            reference = engine.apply_single(image, name)
+            single_s = None
+            for threads in range(1, max_threads + 1):
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    output = engine.apply(image, name, threads=threads)
+                    times.append(time.perf_counter() - start)
+                identical = bool(np.array_equal(output, reference))
+                output = None
+                median = statistics.median(times)
+                if single_s is None:
+                    single_s = median
+                results.append({"filter": name, "megapixels": megapixels,
+                                "threads": threads, "wall_s_median": median,
+                                "speedup": single_s / median,
+                                "identical": identical})
+                print(f"{name:<10} {megapixels:>5} MP {threads:>3} threads "
+                      f"{median * 1000:>10.1f} ms "
+                      f"x{single_s / median:>5.2f}"
+                      f"{'' if identical else '  OUTPUT DIFFERS'}")
+        image = None
+    engine.shutdown()
+    return {"machine": describe_machine(), "repeat": repeat,
+            "filter_scaling": results}
+
+
+def run_transport_benchmark(sizes, processes, repeat=3, name="blur"):
+    """
+    Compares the ways of sending images to worker processes.
+
+    Each image is filtered in the worker processes with the strips sent by
+    pickling, with the image copied into and out of shared memory, and
+    with an image already in shared memory. Every output is checked against
+    a single pass of the filter.
+
+    Parameters
+    sizes (list): Image sizes in megapixels.
+    processes (int): The number of worker processes.
+    repeat (int): Number of timed runs for each transport.
+    name (str): The filter to run.
+
+    Returns
+    dict: The machine description and a list of results.
+    """
+    executor = ProcessImageExecutor(processes)
+    engine = StripFilterEngine()
+    # Start the workers before timing anything
+    executor.apply_filter(make_synthetic_image(0.1), name)
+    results = []
+    for megapixels in sizes:
+        image = make_synthetic_image(megapixels)
+        reference = engine.apply_single(image, name)
+        shared_image = SharedImage.from_array(image)
+        transports = (
+            ("pickled", lambda: executor.apply_filter_pickled(image, name)),
+            ("shared", lambda: executor.apply_filter(image, name)),
+            ("shared_in_place",
+             lambda: executor.apply_filter_shared(shared_image, name)),
+        )
+        pickled_s = None
+        for transport, run in transports:
+            times = []
+            identical = True
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = run()
+                times.append(time.perf_counter() - start)
+                # The comparison with the reference is not timed
+                if isinstance(output, SharedImage):
+                    identical &= np.array_equal(output.array, reference)
+                    output.release()
+                else:
+                    identical &= np.array_equal(output, reference)
+                output = None
+            median = statistics.median(times)
+            if pickled_s is None:
+                pickled_s = median
+            results.append({"transport": transport, "filter": name,
+                            "megapixels": megapixels,
+                            "processes": processes,
+                            "wall_s_median": median,
+                            "speedup": pickled_s / median,
+                            "identical": bool(identical)})
+            print(f"{transport:<16} {megapixels:>5} MP {processes:>3} procs "
+                  f"{median * 1000:>10.1f} ms x{pickled_s / median:>5.2f}"
+                  f"{'' if identical else '  OUTPUT DIFFERS'}")
+        shared_image.release()
+        image = reference = None
+    executor.shutdown()
+    return {"machine": describe_machine(), "repeat": repeat,
+            "transport": results}
+
+
+def describe_machine():
+    """
+    Describes the machine and library versions the benchmark ran on.
+
+    Returns
+    dict: The machine description.
+    """
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def compare_results(current, baseline, threshold=0.10):
+    """
+    Compares benchmark results against a baseline.
+
+    An operation has regressed if its median wall time or its allocated
+    bytes grew by more than the threshold.
+
+    Parameters
+    current (dict): The current results.
+    baseline (dict): The baseline results.
+    threshold (float): The allowed relative increase, 0.10 for 10%.
+
+    Returns
+    list: Regressions, each a dict with the operation, size, metric and
+    the baseline and current values.
+    """
+    baseline_index = {(r["operation"], r["megapixels"]): r
+                      for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base = baseline_index.get((result["operation"], result["megapixels"]))
+        if base is None:
+            continue
+        for metric in ("wall_s_median", "allocated_bytes"):
+            if base[metric] > 0 and \
+                    result[metric] > base[metric] * (1 + threshold):
+                regressions.append({
+                    "operation": result["operation"],
+                    "megapixels": result["megapixels"],
+                    "metric": metric,
+                    "baseline": base[metric],
+                    "current": result[metric],
+                    "change": result[metric] / base[metric] - 1,
+                })
+    return regressions
+
+
+def parse_args():
+    """
+    Parses the command line options.
+
+    Returns
+    argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ImageModel operations")
+    parser.add_argument(
+        "--sizes", type=float, nargs="+", default=DEFAULT_SIZES_MP,
+        metavar="MP", help="image sizes in megapixels (default: %(default)s)")
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="timed runs per operation (default: %(default)s)")
+    parser.add_argument(
+        "--format", default=".jpg", choices=(".jpg", ".png", ".tif"),
+        help="file format of the synthetic images (default: %(default)s)")
+    parser.add_argument(
+        "--output", default="benchmark_results.json", metavar="FILE",
+        help="file to write the results to (default: %(default)s)")
+    parser.add_argument(
+        "--compare", default=None, metavar="BASELINE",
+        help="flag regressions against a saved baseline results file")
+    parser.add_argument(
+        "--filters", action="store_true",
+        help="measure filter scaling from 1 to --max-threads threads instead")
+    parser.add_argument(
+        "--max-threads", type=int, default=os.cpu_count() or 1,
+        help="most threads to use with --filters (default: %(default)s)")
+    parser.add_argument(
+        "--transport", action="store_true",
+        help="compare pickled and shared memory transfer to worker "
+             "processes instead")
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count() or 1,
+        help="worker processes to use with --transport "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, metavar="PERCENT",
+        help="allowed increase before a regression is flagged "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--backends", default=None, metavar="SPEC",
+        help="resize, conversion and rotation backends to use, for results "
+             "comparable across machines: \"reference\" or e.g. "
+             "\"shrink=pil,rotate=numpy\" (default: the fastest found by "
+             "calibrating)")
+    args = parser.parse_args()
+    if args.backends is not None:
+        try:
+            backends.set_overrides(args.backends)
+        except ValueError as error:
+            parser.error(str(error))
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    backends.load_or_calibrate()
+    if args.filters:
+        scaling = run_filter_scaling(args.sizes, args.max_threads, args.repeat)
+        with open(args.output, "w") as output_file:
+            json.dump(scaling, output_file, indent=2)
+        print(f"Results written to: {args.output}")
+        sys.exit(0 if all(r["identical"]
+                          for r in scaling["filter_scaling"]) else 1)
+    if args.transport:
+        transport = run_transport_benchmark(args.sizes, args.processes,
+                                            args.repeat)
+        with open(args.output, "w") as output_file:
+            json.dump(transport, output_file, indent=2)
+        print(f"Results written to: {args.output}")
+        sys.exit(0 if all(r["identical"]
+                          for r in transport["transport"]) else 1)
+    current = run_benchmarks(args.sizes, args.repeat, args.format)
+    with open(args.output, "w") as output_file:
+        json.dump(current, output_file, indent=2)
+    print(f"Results written to: {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(current, baseline,
+                                      args.threshold / 100.0)
+        for r in regressions:
+            print(f"REGRESSION {r['operation']} {r['megapixels']} MP "
+                  f"{r['metric']}: {r['baseline']:.4g} -> "
+                  f"{r['current']:.4g} ({r['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print("No regressions found.")
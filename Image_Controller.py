@@ -7,7 +7,11 @@
 # application. It notifies the View when the data changes, so the View can
 # update itself accordingly.
 
-from PIL import Image, ImageTk
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from Image_Memory import MemoryAccountant, MemoryLimitError, format_bytes
+from Image_Trace import traced
+from Image_Latency import LatencyOverlay
 
 
 class ImageController:
@@ -16,19 +20,42 @@ class ImageController:
 
     Attributes:
         model (ImageModel): The model instance that handles image data and operations.
+            May be given as a Future while the model is loaded in the background.
         view (ImageView): The view instance that handles the user interface.
+        latency_monitor (LatencyMonitor): Measures input-to-paint latency, or None.
+        latency_overlay (LatencyOverlay): Debug window showing the latency statistics.
+        histogram_update (str): The Tk after() id of the pending histogram update, or None.
+        exact_histograms (tuple): The pixel_version and full size histograms, or None.
+        export_executor (ThreadPoolExecutor): Runs frame exports in the background.
+        auto_crop_on_load (bool): Whether uniform borders are cropped off as images load.
 
     Methods:
         bind_events():
             Binds UI events to the corresponding controller methods.
-        load_image():
+        load_image(image_path=None):
             Handles loading an image from the file system and displaying it in the view.
         on_scale_change():
             Handles scaling the current image.
+        on_tone_change(value):
+            Handles the tonal adjustment sliders.
+        refresh_edited_image():
+            Redisplays the edited image after an adjustment.
         save_edited_image():
             Handles saving the edited image to the file system.
+        export_frames():
+            Handles applying the edits to every frame of a video or multi-page image.
+        show_export_progress(future, progress):
+            Shows the progress of an export, and the result once it has finished.
+        save_edit_spec():
+            Handles saving the current edits as an edit spec for the hot folder.
+        offer_restore():
+            Offers to restore the edits autosaved by an editor that didn't close normally.
+        show_settings():
+            Moves the sliders to the model's tonal adjustments and scale.
         crop_image():
             Handles cropping the current image.
+        auto_crop():
+            Handles cropping the uniform border off the current image.
         resize_image():
             Handles resizing the current image.
         quit_app():
@@ -37,14 +64,77 @@ class ImageController:
             Handles rotating image left.
         rotate_image_right():
             Handles rotating image right.
+        apply_filter():
+            Handles applying the filter chosen in the view.
+        apply_tone_to_selection():
+            Handles applying the tonal adjustments to the selected area.
+        get_selected_region():
+            Returns the selected area in edited image coordinates.
+        get_loupe_pixels(x, y, size):
+            Returns the full size pixels shown by the view's loupe.
+        undo():
+            Handles undoing the last edit to a selected area.
         handle_key_press():
             Handles key presses for keyboard shortcuts.
+        display_original(image):
+            Displays the original image in the view and records its memory use.
+        display_edited(image):
+            Displays the edited image in the view and records its memory use.
+        update_memory_status():
+            Shows the current and peak memory use in the view.
+        report_memory_error(error):
+            Tells the user an operation was refused by the memory limit.
+        bind_latency_events():
+            Binds the events used to measure input-to-paint latency.
+        measure_mouse_event(handler):
+            Wraps a view mouse handler so its latency is measured.
+        mark_input(kind):
+            Records an input event with the latency monitor.
+        schedule_paint():
+            Asks the latency monitor to note when the result has been painted.
+        toggle_latency_overlay():
+            Shows or hides the latency debug window.
+        schedule_histogram_update():
+            Updates the histogram panel soon, at most once per interval.
+        update_histogram():
+            Shows the histogram and statistics of the edited image.
+        calculate_exact_stats():
+            Starts calculating full size statistics in the background.
+        show_exact_stats(future, version):
+            Shows the full size statistics once they are ready.
     """
 
-    def __init__(self, model, view):
-        self.model = model  # Instance of ImageModel.
+    HISTOGRAM_INTERVAL_MS = 150  # Minimum time between histogram updates
+    EXACT_STATS_POLL_MS = 50  # How often to check if exact stats are ready
+    EXPORT_POLL_MS = 200  # How often to update the frame export progress
+    RESTORE_POLL_MS = 100  # How often to check if the model has loaded
+
+    def __init__(self, model, view, latency_monitor=None,
+                 auto_crop_on_load=False):
+        self._model = model  # Instance of ImageModel, or a Future for one.
         self.view = view  # Instance of ImageView.
+        self.latency_monitor = latency_monitor  # Instance of LatencyMonitor.
+        self.latency_overlay = None  # Latency debug window.
+        self.resetting_sliders = False  # Ignore slider changes while resetting.
+        self.histogram_update = None  # Pending histogram update after() id.
+        self.exact_histograms = None  # (pixel_version, full size histograms).
+        self.exact_stats_executor = None  # Thread for the exact statistics.
+        self.export_executor = None  # Thread for frame exports.
+        self.auto_crop_on_load = auto_crop_on_load  # Crop borders on load.
         self.bind_events()
+        if self.latency_monitor is not None:
+            self.bind_latency_events()
+
+    @property
+    def model(self):
+        """
+        The model instance that handles image data and operations.
+
+        If the model is still being loaded in the background, waits for it.
+        """
+        if isinstance(self._model, Future):
+            self._model = self._model.result()
+        return self._model
 
     def bind_events(self):
         """
@@ -52,13 +142,22 @@ class ImageController:
         """
         self.view.open_image_button.config(command=self.load_image)
         self.view.save_image_button.config(command=self.save_edited_image)
+        self.view.export_frames_button.config(command=self.export_frames)
+        self.view.filmstrip.on_select = self.load_image
+        self.view.loupe.get_pixels = self.get_loupe_pixels
         self.view.crop_image_button.config(command=self.crop_image)
         self.view.resize_image_slider.config(command=self.on_scale_change)
+        for slider in self.view.tone_sliders.values():
+            slider.config(command=self.on_tone_change)
         self.view.rotate_image_left_button.config(
             command=self.rotate_image_left)
         self.view.rotate_image_right_button.config(
             command=self.rotate_image_right)
         self.view.reset_image_button.config(command=self.reset_image)
+        self.view.apply_filter_button.config(command=self.apply_filter)
+        self.view.exact_stats_button.config(command=self.calculate_exact_stats)
+        self.view.apply_tone_selection_button.config(
+            command=self.apply_tone_to_selection)
         self.view.root.bind("<Control-o>", self.handle_key_press)
         self.view.root.bind("<Control-O>", self.handle_key_press)
         self.view.root.bind("<Control-s>", self.handle_key_press)
@@ -67,32 +166,60 @@ class ImageController:
         self.view.root.bind("<Control-R>", self.handle_key_press)
         self.view.root.bind("<Control-q>", self.handle_key_press)
         self.view.root.bind("<Control-Q>", self.handle_key_press)
+        self.view.root.bind("<Control-z>", self.handle_key_press)
+        self.view.root.bind("<Control-Z>", self.handle_key_press)
+        self.view.root.bind("<Control-e>", self.handle_key_press)
+        self.view.root.bind("<Control-E>", self.handle_key_press)
         self.view.root.bind("<Left>", self.handle_key_press)
         self.view.root.bind("<Right>", self.handle_key_press)
         self.view.root.bind("<Up>", self.handle_key_press)
         self.view.root.bind("<Down>", self.handle_key_press)
         self.view.root.bind("<c>", self.handle_key_press)
         self.view.root.bind("<C>", self.handle_key_press)
+        self.view.root.bind("<a>", self.handle_key_press)
+        self.view.root.bind("<A>", self.handle_key_press)
         self.view.quit_button.config(command=self.quit_app)
 
-    def load_image(self):
+    @traced
+    def load_image(self, image_path=None):
         """
         Handles loading an image from the file system and displaying it in the view.
 
         Displays the "Open file" dialog box and loads the selected image from the file system.
         The image is then displayed in the view.
 
+        Parameters:
+            image_path (str): The image to load. If None the "Open file" dialog is shown.
+
         Returns:
             None
         """
         # Handle loading image
-        image_dir = self.model.get_image_dir()
-        image_path = self.view.open_image_file(start_path=image_dir)
-        self.model.set_image_path(image_path)
-        self.model.load_image(image_path)
-        image = self.model.get_tk_photoimage()
-        self.view.display_image(image)
+        if image_path is None:
+            image_dir = self.model.get_image_dir()
+            image_path = self.view.open_image_file(start_path=image_dir)
+        if not image_path:
+            return  # Dialog was cancelled
+        try:
+            self.model.load_image(image_path)
+            self.model.set_image_path(image_path)
+            image = self.model.get_tk_photoimage()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        except ValueError as error:
+            self.view.show_error("Unable to open image", str(error))
+            return
+        self.display_original(image)
+        self.view.filmstrip.set_folder(self.model.get_image_dir(), image_path)
+        if self.auto_crop_on_load:
+            self.auto_crop()
+        # The original image is shown in both frames - show the edited image
+        # instead if it is scaled or adjusted.
+        if self.model.scale_factor != 1.0 or self.model.has_tone_adjustments():
+            self.refresh_edited_image()
 
+    @traced
     def on_scale_change(self, value):
         """
         Handles scaling the current image.
@@ -103,6 +230,7 @@ class ImageController:
         Returns:
             None
         """
+        self.mark_input("slider")
         # Set a step size for the slider control
         step_size = 1.0
         # Snap to the nearest step size
@@ -115,7 +243,54 @@ class ImageController:
         # Convert the slider value to a scale factor
         scale_factor = scale_value/100.0
         self.resize_image(scale_factor)
+        self.schedule_paint()
+
+    @traced
+    def on_tone_change(self, value):
+        """
+        Handles the tonal adjustment sliders.
+
+        Reads all the tonal adjustment sliders, sets the adjustments in the
+        model and previews the result. The preview only adjusts the
+        displayed image, so it keeps up with the slider.
+
+        Parameters:
+            value (str): The new value of the slider that moved.
+
+        Returns:
+            None
+        """
+        if self.resetting_sliders:
+            return
+        self.mark_input("slider")
+        values = {name: self.view.get_tone_slider_value(name)
+                  for name in self.view.tone_sliders}
+        for name, slider_value in values.items():
+            self.view.set_tone_value_label(name, slider_value)
+        self.model.set_brightness(values["brightness"])
+        self.model.set_contrast(values["contrast"] / 100.0)
+        self.model.set_gamma(values["gamma"] / 100.0)
+        self.model.set_levels(values["black_point"], values["white_point"])
+        self.refresh_edited_image()
+        self.schedule_paint()
+
+    def refresh_edited_image(self):
+        """
+        Redisplays the edited image with the current scale and adjustments.
+
+        Returns:
+            None
+        """
+        if self.model.get_image() is None:
+            return  # No image loaded yet
+        try:
+            tk_img = self.model.get_edited_image_as_tk()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        self.display_edited(tk_img)
 
+    @traced
     def save_edited_image(self):
         """
         Handles saving the current edited image to the file system.
@@ -129,8 +304,172 @@ class ImageController:
         initial_dir = self.model.get_edited_image_dir()
         initial_file = self.model.get_edited_image_name()
         image_path = self.view.save_edited_image(initial_dir, initial_file)
-        self.model.save_edited_image(image_path)
+        if not image_path:
+            return  # Dialog was cancelled
+        try:
+            self.model.save_edited_image(image_path)
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+        except ValueError as error:
+            self.view.show_error("Unable to save image", str(error))
+
+    def export_frames(self):
+        """
+        Handles applying the current edits to every frame of the loaded video
+        or multi-page image.
+
+        The crop, rotation, tonal adjustments and scale are applied to each
+        frame as it is read, in a background thread, so the whole file is
+        never held in memory. Filters and selection edits are not repeated.
+
+        Returns:
+            None
+        """
+        from Image_Stream import FrameEditor, stream_edits
+
+        source_path = self.model.get_image_path()
+        if source_path is None or self.model.get_edited_image() is None:
+            return  # No image loaded yet
+        if self.export_executor is not None:
+            return  # Already exporting
+        name, extension = os.path.splitext(os.path.basename(source_path))
+        output_path = self.view.save_frames_file(
+            self.model.get_edited_image_dir(), name + "_edited" + extension,
+            extension)
+        if not output_path:
+            return  # Dialog was cancelled
+        editor = FrameEditor.from_model(self.model)
+        progress = [0]  # Frames written, updated by the export thread
+
+        def set_progress(count):
+            progress[0] = count
+
+        self.export_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="export")
+        future = self.export_executor.submit(
+            stream_edits, source_path, output_path, editor,
+            progress=set_progress)
+        self.export_executor.shutdown(wait=False)
+        self.view.export_frames_button.config(state="disabled")
+        self.view.root.after(self.EXPORT_POLL_MS,
+                             self.show_export_progress, future, progress)
+
+    def show_export_progress(self, future, progress):
+        """
+        Shows the number of frames exported, and the result once the export
+        has finished.
+
+        Parameters:
+            future (Future): The background export.
+            progress (list): Holds the number of frames written so far.
+
+        Returns:
+            None
+        """
+        if not future.done():
+            self.view.export_frames_button.config(
+                text=f"Exporting... {progress[0]} frames")
+            self.view.root.after(self.EXPORT_POLL_MS,
+                                 self.show_export_progress, future, progress)
+            return
+        self.export_executor = None
+        self.view.export_frames_button.config(
+            text="Export All Frames", state="normal")
+        try:
+            count = future.result()
+        except (ValueError, OSError) as error:
+            self.view.show_error("Unable to export frames", str(error))
+            return
+        self.view.show_info("Export complete", f"{count} frames exported.")
+
+    def save_edit_spec(self):
+        """
+        Handles saving the current edits as an edit spec, which
+        Image_HotFolder.py applies to each new image in a folder.
+
+        Returns:
+            None
+        """
+        from Image_HotFolder import save_spec, spec_from_model
+
+        if self.model.get_edited_image() is None:
+            return  # No image loaded yet
+        spec_path = self.view.save_spec_file(self.model.get_image_dir())
+        if not spec_path:
+            return  # Dialog was cancelled
+        try:
+            save_spec(spec_from_model(self.model), spec_path)
+        except OSError as error:
+            self.view.show_error("Unable to save edits", str(error))
+
+    def offer_restore(self):
+        """
+        Offers to restore the edits autosaved by an editor that didn't close
+        normally, and restores them if the user agrees. Checks again later if
+        the model is still loading in the background, so the window isn't
+        blocked waiting for it.
 
+        Returns:
+            None
+        """
+        if isinstance(self._model, Future) and not self._model.done():
+            self.view.root.after(self.RESTORE_POLL_MS, self.offer_restore)
+            return
+        # Already imported with the model, so this doesn't import NumPy here
+        from Image_Journal import (discard_session, find_abandoned_session,
+                                   restore_session)
+
+        if self.model.journal is None:
+            return  # Autosave is off
+        session = find_abandoned_session()
+        if session is None:
+            return
+        if not self.view.ask_yes_no(
+                "Restore session",
+                "The editor didn't close normally last time.\n"
+                "Restore the unsaved edits?"):
+            discard_session(session)
+            return
+        try:
+            image_path = restore_session(self.model, session)
+            self.model.set_image_path(image_path)
+            image = self.model.get_tk_photoimage()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        except (OSError, ValueError) as error:
+            self.view.show_error("Unable to restore session", str(error))
+            discard_session(session)
+            return
+        self.display_original(image)
+        self.view.filmstrip.set_folder(self.model.get_image_dir(), image_path)
+        self.show_settings()
+        self.refresh_edited_image()
+
+    def show_settings(self):
+        """
+        Moves the resize and tonal adjustment sliders to the model's
+        settings, without applying them again.
+
+        Returns:
+            None
+        """
+        settings = self.model.get_settings()
+        self.resetting_sliders = True
+        self.view.set_resize_image_slider_value(
+            round(settings["scale_factor"] * 100))
+        self.view.set_tone_slider_value("brightness", settings["brightness"])
+        self.view.set_tone_slider_value(
+            "contrast", round(settings["contrast"] * 100))
+        self.view.set_tone_slider_value(
+            "gamma", round(settings["gamma"] * 100))
+        self.view.set_tone_slider_value("black_point",
+                                        settings["black_point"])
+        self.view.set_tone_slider_value("white_point",
+                                        settings["white_point"])
+        self.resetting_sliders = False
+
+    @traced
     def reset_image(self):
         """
         Handles resetting the current image.
@@ -142,14 +481,22 @@ class ImageController:
         """
         # Reset all image edits
         self.view.set_resize_image_slider_value(100)
-        self.model.reset_image()
-        image = self.model.get_tk_photoimage()
-        self.view.display_image(image)
+        self.resetting_sliders = True
+        self.view.reset_tone_sliders()
+        self.resetting_sliders = False
+        try:
+            self.model.reset_image()
+            image = self.model.get_tk_photoimage()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        self.display_original(image)
 
     def quit_app(self):
         # Quit the application
         self.view.root.destroy()
 
+    @traced
     def crop_image(self):
         """
         Handles cropping the current image.
@@ -161,16 +508,46 @@ class ImageController:
             None
         """
         # Handle cropping image
-        # Crop coodinates are read from the view
-        self.model.crop_image(
+        if self.model.get_image() is None or self.view.end_x is None:
+            return  # Nothing loaded or selected yet
+        # Crop coodinates are read from the view and converted from display
+        # coordinates to full size image coordinates
+        coords = self.model.view_to_image_coords(
             self.view.start_x, self.view.start_y, self.view.end_x, self.view.end_y)
-        # Get the cropped image from the model - image in opencv format
-        cropped_image = self.model.get_edited_image()
-        # Convert the cropped image to tkinter format
-        edited_image = self.model.opencv_to_tk(cropped_image)
+        try:
+            self.model.crop_image(*coords)
+            # Get the cropped image from the model in tkinter format
+            edited_image = self.model.get_edited_image_as_tk()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
         # Update the view with the edited image
-        self.view.update_edited_image(edited_image)
+        self.display_edited(edited_image)
 
+    @traced
+    def auto_crop(self):
+        """
+        Handles cropping the uniform border off the current image.
+
+        The model finds the content inside the border, such as the margin
+        around a scan, and crops to it. The cropped image is then displayed
+        in the view. Nothing happens if the image has no border.
+
+        Returns:
+            None
+        """
+        if self.model.get_image() is None:
+            return  # No image loaded yet
+        try:
+            if not self.model.auto_crop():
+                return  # No border found
+            edited_image = self.model.get_edited_image_as_tk()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        self.display_edited(edited_image)
+
+    @traced
     def resize_image(self, scale_factor):
         """
         Handles resizing the current image.
@@ -184,28 +561,150 @@ class ImageController:
         # Handle resizing image
         # Set the model scale factor
         self.model.set_scale_factor(scale_factor)
+        if self.model.get_image() is None:
+            return  # No image loaded yet
         # Get the scaled image as a PhotoImage
-        tk_img = self.model.get_edited_scaled_image_as_tk()
+        try:
+            tk_img = self.model.get_edited_scaled_image_as_tk()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
         # Update the view with the scaled image
-        self.view.update_edited_image(tk_img)
+        self.display_edited(tk_img)
 
+    @traced
     def rotate_image_left(self):
         # Handle rotating image left
         # Rotate image counter-clockwise 90 degrees
-        self.model.rotate_image(-90)
-        tk_img = self.model.get_edited_image_as_tk()
+        if self.model.get_image() is None:
+            return  # No image loaded yet
+        try:
+            self.model.rotate_image(-90)
+            tk_img = self.model.get_edited_image_as_tk()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
         # Update the view with the edited image
-        self.view.update_edited_image(tk_img)
+        self.display_edited(tk_img)
 
+    @traced
     def rotate_image_right(self):
         # Handle rotating image right
         # Rotate image clockwise 90 degrees
-        self.model.rotate_image(90)
-        tk_img = self.model.get_edited_image_as_tk()
+        if self.model.get_image() is None:
+            return  # No image loaded yet
+        try:
+            self.model.rotate_image(90)
+            tk_img = self.model.get_edited_image_as_tk()
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
         # Update the view with the edited image
-        self.view.update_edited_image(tk_img)
-        pass
+        self.display_edited(tk_img)
+
+    @traced
+    def apply_filter(self):
+        """
+        Handles applying the filter chosen in the view to the edited image.
+
+        Returns:
+            None
+        """
+        name = self.view.get_selected_filter()
+        if self.model.get_image() is None or name is None:
+            return  # No image loaded or no filter chosen
+        region = None
+        if self.view.get_selection_only():
+            region = self.get_selected_region()
+            if region is None:
+                return
+        try:
+            self.model.apply_filter(name, region=region)
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        self.refresh_edited_image()
+
+    @traced
+    def apply_tone_to_selection(self):
+        """
+        Handles applying the tonal adjustments to the selected area only.
+
+        The adjustments are made to the selected pixels of the edited image,
+        then the sliders are reset so the rest of the image is unadjusted.
+
+        Returns:
+            None
+        """
+        if self.model.get_image() is None:
+            return  # No image loaded yet
+        region = self.get_selected_region()
+        if region is None:
+            return
+        try:
+            self.model.apply_tone_to_region(region)
+        except MemoryLimitError as error:
+            self.report_memory_error(error)
+            return
+        self.resetting_sliders = True
+        self.view.reset_tone_sliders()
+        self.resetting_sliders = False
+        self.model.reset_tone()
+        self.refresh_edited_image()
 
+    def get_selected_region(self):
+        """
+        Returns the area selected on the original image as a rectangle in
+        the edited image. Tells the user if nothing usable is selected.
+
+        Returns:
+            tuple: (start_x, start_y, end_x, end_y) in edited image
+            coordinates, or None.
+        """
+        region = None
+        if self.view.end_x is not None:
+            coords = self.model.view_to_image_coords(
+                self.view.start_x, self.view.start_y,
+                self.view.end_x, self.view.end_y)
+            region = self.model.image_to_edited_coords(*coords)
+        if region is None:
+            self.view.show_error(
+                "No selection", "Select an area of the original image that "
+                "is part of the edited image first.")
+        return region
+
+    def get_loupe_pixels(self, x, y, size):
+        """
+        Returns the full size pixels around a point of the original image,
+        for the loupe the view shows while a selection is dragged.
+
+        Parameters:
+            x (int): The x-coordinate on the displayed original image.
+            y (int): The y-coordinate on the displayed original image.
+            size (int): Side of the square of pixels.
+
+        Returns:
+            tuple: (pixels, (image_x, image_y)) from the model, or None if
+            no image is loaded.
+        """
+        if self.model.get_image() is None:
+            return None
+        return self.model.get_loupe_pixels(x, y, size)
+
+    @traced
+    def undo(self):
+        """
+        Handles undoing the last edit made to a selected area.
+
+        Returns:
+            None
+        """
+        if self.model.get_image() is None:
+            return  # No image loaded yet
+        if self.model.undo():
+            self.refresh_edited_image()
+
+    @traced
     def handle_key_press(self, event):
         # Handle key press events
         # "print" statements help debug keyboard events
@@ -216,6 +715,7 @@ class ImageController:
         #   f"keysym: {event.keysym}, State: {event.state}")
         # Control key event state = 0x0004
         CONTROL_KEY_STATE = 0x0004
+        self.mark_input("key")
         if event.keysym == "Left":
             self.rotate_image_left()
         if event.keysym == "Right":
@@ -230,7 +730,240 @@ class ImageController:
             self.save_edited_image()
         if event.keysym == "c" or event.keysym == "C":
             self.crop_image()
+        if event.keysym == "a" or event.keysym == "A":
+            self.auto_crop()
         if event.keysym.lower() == "r" and event.state & CONTROL_KEY_STATE:
             self.reset_image()
+        if event.keysym.lower() == "z" and event.state & CONTROL_KEY_STATE:
+            self.undo()
+        if event.keysym.lower() == "e" and event.state & CONTROL_KEY_STATE:
+            self.save_edit_spec()
         if event.keysym.lower() == "q" and event.state & CONTROL_KEY_STATE:
             self.quit_app()
+            return
+        self.schedule_paint()
+
+    def display_original(self, image):
+        """
+        Displays the original image in the view and records its memory use.
+
+        The view shows the same PhotoImage in both image frames, so it is
+        only counted once.
+
+        Parameters:
+            image (ImageTk.PhotoImage): The image to display.
+
+        Returns:
+            None
+        """
+        self.view.display_image(image)
+        memory = self.model.memory
+        memory.set_usage("photoimage_original",
+                         MemoryAccountant.nbytes_of(image))
+        memory.release("photoimage_edited")
+        self.update_memory_status()
+        self.schedule_histogram_update()
+
+    def display_edited(self, image):
+        """
+        Displays the edited image in the view and records its memory use.
+
+        Parameters:
+            image (ImageTk.PhotoImage): The image to display.
+
+        Returns:
+            None
+        """
+        self.view.update_edited_image(image)
+        self.model.memory.set_usage("photoimage_edited",
+                                    MemoryAccountant.nbytes_of(image))
+        self.update_memory_status()
+        self.schedule_histogram_update()
+
+    def update_memory_status(self):
+        """
+        Shows the current and peak memory use of the image buffers in the view.
+
+        Returns:
+            None
+        """
+        memory = self.model.memory
+        text = f"Memory: {format_bytes(memory.get_current())} " \
+            f"(peak {format_bytes(memory.get_peak())})"
+        if memory.get_ceiling() is not None:
+            text += f"\nLimit: {format_bytes(memory.get_ceiling())}"
+        self.view.set_memory_status(text)
+
+    def report_memory_error(self, error):
+        """
+        Tells the user an operation was refused because of the memory limit.
+
+        Parameters:
+            error (MemoryLimitError): The error raised by the model.
+
+        Returns:
+            None
+        """
+        self.update_memory_status()
+        self.view.show_error("Not enough memory", str(error))
+
+    def bind_latency_events(self):
+        """
+        Binds the events used to measure input-to-paint latency.
+
+        The canvas mouse events are rebound so the input is timestamped before
+        the view handles it. F12 shows or hides the latency debug window.
+
+        Returns:
+            None
+        """
+        canvas = self.view.image_canvas_original
+        for sequence, handler in (
+                ("<ButtonPress-1>", self.view.on_mouse_press),
+                ("<B1-Motion>", self.view.on_mouse_drag),
+                ("<ButtonRelease-1>", self.view.on_mouse_release)):
+            canvas.bind(sequence, self.measure_mouse_event(handler))
+        self.latency_overlay = LatencyOverlay(
+            self.view.root, self.latency_monitor)
+        self.view.root.bind("<F12>", lambda event: self.toggle_latency_overlay())
+        self.latency_monitor.start(self.view.root)
+
+    def measure_mouse_event(self, handler):
+        """
+        Wraps a view mouse handler so its latency is measured.
+
+        Parameters:
+            handler (callable): The view's mouse event handler.
+
+        Returns:
+            callable: The wrapped event handler.
+        """
+        def measured_handler(event):
+            self.mark_input("mouse")
+            handler(event)
+            self.schedule_paint()
+        return measured_handler
+
+    def mark_input(self, kind):
+        """
+        Records an input event with the latency monitor, if there is one.
+
+        Parameters:
+            kind (str): The kind of input - "key", "slider" or "mouse".
+
+        Returns:
+            None
+        """
+        if self.latency_monitor is not None:
+            self.latency_monitor.mark_input(kind)
+
+    def schedule_paint(self):
+        """
+        Asks the latency monitor to note when Tk has painted the result of
+        the current input. Must be called after the input has been handled.
+
+        Returns:
+            None
+        """
+        if self.latency_monitor is not None:
+            self.latency_monitor.schedule_paint(self.view.root)
+
+    def toggle_latency_overlay(self):
+        """
+        Shows or hides the latency debug window.
+
+        Returns:
+            None
+        """
+        if self.latency_overlay is not None:
+            self.latency_overlay.toggle()
+
+    def schedule_histogram_update(self):
+        """
+        Updates the histogram panel after HISTOGRAM_INTERVAL_MS, unless an
+        update is already pending.
+
+        While a slider is dragged the edited image is redrawn on every
+        move, but the histogram is only updated a few times a second.
+
+        Returns:
+            None
+        """
+        if self.histogram_update is None:
+            self.histogram_update = self.view.root.after(
+                self.HISTOGRAM_INTERVAL_MS, self.update_histogram)
+
+    @traced
+    def update_histogram(self):
+        """
+        Shows the histogram and statistics of the edited image in the view.
+
+        Uses the exact full size histograms if they have been calculated
+        for the current pixels, otherwise the display proxy's histograms.
+
+        Returns:
+            None
+        """
+        self.histogram_update = None
+        base_histograms = None
+        if self.exact_histograms is not None and \
+                self.exact_histograms[0] == self.model.pixel_version:
+            base_histograms = self.exact_histograms[1]
+        result = self.model.get_histogram(base_histograms)
+        if result is None:
+            self.view.draw_histogram(None)
+            self.view.set_histogram_stats("")
+            return
+        self.view.draw_histogram(result["histograms"])
+        lines = [f"{'exact' if result['exact'] else 'preview':<7}"
+                 f"{'mean':>6}{'std':>6}{'min':>5}{'max':>5}"]
+        for name, stats in result["statistics"].items():
+            lines.append(f"{name:<7}{stats['mean']:>6.1f}{stats['std']:>6.1f}"
+                         f"{stats['min']:>5}{stats['max']:>5}")
+        self.view.set_histogram_stats("\n".join(lines))
+
+    def calculate_exact_stats(self):
+        """
+        Starts calculating the histograms of the full size edited image in a
+        background thread, and shows them when they are ready.
+
+        The result is discarded if the pixels are edited in the meantime.
+
+        Returns:
+            None
+        """
+        image = self.model.get_edited_image()
+        if image is None:
+            return  # No image loaded yet
+        if self.exact_stats_executor is None:
+            self.exact_stats_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="histogram")
+        # Selection edits change this image in place while it is read, but
+        # they also change pixel_version, so the result is discarded.
+        version = self.model.pixel_version
+        future = self.exact_stats_executor.submit(
+            self.model.calculate_histograms, image)
+        self.view.exact_stats_button.config(state="disabled")
+        self.view.root.after(self.EXACT_STATS_POLL_MS,
+                             self.show_exact_stats, future, version)
+
+    def show_exact_stats(self, future, version):
+        """
+        Shows the exact statistics once the background thread has finished.
+
+        Parameters:
+            future (Future): The background calculation.
+            version (int): The model's pixel_version when it was started.
+
+        Returns:
+            None
+        """
+        if not future.done():
+            self.view.root.after(self.EXACT_STATS_POLL_MS,
+                                 self.show_exact_stats, future, version)
+            return
+        self.view.exact_stats_button.config(state="normal")
+        if version != self.model.pixel_version:
+            return  # The image was edited while calculating
+        self.exact_histograms = (version, future.result())
+        self.update_histogram()
@@ -0,0 +1,384 @@
+# Image Decode
+# Decodes only the part of an image file that is needed, for when a region of
+# the image is about to be cropped, or the image is about to be scaled down.
+#
+# - Striped and tiled TIFFs: only the strips or tiles overlapping the region
+#   are read. They are copied into a small TIFF in memory which OpenCV
+#   decodes, so every compression OpenCV reads works and the pixels are the
+#   same as decoding the whole file.
+# - PNGs: the rows are one compressed stream, so the rows down to the last
+#   one needed are inflated and packed into a shorter PNG, which OpenCV
+#   decodes. The rest of the file is not read. This is only done when the
+#   region ends in the top half of the image - further down it costs more
+#   than decoding the whole image.
+# - JPEGs: libjpeg can decode straight to 1/2, 1/4 or 1/8 size, far faster
+#   than decoding in full, for when the image is about to be scaled down.
+# Other files, and files whose layout isn't understood, are decoded whole and
+# the region copied out.
+#
+# Regions are given in the image as it is shown, with its EXIF orientation
+# applied, and the pixels are returned as stored in the file, ready for
+# ImageModel.to_native_image().
+#
+# Usage:
+#   image, reduction = read_region("scan.tif", (100, 200, 900, 800))
+
+import struct
+import zlib
+
+import cv2  # OpenCV library
+import numpy as np
+from PIL import Image, TiffImagePlugin, TiffTags
+
+# Sizes libjpeg can decode JPEGs reduced by, with the cv2.imread() flags for
+# colour and greyscale images
+REDUCTIONS = {
+    2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+    4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+}
+# PNG rows are only streamed when the region ends above this fraction of the
+# image's height. Beyond it, the inflated rows and their decoded copy take
+# more memory than decoding the whole image.
+PNG_ROWS_LIMIT = 0.5
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Channels of each PNG colour type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# OpenCV's TIFF decoder applies the orientation tag itself, even with
+# cv2.IMREAD_UNCHANGED or cv2.IMREAD_IGNORE_ORIENTATION, and flips each tile
+# of 8 bit tiled TIFFs without moving it. The tag is left out of the partial
+# copy, so TIFFs are decoded as stored like every other format.
+TIFF_ORIENTATION_TAG = 274
+# cv2.flip() codes of the orientations the TIFF decoder applies when a whole
+# file is decoded, to undo them. Each flip is its own inverse.
+TIFF_DECODER_FLIPS = {2: 1, 3: -1, 4: 0}
+# TIFF tags locating data elsewhere in the file, which a partial copy of the
+# file can't keep
+TIFF_OFFSET_TAGS = (273, 279, 324, 325,  # Strip and tile offsets, counts
+                    330, 34665, 34853, 40965,  # Sub, EXIF, GPS, Interop IFDs
+                    513, 514)  # Old style JPEG data
+
+
+def get_inverse_orientation(orientation):
+    """
+    Returns the EXIF orientation which undoes another.
+
+    Parameters
+    orientation (int): The EXIF orientation, 1 to 8.
+
+    Returns
+    int: The orientation undoing it. Only the quarter turns, 6 and 8, are
+        not their own inverse.
+    """
+    return {6: 8, 8: 6}.get(orientation, orientation)
+
+
+def orient_region(region, orientation, width, height):
+    """
+    Returns where a region of an image lies once an EXIF orientation is
+    applied, as ImageModel.to_native_image() applies it.
+
+    Parameters
+    region (tuple): (start_x, start_y, end_x, end_y) in the image.
+    orientation (int): The EXIF orientation, 1 to 8.
+    width (int): The width of the image.
+    height (int): The height of the image.
+
+    Returns
+    tuple: (start_x, start_y, end_x, end_y) in the oriented image.
+    """
+    start_x, start_y, end_x, end_y = region
+    if orientation in (2, 4, 5, 7):
+        start_x, end_x = width - end_x, width - start_x
+    if orientation in (3, 4):
+        start_x, start_y, end_x, end_y = (width - end_x, height - end_y,
+                                          width - start_x, height - start_y)
+    elif orientation in (5, 8):
+        # A quarter turn anticlockwise
+        start_x, start_y, end_x, end_y = (start_y, width - end_x,
+                                          end_y, width - start_x)
+    elif orientation in (6, 7):
+        # A quarter turn clockwise
+        start_x, start_y, end_x, end_y = (height - end_y, start_x,
+                                          height - start_y, end_x)
+    return start_x, start_y, end_x, end_y
+
+
+def clip_region(region, width, height):
+    """
+    Limits a region to an image.
+
+    Parameters
+    region (tuple): (start_x, start_y, end_x, end_y), or None for the
+        whole image.
+    width (int): The width of the image.
+    height (int): The height of the image.
+
+    Returns
+    tuple: (start_x, start_y, end_x, end_y) within the image.
+
+    Raises
+    ValueError: If the region lies entirely outside the image.
+    """
+    if region is None:
+        return 0, 0, width, height
+    start_x, start_y, end_x, end_y = (int(value) for value in region)
+    start_x, end_x = max(start_x, 0), min(end_x, width)
+    start_y, end_y = max(start_y, 0), min(end_y, height)
+    if end_x <= start_x or end_y <= start_y:
+        raise ValueError("The region is outside the image")
+    return start_x, start_y, end_x, end_y
+
+
+def copy_region(image, bounds, origin=(0, 0)):
+    """
+    Copies a region out of a decoded image, so the rest can be freed.
+
+    Parameters
+    image (ndarray): The decoded image.
+    bounds (tuple): (start_x, start_y, end_x, end_y) of the region.
+    origin (tuple): (x, y) of the decoded image's top left corner, when
+        only part of the file was decoded.
+
+    Returns
+    ndarray: The region. The image itself if it is all of it.
+    """
+    start_x, start_y, end_x, end_y = bounds
+    region = image[start_y - origin[1]:end_y - origin[1],
+                   start_x - origin[0]:end_x - origin[0]]
+    if region.shape == image.shape:
+        return image
+    return region.copy()
+
+
+def read_tiff_region(path, bounds):
+    """
+    Decodes the strips or tiles of a TIFF that overlap a region.
+
+    Parameters
+    path (str): The TIFF file.
+    bounds (tuple): (start_x, start_y, end_x, end_y) of the region, as
+        stored in the file.
+
+    Returns
+    tuple: (image, origin) - the decoded strips or tiles and the (x, y) of
+        their top left corner, or (None, None) if they can't be decoded.
+    """
+    start_x, start_y, end_x, end_y = bounds
+    with Image.open(path) as tiff:
+        tags = tiff.tag_v2
+        # tiff.size is the size as shown, with quarter turns applied
+        width, height = tags[256], tags[257]
+        if tags.get(284, 1) != 1:
+            # Each channel stored separately
+            return None, None
+        tiled = 322 in tags
+        if tiled:
+            block_width, block_height = tags[322], tags[323]
+            offsets, counts = tags[324], tags[325]
+        else:
+            block_width, block_height = width, tags.get(278, height)
+            offsets, counts = tags[273], tags[279]
+        across = -(-width // block_width)
+        first_column, last_column = (start_x // block_width,
+                                     (end_x - 1) // block_width)
+        first_row, last_row = (start_y // block_height,
+                               (end_y - 1) // block_height)
+        blocks = []
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                index = row * across + column
+                tiff.fp.seek(offsets[index])
+                blocks.append(tiff.fp.read(counts[index]))
+        directory = TiffImagePlugin.ImageFileDirectory_v2()
+        for tag, value in tags.items():
+            if tag not in TIFF_OFFSET_TAGS and tag != TIFF_ORIENTATION_TAG:
+                directory[tag] = value
+                if tag in tags.tagtype:
+                    directory.tagtype[tag] = tags.tagtype[tag]
+    origin = (first_column * block_width, first_row * block_height)
+    directory[256] = min(width, (last_column + 1) * block_width) - origin[0]
+    directory[257] = min(height, (last_row + 1) * block_height) - origin[1]
+    offsets, position = [], 0
+    for block in blocks:
+        offsets.append(position)
+        position += len(block)
+    offsets_tag, counts_tag = (324, 325) if tiled else (273, 279)
+    directory[offsets_tag] = tuple(offsets)
+    directory.tagtype[offsets_tag] = TiffTags.LONG
+    directory[counts_tag] = tuple(len(block) for block in blocks)
+    directory.tagtype[counts_tag] = TiffTags.LONG
+    # The blocks follow the directory. Pillow moves strip offsets past the
+    # directory itself, but tile offsets have to be placed by hand.
+    if tiled:
+        size = len(directory.tobytes(8))
+        directory[offsets_tag] = tuple(8 + size + offset
+                                       for offset in offsets)
+    data = b"".join([b"II*\x00", struct.pack("<I", 8),
+                     directory.tobytes(8), *blocks])
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    return (None, None) if image is None else (image, origin)
+
+
+def read_png_rows(path, end_y):
+    """
+    Decodes the top rows of a PNG, without reading the rest of the file.
+
+    Parameters
+    path (str): The PNG file.
+    end_y (int): The number of rows to decode.
+
+    Returns
+    ndarray: The rows, or None if they can't be decoded this way, e.g.
+        because the PNG is interlaced.
+    """
+    def chunk(kind, data):
+        return struct.pack(">I4s", len(data), kind) + data + \
+            struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+    with open(path, "rb") as png:
+        if png.read(8) != PNG_SIGNATURE:
+            return None
+        inflater = zlib.decompressobj()
+        # Level 0 deflate only frames the rows, so costs little
+        deflater = zlib.compressobj(0)
+        data = bytearray(PNG_SIGNATURE)
+        # Where the rows start, once the first IDAT chunk is found
+        rows_start = None
+        remaining = None
+        while remaining != 0:
+            header = png.read(8)
+            if len(header) < 8:
+                return None
+            length, kind = struct.unpack(">I4s", header)
+            content = png.read(length)
+            png.read(4)  # CRC
+            if kind == b"IHDR":
+                width, height, depth, colour, _, _, interlace = \
+                    struct.unpack(">IIBBBBB", content)
+                if interlace or colour not in PNG_CHANNELS:
+                    return None
+                end_y = min(end_y, height)
+                # Each row starts with its filter type byte
+                remaining = end_y * \
+                    (1 + (width * PNG_CHANNELS[colour] * depth + 7) // 8)
+                data += chunk(kind, content[:4] + struct.pack(">I", end_y) +
+                              content[8:])
+            elif remaining is None or kind == b"IEND":
+                return None
+            elif kind == b"IDAT":
+                if rows_start is None:
+                    # The rows are packed into one IDAT chunk, whose length
+                    # is filled in at the end
+                    data += struct.pack(">I4s", 0, kind)
+                    rows_start = len(data)
+                while content and remaining:
+                    rows = inflater.decompress(content, remaining)
+                    remaining -= len(rows)
+                    data += deflater.compress(rows)
+                    content = inflater.unconsumed_tail
+            else:
+                # Palettes, transparency and other chunks before the rows
+                data += chunk(kind, content)
+    data += deflater.flush()
+    struct.pack_into(">I", data, rows_start - 8, len(data) - rows_start)
+    with memoryview(data) as view:
+        crc = zlib.crc32(view[rows_start - 4:])
+    data += struct.pack(">I", crc)
+    data += chunk(b"IEND", b"")
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def read_jpeg_reduced(path, reduction, grey=False):
+    """
+    Decodes a JPEG reduced in size by libjpeg.
+
+    Parameters
+    path (str): The JPEG file.
+    reduction (int): The size to reduce it by, 2, 4 or 8. Each side is
+        divided by it, rounding up.
+    grey (bool): True if the JPEG is greyscale.
+
+    Returns
+    ndarray: The reduced image, as stored in the file, or None if it can't
+        be read.
+    """
+    flags = REDUCTIONS[reduction][1 if grey else 0]
+    # The orientation is applied by ImageModel.to_native_image()
+    return cv2.imread(path, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+
+
+def read_region(path, region=None, orientation=1, reduction=1):
+    """
+    Decodes a region of an image file, reading as little of the file as its
+    format allows.
+
+    Parameters
+    path (str): The image file.
+    region (tuple): (start_x, start_y, end_x, end_y) of the region in the
+        image with its EXIF orientation applied, or None for the whole
+        image. The region is limited to the image.
+    orientation (int): The image's EXIF orientation, 1 to 8.
+    reduction (int): Most the image may be reduced in size by, 1, 2, 4 or
+        8, when it is about to be scaled down. Only JPEGs are reduced.
+
+    Returns
+    tuple: (image, reduction) - the region as stored in the file, or None
+        if the file can't be read, and the reduction used. The region's
+        sides are divided by the reduction, rounding outwards.
+
+    Raises
+    ValueError: If the region lies entirely outside the image, or the
+        reduction isn't one libjpeg can make.
+    """
+    if reduction != 1 and reduction not in REDUCTIONS:
+        raise ValueError(f"Unsupported reduction {reduction}")
+    try:
+        with Image.open(path) as header:
+            file_format, mode = header.format, header.mode
+            width, height = header.size
+            if file_format == "TIFF":
+                # Pillow gives the size of a TIFF as shown
+                width, height = header.tag_v2[256], header.tag_v2[257]
+        image = None
+    except Exception:
+        # Not a format Pillow reads, so decode it whole to find its size
+        file_format = mode = None
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return None, 1
+        height, width = image.shape[:2]
+    # Quarter turns swap the sides of the image as shown
+    shown_width, shown_height = (height, width) \
+        if orientation in (5, 6, 7, 8) else (width, height)
+    region = clip_region(region, shown_width, shown_height)
+    bounds = orient_region(region, get_inverse_orientation(orientation),
+                           shown_width, shown_height)
+    origin = (0, 0)
+    if image is None:
+        try:
+            if file_format == "JPEG" and reduction > 1 and \
+                    mode in ("L", "RGB"):
+                image = read_jpeg_reduced(path, reduction, mode == "L")
+                if image is not None:
+                    start_x, start_y, end_x, end_y = bounds
+                    bounds = (start_x // reduction, start_y // reduction,
+                              -(-end_x // reduction), -(-end_y // reduction))
+                    return copy_region(image, bounds), reduction
+            elif file_format == "TIFF":
+                image, origin = read_tiff_region(path, bounds)
+            elif file_format == "PNG" and \
+                    bounds[3] <= height * PNG_ROWS_LIMIT:
+                image = read_png_rows(path, bounds[3])
+        except Exception:
+            # Anything unexpected in the file's layout - decode it whole
+            image = None
+        if image is None:
+            origin = (0, 0)
+            image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                return None, 1
+            if file_format == "TIFF" and orientation in TIFF_DECODER_FLIPS:
+                image = cv2.flip(image, TIFF_DECODER_FLIPS[orientation])
+    return copy_region(image, bounds, origin), 1
@@ -0,0 +1,459 @@
+# Image Filmstrip
+# A scrolling strip of thumbnails of the images in the current folder, shown
+# along the bottom of the window. Clicking a thumbnail opens that image.
+#
+# The strip is virtualised: only the cells in view, plus a small margin,
+# have canvas items, and the items of cells scrolled out of view are reused
+# for the cells scrolled into view, so a folder of thousands of images costs
+# no more to show than a folder of ten.
+# Thumbnails are made in a pool of background threads. JPEGs are decoded at
+# a reduced size with Pillow's draft mode, which is many times faster than a
+# full decode. Each thumbnail is saved in a disk cache, keyed by the file's
+# path, size and modification time, so folders open instantly the next time.
+# Requests for cells that are scrolled past before their turn are cancelled.
+#
+# Only Pillow and Tk are used, so the strip doesn't slow down starting up.
+
+import hashlib
+import os
+import queue
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+
+from PIL import Image, ImageOps, ImageTk
+
+# File types shown in the strip
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp",
+                    ".webp", ".gif")
+
+
+def get_cache_dir():
+    """
+    Returns the folder thumbnails are cached in, following the XDG base
+    directory convention.
+
+    Returns
+    str: The thumbnail cache folder.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "hit137-image-editor", "thumbnails")
+
+
+def list_images(folder):
+    """
+    Lists the images in a folder, sorted by name.
+
+    Parameters
+    folder (str): The folder.
+
+    Returns
+    list: The image file paths.
+    """
+    paths = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS) and \
+                        not entry.name.startswith(".") and entry.is_file():
+                    paths.append(entry.path)
+    except OSError:
+        return []
+    paths.sort(key=lambda path: os.path.basename(path).lower())
+    return paths
+
+
+def make_thumbnail(path, size, cache_dir=None):
+    """
+    Returns a thumbnail of an image, from the disk cache if it has one.
+    Runs in a worker thread.
+
+    Parameters
+    path (str): The image file.
+    size (int): Longest side of the thumbnail in pixels.
+    cache_dir (str): The thumbnail cache folder, or None for no cache.
+
+    Returns
+    PIL.Image: The RGB thumbnail, or None if the image can't be read.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cache_path = None
+    if cache_dir is not None:
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{size}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg"
+        cache_path = os.path.join(cache_dir, name[:2], name)
+        try:
+            with Image.open(cache_path) as cached:
+                cached.load()
+                return cached
+        except (OSError, ValueError):
+            pass  # Not cached yet, or the cached file is damaged
+    try:
+        with Image.open(path) as image:
+            # JPEGs are decoded straight to a reduced size (1/2 to 1/8)
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), reducing_gap=2.0)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    if cache_path is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Written under a temporary name so a reader never sees part of it
+            partial_path = f"{cache_path}.{os.getpid()}.partial"
+            image.save(partial_path, format="JPEG", quality=85)
+            os.replace(partial_path, cache_path)
+        except OSError:
+            pass  # The cache is only an optimisation
+    return image
+
+
+class Filmstrip:
+    """
+    A class to show a virtualised, scrolling strip of image thumbnails.
+
+    Attributes
+    frame (ttk.Frame):
+        The frame holding the strip and its scroll bar.
+    canvas (tk.Canvas):
+        The canvas the cells are drawn on.
+    scrollbar (ttk.Scrollbar):
+        The horizontal scroll bar.
+    on_select (callable):
+        Called with an image's path when its thumbnail is clicked.
+    folder (str):
+        The folder shown, or None.
+    paths (list):
+        The image paths in the folder, in order.
+    selected (str):
+        The path of the highlighted image, or None.
+    cells (dict):
+        Canvas item ids (box, image, label) by cell index, for the cells
+        drawn.
+    thumbnails (OrderedDict):
+        PhotoImages by path, least recently used first.
+    requests (dict):
+        Futures of the thumbnails being made, by path.
+
+    Methods
+    __init__(parent, on_select=None, cache_dir=None, workers=2):
+        Creates the strip's widgets.
+    set_folder(folder, selected=None):
+        Shows the images in a folder.
+    set_selected(path):
+        Highlights an image.
+    scroll(*args):
+        Scrolls the strip, for the scroll bar.
+    refresh():
+        Draws the cells in view and requests their thumbnails.
+    request_thumbnails(first, last):
+        Starts making the thumbnails of a range of cells.
+    poll_thumbnails():
+        Shows the thumbnails made since the last poll.
+    shutdown():
+        Cancels outstanding requests and stops the worker threads.
+    """
+
+    THUMBNAIL_SIZE = 96  # Longest side of a thumbnail
+    CELL_WIDTH = 112  # Width of each cell, including the gap
+    LABEL_HEIGHT = 16  # Height of the file name under each thumbnail
+    MARGIN_CELLS = 4  # Cells drawn and requested either side of the view
+    MEMORY_CACHE_SIZE = 256  # Most PhotoImages kept for scrolling back
+    POLL_MS = 30  # How often to check for finished thumbnails
+
+    def __init__(self, parent, on_select=None, cache_dir=None, workers=2):
+        self.on_select = on_select
+        self.cache_dir = get_cache_dir() if cache_dir is None else cache_dir
+        self.folder = None
+        self.paths = []
+        self.selected = None
+        self.cells = {}
+        self.spare_cells = []  # Items of cells scrolled out of view
+        self.thumbnails = OrderedDict()
+        self.requests = {}
+        self.results = queue.Queue()  # (generation, path, future) from workers
+        self.generation = 0  # Incremented when the folder changes
+        self.polling = False
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="thumbnail")
+
+        height = self.THUMBNAIL_SIZE + self.LABEL_HEIGHT + 8
+        self.frame = ttk.Frame(parent)
+        self.canvas = tk.Canvas(self.frame, height=height, bg="white",
+                                highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="horizontal",
+                                       command=self.scroll)
+        self.canvas.config(xscrollcommand=self.scrollbar.set)
+        self.canvas.grid(row=0, column=0, sticky="ew")
+        self.scrollbar.grid(row=1, column=0, sticky="ew")
+        self.frame.columnconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<ButtonRelease-1>", self.on_click)
+        # Mouse wheel - Windows and macOS, then X11
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll(
+            "scroll", -1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>",
+                         lambda event: self.scroll("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>",
+                         lambda event: self.scroll("scroll", 1, "units"))
+
+    def set_folder(self, folder, selected=None):
+        """
+        Shows the images in a folder. Does nothing but highlight the
+        selected image if the folder is already shown.
+
+        Parameters
+        folder (str): The folder.
+        selected (str): The path of the image to highlight, or None.
+
+        Returns
+        None
+        """
+        if folder == self.folder:
+            self.set_selected(selected)
+            return
+        # Forget the old folder's cells and outstanding requests
+        self.generation += 1
+        for future in self.requests.values():
+            future.cancel()
+        self.requests.clear()
+        for index in list(self.cells):
+            self.spare_cells.append(self.cells.pop(index))
+        for box, image, label in self.spare_cells:
+            self.canvas.itemconfig(box, state="hidden")
+            self.canvas.itemconfig(image, state="hidden")
+            self.canvas.itemconfig(label, state="hidden")
+        self.folder = folder
+        self.paths = list_images(folder)
+        self.selected = selected
+        width = max(1, len(self.paths) * self.CELL_WIDTH)
+        self.canvas.config(scrollregion=(0, 0, width, 1),
+                           xscrollincrement=self.CELL_WIDTH)
+        self.canvas.xview_moveto(0)
+        if selected in self.paths:
+            self.scroll_to(self.paths.index(selected))
+        self.refresh()
+
+    def set_selected(self, path):
+        """
+        Highlights an image, scrolling it into view if needed.
+
+        Parameters
+        path (str): The path of the image, or None.
+
+        Returns
+        None
+        """
+        self.selected = path
+        if path in self.paths:
+            self.scroll_to(self.paths.index(path))
+        self.refresh()
+
+    def scroll_to(self, index):
+        """
+        Scrolls the strip so a cell is in view.
+
+        Parameters
+        index (int): The cell index.
+
+        Returns
+        None
+        """
+        first, last = self.get_visible_range()
+        if first <= index < last - 1:
+            return
+        total = len(self.paths) * self.CELL_WIDTH
+        self.canvas.xview_moveto(index * self.CELL_WIDTH / max(1, total))
+
+    def scroll(self, *args):
+        """
+        Scrolls the strip. Used as the scroll bar's command.
+
+        Parameters
+        *args: The scroll bar's arguments, as for tk.Canvas.xview().
+
+        Returns
+        None
+        """
+        self.canvas.xview(*args)
+        self.refresh()
+
+    def get_visible_range(self):
+        """
+        Returns the range of cells in view.
+
+        Returns
+        tuple: (first, last) cell indexes, last not included.
+        """
+        left = self.canvas.canvasx(0)
+        right = left + max(self.canvas.winfo_width(), 1)
+        first = max(0, int(left // self.CELL_WIDTH))
+        last = min(len(self.paths), int(right // self.CELL_WIDTH) + 1)
+        return first, last
+
+    def refresh(self):
+        """
+        Draws the cells in view, reusing the items of cells scrolled out of
+        view, and requests their thumbnails.
+
+        Returns
+        None
+        """
+        first, last = self.get_visible_range()
+        first = max(0, first - self.MARGIN_CELLS)
+        last = min(len(self.paths), last + self.MARGIN_CELLS)
+        for index in [index for index in self.cells
+                      if not first <= index < last]:
+            self.spare_cells.append(self.cells.pop(index))
+        for index in range(first, last):
+            if index not in self.cells:
+                self.cells[index] = self.get_spare_cell()
+            self.draw_cell(index)
+        self.request_thumbnails(first, last)
+
+    def get_spare_cell(self):
+        """
+        Returns the canvas items for a cell, reusing spare ones if there are
+        any.
+
+        Returns
+        tuple: (box, image, label) canvas item ids.
+        """
+        if self.spare_cells:
+            return self.spare_cells.pop()
+        box = self.canvas.create_rectangle(0, 0, 0, 0, width=2)
+        image = self.canvas.create_image(0, 0, anchor="center")
+        label = self.canvas.create_text(0, 0, anchor="n",
+                                        font=("TkDefaultFont", 8))
+        return box, image, label
+
+    def draw_cell(self, index):
+        """
+        Moves a cell's items into place and shows its thumbnail and name.
+
+        Parameters
+        index (int): The cell index.
+
+        Returns
+        None
+        """
+        box, image, label = self.cells[index]
+        path = self.paths[index]
+        left = index * self.CELL_WIDTH + 4
+        centre_x = left + self.THUMBNAIL_SIZE // 2 + 4
+        centre_y = 4 + self.THUMBNAIL_SIZE // 2
+        outline = "dodgerblue" if path == self.selected else "lightgrey"
+        self.canvas.coords(box, left, 2, left + self.CELL_WIDTH - 8,
+                           self.THUMBNAIL_SIZE + self.LABEL_HEIGHT + 6)
+        self.canvas.itemconfig(box, outline=outline, state="normal")
+        thumbnail = self.thumbnails.get(path)
+        if thumbnail is not None:
+            self.thumbnails.move_to_end(path)
+        self.canvas.coords(image, centre_x, centre_y)
+        self.canvas.itemconfig(image, image=thumbnail or "",
+                               state="normal")
+        name = os.path.basename(path)
+        max_chars = self.CELL_WIDTH // 7
+        if len(name) > max_chars:
+            name = name[:max_chars - 1] + "…"
+        self.canvas.coords(label, centre_x, self.THUMBNAIL_SIZE + 6)
+        self.canvas.itemconfig(label, text=name, state="normal")
+
+    def request_thumbnails(self, first, last):
+        """
+        Starts making the thumbnails of a range of cells that aren't shown
+        yet, and cancels requests for cells no longer near the view.
+
+        Parameters
+        first (int): The first cell index.
+        last (int): The cell index after the last.
+
+        Returns
+        None
+        """
+        wanted = set(self.paths[first:last])
+        for path in [path for path in self.requests if path not in wanted]:
+            # A thumbnail already being made is still kept when it arrives
+            self.requests.pop(path).cancel()
+        generation = self.generation
+        for path in self.paths[first:last]:
+            if path in self.thumbnails or path in self.requests:
+                continue
+            future = self.executor.submit(
+                make_thumbnail, path, self.THUMBNAIL_SIZE, self.cache_dir)
+            future.add_done_callback(
+                lambda future, path=path: future.cancelled() or
+                self.results.put((generation, path, future)))
+            self.requests[path] = future
+        if self.requests and not self.polling:
+            self.polling = True
+            self.canvas.after(self.POLL_MS, self.poll_thumbnails)
+
+    def poll_thumbnails(self):
+        """
+        Shows the thumbnails made since the last poll. PhotoImages can only
+        be created in the main thread, so the workers return PIL images.
+
+        Returns
+        None
+        """
+        while True:
+            try:
+                generation, path, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue  # From a folder no longer shown
+            # The cell may have been requested again since this request was
+            # given up on
+            if self.requests.get(path) is future:
+                del self.requests[path]
+            try:
+                image = future.result()
+            except Exception as error:
+                # Something make_thumbnail() didn't expect, e.g. bad EXIF
+                print(f"Filmstrip: Unable to make thumbnail of {path}: "
+                      f"{error}")
+                image = None
+            if image is None:
+                continue
+            self.thumbnails[path] = ImageTk.PhotoImage(image)
+            if len(self.thumbnails) > self.MEMORY_CACHE_SIZE:
+                self.thumbnails.popitem(last=False)
+        for index in self.cells:
+            self.draw_cell(index)
+        if self.requests:
+            self.canvas.after(self.POLL_MS, self.poll_thumbnails)
+        else:
+            self.polling = False
+
+    def on_click(self, event):
+        """
+        Opens the image whose thumbnail was clicked.
+
+        Parameters
+        event (tk.Event): The mouse event.
+
+        Returns
+        None
+        """
+        index = int(self.canvas.canvasx(event.x) // self.CELL_WIDTH)
+        if 0 <= index < len(self.paths) and self.on_select is not None:
+            self.on_select(self.paths[index])
+
+    def shutdown(self):
+        """
+        Cancels outstanding requests and stops the worker threads.
+
+        Returns
+        None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,273 @@
+# Image Hash
+# Perceptual hashes for finding near-duplicate images, such as the same
+# photo saved again at a different quality or size, and an on-disk index to
+# look them up by Hamming distance.
+#
+# The hash is a 64 bit difference hash (dHash): the image is shrunk to 9x8
+# grey pixels and each bit records whether a pixel is brighter than its right
+# hand neighbour. Re-encoding and resizing barely change it. JPEGs are
+# decoded straight to 1/8 size with Pillow's draft mode, so hashing costs a
+# fraction of a full decode.
+#
+# The index is a SQLite table using multi-index hashing. Each hash is split
+# into four 16 bit chunks, each with its own column index. Two hashes at most
+# d bits apart must have a chunk at most d // 4 bits apart, so a lookup only
+# reads the rows matching one of the few chunk values near the query's
+# chunks, then checks their full distance. Lookups stay fast with millions of
+# entries, and only SQLite's small page cache is held in memory.
+#
+# Usage:
+#   index = HashIndex("hashes.sqlite")
+#   matches = index.find(dhash("photo.jpg"))
+
+import itertools
+import sqlite3
+import threading
+
+from PIL import Image, ImageOps
+
+# Bits of hash along each side of the grid - 8 gives a 64 bit hash
+HASH_SIZE = 8
+# Most bits two hashes may differ by to count as the same image
+DEFAULT_DISTANCE = 6
+# The hash is split into this many chunks of CHUNK_BITS for the index
+CHUNKS = 4
+CHUNK_BITS = 16
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """
+    Returns the difference hash of an image file.
+
+    Parameters
+    path (str): The image file.
+    hash_size (int): Bits along each side of the hash grid.
+
+    Returns
+    int: The hash, hash_size * hash_size bits long.
+
+    Raises
+    OSError: If the file can't be read as an image.
+    """
+    with Image.open(path) as image:
+        # JPEGs are decoded straight to a reduced size (1/2 to 1/8). Keep
+        # plenty of pixels for each grid cell so the reduction averages.
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        image = ImageOps.exif_transpose(image)
+        grey = image.convert("L").resize((hash_size + 1, hash_size),
+                                         Image.Resampling.BOX)
+    pixels = grey.tobytes()
+    value = 0
+    for row in range(hash_size):
+        start = row * (hash_size + 1)
+        for column in range(start, start + hash_size):
+            value = value << 1 | (pixels[column] > pixels[column + 1])
+    return value
+
+
+def hamming_distance(first, second):
+    """
+    Returns the number of bits two hashes differ by.
+
+    Parameters
+    first (int): A hash.
+    second (int): Another hash.
+
+    Returns
+    int: The Hamming distance.
+    """
+    return (first ^ second).bit_count()
+
+
+def get_chunks(value):
+    """
+    Splits a 64 bit hash into the chunks kept in the index.
+
+    Parameters
+    value (int): The hash.
+
+    Returns
+    list: CHUNKS ints of CHUNK_BITS each, most significant first.
+    """
+    mask = (1 << CHUNK_BITS) - 1
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - index))) & mask
+            for index in range(CHUNKS)]
+
+
+def get_neighbours(chunk, radius):
+    """
+    Returns every chunk value at most radius bits from a chunk.
+
+    Parameters
+    chunk (int): The chunk value.
+    radius (int): Most bits to differ by.
+
+    Returns
+    list: The chunk values, including the chunk itself.
+    """
+    neighbours = [chunk]
+    for bits in range(1, radius + 1):
+        for positions in itertools.combinations(range(CHUNK_BITS), bits):
+            flipped = chunk
+            for position in positions:
+                flipped ^= 1 << position
+            neighbours.append(flipped)
+    return neighbours
+
+
+class HashIndex:
+    """
+    A class to store image hashes on disk and find the ones near a hash.
+
+    The index can be shared by threads. Each change is committed straight
+    away, so it survives the program stopping.
+
+    Attributes
+    path (str):
+        The SQLite database file.
+    tag (str):
+        What the entries were made for, such as an edit spec's digest.
+
+    Methods
+    __init__(path, tag=None):
+        Opens the index, emptying it if it was made with a different tag.
+    to_signed(value):
+        Converts a hash to the signed integer SQLite stores.
+    add(key, value, output=None):
+        Adds or replaces the hash of a file.
+    find(value, max_distance=DEFAULT_DISTANCE, exclude=None):
+        Returns the entries within a distance of a hash, nearest first.
+    remove(key):
+        Removes a file's entry.
+    count():
+        Returns the number of entries.
+    close():
+        Closes the database.
+    """
+
+    def __init__(self, path, tag=None):
+        self.path = path
+        self.tag = tag
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # Write ahead logging commits without rewriting the whole page
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        chunk_columns = ", ".join(f"chunk{index} INTEGER NOT NULL"
+                                  for index in range(CHUNKS))
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS settings "
+                "(name TEXT PRIMARY KEY, value TEXT)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS hashes (key TEXT PRIMARY KEY, "
+                f"hash INTEGER NOT NULL, {chunk_columns}, output TEXT)")
+            for index in range(CHUNKS):
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS hashes_chunk{index} "
+                    f"ON hashes (chunk{index})")
+            row = self._connection.execute(
+                "SELECT value FROM settings WHERE name = 'tag'").fetchone()
+            if row is not None and row[0] != tag:
+                # Made for something else, so the outputs don't apply
+                self._connection.execute("DELETE FROM hashes")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO settings VALUES ('tag', ?)", (tag,))
+
+    @staticmethod
+    def to_signed(value):
+        """
+        Converts a 64 bit hash to the signed integer SQLite stores.
+
+        Parameters
+        value (int): The hash.
+
+        Returns
+        int: The hash as a signed 64 bit integer.
+        """
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+    def add(self, key, value, output=None):
+        """
+        Adds or replaces the hash of a file.
+
+        Parameters
+        key (str): Identifies the file, such as its name.
+        value (int): The file's hash.
+        output (str): Result kept for the file, such as its output file
+            name, or None.
+
+        Returns
+        None
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO hashes VALUES "
+                f"(?, ?, {', '.join('?' * CHUNKS)}, ?)",
+                (key, self.to_signed(value), *get_chunks(value), output))
+
+    def find(self, value, max_distance=DEFAULT_DISTANCE, exclude=None):
+        """
+        Returns the entries within a distance of a hash, nearest first.
+
+        Parameters
+        value (int): The hash to look up.
+        max_distance (int): Most bits an entry's hash may differ by.
+        exclude (str): A key to leave out, such as the file being looked
+            up, or None.
+
+        Returns
+        list: (distance, key, output) of each entry found.
+        """
+        radius = max_distance // CHUNKS
+        candidates = {}
+        with self._lock:
+            for index, chunk in enumerate(get_chunks(value)):
+                neighbours = get_neighbours(chunk, radius)
+                rows = self._connection.execute(
+                    f"SELECT key, hash, output FROM hashes WHERE chunk{index} "
+                    f"IN ({', '.join('?' * len(neighbours))})", neighbours)
+                for key, stored, output in rows:
+                    candidates[key] = (stored & ((1 << 64) - 1), output)
+        matches = []
+        for key, (stored, output) in candidates.items():
+            distance = hamming_distance(value, stored)
+            if distance <= max_distance and key != exclude:
+                matches.append((distance, key, output))
+        matches.sort()
+        return matches
+
+    def remove(self, key):
+        """
+        Removes a file's entry, if it has one.
+
+        Parameters
+        key (str): Identifies the file.
+
+        Returns
+        None
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM hashes WHERE key = ?",
+                                     (key,))
+
+    def count(self):
+        """
+        Returns the number of entries.
+
+        Returns
+        int: The number of hashes in the index.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the database.
+
+        Returns
+        None
+        """
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,957 @@
+# Image Hot Folder
+# Watches a folder for new images, such as a share that scanners save to,
+# and edits each one with a saved edit spec as it arrives, writing the
+# results to an output folder.
+# An edit spec is a JSON file holding the crop, rotations, whole image
+# filters, tonal adjustments and scale made in the editor (Control-E saves
+# the current edits as a spec). Each file is edited with the ImageModel's
+# own operations, so the results match editing it by hand.
+#
+# Files are found by polling the folder, or with inotify on Linux when the
+# inotify_simple package is installed. A file is only processed once its
+# size and modification time have stopped changing for a settling time, so
+# files still being written are left alone. Files are handed to a pool of
+# worker threads through a bounded queue, so a burst of new files can't use
+# unbounded memory. Every result is recorded in a ledger in the output
+# folder, so after a restart only new, changed, unfinished or failed files
+# are processed, and changing the spec processes everything again.
+# Near-duplicates of images already processed, such as the same photo saved
+# again at a different size, can be skipped, or given a copy of the earlier
+# result, without being decoded in full (see Image_Hash).
+# When the spec starts with a crop, only the cropped region of each file is
+# decoded where the format allows (see Image_Decode), and with
+# --reduced-decode JPEGs about to be scaled down to half size or less are
+# decoded reduced in size.
+#
+# Throughput, queue depth and per-operation latency can be written to a
+# Prometheus text-format or JSON lines file with --metrics and --metrics-json.
+#
+# Usage:
+#   python Image_HotFolder.py scans/ edited/ --spec edits.json
+#   python Image_HotFolder.py scans/ edited/ --spec edits.json --once
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+import Image_Metrics
+from Image_Backends import backends
+from Image_Decode import REDUCTIONS
+from Image_Hash import DEFAULT_DISTANCE, HashIndex, dhash
+from Image_Metrics import metrics
+from Image_Model import ImageModel
+
+try:
+    import inotify_simple  # Optional - only available on Linux
+except ImportError:
+    inotify_simple = None
+
+# Version of the edit spec file format
+SPEC_VERSION = 1
+# File types picked up from the watched folder
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp",
+                    ".webp")
+# Name of the ledger file kept in the output folder
+LEDGER_NAME = ".hotfolder_ledger.jsonl"
+# Times a file that fails is tried, one a run, before it is left until it
+# changes
+MAX_ATTEMPTS = 3
+# Name of the duplicate index kept in the output folder
+HASH_INDEX_NAME = ".hotfolder_hashes.sqlite"
+# What to do with near-duplicates of images already processed
+DUPLICATE_ACTIONS = ("process", "skip", "copy")
+
+# Metrics, recorded when metrics are enabled (see Image_Metrics)
+FILES = metrics.counter("hotfolder_files_total",
+                        "Files finished, by status (done, duplicate, failed)")
+QUEUE_DEPTH = metrics.gauge("hotfolder_queue_depth",
+                            "Files queued for a worker")
+PENDING_FILES = metrics.gauge("hotfolder_pending_files",
+                              "Files waiting for their size to settle")
+ACTIVE_FILES = metrics.gauge("hotfolder_active_files",
+                             "Files queued or being processed")
+
+
+def spec_from_model(model, output_format=None):
+    """
+    Creates an edit spec from the model's current edits.
+
+    Selection edits change the pixels of one image, so they are not saved.
+    An auto crop is saved without its bounds, so each image's own border is
+    found.
+
+    Parameters
+    model (ImageModel): The model, with an image loaded.
+    output_format (str): Extension to save results as, e.g. ".png", or
+        None to keep each file's own format.
+
+    Returns
+    dict: The edit spec.
+    """
+    return {
+        "version": SPEC_VERSION,
+        "steps": [[edit, None if edit == "auto_crop" else value]
+                  for edit, value in model.edit_steps],
+        "tone": {"brightness": model.brightness,
+                 "contrast": model.contrast,
+                 "gamma": model.gamma,
+                 "black_point": model.black_point,
+                 "white_point": model.white_point},
+        "scale": model.scale_factor,
+        "format": output_format,
+    }
+
+
+def save_spec(spec, path):
+    """
+    Writes an edit spec to a JSON file.
+
+    Parameters
+    spec (dict): The edit spec.
+    path (str): The file to write.
+
+    Returns
+    None
+    """
+    with open(path, "w") as spec_file:
+        json.dump(spec, spec_file, indent=2)
+
+
+def load_spec(path):
+    """
+    Reads an edit spec from a JSON file.
+
+    Parameters
+    path (str): The file to read.
+
+    Returns
+    dict: The edit spec.
+
+    Raises
+    ValueError: If the file is not an edit spec this version can read.
+    """
+    with open(path) as spec_file:
+        try:
+            spec = json.load(spec_file)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Invalid edit spec {path}: {error}")
+    if not isinstance(spec, dict) or spec.get("version") != SPEC_VERSION:
+        raise ValueError(f"Unsupported edit spec: {path}")
+    for step in spec.get("steps", []):
+        if step[0] not in ("crop", "auto_crop", "rotate", "filter"):
+            raise ValueError(f"Unknown edit {step[0]!r} in {path}")
+    return spec
+
+
+def spec_digest(spec):
+    """
+    Returns a short hash identifying an edit spec's edits.
+
+    Parameters
+    spec (dict): The edit spec.
+
+    Returns
+    str: The hash, the same for specs with the same edits.
+    """
+    text = json.dumps(spec, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def apply_spec(model, spec):
+    """
+    Makes the edits in an edit spec to the image loaded in a model.
+
+    Crops are limited to the image, so a spec made on a slightly smaller
+    scan can still be used. An auto crop finds each image's own border, with
+    the tolerance given as its value, or the default for None.
+
+    Parameters
+    model (ImageModel): The model, with the image to edit loaded.
+    spec (dict): The edit spec.
+
+    Returns
+    None
+
+    Raises
+    ValueError: If a crop lies entirely outside the image.
+    """
+    for edit, value in spec.get("steps", []):
+        if edit == "crop":
+            height, width = model.get_image().shape[:2]
+            start_x, start_y, end_x, end_y = value
+            start_x, end_x = min(start_x, width), min(end_x, width)
+            start_y, end_y = min(start_y, height), min(end_y, height)
+            if end_x <= start_x or end_y <= start_y:
+                raise ValueError("The crop is outside the image")
+            model.crop_image(start_x, start_y, end_x, end_y)
+        elif edit == "auto_crop":
+            if value is None:
+                model.auto_crop()
+            else:
+                model.auto_crop(value)
+        elif edit == "rotate":
+            model.rotate_image(value)
+        else:
+            name, params = value
+            model.apply_filter(name, **params)
+    tone = spec.get("tone", {})
+    model.set_brightness(tone.get("brightness", 0))
+    model.set_contrast(tone.get("contrast", 1.0))
+    model.set_gamma(tone.get("gamma", 1.0))
+    model.set_levels(tone.get("black_point", 0), tone.get("white_point", 255))
+    model.set_scale_factor(spec.get("scale", 1.0))
+
+
+def plan_load(spec, reduced_decode=False):
+    """
+    Works out how little of each image needs to be decoded for an edit spec.
+
+    A spec starting with a crop only needs the cropped region, which is
+    loaded in place of the crop, giving the same result. With
+    reduced_decode, an image which is only rotated and then scaled down to
+    half size or less may be decoded reduced in size, and scaled down less
+    to make up for it. The result is then close to, but not exactly, the
+    full size edit, and may differ in size by a pixel.
+
+    Parameters
+    spec (dict): The edit spec.
+    reduced_decode (bool): Allow images to be decoded reduced in size.
+
+    Returns
+    tuple: (region, reduction, spec) - the region to load, or None for the
+        whole image, most the image may be reduced by, and the edit spec
+        to apply once it is loaded.
+    """
+    steps = spec.get("steps", [])
+    region = None
+    if steps and steps[0][0] == "crop":
+        region = tuple(steps[0][1])
+        steps = steps[1:]
+    reduction = 1
+    if reduced_decode and all(edit == "rotate" for edit, _ in steps):
+        scale = spec.get("scale", 1.0)
+        for size in sorted(REDUCTIONS):
+            if scale * size <= 1:
+                reduction = size
+    return region, reduction, dict(spec, steps=steps)
+
+
+class Ledger:
+    """
+    A class to record which files have been processed, so work isn't
+    repeated after a restart.
+
+    Each result is appended to a JSON lines file as soon as it is known.
+    Only the last entry for each file counts, and the file is rewritten
+    without the older entries when it is opened. A file that failed is
+    tried again by the next run, up to MAX_ATTEMPTS times.
+
+    Attributes
+    path (str):
+        The ledger file.
+    entries (dict):
+        The last entry for each source file name.
+
+    Methods
+    __init__(path):
+        Opens the ledger, reading any earlier entries.
+    is_processed(name, signature, digest):
+        Returns True if a file has been processed as it is now.
+    record(name, signature, digest, status, output=None, error=None):
+        Records the result of processing a file.
+    close():
+        Closes the ledger file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as ledger_file:
+                for line in ledger_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partly written when the daemon stopped
+                    self.entries[entry["source"]] = entry
+        # Rewrite with only the last entry for each file
+        compacted_path = path + ".tmp"
+        with open(compacted_path, "w") as ledger_file:
+            for entry in self.entries.values():
+                ledger_file.write(json.dumps(entry) + "\n")
+        os.replace(compacted_path, path)
+        self._file = open(path, "a")
+
+    def is_processed(self, name, signature, digest):
+        """
+        Returns True if a file has already been processed with the same
+        contents and edit spec, or has failed MAX_ATTEMPTS times.
+
+        Parameters
+        name (str): The source file name.
+        signature (tuple): The file's (size, modification time in ns).
+        digest (str): The edit spec's spec_digest().
+
+        Returns
+        bool: True if the file doesn't need processing.
+        """
+        with self._lock:
+            entry = self.entries.get(name)
+        if entry is None or tuple(entry["signature"]) != tuple(signature) \
+                or entry["spec"] != digest:
+            return False
+        return entry["status"] != "failed" or \
+            entry.get("attempts", 1) >= MAX_ATTEMPTS
+
+    def record(self, name, signature, digest, status, output=None,
+               error=None):
+        """
+        Records the result of processing a file.
+
+        The entry is flushed to disk before returning. Failures of the same
+        file, contents and spec are counted in the entry's "attempts".
+
+        Parameters
+        name (str): The source file name.
+        signature (tuple): The file's (size, modification time in ns).
+        digest (str): The edit spec's spec_digest().
+        status (str): "done", "duplicate" or "failed".
+        output (str): The output file name, or None.
+        error (str): Why processing failed, or None.
+
+        Returns
+        None
+        """
+        entry = {"source": name, "signature": list(signature),
+                 "spec": digest, "status": status, "output": output,
+                 "error": error, "time": time.time()}
+        with self._lock:
+            if status == "failed":
+                last = self.entries.get(name)
+                entry["attempts"] = 1
+                if last is not None and last["status"] == "failed" and \
+                        last["signature"] == entry["signature"] and \
+                        last["spec"] == digest:
+                    entry["attempts"] = last.get("attempts", 1) + 1
+            self.entries[name] = entry
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """
+        Closes the ledger file.
+
+        Returns
+        None
+        """
+        with self._lock:
+            self._file.close()
+
+
+class PollingWatcher:
+    """
+    A class to find new and changed images in a folder by polling it.
+
+    Each scan reads the folder once with os.scandir() and only stats the
+    entries with an image extension.
+
+    Attributes
+    folder (str):
+        The folder being watched.
+    interval (float):
+        Seconds between scans.
+
+    Methods
+    __init__(folder, interval=1.0):
+        Initializes the PollingWatcher object.
+    scan():
+        Returns the signature of every image in the folder.
+    stat(name):
+        Returns the signature of one image, or None if it has gone.
+    poll():
+        Waits, then returns the images which may have changed.
+    close():
+        Stops watching.
+    """
+
+    def __init__(self, folder, interval=1.0):
+        self.folder = folder
+        self.interval = interval
+
+    def scan(self):
+        """
+        Returns the signature of every image in the folder.
+
+        Returns
+        dict: (size, modification time in ns) by file name.
+        """
+        found = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or \
+                        not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Removed while scanning
+                found[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def stat(self, name):
+        """
+        Returns the signature of one image.
+
+        Parameters
+        name (str): The file name.
+
+        Returns
+        tuple: (size, modification time in ns), or None if it has gone.
+        """
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def poll(self):
+        """
+        Waits for the polling interval, then scans the folder.
+
+        Returns
+        dict: (size, modification time in ns) by file name, of the images
+            which may have changed.
+        """
+        time.sleep(self.interval)
+        return self.scan()
+
+    def close(self):
+        """
+        Stops watching.
+
+        Returns
+        None
+        """
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    A class to find new and changed images in a folder with inotify.
+
+    Only the files named in inotify events are stat'ed, and poll() returns
+    as soon as there are events. The whole folder is still scanned every
+    rescan_interval seconds in case events were lost.
+
+    Attributes
+    rescan_interval (float):
+        Seconds between full scans.
+
+    Methods
+    __init__(folder, interval=1.0, rescan_interval=60.0):
+        Starts watching the folder.
+    poll():
+        Waits for events, then returns the images which may have changed.
+    close():
+        Stops watching.
+    """
+
+    def __init__(self, folder, interval=1.0, rescan_interval=60.0):
+        super().__init__(folder, interval)
+        self.rescan_interval = rescan_interval
+        self.last_scan = time.monotonic()
+        self.inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        self.inotify.add_watch(
+            folder, flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE |
+            flags.MOVED_TO | flags.ATTRIB)
+
+    def poll(self):
+        """
+        Waits up to the polling interval for events, then stats the files
+        they name. Scans the whole folder if it is due.
+
+        Returns
+        dict: (size, modification time in ns) by file name, of the images
+            which may have changed.
+        """
+        events = self.inotify.read(timeout=int(self.interval * 1000))
+        if time.monotonic() - self.last_scan >= self.rescan_interval:
+            self.last_scan = time.monotonic()
+            return self.scan()
+        changed = {}
+        for name in {event.name for event in events}:
+            if name.startswith(".") or \
+                    not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            signature = self.stat(name)
+            if signature is not None:
+                changed[name] = signature
+        return changed
+
+    def close(self):
+        """
+        Stops watching.
+
+        Returns
+        None
+        """
+        self.inotify.close()
+
+
+class HotFolder:
+    """
+    A class to edit images with an edit spec as they arrive in a folder.
+
+    Attributes
+    input_dir (str):
+        The folder watched for new images.
+    output_dir (str):
+        The folder the edited images are written to.
+    spec (dict):
+        The edit spec applied to every image.
+    digest (str):
+        The spec's spec_digest(), recorded in the ledger.
+    workers (int):
+        The number of worker threads, each with its own ImageModel.
+    settle (float):
+        Seconds a file must be unchanged before it is processed.
+    tasks (queue.Queue):
+        Bounded queue of files waiting for a worker.
+    ledger (Ledger):
+        Record of the files processed.
+    duplicate_action (str):
+        "process" to edit near-duplicates as usual, "skip" to leave them
+        out or "copy" to copy the output of the image they duplicate.
+    hash_distance (int):
+        Most bits the hashes of near-duplicates may differ by.
+    hashes (HashIndex):
+        Hashes of the files processed, or None when duplicates are
+        processed as usual.
+    reduced_decode (bool):
+        Whether images may be decoded reduced in size when they are scaled
+        down, trading exact results for speed.
+    load_plan (tuple):
+        The region, reduction and remaining spec from plan_load().
+    watcher (PollingWatcher):
+        Finds new and changed files.
+    pending (dict):
+        (signature, time first seen) by file name, of the files settling.
+    active (set):
+        Names of the files queued or being processed.
+    failures (dict):
+        Signature by file name, of the files that failed in this run. They
+        are tried again by the next run, or once they change.
+    processed (int):
+        Files processed since starting.
+    failed (int):
+        Files that failed since starting.
+    duplicates (int):
+        Near-duplicates skipped or copied since starting.
+
+    Methods
+    __init__(input_dir, output_dir, spec, workers=None, queue_size=None,
+             settle=2.0, interval=1.0, memory_limit=None,
+             duplicate_action="process", hash_distance=DEFAULT_DISTANCE,
+             reduced_decode=False):
+        Initializes the HotFolder object.
+    run(once=False):
+        Watches the folder and processes images until stopped.
+    stop():
+        Asks run() to finish.
+    update_metrics():
+        Records the number of files pending, queued and active.
+    update_pending(changed):
+        Notes the files which have changed.
+    queue_settled():
+        Queues the files which have stopped changing.
+    worker():
+        Processes queued files until stopped.
+    process_file(model, name, signature):
+        Edits one file and writes the result.
+    find_duplicate(name, value):
+        Returns the output of an earlier near-duplicate of a file.
+    """
+
+    def __init__(self, input_dir, output_dir, spec, workers=None,
+                 queue_size=None, settle=2.0, interval=1.0,
+                 memory_limit=None, duplicate_action="process",
+                 hash_distance=DEFAULT_DISTANCE, reduced_decode=False):
+        if os.path.realpath(input_dir) == os.path.realpath(output_dir):
+            raise ValueError("The output folder must not be the input folder")
+        os.makedirs(output_dir, exist_ok=True)
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.spec = spec
+        # Reduced decoding changes the results, so they are redone when it
+        # is turned on or off
+        self.digest = spec_digest(dict(spec, reduced_decode=True)
+                                  if reduced_decode else spec)
+        self.reduced_decode = reduced_decode
+        self.load_plan = plan_load(spec, reduced_decode)
+        self.workers = workers or os.cpu_count() or 1
+        self.settle = settle
+        self.memory_limit = memory_limit
+        self.tasks = queue.Queue(maxsize=queue_size or 2 * self.workers)
+        self.ledger = Ledger(os.path.join(output_dir, LEDGER_NAME))
+        if duplicate_action not in DUPLICATE_ACTIONS:
+            raise ValueError(f"Unknown duplicate action {duplicate_action!r}")
+        self.duplicate_action = duplicate_action
+        self.hash_distance = hash_distance
+        self.hashes = None
+        if duplicate_action != "process":
+            # Outputs made with another spec don't count as duplicates
+            self.hashes = HashIndex(
+                os.path.join(output_dir, HASH_INDEX_NAME), tag=self.digest)
+        if inotify_simple is not None:
+            self.watcher = InotifyWatcher(input_dir, interval)
+        else:
+            self.watcher = PollingWatcher(input_dir, interval)
+        self.pending = {}
+        self.active = set()
+        self.failures = {}
+        self._active_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+
+    def run(self, once=False):
+        """
+        Watches the folder and processes images until stop() is called.
+
+        Parameters
+        once (bool): Stop once the images already in the folder have been
+            processed, rather than waiting for more.
+
+        Returns
+        None
+        """
+        threads = [threading.Thread(target=self.worker,
+                                    name=f"hotfolder-{index}", daemon=True)
+                   for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            self.update_pending(self.watcher.scan())
+            while not self._stopping.is_set():
+                self.queue_settled()
+                self.update_metrics()
+                if once:
+                    with self._active_lock:
+                        idle = not self.pending and not self.active
+                    if idle:
+                        break
+                self.update_pending(self.watcher.poll())
+        finally:
+            self._stopping.set()
+            for thread in threads:
+                thread.join()
+            self.watcher.close()
+            self.ledger.close()
+            if self.hashes is not None:
+                self.hashes.close()
+
+    def stop(self):
+        """
+        Asks run() to finish. Files being processed are finished first, and
+        queued files are left for the next run.
+
+        Returns
+        None
+        """
+        self._stopping.set()
+
+    def update_metrics(self):
+        """
+        Records the number of files pending, queued and active.
+
+        Returns
+        None
+        """
+        if not metrics.enabled:
+            return
+        PENDING_FILES.set(len(self.pending))
+        QUEUE_DEPTH.set(self.tasks.qsize())
+        with self._active_lock:
+            ACTIVE_FILES.set(len(self.active))
+
+    def update_pending(self, changed):
+        """
+        Notes the files which may have changed. A file's settling time
+        starts again whenever its signature changes.
+
+        Parameters
+        changed (dict): (size, modification time in ns) by file name.
+
+        Returns
+        None
+        """
+        now = time.monotonic()
+        with self._active_lock:
+            failures = dict(self.failures)
+        for name, signature in changed.items():
+            if failures.get(name) == signature or \
+                    self.ledger.is_processed(name, signature, self.digest):
+                self.pending.pop(name, None)
+                continue
+            current = self.pending.get(name)
+            if current is None or current[0] != signature:
+                self.pending[name] = (signature, now)
+
+    def queue_settled(self):
+        """
+        Queues the files whose signature hasn't changed for the settling
+        time. Blocks while the queue is full.
+
+        Returns
+        None
+        """
+        now = time.monotonic()
+        for name, (signature, since) in list(self.pending.items()):
+            if now - since < self.settle:
+                continue
+            with self._active_lock:
+                if name in self.active:
+                    continue  # Seen again when the current run finishes
+            if self.ledger.is_processed(name, signature, self.digest):
+                del self.pending[name]  # Seen while it was being processed
+                continue
+            # Check again in case a write was missed between polls
+            current = self.watcher.stat(name)
+            if current != signature:
+                if current is None:
+                    del self.pending[name]
+                else:
+                    self.pending[name] = (current, now)
+                continue
+            del self.pending[name]
+            with self._active_lock:
+                self.active.add(name)
+            while not self._stopping.is_set():
+                try:
+                    self.tasks.put((name, signature), timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def worker(self):
+        """
+        Processes queued files until the hot folder is stopped.
+
+        Returns
+        None
+        """
+        model = ImageModel(memory_limit=self.memory_limit)
+        while not self._stopping.is_set():
+            try:
+                name, signature = self.tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.process_file(model, name, signature)
+            finally:
+                with self._active_lock:
+                    self.active.discard(name)
+
+    def process_file(self, model, name, signature):
+        """
+        Edits one file with the edit spec and writes the result.
+
+        The result is written to a temporary file and renamed, so the
+        output folder never holds a partly written image. Only the part of
+        the file the spec needs is decoded (see plan_load()). When duplicates
+        are looked for, the file is hashed first, and a near-duplicate of
+        an image already processed is skipped, or given a copy of its
+        output, without being edited.
+
+        Parameters
+        model (ImageModel): The worker's model.
+        name (str): The file name in the input folder.
+        signature (tuple): The file's (size, modification time in ns).
+
+        Returns
+        None
+        """
+        stem, extension = os.path.splitext(name)
+        extension = self.spec.get("format") or extension
+        output_name = stem + extension
+        output_path = os.path.join(self.output_dir, output_name)
+        partial_path = os.path.join(self.output_dir,
+                                    f".{stem}.partial{extension}")
+        source_path = os.path.join(self.input_dir, name)
+        try:
+            value = None
+            if self.hashes is not None:
+                value = dhash(source_path)
+                duplicate = self.find_duplicate(name, value)
+                if duplicate is not None:
+                    if self.duplicate_action == "copy":
+                        # Keep the earlier output's format
+                        output_name = stem + os.path.splitext(duplicate)[1]
+                        shutil.copyfile(
+                            os.path.join(self.output_dir, duplicate),
+                            partial_path)
+                        os.replace(partial_path,
+                                   os.path.join(self.output_dir, output_name))
+                    else:
+                        output_name = None
+                    with self._active_lock:
+                        self.duplicates += 1
+                    FILES.inc(status="duplicate")
+                    self.ledger.record(name, signature, self.digest,
+                                       "duplicate", output=output_name)
+                    print(f"HotFolder: {name} duplicates {duplicate}")
+                    return
+            region, reduction, spec = self.load_plan
+            model.load_image(source_path, region=region, reduction=reduction)
+            if model.load_reduction > 1:
+                spec = dict(spec, scale=spec.get("scale", 1.0) *
+                            model.load_reduction)
+            apply_spec(model, spec)
+            model.save_edited_image(partial_path)
+            os.replace(partial_path, output_path)
+            if value is not None:
+                self.hashes.add(name, value, output_name)
+        except Exception as error:
+            # Don't leave a partly written output behind
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            with self._active_lock:
+                self.failed += 1
+                self.failures[name] = signature
+            FILES.inc(status="failed")
+            self.ledger.record(name, signature, self.digest, "failed",
+                               error=str(error))
+            print(f"HotFolder: Failed to process {name}: {error}")
+            return
+        with self._active_lock:
+            self.processed += 1
+        FILES.inc(status="done")
+        self.ledger.record(name, signature, self.digest, "done",
+                           output=output_name)
+        print(f"HotFolder: {name} -> {output_name}")
+
+    def find_duplicate(self, name, value):
+        """
+        Returns the output of the nearest earlier file whose hash is within
+        hash_distance of a file's hash, and whose output still exists.
+
+        Parameters
+        name (str): The file name in the input folder.
+        value (int): The file's dhash().
+
+        Returns
+        str: The output file name of the duplicated image, or None.
+        """
+        for match in self.hashes.find(value, self.hash_distance,
+                                      exclude=name):
+            output = match[2]
+            if output and os.path.exists(
+                    os.path.join(self.output_dir, output)):
+                return output
+        return None
+
+
+def parse_args():
+    """
+    Parses the command line options.
+
+    Returns
+    argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Edit images with a saved edit spec as they arrive in "
+                    "a folder")
+    parser.add_argument("input", help="folder to watch for new images")
+    parser.add_argument("output", help="folder to write edited images to")
+    parser.add_argument(
+        "--spec", required=True, metavar="FILE",
+        help="edit spec saved from the editor with Control-E")
+    parser.add_argument(
+        "--auto-crop", action="store_true",
+        help="crop uniform borders, such as scan margins, off each image "
+             "before the spec's edits")
+    parser.add_argument(
+        "--workers", type=int, default=None, metavar="N",
+        help="images to edit at once (default: CPU count)")
+    parser.add_argument(
+        "--queue", type=int, default=None, metavar="N",
+        help="most images waiting for a worker (default: 2 per worker)")
+    parser.add_argument(
+        "--settle", type=float, default=2.0, metavar="SECONDS",
+        help="time a file must be unchanged before it is processed "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--interval", type=float, default=1.0, metavar="SECONDS",
+        help="time between checks of the folder (default: %(default)s)")
+    parser.add_argument(
+        "--memory-limit", type=float, default=None, metavar="MB",
+        help="maximum memory, in megabytes, each worker's images may use")
+    parser.add_argument(
+        "--duplicates", choices=DUPLICATE_ACTIONS, default="process",
+        help="what to do with near-duplicates of images already processed: "
+             "edit them as usual, skip them or copy the earlier output "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--hash-distance", type=int, default=DEFAULT_DISTANCE, metavar="BITS",
+        help="most bits of the 64 bit perceptual hashes near-duplicates "
+             "may differ by (default: %(default)s)")
+    parser.add_argument(
+        "--reduced-decode", action="store_true",
+        help="decode JPEGs scaled down to half size or less at a reduced "
+             "size, which is much faster but not exactly the same")
+    parser.add_argument(
+        "--once", action="store_true",
+        help="process the images already in the folder, then exit")
+    Image_Metrics.add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = int(args.memory_limit * 1024 * 1024)
+    try:
+        spec = load_spec(args.spec)
+        if args.auto_crop:
+            spec["steps"] = [["auto_crop", None]] + spec.get("steps", [])
+        hot_folder = HotFolder(
+            args.input, args.output, spec,
+            workers=args.workers, queue_size=args.queue,
+            settle=args.settle, interval=args.interval,
+            memory_limit=memory_limit, duplicate_action=args.duplicates,
+            hash_distance=args.hash_distance,
+            reduced_decode=args.reduced_decode)
+    except (OSError, ValueError, sqlite3.Error) as error:
+        print(f"HotFolder: {error}")
+        sys.exit(2)
+    watching = "inotify" if inotify_simple is not None else "polling"
+    print(f"HotFolder: Watching {args.input} ({watching}), writing to "
+          f"{args.output}. Press Control-C to stop.")
+    backends.load_or_calibrate()
+    dumper = Image_Metrics.start_dumper(args)
+    try:
+        hot_folder.run(once=args.once)
+    except KeyboardInterrupt:
+        hot_folder.stop()
+    finally:
+        if dumper is not None:
+            hot_folder.update_metrics()
+            dumper.stop()
+    print(f"HotFolder: {hot_folder.processed} processed, "
+          f"{hot_folder.duplicates} duplicates, {hot_folder.failed} failed")
+    sys.exit(1 if hot_folder.failed else 0)
@@ -0,0 +1,497 @@
+# Image Journal
+# Autosaves the edit session so it can be restored if the application dies.
+# The ImageModel appends each edit, with its parameters and the tonal
+# adjustments and scale at the time, to a journal file. After an edit that
+# is slow to repeat, such as a filter on a large image, a snapshot of the
+# edited image is saved as a .npy file.
+# A session is restored by loading the source image again, memory-mapping
+# the latest snapshot in place of the edits before it, and replaying only
+# the edits made since. Mapping the snapshot means its pixels are read from
+# disk as they are used rather than all at once.
+#
+# All file writes happen in a background thread, so autosaving never blocks
+# the user interface. Edits are queued as small dictionaries, and snapshots
+# hold a reference to the edited image rather than a copy - the model
+# copies the image before changing it in place while it is being saved.
+#
+# Each running editor has its own session folder. A folder left behind by an
+# editor that is no longer running is offered for restore at startup, and
+# the folder is removed when the editor closes normally.
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# Name of the journal file in each session folder
+JOURNAL_NAME = "journal.jsonl"
+# Name of the file holding the process id of the session's editor
+SESSION_NAME = "session.json"
+
+
+def get_autosave_dir():
+    """
+    Returns the folder the session folders are kept in, following the XDG
+    base directory convention.
+
+    Returns
+    str: The autosave folder.
+    """
+    state_home = os.environ.get("XDG_STATE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_home, "hit137-image-editor", "autosave")
+
+
+def is_running(pid):
+    """
+    Returns True if a process is running. Only known on POSIX systems -
+    elsewhere other processes are assumed to have stopped.
+
+    Parameters
+    pid (int): The process id.
+
+    Returns
+    bool: True if the process is running.
+    """
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running as another user
+    return True
+
+
+def to_json(value):
+    """
+    Converts the NumPy values found in edit parameters for json.dumps().
+
+    Parameters
+    value: The value json can't convert itself.
+
+    Returns
+    The value as a Python number or list.
+    """
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Can't save {type(value).__name__} in the journal")
+
+
+def read_journal(directory):
+    """
+    Reads the entries of a session's journal. A last line that was only
+    partly written is ignored.
+
+    Parameters
+    directory (str): The session folder.
+
+    Returns
+    list: The journal entries, oldest first.
+    """
+    entries = []
+    try:
+        with open(os.path.join(directory, JOURNAL_NAME)) as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def find_abandoned_session(autosave_dir=None):
+    """
+    Finds the most recent session folder left behind by an editor that is
+    no longer running and has edits to restore.
+
+    Parameters
+    autosave_dir (str): The autosave folder, default get_autosave_dir().
+
+    Returns
+    str: The session folder, or None if there is none.
+    """
+    autosave_dir = autosave_dir or get_autosave_dir()
+    found = []
+    try:
+        entries = list(os.scandir(autosave_dir))
+    except FileNotFoundError:
+        return None
+    for entry in entries:
+        try:
+            with open(os.path.join(entry.path, SESSION_NAME)) as session_file:
+                pid = json.load(session_file)["pid"]
+            modified = os.stat(os.path.join(entry.path,
+                                            JOURNAL_NAME)).st_mtime
+        except (OSError, ValueError, KeyError):
+            continue
+        if not is_running(pid):
+            found.append((modified, entry.path))
+    for _, directory in sorted(found, reverse=True):
+        if any(entry["op"] == "load_image" for entry in
+               read_journal(directory) if "op" in entry):
+            return directory
+    return None
+
+
+def discard_session(directory):
+    """
+    Deletes a session folder.
+
+    Parameters
+    directory (str): The session folder.
+
+    Returns
+    None
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def restore_session(model, directory):
+    """
+    Restores an autosaved session into a model.
+
+    The source image is loaded, then the latest snapshot, if any, replaces
+    the edits made before it, and the edits made after it are replayed.
+    The model carries on autosaving into the restored session.
+
+    Parameters
+    model (ImageModel): The model to restore into.
+    directory (str): The session folder.
+
+    Returns
+    str: The path of the source image.
+
+    Raises
+    ValueError: If the session has no image to restore.
+    """
+    entries = read_journal(directory)
+    starts = [index for index, entry in enumerate(entries)
+              if entry.get("op") == "load_image"]
+    if not starts:
+        raise ValueError("The autosaved session has no image to restore")
+    entries = entries[starts[-1]:]
+    source_path = entries[0]["args"][0]
+    snapshot = None
+    for entry in entries:
+        if "snapshot" in entry and \
+                os.path.exists(os.path.join(directory, entry["snapshot"])):
+            snapshot = entry
+    journal = model.journal
+    model.journal = None  # Don't journal the replayed edits
+    try:
+        # Including the region and reduction, if only part was loaded
+        model.load_image(source_path, **entries[0]["kwargs"])
+        replay_from = 0
+        if snapshot is not None:
+            # Copy on write - pages are read from the file as they are used
+            image = np.load(os.path.join(directory, snapshot["snapshot"]),
+                            mmap_mode="c").view(np.ndarray)
+            model.restore_snapshot(image, snapshot["state"])
+            replay_from = snapshot["seq"]
+        # Settings are written when convenient, so may be out of order
+        latest = max((entry for entry in entries if "settings" in entry),
+                     key=lambda entry: entry["settings_version"])
+        for entry in entries[1:]:
+            if "op" not in entry or entry["seq"] <= replay_from:
+                continue
+            model.apply_settings(entry["settings"])
+            getattr(model, entry["op"])(*entry["args"], **entry["kwargs"])
+        model.apply_settings(latest["settings"])
+    finally:
+        model.journal = journal
+    if journal is not None:
+        journal.adopt(directory, max(entry.get("seq", 0)
+                                     for entry in entries))
+    return source_path
+
+
+class EditJournal:
+    """
+    A class to autosave the edits made to an image in a background thread.
+
+    Attributes
+    directory (str):
+        This session's folder.
+    snapshot_seconds (float):
+        Edits taking at least this long are followed by a snapshot.
+    seq (int):
+        Sequence number of the last edit recorded.
+
+    Methods
+    __init__(autosave_dir=None, snapshot_seconds=0.25):
+        Creates the session folder and starts the writer thread.
+    record(operation, args, kwargs, settings):
+        Queues an edit to be appended to the journal.
+    set_settings(settings):
+        Notes the current tonal adjustments and scale.
+    snapshot(image, state):
+        Queues a snapshot of the edited image to be saved.
+    is_saving(image):
+        Returns True if an image is waiting to be saved.
+    flush():
+        Waits until everything queued has been written.
+    adopt(directory, seq):
+        Carries on writing to a restored session's folder.
+    close(discard=True):
+        Stops the writer thread and, by default, deletes the session.
+    """
+
+    def __init__(self, autosave_dir=None, snapshot_seconds=0.25):
+        autosave_dir = autosave_dir or get_autosave_dir()
+        self.directory = os.path.join(autosave_dir, f"session-{os.getpid()}")
+        self.snapshot_seconds = snapshot_seconds
+        self.seq = 0
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, SESSION_NAME), "w") as \
+                session_file:
+            json.dump({"pid": os.getpid(), "started": time.time()},
+                      session_file)
+        self._file = open(os.path.join(self.directory, JOURNAL_NAME), "w")
+        self._queue = queue.Queue()
+        self._saving = []  # Images queued for snapshots
+        self._saving_lock = threading.Lock()
+        self._settings = None  # Latest settings, written when convenient
+        self._settings_version = 0  # Incremented when the settings change
+        self._settings_queued = False
+        self._writer = threading.Thread(target=self.write_entries,
+                                        name="journal-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, operation, args, kwargs, settings):
+        """
+        Queues an edit to be appended to the journal.
+
+        Parameters
+        operation (str): The name of the ImageModel method that made the
+            edit.
+        args (tuple): The method's positional arguments.
+        kwargs (dict): The method's keyword arguments.
+        settings (dict): The tonal adjustments and scale when the edit was
+            made, from ImageModel.get_settings().
+
+        Returns
+        None
+        """
+        self.seq += 1
+        self._queue.put(("entry", {
+            "seq": self.seq, "op": operation, "args": list(args),
+            "kwargs": kwargs, "settings": settings,
+            "settings_version": self._settings_version}))
+
+    def set_settings(self, settings):
+        """
+        Notes the current tonal adjustments and scale. Only the latest are
+        written, so moving a slider doesn't flood the journal.
+
+        Parameters
+        settings (dict): From ImageModel.get_settings().
+
+        Returns
+        None
+        """
+        self._settings_version += 1
+        self._settings = (self._settings_version, settings)
+        if not self._settings_queued:
+            self._settings_queued = True
+            self._queue.put(("settings", None))
+
+    def snapshot(self, image, state):
+        """
+        Queues a snapshot of the edited image to be saved. The image must
+        not be changed in place until is_saving() returns False.
+
+        Parameters
+        image (ndarray): The edited image.
+        state (dict): The model's geometry state, from
+            ImageModel.get_snapshot_state().
+
+        Returns
+        None
+        """
+        with self._saving_lock:
+            self._saving.append(image)
+        self._queue.put(("snapshot", (self.seq, image, state)))
+
+    def is_saving(self, image):
+        """
+        Returns True if an image is waiting to be saved as a snapshot.
+
+        Parameters
+        image (ndarray): The image.
+
+        Returns
+        bool: True if the image must not be changed in place.
+        """
+        with self._saving_lock:
+            return any(saving is image for saving in self._saving)
+
+    def flush(self):
+        """
+        Waits until everything queued has been written.
+
+        Returns
+        None
+        """
+        self._queue.join()
+
+    def adopt(self, directory, seq):
+        """
+        Carries on writing to a restored session's folder, which replaces
+        this session's own.
+
+        Parameters
+        directory (str): The restored session folder.
+        seq (int): The last sequence number in its journal.
+
+        Returns
+        None
+        """
+        self.flush()
+        self._file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(directory, self.directory)
+        with open(os.path.join(self.directory, SESSION_NAME), "w") as \
+                session_file:
+            json.dump({"pid": os.getpid(), "started": time.time()},
+                      session_file)
+        self.seq = seq
+        self._file = open(os.path.join(self.directory, JOURNAL_NAME), "a")
+
+    def close(self, discard=True):
+        """
+        Writes anything queued, stops the writer thread and, by default,
+        deletes the session as the editor has closed normally.
+
+        Parameters
+        discard (bool): Delete the session folder.
+
+        Returns
+        None
+        """
+        self._queue.put(("stop", None))
+        self._writer.join()
+        self._file.close()
+        if discard:
+            discard_session(self.directory)
+
+    def write_entries(self):
+        """
+        Writes queued entries and snapshots to disk. Runs in the writer
+        thread until close() is called.
+
+        Returns
+        None
+        """
+        while True:
+            kind, item = self._queue.get()
+            try:
+                if kind == "stop":
+                    return
+                if kind == "entry":
+                    if item["op"] == "load_image":
+                        self.start_journal()
+                    self.write_line(item)
+                elif kind == "settings":
+                    self._settings_queued = False
+                    version, settings = self._settings
+                    self.write_line({"settings": settings,
+                                     "settings_version": version})
+                else:
+                    self.write_snapshot(*item)
+                if self._queue.empty():
+                    # Make the batch durable before waiting for more
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            except OSError as error:
+                # Keep going - a full disk shouldn't stop the editor
+                print(f"EditJournal: Unable to autosave: {error}")
+            finally:
+                self._queue.task_done()
+
+    def write_line(self, entry):
+        """
+        Appends an entry to the journal file.
+
+        Parameters
+        entry (dict): The entry.
+
+        Returns
+        None
+        """
+        self._file.write(json.dumps(entry, default=to_json) + "\n")
+
+    def start_journal(self):
+        """
+        Empties the journal and deletes the snapshots when a new image is
+        loaded, as the earlier edits can no longer be restored.
+
+        Returns
+        None
+        """
+        self._file.close()
+        self._file = open(os.path.join(self.directory, JOURNAL_NAME), "w")
+        self.remove_snapshots()
+
+    def write_snapshot(self, seq, image, state):
+        """
+        Saves a snapshot, then records it in the journal and deletes the
+        older snapshots.
+
+        The file is written under a temporary name and renamed, so a
+        snapshot named in the journal is always complete.
+
+        Parameters
+        seq (int): Sequence number of the last edit the snapshot includes.
+        image (ndarray): The edited image.
+        state (dict): The model's geometry state.
+
+        Returns
+        None
+        """
+        name = f"snapshot-{seq}.npy"
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path + ".tmp", "wb") as snapshot_file:
+                np.save(snapshot_file, image)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            print(f"EditJournal: Unable to save snapshot: {error}")
+            return
+        finally:
+            with self._saving_lock:
+                self._saving = [saving for saving in self._saving
+                                if saving is not image]
+        # The edit the snapshot follows must be on disk before the snapshot
+        # entry, so flush the entries written so far first
+        self._file.flush()
+        self.write_line({"seq": seq, "snapshot": name, "state": state})
+        self.remove_snapshots(keep=name)
+
+    def remove_snapshots(self, keep=None):
+        """
+        Deletes the session's snapshot files.
+
+        Parameters
+        keep (str): The name of a snapshot to keep, or None.
+
+        Returns
+        None
+        """
+        for name in os.listdir(self.directory):
+            if name.startswith("snapshot-") and name != keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
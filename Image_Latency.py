@@ -0,0 +1,287 @@
+# Image Latency Monitor
+# Measures what the user actually notices: the time from an input event
+# (key press, slider move, mouse action) to the next time Tk has finished
+# redrawing, and how long the Tk mainloop stays blocked.
+# Input events are timestamped as they enter the Controller. When the handler
+# has finished, an idle callback is queued behind Tk's own redraw callbacks,
+# so when it runs the result of the input has been painted.
+# Mainloop stalls are found with a heartbeat timer - if the heartbeat runs
+# late, the mainloop was blocked for that long.
+
+import bisect
+import json
+import time
+import tkinter as tk
+from collections import deque
+
+
+class LatencyMonitor:
+    """
+    A class to measure input-to-paint latency and mainloop stalls.
+
+    Attributes
+    stall_threshold_ms (float):
+        Mainloop blocks longer than this are logged as stalls.
+    heartbeat_ms (int):
+        Interval of the heartbeat timer used to detect stalls.
+    samples (dict):
+        Recent input-to-paint latencies in milliseconds, keyed by input kind.
+    counts (dict):
+        Histogram bucket counts of all latencies, keyed by input kind.
+    stalls (deque):
+        Recent mainloop stalls as (time, duration_ms) tuples.
+    pending (list):
+        Inputs waiting to be painted as (kind, time) tuples.
+
+    Methods
+    __init__(stall_threshold_ms=100, heartbeat_ms=20, max_samples=10000):
+        Initializes the LatencyMonitor object.
+    start(root):
+        Starts the stall detector on the Tk mainloop.
+    mark_input(kind):
+        Records that an input event has arrived.
+    schedule_paint(root):
+        Queues a callback that runs once Tk has painted the result.
+    mark_paint():
+        Matches pending inputs to a completed paint.
+    percentiles(kind):
+        Returns the p50, p95 and p99 latencies for an input kind.
+    report():
+        Returns the latency statistics and stalls as a dict.
+    dump_json(path):
+        Writes the report to a JSON file.
+    """
+
+    # Upper bounds of the latency histogram buckets in milliseconds
+    BUCKETS_MS = (1, 2, 5, 10, 16, 25, 33, 50, 75, 100, 150, 250, 500,
+                  1000, 2500, 5000, float("inf"))
+
+    def __init__(self, stall_threshold_ms=100, heartbeat_ms=20,
+                 max_samples=10000):
+        self.stall_threshold_ms = stall_threshold_ms
+        self.heartbeat_ms = heartbeat_ms
+        self.max_samples = max_samples
+        self.samples = {}  # Recent latencies per input kind.
+        self.counts = {}  # Histogram bucket counts per input kind.
+        self.stalls = deque(maxlen=max_samples)  # Recent mainloop stalls.
+        self.pending = []  # Inputs not yet painted.
+        self.root = None
+        self._paint_scheduled = False
+        self._expected_beat = None
+        self._start_time = time.perf_counter()
+
+    def start(self, root):
+        """
+        Starts the stall detector on the Tk mainloop.
+
+        Parameters
+        root (tk.Tk): The main Tkinter window.
+
+        Returns
+        None
+        """
+        self.root = root
+        self._expected_beat = time.perf_counter() + self.heartbeat_ms / 1000
+        self.root.after(self.heartbeat_ms, self._heartbeat)
+
+    def _heartbeat(self):
+        # The heartbeat should run every heartbeat_ms. Any extra delay is
+        # time the mainloop could not respond.
+        now = time.perf_counter()
+        late_ms = (now - self._expected_beat) * 1000
+        if late_ms > self.stall_threshold_ms:
+            self.stalls.append((now - self._start_time, late_ms))
+            print(f"LatencyMonitor: mainloop stalled for {late_ms:.0f} ms")
+        self._expected_beat = now + self.heartbeat_ms / 1000
+        self.root.after(self.heartbeat_ms, self._heartbeat)
+
+    def mark_input(self, kind):
+        """
+        Records that an input event has arrived.
+
+        Should be called as soon as the event reaches the Controller.
+
+        Parameters
+        kind (str): The kind of input, e.g. "key", "slider" or "mouse".
+
+        Returns
+        None
+        """
+        self.pending.append((kind, time.perf_counter()))
+
+    def schedule_paint(self, root):
+        """
+        Queues a callback that runs once Tk has painted the result.
+
+        Should be called when the input handler has finished, so the
+        callback is queued behind the redraws the handler caused.
+
+        Parameters
+        root (tk.Tk): The main Tkinter window.
+
+        Returns
+        None
+        """
+        if not self._paint_scheduled:
+            self._paint_scheduled = True
+            root.after_idle(self.mark_paint)
+
+    def mark_paint(self):
+        """
+        Matches all pending inputs to a completed paint.
+
+        Returns
+        None
+        """
+        self._paint_scheduled = False
+        now = time.perf_counter()
+        for kind, input_time in self.pending:
+            self._add_sample(kind, (now - input_time) * 1000)
+        self.pending = []
+
+    def _add_sample(self, kind, latency_ms):
+        if kind not in self.samples:
+            self.samples[kind] = deque(maxlen=self.max_samples)
+            self.counts[kind] = [0] * len(self.BUCKETS_MS)
+        self.samples[kind].append(latency_ms)
+        bucket = bisect.bisect_left(self.BUCKETS_MS, latency_ms)
+        self.counts[kind][bucket] += 1
+
+    def percentiles(self, kind):
+        """
+        Returns the p50, p95 and p99 latencies for an input kind.
+
+        Parameters
+        kind (str): The kind of input, or None for all inputs.
+
+        Returns
+        dict: Latencies in milliseconds keyed by "p50", "p95" and "p99",
+        empty if there are no samples.
+        """
+        if kind is None:
+            values = [v for samples in self.samples.values() for v in samples]
+        else:
+            values = list(self.samples.get(kind, ()))
+        if not values:
+            return {}
+        values.sort()
+        result = {}
+        for percent in (50, 95, 99):
+            # Nearest rank percentile - the smallest value with at least
+            # percent of the values at or below it. Integer arithmetic keeps
+            # the rank exact.
+            rank = -(-percent * len(values) // 100)
+            result[f"p{percent}"] = round(values[max(rank, 1) - 1], 2)
+        return result
+
+    def report(self):
+        """
+        Returns the latency statistics and mainloop stalls.
+
+        Returns
+        dict: With "latency" statistics per input kind and "stalls".
+        """
+        latency = {}
+        for kind in sorted(self.samples):
+            latency[kind] = {
+                "count": sum(self.counts[kind]),
+                **self.percentiles(kind),
+                "histogram_ms": {
+                    str(bound): count for bound, count
+                    in zip(self.BUCKETS_MS, self.counts[kind]) if count},
+            }
+        if latency:
+            latency["all"] = {
+                "count": sum(sum(c) for c in self.counts.values()),
+                **self.percentiles(None)}
+        return {
+            "stall_threshold_ms": self.stall_threshold_ms,
+            "latency": latency,
+            "stalls": [{"at_s": round(at, 3), "duration_ms": round(ms, 1)}
+                       for at, ms in self.stalls],
+        }
+
+    def dump_json(self, path):
+        """
+        Writes the report to a JSON file.
+
+        Parameters
+        path (str): The path of the file to write.
+
+        Returns
+        None
+        """
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+class LatencyOverlay:
+    """
+    A small debug window showing the latest latency statistics.
+
+    Attributes
+    monitor (LatencyMonitor):
+        The monitor whose statistics are shown.
+    window (tk.Toplevel):
+        The overlay window, None when hidden.
+
+    Methods
+    __init__(root, monitor):
+        Initializes the LatencyOverlay object.
+    toggle():
+        Shows the overlay if hidden, hides it if shown.
+    refresh():
+        Updates the statistics shown.
+    """
+
+    REFRESH_MS = 500  # How often the overlay is refreshed
+
+    def __init__(self, root, monitor):
+        self.root = root
+        self.monitor = monitor
+        self.window = None
+        self.label = None
+
+    def toggle(self):
+        """
+        Shows the overlay if hidden, hides it if shown.
+
+        Returns
+        None
+        """
+        if self.window is not None:
+            self.window.destroy()
+            self.window = None
+            return
+        self.window = tk.Toplevel(self.root)
+        self.window.title("Latency")
+        self.window.attributes("-topmost", True)
+        self.window.protocol("WM_DELETE_WINDOW", self.toggle)
+        self.label = tk.Label(self.window, justify="left",
+                              font=("TkFixedFont", 9), anchor="nw")
+        self.label.pack(fill="both", expand=True, padx=6, pady=6)
+        self.refresh()
+
+    def refresh(self):
+        """
+        Updates the statistics shown, and schedules the next refresh.
+
+        Returns
+        None
+        """
+        if self.window is None:
+            return
+        report = self.monitor.report()
+        lines = ["input      n     p50    p95    p99 (ms)"]
+        for kind, stats in report["latency"].items():
+            lines.append(f"{kind:<8} {stats['count']:>5} "
+                         f"{stats.get('p50', 0):>7.1f}"
+                         f"{stats.get('p95', 0):>7.1f}"
+                         f"{stats.get('p99', 0):>7.1f}")
+        stalls = report["stalls"]
+        lines.append(f"stalls > {self.monitor.stall_threshold_ms} ms: "
+                     f"{len(stalls)}")
+        if stalls:
+            lines.append(f"last stall: {stalls[-1]['duration_ms']} ms")
+        self.label.config(text="\n".join(lines))
+        self.window.after(self.REFRESH_MS, self.refresh)
@@ -0,0 +1,170 @@
+# Image Loupe
+# A magnifier shown beside the cursor while a selection is dragged on the
+# original image, so crop edges can be placed on exact pixels when the image
+# is shown reduced.
+#
+# The loupe shows a small square of the full size image, each pixel drawn as
+# a block of screen pixels, centred on the pixel edge the selection corner
+# will be rounded to, which is marked with crosshairs. The pixels are read
+# straight from the full size image through a callback, so each update costs
+# the same however large the image is. A single PhotoImage is reused, its
+# pixels replaced with paste(), so no Tk images are made or freed while the
+# mouse moves.
+#
+# Only Pillow and Tk are used, so the loupe doesn't slow down starting up.
+
+import tkinter as tk
+
+from PIL import Image, ImageTk
+
+
+class Loupe:
+    """
+    A class to show a magnified square of the full size image beside the
+    cursor.
+
+    Attributes
+    canvas (tk.Canvas):
+        The canvas the loupe is drawn on.
+    source_size (int):
+        Side of the square of image pixels shown.
+    zoom (int):
+        Screen pixels along each side of an image pixel.
+    offset (int):
+        Distance from the cursor to the nearest corner of the loupe.
+    get_pixels (callable):
+        Called with the cursor's canvas x and y and source_size. Returns
+        (pixels, (image_x, image_y)) - an 8 bit RGB array source_size
+        square, centred on the pixel edge a selection corner there is
+        rounded to, and that edge in image coordinates - or None if there
+        is no image. Set by the Controller.
+    photo (ImageTk.PhotoImage):
+        The magnified pixels, reused for every update.
+    position (tuple):
+        The image coordinates of the pixels shown, or None when hidden.
+
+    Methods
+    __init__(canvas, source_size=64, zoom=3, offset=24):
+        Initializes the Loupe object.
+    show(x, y):
+        Shows the loupe for the cursor at a canvas position, or moves it.
+    hide():
+        Removes the loupe from the canvas.
+    get_placement(x, y):
+        Returns where the loupe is drawn for a cursor position.
+    create_items():
+        Creates the loupe's canvas items.
+    """
+
+    TAG = "loupe"  # Tag of all the loupe's canvas items
+    COLOUR = "red"  # Border, crosshairs and label, as the selection
+
+    def __init__(self, canvas, source_size=64, zoom=3, offset=24):
+        self.canvas = canvas
+        self.source_size = source_size
+        self.zoom = zoom
+        self.offset = offset
+        self.get_pixels = None
+        side = source_size * zoom
+        self.photo = ImageTk.PhotoImage("RGB", (side, side))
+        self.position = None
+        self._items = {}
+
+    def show(self, x, y):
+        """
+        Shows the loupe for the cursor at a canvas position, or moves it
+        there. The pixels are only read again when the image position
+        under the cursor changes.
+
+        Parameters
+        x (int): The cursor's x-coordinate on the canvas.
+        y (int): The cursor's y-coordinate on the canvas.
+
+        Returns
+        None
+        """
+        if self.get_pixels is None:
+            return
+        result = self.get_pixels(x, y, self.source_size)
+        if result is None:
+            self.hide()
+            return
+        pixels, position = result
+        side = self.source_size * self.zoom
+        if position != self.position:
+            magnified = Image.fromarray(pixels).resize(
+                (side, side), Image.Resampling.NEAREST)
+            self.photo.paste(magnified)
+            self.position = position
+        # The canvas is cleared when a new image is displayed
+        if not self.canvas.find_withtag(self.TAG):
+            self.create_items()
+        left, top = self.get_placement(x, y)
+        centre_x, centre_y = left + side // 2, top + side // 2
+        self.canvas.coords(self._items["image"], left, top)
+        self.canvas.coords(self._items["border"], left, top,
+                           left + side, top + side)
+        self.canvas.coords(self._items["across"], left, centre_y,
+                           left + side, centre_y)
+        self.canvas.coords(self._items["down"], centre_x, top,
+                           centre_x, top + side)
+        self.canvas.coords(self._items["label"], left + 3, top + side - 2)
+        self.canvas.itemconfigure(self._items["label"],
+                                  text=f"{position[0]}, {position[1]}")
+        self.canvas.tag_raise(self.TAG)
+
+    def hide(self):
+        """
+        Removes the loupe from the canvas.
+
+        Returns
+        None
+        """
+        self.canvas.delete(self.TAG)
+        self._items = {}
+        self.position = None
+
+    def get_placement(self, x, y):
+        """
+        Returns where the loupe is drawn for a cursor position - below and
+        to the right of the cursor, or on the other side where it would go
+        past the edge of the canvas.
+
+        Parameters
+        x (int): The cursor's x-coordinate on the canvas.
+        y (int): The cursor's y-coordinate on the canvas.
+
+        Returns
+        tuple: (left, top) of the loupe on the canvas.
+        """
+        side = self.source_size * self.zoom
+        width = int(self.canvas.cget("width"))
+        height = int(self.canvas.cget("height"))
+        left = x + self.offset
+        if left + side > width:
+            left = max(x - self.offset - side, 0)
+        top = y + self.offset
+        if top + side > height:
+            top = max(y - self.offset - side, 0)
+        return left, top
+
+    def create_items(self):
+        """
+        Creates the loupe's canvas items. They are placed by show().
+
+        Returns
+        None
+        """
+        self._items = {
+            "image": self.canvas.create_image(
+                0, 0, anchor=tk.NW, image=self.photo, tags=self.TAG),
+            "border": self.canvas.create_rectangle(
+                0, 0, 0, 0, outline=self.COLOUR, tags=self.TAG),
+            "across": self.canvas.create_line(
+                0, 0, 0, 0, fill=self.COLOUR, tags=self.TAG),
+            "down": self.canvas.create_line(
+                0, 0, 0, 0, fill=self.COLOUR, tags=self.TAG),
+            "label": self.canvas.create_text(
+                0, 0, anchor=tk.SW, fill=self.COLOUR, font=("TkFixedFont", 9),
+                tags=self.TAG),
+        }
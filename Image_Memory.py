@@ -0,0 +1,283 @@
+# Image Memory Accounting
+# The MemoryAccountant keeps a running total of the bytes held by each kind of
+# image buffer in the application (the loaded image, the edited image, display
+# proxies, caches and the PhotoImages held by the View).
+# It records the current and peak totals and enforces an optional ceiling.
+# When an operation would take the total past the ceiling the accountant first
+# asks its pressure handlers to free memory (drop caches, lower the proxy
+# resolution) and only refuses the operation if that is not enough.
+
+import threading
+
+
+class MemoryLimitError(Exception):
+    """
+    Raised when an operation would take memory use past the ceiling.
+
+    The message is suitable for showing directly to the user.
+    """
+
+
+class MemoryAccountant:
+    """
+    A class to track memory use per image buffer category.
+
+    Attributes
+    ceiling (int):
+        Maximum number of bytes that may be held, or None for no limit.
+    usage (dict):
+        Bytes currently held, keyed by buffer category.
+    peak (int):
+        Highest total number of bytes held at any one time.
+    pressure_handlers (list):
+        Callables invoked, in order, to free memory when the ceiling is hit.
+
+    Methods
+    __init__(ceiling=None):
+        Initializes the MemoryAccountant object.
+    set_ceiling(ceiling):
+        Sets the maximum number of bytes that may be held.
+    get_ceiling():
+        Gets the maximum number of bytes that may be held.
+    set_usage(category, nbytes):
+        Records the number of bytes held by a buffer category.
+    release(category):
+        Records that a buffer category no longer holds any memory.
+    get_usage(category):
+        Gets the number of bytes held by a buffer category.
+    get_current():
+        Gets the total number of bytes currently held.
+    get_peak():
+        Gets the highest total number of bytes held.
+    add_pressure_handler(handler):
+        Adds a callable that frees memory when the ceiling is reached.
+    relieve_pressure(needed):
+        Calls the pressure handlers until the needed bytes fit.
+    reserve(nbytes, replacing):
+        Checks that an allocation fits, freeing memory if required.
+    report():
+        Returns the current, peak and per-category totals as a dict.
+    nbytes_of(image):
+        Returns the number of bytes used by an image buffer.
+    """
+
+    def __init__(self, ceiling=None):
+        self.ceiling = ceiling  # Maximum bytes that may be held.
+        self.usage = {}  # Bytes held per buffer category.
+        self.peak = 0  # Highest total bytes held.
+        self.pressure_handlers = []  # Called in order to free memory.
+        self._lock = threading.Lock()
+
+    def set_ceiling(self, ceiling):
+        """
+        Sets the maximum number of bytes that may be held.
+
+        Parameters
+        ceiling (int): The ceiling in bytes, or None for no limit.
+
+        Returns
+        None
+        """
+        self.ceiling = ceiling
+
+    def get_ceiling(self):
+        """
+        Gets the maximum number of bytes that may be held.
+
+        Returns
+        int: The ceiling in bytes, or None if there is no limit.
+        """
+        return self.ceiling
+
+    def set_usage(self, category, nbytes):
+        """
+        Records the number of bytes held by a buffer category.
+
+        The new value replaces any previous value for the category.
+
+        Parameters
+        category (str): The buffer category, e.g. "image" or "edited_image".
+        nbytes (int): The number of bytes now held by the category.
+
+        Returns
+        None
+        """
+        with self._lock:
+            if nbytes:
+                self.usage[category] = int(nbytes)
+            else:
+                self.usage.pop(category, None)
+            total = sum(self.usage.values())
+            if total > self.peak:
+                self.peak = total
+
+    def release(self, category):
+        """
+        Records that a buffer category no longer holds any memory.
+
+        Parameters
+        category (str): The buffer category to release.
+
+        Returns
+        None
+        """
+        self.set_usage(category, 0)
+
+    def get_usage(self, category):
+        """
+        Gets the number of bytes held by a buffer category.
+
+        Parameters
+        category (str): The buffer category.
+
+        Returns
+        int: The number of bytes held, 0 if the category is not in use.
+        """
+        with self._lock:
+            return self.usage.get(category, 0)
+
+    def get_current(self):
+        """
+        Gets the total number of bytes currently held.
+
+        Returns
+        int: The total number of bytes held across all categories.
+        """
+        with self._lock:
+            return sum(self.usage.values())
+
+    def get_peak(self):
+        """
+        Gets the highest total number of bytes held at any one time.
+
+        Returns
+        int: The peak total in bytes.
+        """
+        return self.peak
+
+    def add_pressure_handler(self, handler):
+        """
+        Adds a callable that frees memory when the ceiling is reached.
+
+        Handlers are called in the order they were added, so cheap and
+        invisible measures (dropping caches) should be added before ones the
+        user will notice (lowering the display resolution).
+
+        Parameters
+        handler (callable): Called with no arguments. It should release
+            memory and update the accountant with set_usage().
+
+        Returns
+        None
+        """
+        self.pressure_handlers.append(handler)
+
+    def _fits(self, nbytes, replacing):
+        # Projected total if nbytes are allocated and the replaced categories
+        # are freed.
+        with self._lock:
+            freed = sum(self.usage.get(c, 0) for c in replacing)
+            projected = sum(self.usage.values()) - freed + nbytes
+        return projected <= self.ceiling, projected
+
+    def relieve_pressure(self, needed=0, replacing=()):
+        """
+        Calls the pressure handlers until the needed bytes fit.
+
+        Parameters
+        needed (int): The number of bytes about to be allocated.
+        replacing (tuple): Categories that the allocation will replace.
+
+        Returns
+        bool: True if the allocation now fits under the ceiling.
+        """
+        if self.ceiling is None:
+            return True
+        for handler in self.pressure_handlers:
+            if self._fits(needed, replacing)[0]:
+                return True
+            handler()
+        return self._fits(needed, replacing)[0]
+
+    def reserve(self, nbytes, replacing=()):
+        """
+        Checks that an allocation fits, freeing memory if required.
+
+        This should be called before a large buffer is created. Nothing is
+        recorded - the caller records the buffer with set_usage() once it
+        exists.
+
+        Parameters
+        nbytes (int): The number of bytes about to be allocated.
+        replacing (tuple): Categories whose memory is freed by the allocation,
+            e.g. ("edited_image",) when the edited image is replaced.
+
+        Returns
+        None
+
+        Raises
+        MemoryLimitError: If the allocation does not fit even after the
+            pressure handlers have run.
+        """
+        if self.ceiling is None:
+            return
+        if self.relieve_pressure(nbytes, replacing):
+            return
+        projected = self._fits(nbytes, replacing)[1]
+        raise MemoryLimitError(
+            f"This operation needs {format_bytes(nbytes)} but would take "
+            f"memory use to {format_bytes(projected)}, over the "
+            f"{format_bytes(self.ceiling)} limit.")
+
+    def report(self):
+        """
+        Returns the current, peak and per-category totals.
+
+        Returns
+        dict: With keys "current", "peak", "ceiling" and "usage".
+        """
+        with self._lock:
+            return {
+                "current": sum(self.usage.values()),
+                "peak": self.peak,
+                "ceiling": self.ceiling,
+                "usage": dict(self.usage),
+            }
+
+    @staticmethod
+    def nbytes_of(image):
+        """
+        Returns the number of bytes used by an image buffer.
+
+        Works for numpy arrays, PIL images and tkinter PhotoImages. Tk stores
+        photo images as 32 bit RGBA so they are counted at 4 bytes per pixel.
+
+        Parameters
+        image: The image buffer, or None.
+
+        Returns
+        int: The number of bytes used by the buffer, 0 for None.
+        """
+        if image is None:
+            return 0
+        if hasattr(image, "nbytes"):  # numpy array
+            return int(image.nbytes)
+        if hasattr(image, "getbands"):  # PIL image
+            width, height = image.size
+            return width * height * len(image.getbands())
+        if callable(getattr(image, "width", None)):  # PhotoImage
+            return image.width() * image.height() * 4
+        return 0
+
+
+def format_bytes(nbytes):
+    """
+    Formats a number of bytes for display, e.g. "12.5 MB".
+
+    Parameters
+    nbytes (int): The number of bytes.
+
+    Returns
+    str: The formatted size.
+    """
+    return f"{nbytes / (1024 * 1024):.1f} MB"
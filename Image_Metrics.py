@@ -0,0 +1,639 @@
+# Image Metrics
+# Counters, gauges and histograms for watching long headless runs, such as
+# the hot folder or a frame export, with local tooling: images processed,
+# bytes read and written, the time taken by each ImageModel operation, queue
+# depths, cache hit rates and peak resident memory (RSS).
+# Metrics are disabled by default, in which case recording a value costs a
+# single attribute check. When enabled, a MetricsDumper writes them every few
+# seconds to a Prometheus text-format file, which node_exporter's textfile
+# collector can read, and/or appends them to a JSON lines file.
+#
+# Usage:
+#   python Image_HotFolder.py scans/ edited/ --spec edits.json \
+#       --metrics hotfolder.prom --metrics-json hotfolder.jsonl
+
+import bisect
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+# Upper bounds of the duration histogram buckets in seconds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+
+class Metric:
+    """
+    The base class of counters, gauges and histograms.
+
+    Each metric holds one value for each combination of label values it is
+    recorded with, e.g. one latency histogram per operation name.
+
+    Attributes
+    registry (MetricsRegistry):
+        The registry the metric belongs to.
+    name (str):
+        The metric name, e.g. "image_loads_total".
+    help (str):
+        A description of the metric.
+    values (dict):
+        The value for each label combination, keyed by a tuple of sorted
+        (label, value) pairs.
+
+    Methods
+    snapshot():
+        Returns a copy of the values.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def snapshot(self):
+        """
+        Returns a copy of the values, safe to read while they are recorded.
+
+        Returns
+        dict: The value for each label combination.
+        """
+        with self.registry._lock:
+            return {labels: self.copy_value(value)
+                    for labels, value in self.values.items()}
+
+    @staticmethod
+    def copy_value(value):
+        # Values are numbers, so need no copying
+        return value
+
+
+class Counter(Metric):
+    """
+    A metric that only goes up, such as the number of images processed.
+
+    Methods
+    inc(amount=1, **labels):
+        Adds to the count.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        Adds to the count.
+
+        Parameters
+        amount (float): The amount to add.
+        **labels: The label values, e.g. status="done".
+
+        Returns
+        None
+        """
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.registry._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A metric that goes up and down, such as the length of a queue.
+
+    Methods
+    set(value, **labels):
+        Sets the value.
+    """
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        """
+        Sets the value.
+
+        Parameters
+        value (float): The new value.
+        **labels: The label values.
+
+        Returns
+        None
+        """
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.registry._lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """
+    A metric counting values into buckets, such as operation durations.
+
+    Each value is kept as [bucket counts, sum, count]. Bucket counts are not
+    cumulative until they are exported.
+
+    Attributes
+    buckets (tuple):
+        The upper bound of each bucket, ending with infinity.
+
+    Methods
+    observe(value, **labels):
+        Records a value.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, buckets=DURATION_BUCKETS):
+        super().__init__(registry, name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Records a value.
+
+        Parameters
+        value (float): The value, e.g. a duration in seconds.
+        **labels: The label values, e.g. operation="crop_image".
+
+        Returns
+        None
+        """
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @staticmethod
+    def copy_value(value):
+        # Copy the bucket counts, which are updated in place
+        return [list(value[0]), value[1], value[2]]
+
+
+class MetricsRegistry:
+    """
+    A class to hold the application's metrics and export them.
+
+    Attributes
+    enabled (bool):
+        Whether values are recorded.
+    metrics (dict):
+        The metrics by name, in the order they were created.
+    collectors (list):
+        Functions called before each export to update gauges, e.g. with
+        the current memory use.
+
+    Methods
+    __init__():
+        Initializes the MetricsRegistry object.
+    enable():
+        Starts recording values.
+    disable():
+        Stops recording values.
+    counter(name, help):
+        Returns the counter with a name, creating it if needed.
+    gauge(name, help):
+        Returns the gauge with a name, creating it if needed.
+    histogram(name, help, buckets=DURATION_BUCKETS):
+        Returns the histogram with a name, creating it if needed.
+    add_collector(collector):
+        Adds a function to call before each export.
+    collect():
+        Calls the collectors.
+    to_prometheus():
+        Returns the metrics in Prometheus text format.
+    to_json():
+        Returns the metrics as a dict.
+    write_prometheus(path):
+        Replaces a file with the metrics in Prometheus text format.
+    append_json(path):
+        Appends the metrics to a JSON lines file.
+    """
+
+    def __init__(self):
+        self.enabled = False  # Values are only recorded when enabled.
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+
+    def enable(self):
+        """
+        Starts recording values.
+
+        Returns
+        None
+        """
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stops recording values.
+
+        Returns
+        None
+        """
+        self.enabled = False
+
+    def _get(self, kind, name, help, **options):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = kind(self, name, help,
+                                                   **options)
+        if not isinstance(metric, kind):
+            raise ValueError(f"Metric {name} is a {metric.kind}")
+        return metric
+
+    def counter(self, name, help):
+        """
+        Returns the counter with a name, creating it if needed.
+
+        Parameters
+        name (str): The metric name, ending in "_total".
+        help (str): A description of the metric.
+
+        Returns
+        Counter: The counter.
+        """
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help):
+        """
+        Returns the gauge with a name, creating it if needed.
+
+        Parameters
+        name (str): The metric name.
+        help (str): A description of the metric.
+
+        Returns
+        Gauge: The gauge.
+        """
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help, buckets=DURATION_BUCKETS):
+        """
+        Returns the histogram with a name, creating it if needed.
+
+        Parameters
+        name (str): The metric name, e.g. ending in "_seconds".
+        help (str): A description of the metric.
+        buckets (tuple): The upper bound of each bucket, ending with
+            infinity.
+
+        Returns
+        Histogram: The histogram.
+        """
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def add_collector(self, collector):
+        """
+        Adds a function to call before each export.
+
+        Parameters
+        collector (callable): Called with no arguments, e.g. to set gauges.
+
+        Returns
+        None
+        """
+        self.collectors.append(collector)
+
+    def collect(self):
+        """
+        Calls the collectors, so gauges they set are up to date.
+
+        Returns
+        None
+        """
+        for collector in list(self.collectors):
+            collector()
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        """
+        Formats label values for the Prometheus text format.
+
+        Parameters
+        labels (tuple): (label, value) pairs.
+        extra (tuple): More (label, value) pairs, e.g. a bucket's "le".
+
+        Returns
+        str: e.g. '{operation="crop_image"}', or "" with no labels.
+        """
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        text = ",".join(
+            f'{label}="' + str(value).replace("\\", "\\\\")
+            .replace('"', '\\"').replace("\n", "\\n") + '"'
+            for label, value in pairs)
+        return "{" + text + "}"
+
+    @staticmethod
+    def format_value(value):
+        """
+        Formats a number for the Prometheus text format.
+
+        Parameters
+        value (float): The number.
+
+        Returns
+        str: The number, with infinity written as "+Inf".
+        """
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in Prometheus text format.
+
+        Returns
+        str: The exposition text.
+        """
+        self.collect()
+        lines = []
+        for metric in list(self.metrics.values()):
+            values = metric.snapshot()
+            if not values:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in sorted(values.items()):
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}"
+                                 f"{self.format_labels(labels)} "
+                                 f"{self.format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets, counts):
+                    cumulative += bucket_count
+                    le = (("le", self.format_value(bound)),)
+                    lines.append(f"{metric.name}_bucket"
+                                 f"{self.format_labels(labels, le)} "
+                                 f"{cumulative}")
+                lines.append(f"{metric.name}_sum"
+                             f"{self.format_labels(labels)} "
+                             f"{self.format_value(total)}")
+                lines.append(f"{metric.name}_count"
+                             f"{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        """
+        Returns the metrics as a dict, for the JSON lines file.
+
+        Histograms are given as their count, sum and bucket counts, with
+        the bucket upper bounds.
+
+        Returns
+        dict: The time, uptime and each metric's values.
+        """
+        self.collect()
+        result = {"time": time.time(),
+                  "uptime": time.time() - self._start_time,
+                  "metrics": {}}
+        for metric in list(self.metrics.values()):
+            values = metric.snapshot()
+            if not values:
+                continue
+            entries = []
+            for labels, value in sorted(values.items()):
+                entry = {"labels": dict(labels)}
+                if metric.kind == "histogram":
+                    entry.update(count=value[2], sum=value[1],
+                                 buckets=value[0])
+                else:
+                    entry["value"] = value
+                entries.append(entry)
+            description = {"type": metric.kind, "values": entries}
+            if metric.kind == "histogram":
+                description["bounds"] = [
+                    None if bound == math.inf else bound
+                    for bound in metric.buckets]
+            result["metrics"][metric.name] = description
+        return result
+
+    def write_prometheus(self, path):
+        """
+        Replaces a file with the metrics in Prometheus text format.
+
+        The file is written under a temporary name and renamed, so a reader
+        never sees it partly written.
+
+        Parameters
+        path (str): The file to write.
+
+        Returns
+        None
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+    def append_json(self, path):
+        """
+        Appends the metrics to a JSON lines file, one line per call.
+
+        Parameters
+        path (str): The file to append to.
+
+        Returns
+        None
+        """
+        with open(path, "a") as metrics_file:
+            metrics_file.write(json.dumps(self.to_json()) + "\n")
+
+
+class MetricsDumper:
+    """
+    A class to write the metrics to files every few seconds in a background
+    thread.
+
+    Attributes
+    registry (MetricsRegistry):
+        The metrics to write.
+    prometheus_path (str):
+        The Prometheus text-format file, or None.
+    json_path (str):
+        The JSON lines file, or None.
+    interval (float):
+        Seconds between writes.
+
+    Methods
+    __init__(registry, prometheus_path=None, json_path=None, interval=10.0):
+        Initializes the MetricsDumper object.
+    start():
+        Enables the registry and starts writing.
+    stop():
+        Stops writing, after writing the final values.
+    dump():
+        Writes the metrics once.
+    """
+
+    def __init__(self, registry, prometheus_path=None, json_path=None,
+                 interval=10.0):
+        self.registry = registry
+        self.prometheus_path = prometheus_path
+        self.json_path = json_path
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Enables the registry and starts writing the metrics.
+
+        Returns
+        None
+        """
+        self.registry.enable()
+        self._thread = threading.Thread(target=self.run, name="metrics",
+                                        daemon=True)
+        self._thread.start()
+
+    def run(self):
+        # Write the metrics every interval until stopped
+        while not self._stopping.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        """
+        Stops writing, after writing the final values.
+
+        Returns
+        None
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.dump()
+
+    def dump(self):
+        """
+        Writes the metrics once. A failed write is reported and the next
+        one tried as usual, so a full disk doesn't stop the job.
+
+        Returns
+        None
+        """
+        try:
+            if self.prometheus_path:
+                self.registry.write_prometheus(self.prometheus_path)
+            if self.json_path:
+                self.registry.append_json(self.json_path)
+        except OSError as error:
+            print(f"MetricsDumper: Unable to write metrics: {error}",
+                  file=sys.stderr)
+
+
+def get_resident_memory():
+    """
+    Returns the process's current resident memory (RSS).
+
+    Returns
+    int: Bytes resident, or 0 where /proc/self/statm is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def get_peak_resident_memory():
+    """
+    Returns the process's peak resident memory (RSS) since it started.
+
+    Returns
+    int: Bytes, or 0 where the resource module is not available.
+    """
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def add_arguments(parser):
+    """
+    Adds the options for writing metrics to a command line parser.
+
+    Parameters
+    parser (argparse.ArgumentParser): The parser.
+
+    Returns
+    None
+    """
+    parser.add_argument(
+        "--metrics", default=None, metavar="FILE",
+        help="write throughput, latency and memory metrics to FILE in "
+             "Prometheus text format")
+    parser.add_argument(
+        "--metrics-json", default=None, metavar="FILE",
+        help="append the metrics to FILE as JSON lines")
+    parser.add_argument(
+        "--metrics-interval", type=float, default=10.0, metavar="SECONDS",
+        help="time between metrics writes (default: %(default)s)")
+
+
+def start_dumper(args):
+    """
+    Starts writing the shared metrics if the command line asked for them.
+
+    Parameters
+    args (argparse.Namespace): Options added by add_arguments().
+
+    Returns
+    MetricsDumper: The started dumper, or None if no file was given.
+    """
+    if not args.metrics and not args.metrics_json:
+        return None
+    dumper = MetricsDumper(metrics, args.metrics, args.metrics_json,
+                           interval=args.metrics_interval)
+    dumper.start()
+    return dumper
+
+
+# The metrics shared by the whole application
+metrics = MetricsRegistry()
+
+# Metrics recorded by more than one module
+OPERATION_SECONDS = metrics.histogram(
+    "image_operation_duration_seconds",
+    "Time taken by each traced ImageModel, View and Controller operation")
+CACHE_REQUESTS = metrics.counter(
+    "image_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)")
+RESIDENT_BYTES = metrics.gauge(
+    "process_resident_memory_bytes", "Resident memory (RSS)")
+PEAK_RESIDENT_BYTES = metrics.gauge(
+    "process_peak_resident_memory_bytes", "Peak resident memory (RSS)")
+
+
+def collect_process_memory():
+    # Collector for the process memory gauges
+    RESIDENT_BYTES.set(get_resident_memory())
+    PEAK_RESIDENT_BYTES.set(get_peak_resident_memory())
+
+
+metrics.add_collector(collect_process_memory)
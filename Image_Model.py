@@ -6,9 +6,24 @@
 # can update itself accordingly.
 
 import os
+import time
 import cv2  # OpenCV library
 import numpy as np
 from PIL import Image, ImageTk
+from Image_Backends import backends
+from Image_Decode import clip_region, copy_region, read_region
+from Image_Memory import MemoryAccountant
+from Image_Metrics import CACHE_REQUESTS, metrics
+from Image_Trace import traced, tracer
+from Image_Filters import StripFilterEngine
+
+# Throughput metrics, recorded when metrics are enabled (see Image_Metrics)
+IMAGES_READ = metrics.counter("image_reads_total", "Images loaded")
+BYTES_READ = metrics.counter("image_read_bytes_total",
+                             "Bytes of image files loaded")
+IMAGES_WRITTEN = metrics.counter("image_writes_total", "Edited images saved")
+BYTES_WRITTEN = metrics.counter("image_written_bytes_total",
+                                "Bytes of edited image files saved")
 
 
 class ImageModel:
@@ -22,6 +37,8 @@ class ImageModel:
         Directory of the image file.
     image (OpenCV image): 
         The image object loaded from a file.
+    load_reduction (int):
+        Size the image was reduced by when it was decoded, 1 for full size.
     original_image (OpenCV image):
         The original image object.
     edited_image (OpenCV image):
@@ -38,6 +55,49 @@ class ImageModel:
         Angle for rotating the image.
     scale_factor (float): 
         Factor for scaling the image
+    proxy_max_size (int):
+        Longest side, in pixels, of the reduced images used for display.
+    display_scale (float):
+        Scale of the displayed original image relative to the full image.
+    display_cache (dict):
+        Cached display proxies, dropped when memory runs short.
+    memory (MemoryAccountant):
+        Tracks the memory held by image buffers and enforces the ceiling.
+    edit_version (int):
+        Incremented each time the pixels of the edited image change.
+    pixel_version (int):
+        Incremented each time the pixel values change. Unlike edit_version
+        it is not changed by 90 degree rotations, which only move pixels.
+    histogram_cache (tuple):
+        The pixel_version and histograms of the display proxy.
+    edit_transform (ndarray):
+        2x3 affine matrix mapping full size image coordinates to edited
+        image coordinates, kept up to date by crops and rotations.
+    edit_steps (list):
+        The crop, rotations and whole image filters made since the image
+        was loaded or reset, in order, as ("crop", (x0, y0, x1, y1)),
+        ("auto_crop", (x0, y0, x1, y1)), ("rotate", angle) and
+        ("filter", (name, params)).
+    undo_history (list):
+        (x, y, patch) tuples holding the pixels overwritten by each
+        selection edit, most recent last.
+    journal (EditJournal):
+        Autosaves the edits so the session can be restored, or None.
+    brightness (int):
+        Brightness offset, -100 to 100.
+    contrast (float):
+        Contrast factor, 1.0 for no change.
+    gamma (float):
+        Gamma correction, 1.0 for no change.
+    black_point (int):
+        Input level mapped to black by the levels adjustment.
+    white_point (int):
+        Input level mapped to white by the levels adjustment.
+    filter_engine (StripFilterEngine):
+        Runs the convolution filters on strips of the image in parallel.
+    process_executor (ProcessImageExecutor):
+        If set, large images are filtered in worker processes instead,
+        sharing the pixels through shared memory.
 
     Methods
     __init__():
@@ -48,8 +108,8 @@ class ImageModel:
         Gets the path to the image file.
     get_image_dir():
         Gets the directory of the image file.
-    load_image(image_path):
-        Loads an image from the given path using OpenCV.
+    load_image(image_path, region=None, reduction=1):
+        Loads an image, or a region of it, from the given path using OpenCV.
     get_image():
         Returns the image object.
     get_tk_photoimage():
@@ -65,14 +125,82 @@ class ImageModel:
     crop_image(x, y, width, height):
         Crops the image.
         Returns the cropped image.
+    find_content_bounds(tolerance=AUTO_CROP_TOLERANCE):
+        Finds the content inside a uniform border.
+    auto_crop(tolerance=AUTO_CROP_TOLERANCE):
+        Crops away a uniform border.
     rotate_image(angle):
         Rotates the image.
+    get_original_proxy():
+        Returns the reduced copy of the loaded image used for display.
+    view_to_image_coords(start_x, start_y, end_x, end_y):
+        Converts a selection on the displayed image to image coordinates.
+    get_loupe_pixels(view_x, view_y, size):
+        Returns the full size pixels around a point of the displayed image.
+    drop_caches():
+        Frees the cached display proxies.
+    lower_proxy_resolution():
+        Halves the resolution of the display proxies to save memory.
+    edited_image_changed():
+        Records that the pixels of the edited image have changed.
+    set_brightness(brightness), set_contrast(contrast), set_gamma(gamma),
+    set_levels(black_point, white_point):
+        Set the tonal adjustments.
+    get_tone_lut(dtype=np.uint8):
+        Returns the lookup table combining all the tonal adjustments.
+    apply_tone(image):
+        Applies the tonal adjustments to an image.
+    apply_lut(image, lut):
+        Maps the levels of an image through a lookup table, keeping alpha.
+    to_native_image(image, orientation=1):
+        Prepares an image decoded at its own bit depth for editing.
+    to_8bit(image):
+        Converts an image to 8 bit for display.
+    get_edited_scaled_image():
+        Returns the adjusted and scaled edited image at its own bit depth.
+    get_histogram(base_histograms=None):
+        Returns histograms and statistics of the edited image.
+    calculate_histograms(image):
+        Calculates a 256 bin histogram for each channel of an image.
+    image_to_edited_coords(start_x, start_y, end_x, end_y):
+        Converts a rectangle in the full size image to the edited image.
+    apply_filter(name, region=None, **params):
+        Applies a filter to the whole edited image or a region of it.
+    apply_tone_to_region(region):
+        Applies the tonal adjustments to a region of the edited image.
+    undo():
+        Undoes the most recent selection edit.
+    record_edit(operation, *args, cost=0.0, **kwargs):
+        Autosaves an edit to the journal, with a snapshot if it was slow.
+    get_settings(), apply_settings(settings):
+        Get and set the tonal adjustments and scale together.
+    restore_snapshot(image, state):
+        Replaces the edited image with an autosaved snapshot.
     """
 
-    def __init__(self):
+    # Display proxy limits - longest side in pixels
+    DEFAULT_PROXY_MAX_SIZE = 1024
+    MIN_PROXY_MAX_SIZE = 256
+    # Number of selection edits that can be undone
+    MAX_UNDO_STEPS = 20
+    # File types loaded as video - the first frame is edited
+    VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+    # File types that can be saved with 16 bit channels or alpha
+    SIXTEEN_BIT_EXTENSIONS = (".png", ".tif", ".tiff")
+    ALPHA_EXTENSIONS = (".png", ".tif", ".tiff", ".webp")
+    # Auto crop - how far, in 8 bit levels, a pixel must differ from the
+    # border colour to count as content, and the fraction of a row or
+    # column that must be content, so specks of dust are ignored
+    AUTO_CROP_TOLERANCE = 24
+    AUTO_CROP_MIN_FRACTION = 0.005
+    # Grey shown by the loupe beyond the edges of the image
+    LOUPE_BACKGROUND = 128
+
+    def __init__(self, memory_limit=None):
         self.image_path = None  # Path to the image file.
         self.image_dir = "/"  # Directory of the image file - default is root.
         self.image = None  # The image object - an OpenCV image.
+        self.load_reduction = 1  # Size the image was reduced by on decoding
         self.original_image = None  # The original image object.
         self.edited_image = None  # The edited image object.
         self.edited_image_dir = self.image_dir  # Edited image directory.
@@ -81,6 +209,35 @@ class ImageModel:
         self.crop_coords = None  # Coordinates for cropping the image.
         self.rotation_angle = 0  # Angle for rotating the image.
         self.scale_factor = 1.0  # Factor for scaling the image
+        # Longest side of the reduced images shown in the View
+        self.proxy_max_size = self.DEFAULT_PROXY_MAX_SIZE
+        self.display_scale = 1.0  # Displayed size / full image size
+        self.display_cache = {}  # Cached display proxies
+        # Memory accounting - caches are dropped before the proxy resolution
+        # is lowered when the memory limit is reached.
+        self.memory = MemoryAccountant(memory_limit)
+        self.memory.add_pressure_handler(self.drop_caches)
+        self.memory.add_pressure_handler(self.lower_proxy_resolution)
+        self.edit_version = 0  # Incremented when the edited pixels change
+        # Incremented when the pixel values change, not when they only move
+        self.pixel_version = 0
+        self.histogram_cache = None  # (pixel_version, histograms) of proxy
+        # Tonal adjustments - applied through a single lookup table
+        self.brightness = 0
+        self.contrast = 1.0
+        self.gamma = 1.0
+        self.black_point = 0
+        self.white_point = 255
+        self.tone_lut = {}  # Cached combined lookup tables, by bit depth
+        self.tone_lut_key = None  # Adjustments the cached tables were made for
+        # Runs filters on strips of large images in parallel
+        self.filter_engine = StripFilterEngine()
+        self.process_executor = None  # Filters in worker processes if set
+        # Full size image coordinates to edited image coordinates
+        self.edit_transform = np.float64([[1, 0, 0], [0, 1, 0]])
+        self.undo_history = []  # Pixels overwritten by selection edits
+        self.journal = None  # Autosaves the edits if set
+        self.edit_steps = []  # Crop, rotations and filters, in order
 
     def get_image_path(self):
         """
@@ -131,21 +288,230 @@ class ImageModel:
     def set_edited_image_name(self, name):
         self.edited_image_name = name
 
-    def load_image(self, image_path):
+    @traced(output="edited_image")
+    def load_image(self, image_path, region=None, reduction=1):
         """
         Loads an image from the given path.
 
+        When the edits to come are known, e.g. in a batch, only the region
+        about to be cropped need be loaded, and the image can be decoded
+        reduced in size when it is about to be scaled down. As little of
+        the file is decoded as its format allows (see Image_Decode). The
+        region is then edited as if it were the whole image.
+
         Parameters
         image_path (str): The path to the image file.
+        region (tuple): (start_x, start_y, end_x, end_y) of the region to
+            load, limited to the image, or None to load the whole image.
+        reduction (int): Most the image may be reduced in size by, 1, 2, 4
+            or 8. Only JPEGs are decoded reduced, and the reduction made is
+            kept in load_reduction. The region is divided by it.
 
         Returns
         ImageTk.PhotoImage: The loaded image object.
+
+        Raises
+        ValueError: If the image can't be read, or the region lies outside
+            it.
         """
         # Load image logic
+        # Check the decoded image and its edited copy will fit in memory. The
+        # current images are replaced, so their memory does not count.
+        self.memory.reserve(
+            2 * self.estimate_image_bytes(image_path, region, reduction),
+            replacing=("image", "edited_image", "cache"))
         # Set edited image path to loaded image path by default
         self.set_edited_image_dir(os.path.dirname(image_path))
-        self.image = cv2.imread(image_path)
+        self.drop_caches()
+        # Keep the image's own channels and bit depth - greyscale is not
+        # expanded to 3 channels, 16 bit is not truncated, alpha is kept
+        orientation = self.get_exif_orientation(image_path)
+        self.load_reduction = 1
+        with tracer.span("cv2.imread", path=image_path):
+            if os.path.splitext(image_path)[1].lower() in \
+                    self.VIDEO_EXTENSIONS:
+                image = self.read_first_frame(image_path)
+                if image is not None and region is not None:
+                    height, width = image.shape[:2]
+                    image = copy_region(image,
+                                        clip_region(region, width, height))
+            # Oriented images go through read_region(), which decodes TIFFs
+            # without the decoder's own orientation
+            elif region is None and reduction == 1 and orientation == 1:
+                image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+            else:
+                image, self.load_reduction = read_region(
+                    image_path, region, orientation, reduction)
+        if image is None:
+            raise ValueError(f"Unable to read image: {image_path}")
+        self.image = self.to_native_image(image, orientation)
+        image = None
         self.edited_image = self.image.copy()
+        self.memory.set_usage("image", self.image.nbytes)
+        self.edited_image_changed()
+        self.edit_transform = np.float64([[1, 0, 0], [0, 1, 0]])
+        self.edit_steps = []
+        self.clear_undo()
+        self.update_display_scale()
+        # Only a region or reduction is journaled, so the journal entries of
+        # whole images stay the same
+        load_args = {}
+        if region is not None:
+            load_args["region"] = [int(value) for value in region]
+        if reduction != 1:
+            load_args["reduction"] = reduction
+        self.record_edit("load_image", image_path, **load_args)
+        if metrics.enabled:
+            IMAGES_READ.inc()
+            BYTES_READ.inc(os.path.getsize(image_path))
+
+    def estimate_image_bytes(self, image_path, region=None, reduction=1):
+        """
+        Estimates the memory needed to hold an image file once decoded.
+
+        Only the file header is read, so this is cheap even for large files.
+
+        Parameters
+        image_path (str): The path to the image file.
+        region (tuple): (start_x, start_y, end_x, end_y) of the region to
+            be decoded, or None for the whole image.
+        reduction (int): Size the image is to be reduced by when decoded.
+
+        Returns
+        int: The estimated number of bytes, 0 if the header can't be read.
+        """
+        try:
+            with Image.open(image_path) as img:
+                width, height = img.size
+                mode = img.mode
+                file_format = img.format
+                has_transparency = "transparency" in img.info
+                # PIL reads 16 bit colour TIFFs as 8 bit, so check the
+                # TIFF BitsPerSample tag for the real depth
+                bits = getattr(img, "tag_v2", {}).get(258, (8,))
+        except Exception:
+            return 0
+        # Images are kept with their own channels and bit depth
+        if mode in ("1", "L", "I", "F") or mode.startswith("I;16"):
+            channels = 1
+        elif "A" in mode or has_transparency:
+            channels = 4
+        else:
+            channels = 3
+        depth = 2 if mode in ("I", "F") or mode.startswith("I;16") or \
+            max(bits if isinstance(bits, tuple) else (bits,)) > 8 else 1
+        pixels = width * height
+        if region is not None:
+            start_x, start_y, end_x, end_y = region
+            pixels = min(pixels, max(0, end_x - start_x) *
+                         max(0, end_y - start_y))
+        if file_format != "JPEG":
+            reduction = 1  # Only JPEGs are decoded reduced
+        return pixels * channels * depth // (reduction * reduction)
+
+    @staticmethod
+    def read_first_frame(video_path):
+        """
+        Reads the first frame of a video, so its edits can be set up and
+        then applied to every frame with Image_Stream.
+
+        Parameters
+        video_path (str): The path to the video file.
+
+        Returns
+        ndarray: The frame, or None if the video can't be read.
+        """
+        capture = cv2.VideoCapture(video_path)
+        try:
+            read, frame = capture.read()
+        finally:
+            capture.release()
+        return frame if read else None
+
+    @staticmethod
+    def get_exif_orientation(image_path):
+        """
+        Reads the EXIF orientation tag from an image file's header.
+
+        cv2.imread() only applies the orientation when converting the image
+        to 8 bit colour, so it has to be applied separately. OpenCV's TIFF
+        decoder applies it itself, so oriented TIFFs are decoded with
+        Image_Decode.read_region(), which leaves it out.
+
+        Parameters
+        image_path (str): The path to the image file.
+
+        Returns
+        int: The EXIF orientation, 1 to 8. 1 if there is none.
+        """
+        try:
+            with Image.open(image_path) as img:
+                return int(img.getexif().get(0x0112, 1))  # Orientation tag
+        except Exception:
+            return 1
+
+    @staticmethod
+    def to_native_image(image, orientation=1):
+        """
+        Prepares an image decoded with cv2.IMREAD_UNCHANGED for editing.
+
+        8 and 16 bit images are kept as they are. Other depths, e.g. 32 bit
+        float TIFFs, are converted to 16 bit. A 3D array with one channel is
+        reduced to 2D, and the EXIF orientation is applied.
+
+        Parameters
+        image (ndarray): The decoded image.
+        orientation (int): The EXIF orientation, 1 to 8.
+
+        Returns
+        ndarray: A 2D greyscale, BGR or BGRA image, 8 or 16 bit.
+        """
+        if image.ndim == 3 and image.shape[2] == 1:
+            image = image[:, :, 0]
+        if image.dtype.kind == "f":
+            image = np.clip(np.rint(image * 65535.0), 0, 65535)
+            image = image.astype(np.uint16)
+        elif image.dtype not in (np.uint8, np.uint16):
+            image = np.clip(image, 0, 65535).astype(np.uint16)
+        # EXIF orientations 2 to 8 are mirrorings and quarter turns
+        if orientation in (2, 4, 5, 7):
+            image = np.fliplr(image)
+        if orientation in (3, 4):
+            image = np.rot90(image, 2)
+        elif orientation in (5, 8):
+            image = np.rot90(image, 1)
+        elif orientation in (6, 7):
+            image = np.rot90(image, -1)
+        return np.ascontiguousarray(image)
+
+    @staticmethod
+    def has_alpha(image):
+        """
+        Checks if an image has an alpha channel.
+
+        Parameters
+        image (ndarray): The OpenCV image.
+
+        Returns
+        bool: True for a 4 channel BGRA image.
+        """
+        return image.ndim == 3 and image.shape[2] == 4
+
+    @staticmethod
+    def to_8bit(image):
+        """
+        Converts an image to 8 bit for display, keeping its channels.
+
+        Parameters
+        image (ndarray): An 8 or 16 bit OpenCV image.
+
+        Returns
+        ndarray: The 8 bit image, or the given image if already 8 bit.
+        """
+        if image.dtype == np.uint8:
+            return image
+        with tracer.span("cv2.convertScaleAbs", bytes=image.nbytes):
+            return cv2.convertScaleAbs(image, alpha=255.0 / 65535.0)
 
     def get_image(self):
         """
@@ -179,6 +545,7 @@ class ImageModel:
         tk_img = self.get_edited_scaled_image_as_tk()
         return tk_img
 
+    @traced
     def get_tk_photoimage(self):
         """
         Gets the loaded image converted to a tkinter photoimage object.
@@ -192,61 +559,457 @@ class ImageModel:
         """
         if self.image is None:
             return None  # No image loaded yet
-        return self.opencv_to_tk(self.image)
+        return self.opencv_to_tk(self.get_original_proxy())
 
-    def get_edited_scaled_image_as_pil(self):
+    def update_display_scale(self):
         """
-        Gets the edited scaled image object as a PIL image object.
+        Updates the display scale so the displayed original image fits within
+        the proxy size limit.
 
-        Returns:
-            PIL.Image: The converted PIL image object.
+        Returns
+        float: The new display scale.
         """
-        if self.scale_factor == 1.0:  # No need for scale operation if scale_factor == 1
-            return self.opencv_to_pil(self.edited_image)
+        if self.image is None:
+            self.display_scale = 1.0
+        else:
+            height, width = self.image.shape[:2]
+            self.display_scale = min(
+                1.0, self.proxy_max_size / max(height, width))
+        return self.display_scale
+
+    @traced
+    def get_original_proxy(self):
+        """
+        Gets the reduced copy of the loaded image used for display.
 
-        # Convert edited_image in opencv format to pil image
-        pil_img = self.opencv_to_pil(self.edited_image)
+        The proxy is no larger than proxy_max_size on its longest side. It is
+        cached until the image changes or memory runs short.
 
-        # Calculate scaled dimensions from stored scale_factor
-        scaled_width = int(pil_img.width * self.scale_factor)
-        scaled_height = int(pil_img.height * self.scale_factor)
+        Returns
+        OpenCV image: The display proxy, the loaded image itself if it is
+        already small enough.
+        """
+        if self.display_scale >= 1.0:
+            return self.image
+        proxy = self.display_cache.get("original")
+        CACHE_REQUESTS.inc(cache="original_proxy",
+                           result="miss" if proxy is None else "hit")
+        if proxy is None:
+            proxy = self.resize_for_display(self.image, self.display_scale)
+            self.display_cache["original"] = proxy
+            self.update_cache_usage()
+        return proxy
+
+    @traced
+    def resize_for_display(self, image, factor, exact=False):
+        """
+        Resizes an OpenCV image by the given factor for display.
 
-        # Create a copy of the scaled image
-        resz_img = pil_img.resize((scaled_width, scaled_height))
+        Resizing before conversion to PIL means no full size RGB copy of the
+        image is made just to be shrunk again. The resize is done by the
+        fastest backend for the image's size (see Image_Backends).
 
-        # Convert to PhotoImage type
-        tk_img = ImageTk.PhotoImage(resz_img)
-        # Clean up unused images
-        pil_img = None
-        return resz_img
+        Parameters
+        image (ndarray): The OpenCV image to resize.
+        factor (float): The scale factor.
+        exact (bool): Use a backend giving the same pixels on every
+            machine, for images that are saved.
 
-    def get_edited_scaled_image_as_tk(self):
+        Returns
+        ndarray: The resized image.
         """
-        Gets the edited scaled image object as a tkinter photoimage object.
+        height, width = image.shape[:2]
+        size = (max(1, int(width * factor)), max(1, int(height * factor)))
+        if size == (width, height):
+            return image
+        self.memory.reserve(size[0] * size[1] * image.itemsize *
+                            (image.shape[2] if image.ndim == 3 else 1))
+        # Area averaging gives the best quality when shrinking
+        backend = backends.choose("shrink" if factor < 1.0 else "enlarge",
+                                  image, exact)
+        with tracer.span(f"resize.{backend.name}",
+                         size=f"{size[0]}x{size[1]}"):
+            return backend.function(image, size)
+
+    def view_to_image_coords(self, start_x, start_y, end_x, end_y):
+        """
+        Converts a selection on the displayed original image to coordinates
+        in the full size image.
+
+        The selection may have been drawn in any direction, so the corners
+        are sorted, and it is clipped to the image bounds.
+
+        Parameters
+        start_x (int): The x-coordinate where the selection started.
+        start_y (int): The y-coordinate where the selection started.
+        end_x (int): The x-coordinate where the selection ended.
+        end_y (int): The y-coordinate where the selection ended.
+
+        Returns
+        tuple: (start_x, start_y, end_x, end_y) in image coordinates.
+        """
+        height, width = self.image.shape[:2]
+        x0, x1 = sorted((start_x, end_x))
+        y0, y1 = sorted((start_y, end_y))
+        scale = self.display_scale
+        x0 = min(max(int(round(x0 / scale)), 0), width)
+        x1 = min(max(int(round(x1 / scale)), 0), width)
+        y0 = min(max(int(round(y0 / scale)), 0), height)
+        y1 = min(max(int(round(y1 / scale)), 0), height)
+        return x0, y0, x1, y1
+
+    def get_loupe_pixels(self, view_x, view_y, size):
+        """
+        Returns the full size pixels around a point of the displayed
+        original image, for the magnifier loupe shown while selecting.
+
+        The square is centred on the pixel edge a selection corner at the
+        point is rounded to by view_to_image_coords(), so the loupe shows
+        exactly where a crop will be made. Only the square is read and
+        converted, so the cost doesn't depend on the image's size.
+
+        Parameters
+        view_x (int): The x-coordinate on the displayed image.
+        view_y (int): The y-coordinate on the displayed image.
+        size (int): Side of the square of pixels.
+
+        Returns
+        tuple: (pixels, (image_x, image_y)) - an 8 bit RGB array size
+        pixels square, grey beyond the edges of the image, and the pixel
+        edge at its centre in image coordinates.
+        """
+        height, width = self.image.shape[:2]
+        scale = self.display_scale
+        image_x = min(max(int(round(view_x / scale)), 0), width)
+        image_y = min(max(int(round(view_y / scale)), 0), height)
+        left, top = image_x - size // 2, image_y - size // 2
+        pixels = np.full((size, size, 3), self.LOUPE_BACKGROUND, np.uint8)
+        x0, x1 = max(left, 0), min(left + size, width)
+        y0, y1 = max(top, 0), min(top + size, height)
+        if x1 > x0 and y1 > y0:
+            window = self.to_8bit(self.image[y0:y1, x0:x1])
+            if window.ndim == 2:
+                window = cv2.cvtColor(window, cv2.COLOR_GRAY2RGB)
+            elif window.shape[2] == 4:
+                window = cv2.cvtColor(window, cv2.COLOR_BGRA2RGB)
+            else:
+                window = cv2.cvtColor(window, cv2.COLOR_BGR2RGB)
+            pixels[y0 - top:y1 - top, x0 - left:x1 - left] = window
+        return pixels, (image_x, image_y)
+
+    def edited_image_changed(self, values_changed=True):
+        """
+        Records that the pixels of the edited image have changed.
+
+        Updates the memory accounting and discards the display proxy of the
+        old edited image.
+
+        Parameters
+        values_changed (bool): False if the pixels were only moved, e.g. by
+            a 90 degree rotation, so the histogram is still valid.
+
+        Returns
+        None
+        """
+        self.edit_version += 1
+        if values_changed:
+            self.pixel_version += 1
+        self.memory.set_usage("edited_image", self.edited_image.nbytes)
+        if self.display_cache.pop("edited", None) is not None:
+            self.update_cache_usage()
+
+    def update_cache_usage(self):
+        """
+        Records the memory held by the display cache.
+
+        Returns
+        None
+        """
+        self.memory.set_usage("cache", sum(
+            entry[-1].nbytes if isinstance(entry, tuple) else entry.nbytes
+            for entry in self.display_cache.values()))
+
+    def drop_caches(self):
+        """
+        Frees the cached display proxies.
+
+        Used as a memory pressure handler. The proxies are rebuilt the next
+        time they are needed.
+
+        Returns
+        None
+        """
+        self.display_cache.clear()
+        self.memory.release("cache")
+
+    def lower_proxy_resolution(self):
+        """
+        Halves the resolution of the display proxies to save memory.
+
+        Used as a memory pressure handler. The resolution is never lowered
+        below MIN_PROXY_MAX_SIZE.
+
+        Returns
+        None
+        """
+        if self.proxy_max_size <= self.MIN_PROXY_MAX_SIZE:
+            return
+        self.proxy_max_size = max(self.MIN_PROXY_MAX_SIZE,
+                                  self.proxy_max_size // 2)
+        self.drop_caches()
+        self.update_display_scale()
+
+    @traced
+    def get_edited_scaled_image(self):
+        """
+        Gets the edited image at full resolution, with the tonal adjustments
+        and scale factor applied, in its own channels and bit depth.
 
         Returns:
-            ImageTk.PhotoImage: The edited scaled image object in PhotoImage format.
+            ndarray: The OpenCV image, ready to save.
         """
+        # Apply the tonal adjustments at full resolution
+        toned_img = self.apply_tone(self.edited_image)
         if self.scale_factor == 1.0:  # No need for scale operation if scale_factor == 1
-            return self.opencv_to_tk(self.edited_image)
+            return toned_img
+        return self.resize_for_display(toned_img, self.scale_factor,
+                                       exact=True)
+
+    @traced
+    def get_edited_scaled_image_as_pil(self):
+        """
+        Gets the edited scaled image object as a PIL image object.
+
+        Returns:
+            PIL.Image: The converted 8 bit PIL image object.
+        """
+        return self.opencv_to_pil(self.get_edited_scaled_image())
 
-        # Convert edited_image in opencv format to pil image
-        pil_img = self.opencv_to_pil(self.edited_image)
+    @traced
+    def get_edited_scaled_image_as_tk(self):
+        """
+        Gets the edited scaled image object as a tkinter photoimage object.
 
-        # Calculate scaled dimensions from stored scale_factor
-        scaled_width = int(pil_img.width * self.scale_factor)
-        scaled_height = int(pil_img.height * self.scale_factor)
+        Returns:
+            ImageTk.PhotoImage: The edited scaled image object in PhotoImage format.
+        """
+        # The edited image is shown at the same display scale as the original
+        # so large images are never converted to PhotoImages at full size.
+        resz_img = self.get_edited_proxy()
 
-        # Create a copy of the scaled image
-        resz_img = pil_img.resize((scaled_width, scaled_height))
+        # Tonal adjustments are previewed on the display proxy only. The
+        # full size image is adjusted when it is saved.
+        toned_img = self.apply_tone(resz_img)
 
         # Convert to PhotoImage type
-        tk_img = ImageTk.PhotoImage(resz_img)
+        tk_img = self.opencv_to_tk(toned_img)
         # Clean up unused images
-        pil_img = None
         resz_img = None
+        toned_img = None
         return tk_img
 
+    def get_edited_proxy(self):
+        """
+        Gets the edited image scaled for display.
+
+        The edited image is scaled by the scale factor and the display scale.
+        The result is cached until the edited image or the scale changes, so
+        adjustments previewed on it don't need to resize the image again.
+
+        Returns
+        OpenCV image: The edited image scaled for display.
+        """
+        factor = self.scale_factor * self.display_scale
+        if factor == 1.0:  # No need for scale operation if factor == 1
+            return self.edited_image
+        key = (self.edit_version, factor)
+        cached = self.display_cache.get("edited")
+        hit = cached is not None and cached[0] == key
+        CACHE_REQUESTS.inc(cache="edited_proxy", result="hit" if hit else "miss")
+        if hit:
+            return cached[1]
+        # Scale in OpenCV format before converting, so only the displayed
+        # pixels are converted to RGB and PIL format.
+        proxy = self.resize_for_display(self.edited_image, factor)
+        self.display_cache["edited"] = (key, proxy)
+        self.update_cache_usage()
+        return proxy
+
+    def set_brightness(self, brightness):
+        """
+        Sets the brightness adjustment.
+
+        Parameters
+        brightness (int): Offset added to every level, -100 to 100.
+
+        Returns
+        None
+        """
+        self.brightness = int(brightness)
+        self.settings_changed()
+
+    def set_contrast(self, contrast):
+        """
+        Sets the contrast adjustment.
+
+        Parameters
+        contrast (float): Factor to stretch levels away from mid grey by,
+            1.0 for no change.
+
+        Returns
+        None
+        """
+        self.contrast = float(contrast)
+        self.settings_changed()
+
+    def set_gamma(self, gamma):
+        """
+        Sets the gamma adjustment.
+
+        Parameters
+        gamma (float): Gamma value, above 1.0 brightens the mid tones and
+            below 1.0 darkens them.
+
+        Returns
+        None
+        """
+        self.gamma = float(gamma)
+        self.settings_changed()
+
+    def set_levels(self, black_point, white_point):
+        """
+        Sets the input levels adjustment.
+
+        Levels at or below the black point become black and at or above the
+        white point become white, with the levels between stretched to fit.
+
+        Parameters
+        black_point (int): Input level mapped to black, 0 to 254.
+        white_point (int): Input level mapped to white, 1 to 255.
+
+        Returns
+        None
+        """
+        black_point = min(max(int(black_point), 0), 254)
+        white_point = min(max(int(white_point), black_point + 1), 255)
+        self.black_point = black_point
+        self.white_point = white_point
+        self.settings_changed()
+
+    def reset_tone(self):
+        """
+        Removes all the tonal adjustments.
+
+        Returns
+        None
+        """
+        self.brightness = 0
+        self.contrast = 1.0
+        self.gamma = 1.0
+        self.black_point = 0
+        self.white_point = 255
+        self.settings_changed()
+
+    def get_tone_lut(self, dtype=np.uint8):
+        """
+        Returns the lookup table combining all the tonal adjustments.
+
+        The adjustments are applied in the order levels, contrast,
+        brightness, gamma. They are combined in floating point and rounded
+        once, so a single table gives the same result as applying each
+        adjustment in turn without rounding in between. The adjustments are
+        defined on a 0 to 255 scale, which 16 bit levels are mapped to. The
+        tables are cached until an adjustment changes.
+
+        Parameters
+        dtype (type): np.uint8 for a 256 entry table, np.uint16 for a 65536
+            entry table.
+
+        Returns
+        ndarray: The table, of the given type, or None if there are no
+        adjustments.
+        """
+        key = (self.brightness, self.contrast, self.gamma,
+               self.black_point, self.white_point)
+        if key != self.tone_lut_key:
+            self.tone_lut = {}
+            self.tone_lut_key = key
+        dtype = np.dtype(dtype)
+        hit = dtype.str in self.tone_lut
+        CACHE_REQUESTS.inc(cache="tone_lut", result="hit" if hit else "miss")
+        if hit:
+            return self.tone_lut[dtype.str]
+        maximum = np.iinfo(dtype).max
+        # Levels on the 0 to 255 scale the adjustments are defined on
+        levels = np.arange(maximum + 1, dtype=np.float64) * (255.0 / maximum)
+        # Levels - stretch black_point..white_point to 0..255
+        levels = (levels - self.black_point) * \
+            (255.0 / (self.white_point - self.black_point))
+        # Contrast - stretch away from mid grey
+        levels = (levels - 127.5) * self.contrast + 127.5
+        # Brightness - offset every level
+        levels = levels + self.brightness * 2.55
+        # Gamma - applied to levels normalised to 0..1
+        levels = np.clip(levels, 0, 255) / 255.0
+        levels = np.power(levels, 1.0 / self.gamma) * maximum
+        lut = np.clip(np.rint(levels), 0, maximum).astype(dtype)
+        if np.array_equal(lut, np.arange(maximum + 1, dtype=dtype)):
+            lut = None  # No adjustments - skip the lookup entirely
+        self.tone_lut[dtype.str] = lut
+        return lut
+
+    def has_tone_adjustments(self):
+        """
+        Checks if any tonal adjustments are set.
+
+        Returns
+        bool: True if applying the adjustments would change the image.
+        """
+        return self.get_tone_lut() is not None
+
+    @traced
+    def apply_tone(self, image):
+        """
+        Applies the tonal adjustments to an image.
+
+        Parameters
+        image (ndarray): The OpenCV image to adjust.
+
+        Returns
+        ndarray: A new adjusted image, or the given image if there are no
+        adjustments.
+        """
+        lut = self.get_tone_lut(image.dtype)
+        if lut is None:
+            return image
+        self.memory.reserve(image.nbytes)
+        return self.apply_lut(image, lut)
+
+    @staticmethod
+    def apply_lut(image, lut):
+        """
+        Maps the colour or grey levels of an image through a lookup table.
+        The alpha channel is left unchanged.
+
+        Parameters
+        image (ndarray): An 8 or 16 bit OpenCV image.
+        lut (ndarray): A table from get_tone_lut() for the image's type.
+
+        Returns
+        ndarray: A new mapped image.
+        """
+        if image.dtype == np.uint8:
+            with tracer.span("cv2.LUT", bytes=image.nbytes):
+                mapped = cv2.LUT(image, lut)
+        else:
+            # cv2.LUT only supports 8 bit images
+            with tracer.span("np.take", bytes=image.nbytes):
+                mapped = np.take(lut, image)
+        if ImageModel.has_alpha(image):
+            mapped[..., 3] = image[..., 3]
+        return mapped
+
+    @traced
     def opencv_to_pil(self, image):
         """
         Converts an OpenCV image to a PIL image.
@@ -261,12 +1024,18 @@ class ImageModel:
         if not self.is_opencv_image(image):
             print("Input image is not a valid OpenCV image.")
             return None
-        # OpenCV uses BGR format, PIL uses RGB
-        color_coverted = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        # Convert to PIL Image - from BGR to RGB format
-        pil_image = Image.fromarray(color_coverted)
+        # PIL images are 8 bit for display - 16 bit images are only
+        # reduced here, at the display boundary
+        image = self.to_8bit(image)
+        # OpenCV uses BGR(A) format, PIL uses RGB(A). Greyscale images are
+        # kept as single channel "L" images. The fastest backend for the
+        # image's size converts and copies it (see Image_Backends).
+        backend = backends.choose("to_pil", image)
+        with tracer.span(f"to_pil.{backend.name}", bytes=image.nbytes):
+            pil_image = backend.function(image)
         return pil_image
 
+    @traced
     def opencv_to_tk(self, image):
         """
         Converts an OpenCV image to a tkinter photoimage object.
@@ -282,7 +1051,9 @@ class ImageModel:
             print("Input image is not a valid OpenCV image.")
             return None
         pil_image = self.opencv_to_pil(image)
-        tk_image = ImageTk.PhotoImage(image=pil_image)
+        with tracer.span("ImageTk.PhotoImage",
+                         size=f"{pil_image.width}x{pil_image.height}"):
+            tk_image = ImageTk.PhotoImage(image=pil_image)
         pil_image = None  # Clean up unused image
         return tk_image
 
@@ -342,6 +1113,7 @@ class ImageModel:
             None
         """
         self.scale_factor = scale_factor
+        self.settings_changed()
 
     def get_cropped_image(self) -> ImageTk.PhotoImage:
         """
@@ -356,10 +1128,138 @@ class ImageModel:
             return ImageTk.PhotoImage(img.crop(self.crop_coords))
         return None
 
+    @staticmethod
+    def count_content(image, lower, upper, axis):
+        """
+        Counts the pixels in each row or column of an image that differ
+        from the border colour.
+
+        Parameters
+        image (ndarray): An 8 or 16 bit OpenCV image, or part of one.
+        lower (tuple): The lowest border level of each channel.
+        upper (tuple): The highest border level of each channel.
+        axis (int): 1 to count each row, 0 to count each column.
+
+        Returns
+        ndarray: The number of content pixels in each row or column.
+        """
+        # 255 where every channel is within the border range
+        border = cv2.inRange(image, lower, upper)
+        sums = cv2.reduce(border, 1 if axis == 1 else 0, cv2.REDUCE_SUM,
+                          dtype=cv2.CV_32S).ravel()
+        return image.shape[axis] - sums // 255
+
+    @traced
+    def find_content_bounds(self, tolerance=AUTO_CROP_TOLERANCE):
+        """
+        Finds the bounds of the content inside a uniform border, such as
+        the margin around a scan.
+
+        The border colour is the median of the display proxy's outer
+        pixels. The bounds are found on the proxy with row and column
+        counts of the pixels that differ from it, then each edge is found
+        exactly at full resolution in a strip a few proxy pixels wide.
+        Only those strips of the full size image are read.
+
+        Parameters
+        tolerance (int): How far, in 8 bit levels, a pixel must differ
+            from the border colour to count as content.
+
+        Returns
+        tuple: (start_x, start_y, end_x, end_y) in full size image
+        coordinates, or None if the image is all border.
+        """
+        image = self.image
+        proxy = self.get_original_proxy()
+        height, width = image.shape[:2]
+        proxy_height, proxy_width = proxy.shape[:2]
+        frame = np.concatenate((proxy[0], proxy[-1], proxy[:, 0],
+                                proxy[:, -1]))
+        border = np.median(frame, axis=0)
+        if image.dtype == np.uint16:
+            tolerance *= 257  # Scale the tolerance to 16 bit levels
+        maximum = np.iinfo(image.dtype).max
+        lower = np.clip(border - tolerance, 0, maximum).reshape(-1)
+        upper = np.clip(border + tolerance, 0, maximum).reshape(-1)
+
+        def content_lines(block, axis):
+            # Indexes of the rows (axis 1) or columns (axis 0) of a block
+            # with more than a few content pixels
+            counts = self.count_content(block, lower, upper, axis)
+            return np.flatnonzero(
+                counts > self.AUTO_CROP_MIN_FRACTION * block.shape[axis])
+
+        def strip(first, size, scale):
+            # Full size range covering a proxy row or column, with one
+            # proxy pixel either side for the proxy's averaging
+            return (max(0, int((first - 1) * scale)),
+                    min(size, int(np.ceil((first + 2) * scale))))
+
+        rows = content_lines(proxy, 1)
+        columns = content_lines(proxy, 0)
+        if rows.size == 0 or columns.size == 0:
+            return None
+        scale_y = height / proxy_height
+        scale_x = width / proxy_width
+        # Rough bounds, used to limit the strips to the content
+        y0 = int(rows[0] * scale_y)
+        y1 = min(height, int(np.ceil((rows[-1] + 1) * scale_y)))
+        x0 = int(columns[0] * scale_x)
+        x1 = min(width, int(np.ceil((columns[-1] + 1) * scale_x)))
+        # Top and bottom edges
+        top, top_end = strip(rows[0], height, scale_y)
+        found = content_lines(image[top:top_end, x0:x1], 1)
+        start_y = top + found[0] if found.size else y0
+        bottom, bottom_end = strip(rows[-1], height, scale_y)
+        found = content_lines(image[bottom:bottom_end, x0:x1], 1)
+        end_y = bottom + found[-1] + 1 if found.size else y1
+        # Left and right edges, within the exact top and bottom
+        left, left_end = strip(columns[0], width, scale_x)
+        found = content_lines(image[start_y:end_y, left:left_end], 0)
+        start_x = left + found[0] if found.size else x0
+        right, right_end = strip(columns[-1], width, scale_x)
+        found = content_lines(image[start_y:end_y, right:right_end], 0)
+        end_x = right + found[-1] + 1 if found.size else x1
+        return int(start_x), int(start_y), int(end_x), int(end_y)
+
+    def auto_crop(self, tolerance=AUTO_CROP_TOLERANCE):
+        """
+        Crops away a uniform border around the image with crop_image().
+
+        The edit is kept as an "auto_crop" step, so an edit spec made from
+        it finds each image's own border.
+
+        Parameters
+        tolerance (int): How far, in 8 bit levels, a pixel must differ
+            from the border colour to count as content.
+
+        Returns
+        bool: True if the image was cropped, False if there was no border.
+        """
+        bounds = self.find_content_bounds(tolerance)
+        height, width = self.image.shape[:2]
+        if bounds is None or bounds == (0, 0, width, height):
+            return False
+        self.crop_image(*bounds)
+        self.edit_steps = [("auto_crop", bounds)]
+        return True
+
     # Crops the image.
+    @traced(output="edited_image")
     def crop_image(self, start_x, start_y, end_x, end_y):
         # Crop image logic
+        crop_bytes = (abs(end_y - start_y) * abs(end_x - start_x) *
+                      self.image.itemsize *
+                      (self.image.shape[2] if self.image.ndim == 3 else 1))
+        self.memory.reserve(crop_bytes, replacing=("edited_image",))
         self.edited_image = self.image[start_y: end_y, start_x: end_x].copy()
+        self.edited_image_changed()
+        # The crop is taken from the full size image, so replaces any
+        # earlier crop or rotation
+        self.edit_transform = np.float64([[1, 0, -start_x], [0, 1, -start_y]])
+        self.edit_steps = [("crop", (start_x, start_y, end_x, end_y))]
+        self.clear_undo()
+        self.record_edit("crop_image", start_x, start_y, end_x, end_y)
 
     def get_edited_image(self):
         """
@@ -377,28 +1277,30 @@ class ImageModel:
     def get_rotation_angle(self):
         return self.rotation_angle
 
-    def rotate_image(self, angle):
+    @staticmethod
+    def get_rotation_matrix(width, height, angle):
         """
-        Rotates the image.
+        Returns the matrix used by cv2.warpAffine() to rotate an image, and
+        the size of the rotated image.
 
         Parameters
-        angle (int): The angle to rotate the image by.
+        width (int): The width of the image.
+        height (int): The height of the image.
+        angle (int): The clockwise angle in degrees.
 
         Returns
-        None
+        tuple: (2x3 rotation matrix, (width, height) of the rotated image).
         """
-        # Rotate image logic
-        # angle is the amount to rotate the image by
-        if angle == 0:
-            return  # No rotation required
-        # Set the stored rotation of the image
-        self.rotation_angle = (self.rotation_angle + angle) % 360
-        if self.rotation_angle < 0:
-            self.rotation_angle += 360
-
-        img = self.edited_image.copy()
-        # Get current image dimensions
-        height, width = img.shape[:2]
+        if angle % 90 == 0:
+            # Quarter turns move each pixel centre exactly onto another, so
+            # the result is the same as cv2.rotate() or np.rot90()
+            turns = angle // 90 % 4
+            matrix = ([[1, 0, 0], [0, 1, 0]],
+                      [[0, -1, height - 1], [1, 0, 0]],
+                      [[-1, 0, width - 1], [0, -1, height - 1]],
+                      [[0, 1, 0], [-1, 0, width - 1]])[turns]
+            size = (width, height) if turns % 2 == 0 else (height, width)
+            return np.float64(matrix), size
         image_centre = (width // 2, height // 2)
         # Get rotation matrix - Positive values mean counter-clockwise rotation.
         # Convert standard angle - 0 to +360 in clockwise direction to opposite
@@ -417,23 +1319,548 @@ class ImageModel:
         # Re-centre the image within the new bounds
         rotation_matrix[0, 2] += bound_width / 2 - image_centre[0]
         rotation_matrix[1, 2] += bound_height / 2 - image_centre[1]
+        return rotation_matrix, (bound_width, bound_height)
+
+    @traced(output="edited_image")
+    def rotate_image(self, angle):
+        """
+        Rotates the image.
+
+        Parameters
+        angle (int): The angle to rotate the image by.
 
-        # Rotate image
-        self.edited_image = cv2.warpAffine(
-            img, rotation_matrix, (bound_width, bound_height), flags=cv2.INTER_NEAREST)
+        Returns
+        None
+        """
+        # Rotate image logic
+        # angle is the amount to rotate the image by
+        if angle == 0:
+            return  # No rotation required
+        # Set the stored rotation of the image once the rotation succeeds
+        rotation_angle = (self.rotation_angle + angle) % 360
+        if rotation_angle < 0:
+            rotation_angle += 360
+
+        # warpAffine does not modify its input, so no copy is needed
+        img = self.edited_image
+        # Get current image dimensions
+        height, width = img.shape[:2]
+        rotation_matrix, (bound_width, bound_height) = \
+            self.get_rotation_matrix(width, height, angle)
+
+        # Rotate image - the old and new images are both held while rotating
+        self.memory.reserve(bound_width * bound_height * img.itemsize *
+                            (img.shape[2] if img.ndim == 3 else 1))
+        started = time.perf_counter()
+        if angle % 90 == 0:
+            # Quarter turns are done by the fastest backend for the size
+            backend = backends.choose("rotate", img, exact=True)
+            with tracer.span(f"rotate.{backend.name}", angle=angle):
+                self.edited_image = backend.function(img, angle // 90 % 4)
+        else:
+            with tracer.span("cv2.warpAffine", angle=angle):
+                self.edited_image = cv2.warpAffine(
+                    img, rotation_matrix, (bound_width, bound_height), flags=cv2.INTER_NEAREST)
+        cost = time.perf_counter() - started
         img = None  # Clean up unsued image
+        self.rotation_angle = rotation_angle
+        self.edit_transform = rotation_matrix @ np.vstack(
+            (self.edit_transform, (0, 0, 1)))
+        self.edit_steps.append(("rotate", angle))
+        self.clear_undo()
+        # Quarter turns only move pixels, so the histogram is unchanged
+        self.edited_image_changed(values_changed=angle % 90 != 0)
+        self.record_edit("rotate_image", angle, cost=cost)
 
         # Get rotated image dimensions
         (rh, rw) = self.edited_image.shape[:2]
 
+    @traced(output="edited_image")
+    def apply_filter(self, name, region=None, **params):
+        """
+        Applies a filter to the edited image, or to a region of it.
+
+        Large images are split into strips which are filtered in parallel.
+        The result is the same as filtering the whole image at once.
+
+        A region is filtered in place. Only the region and enough
+        surrounding pixels for the filter's kernel are read, so the work
+        and memory used depend on the size of the region, not the image.
+        The pixels inside the region are the same as if the whole image
+        had been filtered.
+
+        Parameters
+        name (str): The filter - "blur", "sharpen", "denoise" or "edges".
+        region (tuple): (start_x, start_y, end_x, end_y) in edited image
+            coordinates, or None for the whole image.
+        **params: Filter parameters, see Image_Filters. Defaults are used
+            for any not given.
+
+        Returns
+        None
+        """
+        if region is not None:
+            self.apply_filter_to_region(name, region, **params)
+            self.record_edit("apply_filter", name, region=region, **params)
+            return
+        # The filtered image is written to a new buffer the same size
+        self.memory.reserve(self.edited_image.nbytes)
+        started = time.perf_counter()
+        with tracer.span("StripFilterEngine.apply", filter=name):
+            filtered = self.filter_image(self.edited_image, name, **params)
+        cost = time.perf_counter() - started
+        self.edited_image = filtered
+        self.edited_image_changed()
+        self.edit_steps.append(("filter", (name, dict(params))))
+        self.clear_undo()
+        self.record_edit("apply_filter", name, cost=cost, **params)
+
+    def apply_filter_to_region(self, name, region, **params):
+        """
+        Applies a filter in place to a region of the edited image.
+
+        Parameters
+        name (str): The filter name.
+        region (tuple): (start_x, start_y, end_x, end_y) in edited image
+            coordinates.
+        **params: Filter parameters.
+
+        Returns
+        None
+        """
+        x0, y0, x1, y1 = region
+        _, _, halo = self.filter_engine.get_filter(name, params)
+        height, width = self.edited_image.shape[:2]
+        # The region with a halo of neighbouring pixels for the kernel. At
+        # the image edges there is no halo and the filter's own border
+        # handling applies, as it does when filtering the whole image.
+        hx0, hy0 = max(0, x0 - halo), max(0, y0 - halo)
+        hx1, hy1 = min(width, x1 + halo), min(height, y1 + halo)
+        block = self.edited_image[hy0:hy1, hx0:hx1]
+        # The filtered block and the undo patch are held while filtering
+        self.memory.reserve(block.nbytes + self.region_bytes(region))
+        with tracer.span("StripFilterEngine.apply", filter=name,
+                         region=region):
+            filtered = self.filter_image(block, name, **params)
+        self.push_undo(region)
+        self.unshare_edited_image()
+        self.edited_image[y0:y1, x0:x1] = \
+            filtered[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+        self.edited_image_changed()
+
+    def filter_image(self, image, name, **params):
+        """
+        Filters the colour or grey channels of an image. The alpha channel
+        is left unchanged.
+
+        Parameters
+        image (ndarray): The OpenCV image to filter.
+        name (str): The filter name.
+        **params: Filter parameters.
+
+        Returns
+        ndarray: The filtered image.
+        """
+        if not self.has_alpha(image):
+            return self.run_filter(image, name, **params)
+        colour = np.ascontiguousarray(image[..., :3])
+        filtered = np.empty_like(image)
+        filtered[..., :3] = self.run_filter(colour, name, **params)
+        filtered[..., 3] = image[..., 3]
+        return filtered
+
+    def run_filter(self, image, name, **params):
+        """
+        Runs a filter in the worker processes if there are any and the
+        image is large enough to be worth it, otherwise in threads.
+
+        Parameters
+        image (ndarray): The OpenCV image to filter.
+        name (str): The filter name.
+        **params: Filter parameters.
+
+        Returns
+        ndarray: The filtered image.
+        """
+        height, width = image.shape[:2]
+        if self.process_executor is not None and \
+                height * width >= self.filter_engine.min_parallel_pixels:
+            with tracer.span("ProcessImageExecutor.apply_filter"):
+                return self.process_executor.apply_filter(
+                    image, name, **params)
+        return self.filter_engine.apply(image, name, **params)
+
+    @traced(output="edited_image")
+    def apply_tone_to_region(self, region):
+        """
+        Applies the current tonal adjustments in place to a region of the
+        edited image.
+
+        The adjustments are still set afterwards, so they should be reset
+        to see the region on its own.
+
+        Parameters
+        region (tuple): (start_x, start_y, end_x, end_y) in edited image
+            coordinates.
+
+        Returns
+        None
+        """
+        lut = self.get_tone_lut(self.edited_image.dtype)
+        if lut is None:
+            return  # No adjustments to apply
+        x0, y0, x1, y1 = region
+        roi = self.edited_image[y0:y1, x0:x1]
+        # The adjusted region and the undo patch are held while adjusting
+        self.memory.reserve(2 * roi.nbytes)
+        self.push_undo(region)
+        self.unshare_edited_image()
+        roi = self.edited_image[y0:y1, x0:x1]
+        roi[...] = self.apply_lut(roi, lut)
+        self.edited_image_changed()
+        self.record_edit("apply_tone_to_region", region)
+
+    def image_to_edited_coords(self, start_x, start_y, end_x, end_y):
+        """
+        Converts a rectangle in the full size image to the rectangle it
+        covers in the edited image, allowing for crops and rotations.
+
+        Parameters
+        start_x (int): The left edge in the full size image.
+        start_y (int): The top edge in the full size image.
+        end_x (int): The right edge, exclusive.
+        end_y (int): The bottom edge, exclusive.
+
+        Returns
+        tuple: (start_x, start_y, end_x, end_y) in the edited image,
+        clipped to its bounds, or None if the rectangle is outside it.
+        """
+        if end_x <= start_x or end_y <= start_y:
+            return None
+        # Transform the centres of the corner pixels
+        corners = np.float64([[start_x, start_y, 1], [end_x - 1, start_y, 1],
+                              [start_x, end_y - 1, 1],
+                              [end_x - 1, end_y - 1, 1]])
+        # Round away floating point error before taking the bounds
+        points = np.round(corners @ self.edit_transform.T, 6)
+        height, width = self.edited_image.shape[:2]
+        x0 = max(0, int(np.floor(points[:, 0].min())))
+        y0 = max(0, int(np.floor(points[:, 1].min())))
+        x1 = min(width, int(np.ceil(points[:, 0].max())) + 1)
+        y1 = min(height, int(np.ceil(points[:, 1].max())) + 1)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def region_bytes(self, region):
+        """
+        Returns the size of a region of the edited image in bytes.
+
+        Parameters
+        region (tuple): (start_x, start_y, end_x, end_y).
+
+        Returns
+        int: The number of bytes.
+        """
+        x0, y0, x1, y1 = region
+        return (x1 - x0) * (y1 - y0) * self.edited_image.itemsize * \
+            (self.edited_image.shape[2] if self.edited_image.ndim == 3 else 1)
+
+    def push_undo(self, region):
+        """
+        Saves the pixels of a region before they are edited in place.
+
+        Only the MAX_UNDO_STEPS most recent edits are kept.
+
+        Parameters
+        region (tuple): (start_x, start_y, end_x, end_y).
+
+        Returns
+        None
+        """
+        x0, y0, x1, y1 = region
+        self.undo_history.append(
+            (x0, y0, self.edited_image[y0:y1, x0:x1].copy()))
+        del self.undo_history[:-self.MAX_UNDO_STEPS]
+        self.memory.set_usage("undo", sum(
+            patch.nbytes for _, _, patch in self.undo_history))
+
+    def clear_undo(self):
+        """
+        Discards the undo history.
+
+        The saved pixels are positions in the edited image, so they are
+        discarded when it is replaced or rotated.
+
+        Returns
+        None
+        """
+        self.undo_history = []
+        self.memory.release("undo")
+
+    @traced(output="edited_image")
+    def undo(self):
+        """
+        Undoes the most recent selection edit by restoring the saved pixels.
+
+        Returns
+        bool: True if an edit was undone, False if there was nothing to undo.
+        """
+        if not self.undo_history:
+            return False
+        x, y, patch = self.undo_history.pop()
+        self.unshare_edited_image()
+        self.edited_image[y:y + patch.shape[0], x:x + patch.shape[1]] = patch
+        self.memory.set_usage("undo", sum(
+            patch.nbytes for _, _, patch in self.undo_history))
+        self.edited_image_changed()
+        self.record_edit("undo")
+        return True
+
+    def record_edit(self, operation, *args, cost=0.0, **kwargs):
+        """
+        Appends an edit to the autosave journal, if there is one. An edit
+        that took at least the journal's snapshot_seconds is followed by a
+        snapshot, so a restore doesn't have to repeat it.
+
+        Parameters
+        operation (str): The name of the method that made the edit.
+        *args: The method's positional arguments.
+        cost (float): The time the edit took in seconds.
+        **kwargs: The method's keyword arguments.
+
+        Returns
+        None
+        """
+        if self.journal is None:
+            return
+        self.journal.record(operation, args, kwargs, self.get_settings())
+        # Undo patches aren't saved, so only snapshot without any
+        if cost >= self.journal.snapshot_seconds and not self.undo_history:
+            self.journal.snapshot(self.edited_image,
+                                  self.get_snapshot_state())
+
+    def settings_changed(self):
+        """
+        Tells the autosave journal, if there is one, the tonal adjustments
+        or scale have changed.
+
+        Returns
+        None
+        """
+        if self.journal is not None:
+            self.journal.set_settings(self.get_settings())
+
+    def get_settings(self):
+        """
+        Returns the tonal adjustments and scale factor.
+
+        Returns
+        dict: The settings, by name.
+        """
+        return {"brightness": self.brightness, "contrast": self.contrast,
+                "gamma": self.gamma, "black_point": self.black_point,
+                "white_point": self.white_point,
+                "scale_factor": self.scale_factor}
+
+    def apply_settings(self, settings):
+        """
+        Sets the tonal adjustments and scale factor.
+
+        Parameters
+        settings (dict): The settings, from get_settings().
+
+        Returns
+        None
+        """
+        self.set_brightness(settings["brightness"])
+        self.set_contrast(settings["contrast"])
+        self.set_gamma(settings["gamma"])
+        self.set_levels(settings["black_point"], settings["white_point"])
+        self.set_scale_factor(settings["scale_factor"])
+
+    def get_snapshot_state(self):
+        """
+        Returns the state saved with a snapshot of the edited image.
+
+        Returns
+        dict: The edit transform, edit steps and rotation angle.
+        """
+        return {"edit_transform": self.edit_transform.tolist(),
+                "edit_steps": [[edit, value] for edit, value in
+                               self.edit_steps],
+                "rotation_angle": self.rotation_angle}
+
+    def restore_snapshot(self, image, state):
+        """
+        Replaces the edited image with an autosaved snapshot.
+
+        Parameters
+        image (ndarray): The snapshot, usually memory-mapped.
+        state (dict): The state saved with it, from get_snapshot_state().
+
+        Returns
+        None
+        """
+        self.memory.reserve(image.nbytes, replacing=("edited_image",))
+        self.edited_image = image
+        self.edited_image_changed()
+        self.edit_transform = np.float64(state["edit_transform"])
+        self.edit_steps = [
+            (edit, tuple(value) if edit != "rotate" else value)
+            for edit, value in state["edit_steps"]]
+        self.rotation_angle = state["rotation_angle"]
+        self.clear_undo()
+
+    def unshare_edited_image(self):
+        """
+        Copies the edited image if the autosave journal is still saving it,
+        so it can be changed in place.
+
+        Returns
+        None
+        """
+        if self.journal is not None and \
+                self.journal.is_saving(self.edited_image):
+            self.memory.reserve(self.edited_image.nbytes)
+            self.edited_image = self.edited_image.copy()
+
+    @staticmethod
+    def calculate_histograms(image):
+        """
+        Calculates a 256 bin histogram for each channel of an image.
+
+        Parameters
+        image (ndarray): An 8 or 16 bit OpenCV image.
+
+        Returns
+        list: (channel name, histogram) tuples. Histograms are float64
+        arrays of 256 pixel counts.
+        """
+        if image.ndim == 2:
+            names = ("grey",)
+        else:
+            names = ("blue", "green", "red", "alpha")[:image.shape[2]]
+        # 16 bit levels are counted in 256 bins, on the same scale as 8 bit
+        top = 65536 if image.dtype == np.uint16 else 256
+        histograms = []
+        for channel, name in enumerate(names):
+            with tracer.span("cv2.calcHist", channel=name):
+                hist = cv2.calcHist([image], [channel], None, [256], [0, top])
+            histograms.append((name, hist.ravel().astype(np.float64)))
+        return histograms
+
+    def adjust_histograms(self, histograms):
+        """
+        Applies the tonal adjustments to histograms of the unadjusted image.
+
+        Each level's count is moved to the level the tone lookup table maps
+        it to, which gives the histogram of the adjusted image without
+        touching the pixels.
+
+        Parameters
+        histograms (list): (channel name, histogram) tuples.
+
+        Returns
+        list: The adjusted (channel name, histogram) tuples.
+        """
+        lut = self.get_tone_lut()
+        if lut is None:
+            return histograms
+        adjusted = []
+        for name, hist in histograms:
+            if name == "alpha":
+                adjusted.append((name, hist))  # Alpha is not adjusted
+            else:
+                adjusted.append(
+                    (name, np.bincount(lut, weights=hist, minlength=256)))
+        return adjusted
+
+    @staticmethod
+    def histogram_statistics(histograms):
+        """
+        Calculates the mean, standard deviation, minimum and maximum of each
+        channel from its histogram.
+
+        Parameters
+        histograms (list): (channel name, histogram) tuples.
+
+        Returns
+        dict: Statistics for each channel, keyed by channel name.
+        """
+        levels = np.arange(256, dtype=np.float64)
+        statistics = {}
+        for name, hist in histograms:
+            count = hist.sum()
+            if count == 0:
+                continue
+            mean = float((hist * levels).sum() / count)
+            variance = float((hist * (levels - mean) ** 2).sum() / count)
+            used = np.nonzero(hist)[0]
+            statistics[name] = {"mean": mean, "std": variance ** 0.5,
+                                "min": int(used[0]), "max": int(used[-1])}
+        return statistics
+
+    @traced
+    def get_histogram(self, base_histograms=None):
+        """
+        Returns histograms and statistics of the edited image, calculated
+        from its display proxy.
+
+        The histograms of the unadjusted proxy are cached until the pixel
+        values change, so rotating or changing the scale reuses them. Tonal
+        adjustments are applied to the cached histograms directly.
+
+        Parameters
+        base_histograms (list): Histograms of the full size unadjusted image
+            from calculate_histograms(), to use instead of the proxy. These
+            are slow to calculate, so are best calculated in the background.
+
+        Returns
+        dict: "histograms" - (channel name, histogram) tuples, "statistics"
+        - per channel statistics, and "exact" - True if base_histograms
+        were given. None if no image is loaded.
+        """
+        if self.edited_image is None:
+            return None
+        if base_histograms is not None:
+            histograms = self.adjust_histograms(base_histograms)
+            return {"histograms": histograms,
+                    "statistics": self.histogram_statistics(histograms),
+                    "exact": True}
+        cached = self.histogram_cache
+        hit = cached is not None and cached[0] == self.pixel_version
+        CACHE_REQUESTS.inc(cache="histogram", result="hit" if hit else "miss")
+        if not hit:
+            # Use the edited image at the display scale, not the chosen
+            # scale factor, so the scale slider doesn't change the result.
+            proxy = self.edited_image
+            if self.display_scale < 1.0:
+                proxy = self.resize_for_display(proxy, self.display_scale)
+            cached = (self.pixel_version, self.calculate_histograms(proxy))
+            self.histogram_cache = cached
+        histograms = self.adjust_histograms(cached[1])
+        return {"histograms": histograms,
+                "statistics": self.histogram_statistics(histograms),
+                "exact": False}
+
+    @traced(output="edited_image")
     def reset_image(self):
-        # Reset all image edits
-        self.edited_image = None
+        # Reset all image edits. The copy replaces the edited image, so a
+        # reset refused for memory leaves the current edits as they are.
+        self.memory.reserve(self.image.nbytes, replacing=("edited_image",))
         self.edited_image = self.image.copy()
+        self.edited_image_changed()
+        self.edit_transform = np.float64([[1, 0, 0], [0, 1, 0]])
+        self.edit_steps = []
+        self.clear_undo()
         self.crop_coords = None
         self.rotation_angle = 0
         self.scale_factor = 1.0
+        self.reset_tone()
+        self.record_edit("reset_image")
 
+    @traced
     def save_edited_image(self, image_path):
         """
         Handles saving the current edited image to the file system.
@@ -448,7 +1875,23 @@ class ImageModel:
         self.set_edited_image_dir(os.path.dirname(image_path))
         self.set_edited_image_name(os.path.basename(image_path))
         self.set_edited_image_path(image_path)
-        image = self.get_edited_scaled_image_as_pil()
-        image.save(image_path)
-        print(f"ImageModel.save_edited_image(): Saved edited image to: {
-            image_path}")
+        image = self.get_edited_scaled_image()
+        # Keep 16 bit and alpha where the file format supports them
+        extension = os.path.splitext(image_path)[1].lower()
+        if image.dtype == np.uint16 and \
+                extension not in self.SIXTEEN_BIT_EXTENSIONS:
+            image = self.to_8bit(image)
+        if self.has_alpha(image) and extension not in self.ALPHA_EXTENSIONS:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        # Encode in memory and write with Python so any path can be used
+        try:
+            with tracer.span("cv2.imencode", path=image_path):
+                encoded, data = cv2.imencode(extension, image)
+        except cv2.error:
+            encoded = False  # OpenCV has no encoder for the extension
+        if not encoded:
+            raise ValueError(f"Unable to save image as {extension}")
+        with open(image_path, "wb") as image_file:
+            data.tofile(image_file)
+        IMAGES_WRITTEN.inc()
+        BYTES_WRITTEN.inc(data.nbytes)
@@ -0,0 +1,426 @@
+# Image Replay
+# Records real interaction sessions with the Image Editor and replays them to
+# measure end-to-end GUI performance, including Tk event dispatch and image
+# display which the micro-benchmarks miss.
+# A recording is a JSON list of timestamped events: key presses, mouse events
+# on the original image canvas, slider moves, button clicks and the images
+# opened. Replay feeds the same events back through Tk with event_generate(),
+# waits for Tk to go idle after each one and reports the total replay time,
+# the per-event latency and the number of frames displayed.
+#
+# Usage:
+#   python main.py --record session.json           (record a session)
+#   python Image_Replay.py session.json --report report.json
+#
+# Image_Replay.py starts a virtual X display (Xvfb) when there is no DISPLAY,
+# so replays can be run on any Linux box, including headless ones.
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Control key event state - see ImageController.handle_key_press()
+CONTROL_KEY_STATE = 0x0004
+
+# Key shortcuts which open dialogs or quit. They are not recorded as keys -
+# opening is recorded as an "open" event with the chosen path instead.
+DIALOG_KEYSYMS = ("o", "s", "q", "e")
+
+# View buttons whose clicks are recorded and replayed with invoke()
+RECORDED_BUTTONS = ("crop_image_button", "reset_image_button",
+                    "rotate_image_left_button", "rotate_image_right_button",
+                    "apply_filter_button", "apply_tone_selection_button")
+
+
+class SessionRecorder:
+    """
+    A class to record the events of an interactive session.
+
+    Attributes
+    view (ImageView):
+        The view being recorded.
+    events (list):
+        The recorded events, each a dict with the time "t" in seconds since
+        recording started and the event "type".
+
+    Methods
+    __init__(view):
+        Initializes the SessionRecorder object and starts recording.
+    record(event_type, **details):
+        Adds an event to the recording.
+    save(path):
+        Writes the recording to a JSON file.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.events = []
+        self.start_time = time.perf_counter()
+
+        root = view.root
+        # Keys - the "all" binding tag runs after the root's own bindings
+        root.bind_all("<KeyPress>", self.on_key_press, add="+")
+        # Mouse selection on the original image canvas
+        canvas = view.image_canvas_original
+        canvas.bind("<ButtonPress-1>", self.on_mouse("press"), add="+")
+        canvas.bind("<B1-Motion>", self.on_mouse("drag"), add="+")
+        canvas.bind("<ButtonRelease-1>", self.on_mouse("release"), add="+")
+        # Slider moves made with the mouse - key moves are replayed as keys
+        slider = view.resize_image_slider
+        slider.bind("<B1-Motion>", self.on_slider, add="+")
+        slider.bind("<ButtonRelease-1>", self.on_slider, add="+")
+        for name, tone_slider in view.tone_sliders.items():
+            tone_slider.bind("<B1-Motion>", self.on_tone_slider(name), add="+")
+            tone_slider.bind("<ButtonRelease-1>", self.on_tone_slider(name),
+                             add="+")
+        for name in RECORDED_BUTTONS:
+            button = getattr(view, name)
+            button.bind("<ButtonRelease-1>", self.on_button(name), add="+")
+        # Record the image chosen in the "Open file" dialog
+        open_image_file = view.open_image_file
+
+        def recording_open_image_file(*args, **kwargs):
+            path = open_image_file(*args, **kwargs)
+            if path:
+                self.record("open", path=portable_path(path))
+            return path
+        view.open_image_file = recording_open_image_file
+        # Images opened from the filmstrip are recorded the same way
+        filmstrip_select = view.filmstrip.on_select
+
+        def recording_filmstrip_select(path):
+            self.record("open", path=portable_path(path))
+            filmstrip_select(path)
+        view.filmstrip.on_select = recording_filmstrip_select
+
+    def record(self, event_type, **details):
+        """
+        Adds an event to the recording.
+
+        Parameters
+        event_type (str): The kind of event, e.g. "key" or "mouse".
+        **details: The event details needed to replay it.
+
+        Returns
+        None
+        """
+        self.events.append({"t": round(time.perf_counter() - self.start_time, 4),
+                            "type": event_type, **details})
+
+    def on_key_press(self, event):
+        # Record key presses, except the shortcuts that open dialogs
+        if event.keysym.lower() in DIALOG_KEYSYMS and \
+                event.state & CONTROL_KEY_STATE:
+            return
+        self.record("key", keysym=event.keysym,
+                    control=bool(event.state & CONTROL_KEY_STATE))
+
+    def on_mouse(self, action):
+        def record_mouse(event):
+            self.record("mouse", action=action, x=event.x, y=event.y)
+        return record_mouse
+
+    def on_slider(self, event):
+        # The slider's class binding moves it after this binding runs, so
+        # read the value once Tk is idle.
+        slider = self.view.resize_image_slider
+        self.view.root.after_idle(
+            lambda: self.record("scale", value=float(slider.get())))
+
+    def on_tone_slider(self, name):
+        def record_tone(event):
+            slider = self.view.tone_sliders[name]
+            self.view.root.after_idle(lambda: self.record(
+                "tone", name=name, value=float(slider.get())))
+        return record_tone
+
+    def on_button(self, name):
+        def record_button(event):
+            # Only a release over the button is a click
+            widget = event.widget
+            if widget.winfo_containing(event.x_root, event.y_root) is widget:
+                self.record("button", name=name,
+                            filter=self.view.filter_combobox.get(),
+                            selection_only=self.view.get_selection_only())
+        return record_button
+
+    def save(self, path):
+        """
+        Writes the recording to a JSON file.
+
+        Parameters
+        path (str): The path of the file to write.
+
+        Returns
+        None
+        """
+        with open(path, "w") as recording_file:
+            json.dump({"version": 1, "events": self.events},
+                      recording_file, indent=1)
+
+
+class SessionPlayer:
+    """
+    A class to replay a recorded session and measure its performance.
+
+    Each event is dispatched through Tk, then Tk is run until idle so the
+    event's handler, layout and redraw are all included in its latency.
+    By default events are replayed back to back, which makes the replay
+    deterministic. With realtime=True the recorded gaps are kept.
+
+    Attributes
+    view (ImageView):
+        The view to replay into.
+    controller (ImageController):
+        The controller, used to open images without a dialog.
+    events (list):
+        The events to replay.
+    latencies (list):
+        Per-event latencies in milliseconds, filled in during replay.
+    frames (int):
+        Number of images displayed during replay.
+
+    Methods
+    __init__(view, controller, events, realtime=False):
+        Initializes the SessionPlayer object.
+    play():
+        Replays all events and returns the report.
+    dispatch(event):
+        Sends one recorded event through Tk.
+    report(total_s):
+        Returns the replay statistics.
+    """
+
+    def __init__(self, view, controller, events, realtime=False):
+        self.view = view
+        self.controller = controller
+        self.events = events
+        self.realtime = realtime
+        self.latencies = []
+        self.frames = 0
+
+        # Count the images displayed by wrapping the view's display methods
+        for name in ("display_image", "update_edited_image"):
+            method = getattr(view, name)
+            setattr(view, name, self.counting(method))
+
+    def counting(self, method):
+        def counted(*args, **kwargs):
+            self.frames += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def play(self):
+        """
+        Replays all events.
+
+        Returns
+        dict: The replay report.
+        """
+        root = self.view.root
+        root.update()
+        root.focus_force()
+        start = time.perf_counter()
+        for event in self.events:
+            if self.realtime:
+                delay = event["t"] - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            event_start = time.perf_counter()
+            self.dispatch(event)
+            root.update()  # Run handlers, layout and redraw until idle
+            self.latencies.append(
+                (event["type"], (time.perf_counter() - event_start) * 1000))
+        return self.report(time.perf_counter() - start)
+
+    def dispatch(self, event):
+        """
+        Sends one recorded event through Tk.
+
+        Parameters
+        event (dict): The recorded event.
+
+        Returns
+        None
+        """
+        view = self.view
+        event_type = event["type"]
+        if event_type == "key":
+            sequence = event["keysym"]
+            if event.get("control"):
+                sequence = "Control-" + sequence
+            view.root.event_generate(f"<{sequence}>", when="tail")
+        elif event_type == "mouse":
+            sequence = {"press": "<ButtonPress-1>", "drag": "<B1-Motion>",
+                        "release": "<ButtonRelease-1>"}[event["action"]]
+            view.image_canvas_original.event_generate(
+                sequence, x=event["x"], y=event["y"], when="tail")
+        elif event_type == "scale":
+            view.resize_image_slider.set(event["value"])
+        elif event_type == "tone":
+            view.tone_sliders[event["name"]].set(event["value"])
+        elif event_type == "button":
+            if event.get("filter"):
+                view.filter_combobox.set(event["filter"])
+            view.selection_only.set(event.get("selection_only", False))
+            getattr(view, event["name"]).invoke()
+        elif event_type == "open":
+            self.controller.load_image(image_path=event["path"])
+
+    def report(self, total_s):
+        """
+        Returns the replay statistics.
+
+        Parameters
+        total_s (float): The total replay time in seconds.
+
+        Returns
+        dict: The total time, frame count and latency statistics.
+        """
+        def summary(values):
+            if not values:
+                return {}
+            values = sorted(values)
+            return {
+                "count": len(values),
+                "mean_ms": round(statistics.fmean(values), 2),
+                "p50_ms": round(values[int(0.50 * (len(values) - 1))], 2),
+                "p95_ms": round(values[int(0.95 * (len(values) - 1))], 2),
+                "max_ms": round(values[-1], 2),
+            }
+        by_type = {}
+        for event_type, latency in self.latencies:
+            by_type.setdefault(event_type, []).append(latency)
+        return {
+            "events": len(self.events),
+            "total_s": round(total_s, 4),
+            "frames": self.frames,
+            "latency": summary([latency for _, latency in self.latencies]),
+            "latency_by_type": {event_type: summary(values)
+                                for event_type, values in by_type.items()},
+            "per_event_ms": [round(latency, 3)
+                             for _, latency in self.latencies],
+        }
+
+
+def portable_path(path):
+    """
+    Returns a path relative to the current directory if it is inside it, so
+    recordings that use the repository's test images work on any machine.
+
+    Parameters
+    path (str): The path to convert.
+
+    Returns
+    str: The relative path, or the absolute path if outside the directory.
+    """
+    relative = os.path.relpath(path)
+    return path if relative.startswith("..") else relative
+
+
+def load_recording(path):
+    """
+    Loads a recording written by SessionRecorder.save().
+
+    Parameters
+    path (str): The path of the recording.
+
+    Returns
+    list: The recorded events.
+    """
+    with open(path) as recording_file:
+        return json.load(recording_file)["events"]
+
+
+def start_virtual_display(display=":99", screen="1600x1200x24"):
+    """
+    Starts an Xvfb virtual X display.
+
+    Parameters
+    display (str): The display name to use.
+    screen (str): The screen size and depth.
+
+    Returns
+    subprocess.Popen: The Xvfb process.
+    """
+    if shutil.which("Xvfb") is None:
+        sys.exit("Xvfb was not found - install it (e.g. the xvfb package) "
+                 "or set DISPLAY to an existing X display.")
+    process = subprocess.Popen(
+        ["Xvfb", display, "-screen", "0", screen, "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)  # Give the server time to start accepting clients
+    if process.poll() is not None:
+        sys.exit(f"Xvfb failed to start on display {display}")
+    return process
+
+
+def parse_args():
+    """
+    Parses the command line options.
+
+    Returns
+    argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded Image Editor session and report its "
+                    "performance")
+    parser.add_argument("recording", help="session recorded with "
+                        "main.py --record")
+    parser.add_argument("--report", default="replay_report.json",
+                        metavar="FILE",
+                        help="file to write the report to (default: "
+                             "%(default)s)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="keep the recorded gaps between events")
+    parser.add_argument("--display", default=":99",
+                        help="Xvfb display to use when DISPLAY is not set "
+                             "(default: %(default)s)")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",
+                        help="compare with a previous report")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    env = dict(os.environ)
+    xvfb = None
+    if not env.get("DISPLAY"):
+        xvfb = start_virtual_display(args.display)
+        env["DISPLAY"] = args.display
+    command = [sys.executable, "main.py",
+               "--replay", os.path.abspath(args.recording),
+               "--replay-report", os.path.abspath(args.report)]
+    if args.realtime:
+        command.append("--replay-realtime")
+    try:
+        result = subprocess.run(
+            command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+    if result.returncode != 0:
+        sys.exit(result.returncode)
+    with open(args.report) as report_file:
+        report = json.load(report_file)
+    print(f"Events: {report['events']}  Frames: {report['frames']}  "
+          f"Total: {report['total_s'] * 1000:.1f} ms  "
+          f"p50: {report['latency'].get('p50_ms', 0)} ms  "
+          f"p95: {report['latency'].get('p95_ms', 0)} ms")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        for name, current, previous in (
+                ("total_s", report["total_s"], baseline["total_s"]),
+                ("p95_ms", report["latency"].get("p95_ms", 0),
+                 baseline["latency"].get("p95_ms", 0)),
+                ("frames", report["frames"], baseline["frames"])):
+            change = (current / previous - 1) if previous else 0.0
+            print(f"{name:<8} {previous:>10} -> {current:>10} ({change:+.1%})")
@@ -0,0 +1,416 @@
+# Image Shared Memory
+# Moves images to and from worker processes without pickling them.
+# Sending a numpy image to a process pool pickles it, copies it through a
+# pipe and unpickles it in the worker, and the result comes back the same
+# way - every frame is copied at least twice each way. Here the image is
+# placed in a multiprocessing.shared_memory block once, and only the block's
+# name, shape and type are sent. Workers attach to the input and output
+# blocks by name and read and write the pixels in place.
+#
+# Blocks are owned by the process that created them. The owner keeps a
+# reference count for each block and unlinks it when the count reaches
+# zero, and any blocks still open when the owner exits are unlinked then.
+# Workers only attach, so a worker that crashes leaves nothing behind. If
+# the owner itself is killed, Python's resource tracker unlinks its blocks.
+
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+import cv2
+import numpy as np
+
+from Image_Filters import StripFilterEngine
+
+
+class SharedImage:
+    """
+    A class to hold an image in a shared memory block.
+
+    Attributes
+    array (ndarray):
+        The image, backed by the shared memory block.
+    name (str):
+        The name of the shared memory block.
+    owner (bool):
+        True in the process that created the block and will unlink it.
+    refs (int):
+        The number of references held by the owner.
+
+    Methods
+    create(shape, dtype):
+        Creates a new shared image.
+    from_array(image):
+        Creates a shared image holding a copy of an image.
+    attach(descriptor):
+        Attaches to a shared image created by another process.
+    descriptor():
+        Returns the picklable description used to attach to the image.
+    retain():
+        Adds a reference.
+    release():
+        Removes a reference, closing and unlinking the block at zero.
+    close():
+        Closes this process's view of the block.
+    """
+
+    # Blocks created by this process that have not been unlinked, by name
+    _owned = {}
+    _owned_lock = threading.Lock()
+
+    def __init__(self, block, shape, dtype, owner):
+        self.block = block
+        self.name = block.name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.refs = 1
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=block.buf)
+
+    @classmethod
+    def create(cls, shape, dtype):
+        """
+        Creates a new, uninitialised shared image.
+
+        Parameters
+        shape (tuple): The image shape.
+        dtype (type): The image type, e.g. np.uint8.
+
+        Returns
+        SharedImage: The new image, with one reference.
+        """
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        shared = cls(block, shape, dtype, owner=True)
+        with cls._owned_lock:
+            cls._owned[shared.name] = shared
+        return shared
+
+    @classmethod
+    def from_array(cls, image):
+        """
+        Creates a shared image holding a copy of an image.
+
+        Parameters
+        image (ndarray): The image to copy.
+
+        Returns
+        SharedImage: The new image, with one reference.
+        """
+        shared = cls.create(image.shape, image.dtype)
+        shared.array[...] = image
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        Attaches to a shared image created by another process.
+
+        Parameters
+        descriptor (tuple): From the owner's descriptor().
+
+        Returns
+        SharedImage: The attached image. It must be closed, not released.
+        """
+        name, shape, dtype = descriptor
+        try:
+            # Python 3.13+ - only the owner should track the block
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            block = shared_memory.SharedMemory(name=name)
+        return cls(block, shape, dtype, owner=False)
+
+    def descriptor(self):
+        """
+        Returns the picklable description used to attach to the image.
+
+        Returns
+        tuple: (block name, shape, type).
+        """
+        return (self.name, self.shape, self.dtype.str)
+
+    def retain(self):
+        """
+        Adds a reference to the image.
+
+        Returns
+        SharedImage: This image.
+        """
+        self.refs += 1
+        return self
+
+    def release(self):
+        """
+        Removes a reference. When none remain the block is closed and, in
+        the owner, unlinked.
+
+        Returns
+        None
+        """
+        self.refs -= 1
+        if self.refs > 0:
+            return
+        self.close()
+        if self.owner:
+            with SharedImage._owned_lock:
+                SharedImage._owned.pop(self.name, None)
+            try:
+                self.block.unlink()
+            except FileNotFoundError:
+                pass  # Already unlinked
+
+    def close(self):
+        """
+        Closes this process's view of the block. The array can't be used
+        afterwards.
+
+        Returns
+        None
+        """
+        if self.array is None:
+            return
+        # The block can't be closed while the array still refers to it
+        self.array = None
+        self.block.close()
+
+    @classmethod
+    def release_all(cls):
+        """
+        Unlinks every block this process created that is still open.
+
+        Registered to run when the process exits.
+
+        Returns
+        None
+        """
+        with cls._owned_lock:
+            remaining = list(cls._owned.values())
+        for shared in remaining:
+            shared.refs = 1
+            shared.release()
+
+
+atexit.register(SharedImage.release_all)
+
+
+def init_worker():
+    """
+    Sets up a worker process. Each worker filters one strip at a time, so
+    OpenCV's own threads would only compete with the other workers.
+
+    Returns
+    None
+    """
+    cv2.setNumThreads(1)
+
+
+def filter_strip_shared(source, output, name, params, strip):
+    """
+    Filters one strip of a shared image into a shared output image.
+
+    Runs in a worker process. Only the descriptors are sent to the worker.
+
+    Parameters
+    source (tuple): Descriptor of the shared image to filter.
+    output (tuple): Descriptor of the shared output image.
+    name (str): The filter name.
+    params (dict): The filter parameters.
+    strip (tuple): (start, end, halo_start, halo_end) rows.
+
+    Returns
+    None
+    """
+    function, params, _ = StripFilterEngine.get_filter(name, params)
+    start, end, halo_start, halo_end = strip
+    source_image = SharedImage.attach(source)
+    output_image = SharedImage.attach(output)
+    try:
+        filtered = function(source_image.array[halo_start:halo_end],
+                            **params)
+        output_image.array[start:end] = \
+            filtered[start - halo_start:end - halo_start]
+        filtered = None
+    finally:
+        source_image.close()
+        output_image.close()
+
+
+def filter_strip_pickled(block, name, params, offset, rows):
+    """
+    Filters one strip sent by pickling, and returns it by pickling.
+
+    Runs in a worker process. Used to compare with the shared transport.
+
+    Parameters
+    block (ndarray): The strip with its halo rows.
+    name (str): The filter name.
+    params (dict): The filter parameters.
+    offset (int): The row of the block where the strip starts.
+    rows (int): The number of rows in the strip.
+
+    Returns
+    ndarray: The filtered strip, without its halo.
+    """
+    function, params, _ = StripFilterEngine.get_filter(name, params)
+    return function(block, **params)[offset:offset + rows]
+
+
+class ProcessImageExecutor:
+    """
+    A class to run image filters on strips in a pool of worker processes.
+
+    Attributes
+    processes (int):
+        The number of worker processes.
+    strips (StripFilterEngine):
+        Splits images into strips with halos.
+
+    Methods
+    __init__(processes=None, min_strip_rows=64):
+        Initializes the ProcessImageExecutor object.
+    apply_filter(image, name, **params):
+        Filters an image in the worker processes using shared memory.
+    apply_filter_shared(source, name, **params):
+        Filters a shared image into a new shared image, with no copies.
+    apply_filter_pickled(image, name, **params):
+        Filters an image in the worker processes by pickling the strips.
+    shutdown():
+        Stops the worker processes.
+    """
+
+    def __init__(self, processes=None, min_strip_rows=64):
+        self.processes = processes or os.cpu_count() or 1
+        self.strips = StripFilterEngine(min_strip_rows=min_strip_rows)
+        self._pool = None
+
+    def get_pool(self):
+        """
+        Returns the process pool, starting it if needed.
+
+        Workers are started with "spawn" rather than "fork", which isn't
+        safe once Tk and the application's threads are running.
+
+        Returns
+        ProcessPoolExecutor: The process pool.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=get_context("spawn"),
+                initializer=init_worker)
+        return self._pool
+
+    def shutdown(self):
+        """
+        Stops the worker processes.
+
+        Returns
+        None
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def run(self, function, tasks):
+        """
+        Runs tasks in the pool and waits for them all.
+
+        If a worker crashes the pool is discarded, so the next call starts
+        a new one.
+
+        Parameters
+        function (callable): The worker function.
+        tasks (list): The argument tuples, one per task.
+
+        Returns
+        list: The results, in the order of the tasks.
+        """
+        pool = self.get_pool()
+        futures = [pool.submit(function, *task) for task in tasks]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def apply_filter_shared(self, source, name, **params):
+        """
+        Filters a shared image into a new shared image.
+
+        No pixels are copied between processes - each worker reads its
+        strip from the source block and writes it into the output block.
+
+        Parameters
+        source (SharedImage): The image to filter.
+        name (str): The filter name.
+        **params: The filter parameters.
+
+        Returns
+        SharedImage: The filtered image. The caller must release it.
+        """
+        _, params, halo = StripFilterEngine.get_filter(name, params)
+        height = source.shape[0]
+        strips = self.strips.get_strips(height, halo, self.processes * 2)
+        output = SharedImage.create(source.shape, source.dtype)
+        try:
+            self.run(filter_strip_shared,
+                     [(source.descriptor(), output.descriptor(), name,
+                       params, strip) for strip in strips])
+        except BaseException:
+            output.release()
+            raise
+        return output
+
+    def apply_filter(self, image, name, **params):
+        """
+        Filters an image in the worker processes using shared memory.
+
+        The image is copied into shared memory once, and the result copied
+        out once. Use apply_filter_shared() to avoid even these copies.
+
+        Parameters
+        image (ndarray): The image to filter.
+        name (str): The filter name.
+        **params: The filter parameters.
+
+        Returns
+        ndarray: The filtered image.
+        """
+        source = SharedImage.from_array(image)
+        try:
+            output = self.apply_filter_shared(source, name, **params)
+        finally:
+            source.release()
+        try:
+            return output.array.copy()
+        finally:
+            output.release()
+
+    def apply_filter_pickled(self, image, name, **params):
+        """
+        Filters an image in the worker processes, sending the strips and
+        results by pickling.
+
+        Parameters
+        image (ndarray): The image to filter.
+        name (str): The filter name.
+        **params: The filter parameters.
+
+        Returns
+        ndarray: The filtered image.
+        """
+        _, params, halo = StripFilterEngine.get_filter(name, params)
+        strips = self.strips.get_strips(
+            image.shape[0], halo, self.processes * 2)
+        results = self.run(filter_strip_pickled, [
+            (image[halo_start:halo_end], name, params, start - halo_start,
+             end - start) for start, end, halo_start, halo_end in strips])
+        output = np.empty_like(image)
+        for (start, end, _, _), strip in zip(strips, results):
+            output[start:end] = strip
+        return output
@@ -0,0 +1,156 @@
+# Image Startup Profiler
+# Measures how long the application takes to start: the time to the first
+# paint of the main window, when the deferred Model (OpenCV and NumPy) is
+# ready, and how long each module took to import.
+# Imports are timed by wrapping builtins.__import__ while profiling. Each
+# top level module is timed the first time it is imported, in whichever
+# thread imports it. The "self" time excludes the other top level modules it
+# imported in turn, so the self times add up to the total import time.
+# This module only uses the standard library so it can be imported first.
+
+import builtins
+import sys
+import threading
+import time
+
+
+class StartupProfiler:
+    """
+    A class to record startup milestones and module import times.
+
+    Attributes
+    start_time (float):
+        time.perf_counter() when the profiler was created.
+    milestones (list):
+        (name, seconds since start) tuples, in the order they were reached.
+    imports (list):
+        (module, thread name, total seconds, self seconds) tuples.
+
+    Methods
+    __init__():
+        Initializes the StartupProfiler object.
+    start_import_timing():
+        Starts timing module imports.
+    stop_import_timing():
+        Stops timing module imports.
+    mark(name):
+        Records that a startup milestone has been reached.
+    has_milestone(name):
+        Checks if a milestone has been reached.
+    report():
+        Returns the startup profile as text.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.milestones = []
+        self.imports = []
+        self._original_import = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start_import_timing(self):
+        """
+        Starts timing module imports.
+
+        Returns
+        None
+        """
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def stop_import_timing(self):
+        """
+        Stops timing module imports.
+
+        Returns
+        None
+        """
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(),
+                      level=0):
+        original_import = self._original_import or builtins.__import__
+        module = name.partition(".")[0]
+        if level != 0 or module in sys.modules:
+            return original_import(name, globals, locals, fromlist, level)
+        # Per thread stack of the imports in progress, each entry is
+        # [module, time spent in nested top level imports]
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        if any(entry[0] == module for entry in stack):
+            return original_import(name, globals, locals, fromlist, level)
+        stack.append([module, 0.0])
+        start = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - start
+            nested = stack.pop()[1]
+            if stack:
+                stack[-1][1] += total
+            with self._lock:
+                self.imports.append((module, threading.current_thread().name,
+                                     total, total - nested))
+
+    def mark(self, name):
+        """
+        Records that a startup milestone has been reached.
+
+        Only the first time a milestone is reached is recorded.
+
+        Parameters
+        name (str): The milestone, e.g. "first paint".
+
+        Returns
+        None
+        """
+        with self._lock:
+            if not any(m[0] == name for m in self.milestones):
+                self.milestones.append(
+                    (name, time.perf_counter() - self.start_time))
+
+    def has_milestone(self, name):
+        """
+        Checks if a milestone has been reached.
+
+        Parameters
+        name (str): The milestone.
+
+        Returns
+        bool: True if the milestone has been reached.
+        """
+        with self._lock:
+            return any(m[0] == name for m in self.milestones)
+
+    def report(self):
+        """
+        Returns the startup profile as text.
+
+        Returns
+        str: The milestones and the import times, slowest first.
+        """
+        lines = ["Startup profile (seconds since main.py started)"]
+        for name, seconds in self.milestones:
+            lines.append(f"  {name:<32} {seconds * 1000:>9.1f} ms")
+        if self.imports:
+            lines.append("Imports (self time excludes nested top level "
+                         "imports)")
+            lines.append(f"  {'module':<24} {'thread':<16} "
+                         f"{'total':>10} {'self':>10}")
+            for module, thread, total, own in sorted(
+                    self.imports, key=lambda i: i[3], reverse=True):
+                if own < 0.0005:
+                    continue  # Skip modules that took under 0.5 ms
+                lines.append(f"  {module:<24} {thread:<16} "
+                             f"{total * 1000:>8.1f}ms {own * 1000:>8.1f}ms")
+        return "\n".join(lines)
+
+
+# The profiler shared by the whole application - created when this module is
+# first imported, which main.py does before anything else.
+profiler = StartupProfiler()
@@ -0,0 +1,460 @@
+# Image Stream
+# Applies the ImageModel's crop, rotation, tonal adjustments and scale to
+# every frame of a video or every page of a multi-page image.
+# Frames are read one at a time and edited in a thread pool (OpenCV releases
+# the GIL), but written in their original order. Only a fixed number of
+# frames are ever held in memory, however long the clip.
+#
+# Videos are read with cv2.VideoCapture and written with cv2.VideoWriter.
+# Multi-page images are read a page at a time with cv2.imreadmulti, and
+# TIFFs are written a page at a time with Pillow's appending TIFF writer.
+# Other image formats are written as one numbered file per page.
+#
+# Progress and per-frame latency can be written to a Prometheus text-format
+# or JSON lines file with --metrics and --metrics-json.
+#
+# Usage:
+#   python Image_Stream.py clip.mp4 edited.mp4 --crop 100 50 740 410
+#   python Image_Stream.py scan.tif edited.tif --rotate 90 --scale 0.5
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+import Image_Metrics
+from Image_Backends import backends
+from Image_Metrics import metrics
+from Image_Model import ImageModel
+
+# File types read and written as video
+VIDEO_EXTENSIONS = ImageModel.VIDEO_EXTENSIONS
+# Video codecs used for each output file type
+VIDEO_CODECS = {".mp4": "mp4v", ".mov": "mp4v", ".avi": "MJPG",
+                ".mkv": "MJPG"}
+# File types written as a single multi-page file
+MULTI_PAGE_EXTENSIONS = (".tif", ".tiff")
+
+# Metrics, recorded when metrics are enabled (see Image_Metrics)
+FRAMES_WRITTEN = metrics.counter("stream_frames_written_total",
+                                 "Frames edited and written")
+FRAMES_IN_FLIGHT = metrics.gauge("stream_frames_in_flight",
+                                 "Frames read but not yet written")
+FRAME_SECONDS = metrics.histogram("stream_frame_duration_seconds",
+                                  "Time taken to edit each frame")
+
+
+class FrameEditor:
+    """
+    A class to apply a snapshot of the ImageModel's edits to other frames.
+
+    The edits are copied from the model when the editor is created, so the
+    user can carry on editing while frames are processed in the background.
+    Filters and selection edits change the pixels of the edited image
+    directly, so they are not repeated on the frames.
+
+    Attributes
+    source_size (tuple):
+        (width, height) of the image the edits were made on. Frames of a
+        different size are resized to it first.
+    geometry_edits (list):
+        The model's crop and rotations, repeated in the same order so the
+        frames match the edited image exactly.
+    luts (dict):
+        Tone lookup tables by numpy type string, None for no adjustments.
+    scale_factor (float):
+        The scale applied last.
+
+    Methods
+    from_model(model):
+        Creates an editor with the model's current edits.
+    apply(frame):
+        Returns the edited frame.
+    """
+
+    def __init__(self, source_size, geometry_edits, luts, scale_factor=1.0):
+        self.source_size = tuple(source_size)
+        self.geometry_edits = list(geometry_edits)
+        self.luts = luts
+        self.scale_factor = scale_factor
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Creates an editor with the model's current edits.
+
+        Parameters
+        model (ImageModel): The model, with an image loaded.
+
+        Returns
+        FrameEditor: The new editor.
+        """
+        height, width = model.get_image().shape[:2]
+        luts = {np.dtype(dtype).str: model.get_tone_lut(dtype)
+                for dtype in (np.uint8, np.uint16)}
+        geometry_edits = [(edit, value) for edit, value in model.edit_steps
+                          if edit != "filter"]
+        return cls((width, height), geometry_edits, luts, model.scale_factor)
+
+    def apply(self, frame):
+        """
+        Returns the edited frame. Without a rotation, adjustment or scale
+        this is a view of the given frame.
+
+        Parameters
+        frame (ndarray): An 8 or 16 bit OpenCV image.
+
+        Returns
+        ndarray: The edited frame.
+        """
+        if frame.shape[1::-1] != self.source_size:
+            frame = cv2.resize(frame, self.source_size,
+                               interpolation=cv2.INTER_AREA)
+        for edit, value in self.geometry_edits:
+            if edit in ("crop", "auto_crop"):
+                start_x, start_y, end_x, end_y = value
+                frame = frame[start_y:end_y, start_x:end_x]
+            elif value % 90 == 0:
+                # The same quarter turns as ImageModel.rotate_image()
+                frame = backends.run("rotate", frame, value // 90 % 4,
+                                     exact=True)
+            else:
+                # The same nearest neighbour warp as ImageModel.rotate_image()
+                height, width = frame.shape[:2]
+                matrix, size = ImageModel.get_rotation_matrix(
+                    width, height, value)
+                frame = cv2.warpAffine(frame, matrix, size,
+                                       flags=cv2.INTER_NEAREST)
+        lut = self.luts.get(frame.dtype.str)
+        if lut is not None:
+            frame = ImageModel.apply_lut(frame, lut)
+        if self.scale_factor != 1.0:
+            height, width = frame.shape[:2]
+            size = (max(1, int(width * self.scale_factor)),
+                    max(1, int(height * self.scale_factor)))
+            interpolation = cv2.INTER_AREA if self.scale_factor < 1.0 \
+                else cv2.INTER_LINEAR
+            frame = cv2.resize(frame, size, interpolation=interpolation)
+        return frame
+
+
+def is_video(path):
+    """
+    Checks if a file is a video, by its extension.
+
+    Parameters
+    path (str): The file path.
+
+    Returns
+    bool: True for a video file.
+    """
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+
+def count_frames(path):
+    """
+    Returns the number of frames or pages in a file.
+
+    Parameters
+    path (str): The video or image file.
+
+    Returns
+    int: The number of frames. For videos this is the count in the file
+    header, which may be approximate or 0 if unknown.
+    """
+    if is_video(path):
+        capture = cv2.VideoCapture(path)
+        try:
+            return max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        finally:
+            capture.release()
+    return cv2.imcount(path, cv2.IMREAD_UNCHANGED)
+
+
+def read_frames(path):
+    """
+    Reads the frames of a video, or the pages of an image, one at a time.
+
+    Parameters
+    path (str): The video or image file.
+
+    Yields
+    ndarray: Each frame, at its own channel count and bit depth.
+    """
+    if is_video(path):
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f"Unable to read video: {path}")
+        try:
+            while True:
+                read, frame = capture.read()
+                if not read:
+                    break
+                yield frame
+        finally:
+            capture.release()
+        return
+    pages = cv2.imcount(path, cv2.IMREAD_UNCHANGED)
+    if pages == 0:
+        raise ValueError(f"Unable to read image: {path}")
+    for page in range(pages):
+        # Read one page at a time so the whole file is never in memory
+        read, images = cv2.imreadmulti(path, page, 1,
+                                       flags=cv2.IMREAD_UNCHANGED)
+        if not read or not images:
+            raise ValueError(f"Unable to read page {page + 1} of {path}")
+        yield ImageModel.to_native_image(images[0])
+
+
+class FrameWriter:
+    """
+    A class to write frames to a video, a multi-page TIFF or numbered files.
+
+    Attributes
+    path (str):
+        The output file. For numbered files, the page number is added
+        before the extension.
+    fps (float):
+        Frames per second for video output.
+    count (int):
+        The number of frames written.
+
+    Methods
+    __init__(path, fps=25.0):
+        Initializes the FrameWriter object.
+    write(frame):
+        Writes the next frame.
+    close():
+        Finishes the output file.
+    """
+
+    def __init__(self, path, fps=25.0):
+        self.path = path
+        self.fps = fps or 25.0
+        self.count = 0
+        self.extension = os.path.splitext(path)[1].lower()
+        self.video = None
+        self.tiff = None
+
+    def write(self, frame):
+        """
+        Writes the next frame.
+
+        Parameters
+        frame (ndarray): An 8 or 16 bit OpenCV image. Every frame must be
+            the same size.
+
+        Returns
+        None
+        """
+        if self.extension in VIDEO_EXTENSIONS:
+            self.write_video(frame)
+        elif self.extension in MULTI_PAGE_EXTENSIONS:
+            self.write_tiff_page(frame)
+        else:
+            base = os.path.splitext(self.path)[0]
+            encoded, data = cv2.imencode(self.extension, frame)
+            if not encoded:
+                raise ValueError(f"Unable to save image as {self.extension}")
+            with open(f"{base}_{self.count + 1:04d}{self.extension}",
+                      "wb") as page_file:
+                data.tofile(page_file)
+        self.count += 1
+
+    def write_video(self, frame):
+        # Video codecs take 8 bit BGR or greyscale frames
+        frame = ImageModel.to_8bit(frame)
+        if ImageModel.has_alpha(frame):
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+        if self.video is None:
+            codec = VIDEO_CODECS.get(self.extension, "mp4v")
+            self.video = cv2.VideoWriter(
+                self.path, cv2.VideoWriter_fourcc(*codec), self.fps,
+                frame.shape[1::-1], frame.ndim == 3)
+            if not self.video.isOpened():
+                raise ValueError(f"Unable to write video: {self.path}")
+        self.video.write(frame)
+
+    def write_tiff_page(self, frame):
+        # Pillow can't hold 16 bit colour, only 16 bit greyscale
+        if frame.ndim == 3:
+            frame = ImageModel.to_8bit(frame)
+            conversion = cv2.COLOR_BGRA2RGBA if ImageModel.has_alpha(frame) \
+                else cv2.COLOR_BGR2RGB
+            frame = cv2.cvtColor(frame, conversion)
+        if self.tiff is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)  # Start a new file, don't append
+            self.tiff = TiffImagePlugin.AppendingTiffWriter(self.path)
+        Image.fromarray(frame).save(self.tiff, format="TIFF",
+                                    compression="tiff_deflate")
+        self.tiff.newFrame()
+
+    def close(self):
+        """
+        Finishes the output file.
+
+        Returns
+        None
+        """
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+        if self.tiff is not None:
+            self.tiff.close()
+            self.tiff = None
+
+
+def stream_edits(source_path, output_path, editor, threads=None,
+                 max_in_flight=None, progress=None):
+    """
+    Applies an editor's edits to every frame of a file and writes them out.
+
+    Frames are edited in parallel, but at most max_in_flight are read ahead
+    of the writer, and they are written in their original order.
+
+    Parameters
+    source_path (str): The video or image file to read.
+    output_path (str): The file to write.
+    editor (FrameEditor): The edits to apply.
+    threads (int): Threads to edit frames with, default the CPU count.
+    max_in_flight (int): Most frames held at once, default 2 per thread.
+    progress (callable): Called with the number of frames written after
+        each frame, or None.
+
+    Returns
+    int: The number of frames written.
+    """
+    threads = threads or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or 2 * threads)
+    frames = read_frames(source_path)
+    pending = deque()
+    writer = FrameWriter(output_path, fps=get_fps(source_path))
+
+    def timed_apply(frame):
+        # Time each frame's edit for the metrics
+        start = time.perf_counter()
+        try:
+            return editor.apply(frame)
+        finally:
+            FRAME_SECONDS.observe(time.perf_counter() - start)
+
+    apply = timed_apply if metrics.enabled else editor.apply
+    with ThreadPoolExecutor(max_workers=threads,
+                            thread_name_prefix="stream") as executor:
+        try:
+            while True:
+                # Read ahead until the window is full or the input ends
+                while len(pending) < max_in_flight:
+                    try:
+                        frame = next(frames)
+                    except StopIteration:
+                        break
+                    pending.append(executor.submit(apply, frame))
+                    frame = None
+                FRAMES_IN_FLIGHT.set(len(pending))
+                if not pending:
+                    break
+                edited = pending.popleft().result()
+                writer.write(edited)
+                FRAMES_WRITTEN.inc()
+                edited = None
+                if progress is not None:
+                    progress(writer.count)
+        finally:
+            for future in pending:
+                future.cancel()
+            frames.close()
+            writer.close()
+    return writer.count
+
+
+def get_fps(path):
+    """
+    Returns the frame rate of a video file.
+
+    Parameters
+    path (str): The file path.
+
+    Returns
+    float: Frames per second, or 0 if it isn't a video.
+    """
+    if not is_video(path):
+        return 0.0
+    capture = cv2.VideoCapture(path)
+    try:
+        return capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+
+
+def parse_args():
+    """
+    Parses the command line options.
+
+    Returns
+    argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Apply crop, rotate, adjustment and scale edits to "
+                    "every frame of a video or multi-page image")
+    parser.add_argument("source", help="video or multi-page image to read")
+    parser.add_argument("output", help="video, TIFF or image file to write")
+    parser.add_argument(
+        "--crop", type=int, nargs=4, default=None,
+        metavar=("X0", "Y0", "X1", "Y1"), help="crop rectangle in pixels")
+    parser.add_argument(
+        "--rotate", type=int, default=0, metavar="DEGREES",
+        help="clockwise rotation after cropping, e.g. 90")
+    parser.add_argument(
+        "--brightness", type=int, default=0, help="brightness, -100 to 100")
+    parser.add_argument(
+        "--contrast", type=float, default=1.0, help="contrast factor")
+    parser.add_argument(
+        "--gamma", type=float, default=1.0, help="gamma correction")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="scale factor, applied last")
+    parser.add_argument(
+        "--threads", type=int, default=None,
+        help="threads to edit frames with (default: CPU count)")
+    Image_Metrics.add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    backends.load_or_calibrate()
+    dumper = Image_Metrics.start_dumper(args)
+    # Make the edits on the first frame, as the editor would, then repeat
+    # them on every frame
+    model = ImageModel()
+    model.load_image(args.source)
+    if args.crop:
+        model.crop_image(*args.crop)
+    if args.rotate:
+        model.rotate_image(args.rotate)
+    model.set_brightness(args.brightness)
+    model.set_contrast(args.contrast)
+    model.set_gamma(args.gamma)
+    model.set_scale_factor(args.scale)
+    total = count_frames(args.source)
+
+    def show_progress(count):
+        print(f"\rFrame {count}" + (f" of {total}" if total else ""),
+              end="", flush=True)
+
+    try:
+        written = stream_edits(args.source, args.output,
+                               FrameEditor.from_model(model),
+                               threads=args.threads, progress=show_progress)
+    finally:
+        if dumper is not None:
+            dumper.stop()
+    print(f"\n{written} frames written to: {args.output}")
+    sys.exit(0 if written else 1)
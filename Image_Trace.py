@@ -0,0 +1,303 @@
+# Image Trace
+# Lightweight tracing of the time spent in the Model, View and Controller.
+# Hot paths are wrapped in spans which record their name, start time and
+# duration along with the bytes and image dimensions going in and out.
+# Tracing is disabled by default, in which case a span costs a single
+# attribute check. The recorded spans can be exported as Chrome trace-event
+# JSON and opened in chrome://tracing or https://ui.perfetto.dev
+# When metrics are enabled (see Image_Metrics), traced functions also record
+# their duration in the operation latency histogram.
+
+import functools
+import json
+import os
+import threading
+import time
+
+from Image_Metrics import OPERATION_SECONDS, metrics
+
+
+class Tracer:
+    """
+    A class to record timed spans and export them as a Chrome trace.
+
+    Attributes
+    enabled (bool):
+        Whether spans are recorded.
+    events (list):
+        The recorded trace events, in Chrome trace-event format.
+
+    Methods
+    __init__():
+        Initializes the Tracer object.
+    enable():
+        Starts recording spans.
+    disable():
+        Stops recording spans.
+    clear():
+        Discards all recorded spans.
+    span(name, **args):
+        Returns a context manager that records a span.
+    add_event(name, start_ns, end_ns, args):
+        Records a completed span.
+    export_chrome_trace(path):
+        Writes the recorded spans to a Chrome trace-event JSON file.
+    """
+
+    def __init__(self):
+        self.enabled = False  # Spans are only recorded when enabled.
+        self.events = []  # Recorded trace events.
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()  # Time zero of the trace.
+
+    def enable(self):
+        """
+        Starts recording spans.
+
+        Returns
+        None
+        """
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stops recording spans.
+
+        Returns
+        None
+        """
+        self.enabled = False
+
+    def clear(self):
+        """
+        Discards all recorded spans.
+
+        Returns
+        None
+        """
+        with self._lock:
+            self.events = []
+
+    def span(self, name, **args):
+        """
+        Returns a context manager that records a span around a block.
+
+        Extra information can be added to the span while it is open with
+        its set() method, e.g. the size of a result.
+
+        Parameters
+        name (str): The name of the span.
+        **args: Values to record with the span.
+
+        Returns
+        Span: The span context manager, or a no-op span if disabled.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, args)
+
+    def add_event(self, name, start_ns, end_ns, args):
+        """
+        Records a completed span.
+
+        Parameters
+        name (str): The name of the span.
+        start_ns (int): The start time from time.perf_counter_ns().
+        end_ns (int): The end time from time.perf_counter_ns().
+        args (dict): Values to record with the span.
+
+        Returns
+        None
+        """
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",  # Complete event - has a start and a duration
+            "ts": (start_ns - self._origin_ns) / 1000.0,  # microseconds
+            "dur": (end_ns - start_ns) / 1000.0,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def export_chrome_trace(self, path):
+        """
+        Writes the recorded spans to a Chrome trace-event JSON file.
+
+        Parameters
+        path (str): The path of the file to write.
+
+        Returns
+        None
+        """
+        with self._lock:
+            events = list(self.events)
+        # Name the threads so the trace viewer shows something readable
+        for tid in {event["tid"] for event in events}:
+            name = "main" if tid == threading.main_thread().ident \
+                else f"thread-{tid}"
+            events.append({"name": "thread_name", "ph": "M",
+                           "pid": os.getpid(), "tid": tid,
+                           "args": {"name": name}})
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"},
+                      trace_file)
+
+
+class Span:
+    """
+    A context manager that records a span with its Tracer when it exits.
+
+    Methods
+    set(**args):
+        Adds values to record with the span.
+    """
+
+    __slots__ = ("tracer", "name", "args", "start_ns")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add_event(self.name, self.start_ns, end_ns, self.args)
+        return False
+
+    def set(self, **args):
+        """
+        Adds values to record with the span.
+
+        Parameters
+        **args: Values to record with the span.
+
+        Returns
+        None
+        """
+        self.args.update(args)
+
+
+class _NullSpan:
+    # Span used when tracing is disabled - does nothing.
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+# The tracer shared by the whole application
+tracer = Tracer()
+
+
+def describe(value):
+    """
+    Returns the size in bytes and the dimensions of an image value.
+
+    Works for numpy arrays, PIL images and tkinter PhotoImages.
+
+    Parameters
+    value: The value to describe.
+
+    Returns
+    tuple: (bytes, "WxH" dimensions), or (0, None) if not an image.
+    """
+    if hasattr(value, "nbytes") and hasattr(value, "shape"):  # numpy
+        if len(value.shape) >= 2:
+            return int(value.nbytes), f"{value.shape[1]}x{value.shape[0]}"
+        return int(value.nbytes), None
+    if hasattr(value, "getbands"):  # PIL image
+        width, height = value.size
+        return width * height * len(value.getbands()), f"{width}x{height}"
+    if callable(getattr(value, "width", None)) and \
+            callable(getattr(value, "height", None)):  # PhotoImage
+        width, height = value.width(), value.height()
+        return width * height * 4, f"{width}x{height}"
+    return 0, None
+
+
+def traced(name=None, output=None):
+    """
+    Decorator that records a span each time the function is called.
+
+    The span records the bytes and dimensions of any image arguments and of
+    the returned image. When metrics are enabled the duration is also
+    recorded in the operation latency histogram. When tracing and metrics
+    are disabled the only overhead is two attribute checks.
+
+    Can be used as @traced or @traced("span name"). The default span name is
+    the function's qualified name, e.g. "ImageModel.load_image".
+
+    Parameters
+    name (str): The name of the span.
+    output (str): For methods that store their result rather than return
+        it, the name of the attribute of self holding the result, e.g.
+        "edited_image".
+
+    Returns
+    callable: The decorator.
+    """
+    def decorator(func):
+        span_name = name if isinstance(name, str) else func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                if not metrics.enabled:
+                    return func(*args, **kwargs)
+                start_ns = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    OPERATION_SECONDS.observe(
+                        (time.perf_counter_ns() - start_ns) / 1e9,
+                        operation=span_name)
+            bytes_in = 0
+            dims_in = None
+            for arg in args:
+                nbytes, dims = describe(arg)
+                bytes_in += nbytes
+                dims_in = dims_in or dims
+            start_ns = time.perf_counter_ns()
+            span_args = {}
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as error:
+                span_args["error"] = type(error).__name__
+                raise
+            finally:
+                end_ns = time.perf_counter_ns()
+                if "error" not in span_args:
+                    if output is not None:
+                        result_image = getattr(args[0], output, None)
+                    else:
+                        result_image = result
+                    bytes_out, dims_out = describe(result_image)
+                    span_args.update(bytes_out=bytes_out, dims_out=dims_out)
+                span_args.update(bytes_in=bytes_in, dims_in=dims_in)
+                tracer.add_event(span_name, start_ns, end_ns, span_args)
+                OPERATION_SECONDS.observe((end_ns - start_ns) / 1e9,
+                                          operation=span_name)
+            return result
+        return wrapper
+
+    if callable(name):  # Used as @traced without arguments
+        return decorator(name)
+    return decorator
@@ -7,9 +7,15 @@
 # changes to the Model and Controller.
 
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk
 from tkinter import filedialog
+from tkinter import messagebox
 from PIL import Image, ImageTk
+from Image_Trace import traced, tracer
+from Image_Startup import profiler
+from Image_Filmstrip import Filmstrip
+from Image_Loupe import Loupe
 
 
 class ImageView:
@@ -33,8 +39,10 @@ class ImageView:
         end_x (int): The x coordinate on mouse release.
         end_y (int): The y coordinate on mouse release.
         rect (tk.Canvas): The rectangle drawn on the canvas.
+        loupe (Loupe): The magnifier shown while a selection is dragged.
         open_image_button (ttk.Button): The button to open a file.
         save_image_button (ttk.Button): The button to save the image.
+        export_frames_button (ttk.Button): The button to edit every frame of a video or multi-page image.
         crop_image_button (ttk.Button): The button to crop the image.
         rotate_image_left_button (tk.Button): The button to rotate the image left.
         rotate_image_right_button (tk.Button): The button to rotate the image right.
@@ -45,6 +53,22 @@ class ImageView:
         icon_rotate_right (ttk.Button): The button to rotate the image right.
         slider_scale (ttk.Scale): The scale for image size.
         slider_label (ttk.Label): The label for image size.
+        memory_status_label (ttk.Label): The label showing memory use.
+        tone_frame (ttk.LabelFrame): The frame for the tonal adjustment sliders.
+        tone_sliders (dict): The tonal adjustment sliders, keyed by name.
+        tone_value_labels (dict): The labels showing the tonal adjustment values.
+        filter_frame (ttk.LabelFrame): The frame for the filter controls.
+        filter_combobox (ttk.Combobox): The list of filters to choose from.
+        apply_filter_button (ttk.Button): The button to apply the chosen filter.
+        selection_only (tk.BooleanVar): True to filter the selected area only.
+        selection_only_checkbutton (ttk.Checkbutton): The check box for selection_only.
+        apply_tone_selection_button (ttk.Button): The button to adjust the selected area.
+        histogram_frame (ttk.LabelFrame): The frame for the histogram panel.
+        histogram_canvas (tk.Canvas): The canvas the histogram is drawn on.
+        histogram_stats_label (ttk.Label): The label for the channel statistics.
+        exact_stats_button (ttk.Button): The button to calculate exact statistics.
+        bottom_frame (ttk.Frame): The frame for the filmstrip.
+        filmstrip (Filmstrip): Thumbnails of the images in the current folder.
 
     Methods:
         __init__(self, root): Initializes the ImageView class.
@@ -62,13 +86,30 @@ class ImageView:
         on_mouse_release(self, event): Handles mouse release event.
         update_edited_image(self, image): 
             Updates the edited image in the edited image frame.
-        load_icons(self): Loads icon images for the application.
+        load_icons(self): Starts loading the icon images in the background.
+        apply_icons(self): Shows the icon images on the buttons once loaded.
         get_max_scale_value(self): Returns the maximum value for the scale.
         get_min_scale_value(self): Returns the minimum value for the scale.
         get_resize_image_slider_value(self): Returns the current value of the scale.
         set_resize_image_slider_value(self, value): Sets the value of the scale.
         increment_resize_image_slider_value(self): Increments the value of the scale.
         decrement_resize_image_slider_value(self): Decrements the value of the scale.
+        set_memory_status(self, text): Sets the text of the memory status label.
+        get_tone_slider_value(self, name): Returns the value of a tonal adjustment slider.
+        set_tone_value_label(self, name, text): Sets the label of a tonal adjustment slider.
+        reset_tone_sliders(self): Sets the tonal adjustment sliders to their defaults.
+        get_selected_filter(self): Returns the name of the chosen filter.
+        get_selection_only(self): Returns True to filter the selected area only.
+        draw_histogram(self, histograms): Draws the channel histograms.
+        set_histogram_stats(self, text): Sets the text of the statistics label.
+        show_error(self, title, message): Shows an error message dialog.
+        show_info(self, title, message): Shows an information message dialog.
+        ask_yes_no(self, title, message): Asks the user a yes or no question.
+        set_tone_slider_value(self, name, value): Moves a tonal adjustment slider.
+        save_frames_file(self, initial_dir, initial_file, extension):
+            Opens a file dialog to choose where to export all the frames.
+        save_spec_file(self, initial_dir):
+            Opens a file dialog to choose where to save an edit spec.
     """
 
     def __init__(self, root):
@@ -90,10 +131,13 @@ class ImageView:
         self.end_x = None  # End x coordinate on mouse release
         self.end_y = None  # End y coordinate on mouse release
         self.rect = None
+        self.loupe = None  # Magnifier shown while selecting
 
         # Control Frame Buttons
         self.open_image_button = None  # Button to open a file.
         self.save_image_button = None  # Button to save the image.
+        # Button to edit every frame of a video or multi-page image.
+        self.export_frames_button = None
         self.crop_image_button = None  # Button to crop the image.
         self.rotate_image_left_button = None  # Button to rotate the image.
         self.rotate_image_right_button = None  # Button to rotate the image.
@@ -107,18 +151,23 @@ class ImageView:
             f"Control-S: Save\n" \
             f"Control-R: Reset\n" \
             f"Control-Q: Quit\n" \
+            f"Control-Z: Undo Selection Edit\n" \
+            f"Control-E: Save Edits for Hot Folder\n" \
             f"Left Arrow: Rotate Left\n" \
             f"Right Arrow: Rotate Right\n" \
             f"Up Arrow: Expand Image Size\n" \
             f"Down Arrow: Shrink Image Size\n" \
-            f"C: Crop Image\n"
+            f"C: Crop Image\n" \
+            f"A: Auto Crop Borders\n"
         self.kbd_shortcuts_label = None
+        self.memory_status_label = None  # Shows memory use of the images.
 
         # Button Icons
         self.icon_rotate_left = None
         self.icon_rotate_right = None
         self.icon_rotate_left_path = "icons/rotate-left-24.png"
         self.icon_rotate_right_path = "icons/rotate-right-24.png"
+        self.ICON_POLL_MS = 20  # How often to check if the icons are loaded
 
         # Sliders
         self.resize_image_label = None  # Label for the resize slider.
@@ -129,6 +178,49 @@ class ImageView:
         self.MIN_RESIZE_VALUE = 25
         self.DEFAULT_RESIZE_VALUE = 100
 
+        # Tonal adjustment sliders - (name, label, minimum, maximum, default)
+        self.TONE_SLIDERS = (
+            ("brightness", "Brightness", -100, 100, 0),
+            ("contrast", "Contrast %", 50, 200, 100),
+            ("gamma", "Gamma x100", 20, 300, 100),
+            ("black_point", "Black Level", 0, 254, 0),
+            ("white_point", "White Level", 1, 255, 255),
+        )
+        self.tone_frame = None  # Frame for the tonal adjustment sliders.
+        self.tone_sliders = {}  # Tonal adjustment sliders, by name.
+        self.tone_value_labels = {}  # Labels showing the slider values.
+
+        # Filters - the labels shown in the filter list, by filter name
+        self.FILTER_LABELS = {
+            "blur": "Blur",
+            "sharpen": "Sharpen",
+            "denoise": "Denoise",
+            "edges": "Edge Detect",
+        }
+        self.filter_frame = None  # Frame for the filter controls.
+        self.filter_combobox = None  # List of filters to choose from.
+        self.apply_filter_button = None  # Button to apply the chosen filter.
+        self.selection_only = None  # Filter the selected area only.
+        self.selection_only_checkbutton = None
+        # Button to apply the tonal adjustments to the selected area.
+        self.apply_tone_selection_button = None
+
+        # Histogram panel
+        self.HISTOGRAM_WIDTH = 256  # One pixel per level
+        self.HISTOGRAM_HEIGHT = 120
+        self.HISTOGRAM_COLOURS = {
+            "blue": "#3060ff",
+            "green": "#20a020",
+            "red": "#e02020",
+            "grey": "#404040",
+        }
+        self.histogram_frame = None  # Frame for the histogram panel.
+        self.histogram_canvas = None  # Canvas the histogram is drawn on.
+        self.histogram_stats_label = None  # Label for the channel statistics.
+        self.exact_stats_button = None  # Button to calculate exact statistics.
+        self.bottom_frame = None  # Frame for the filmstrip.
+        self.filmstrip = None  # Thumbnails of the images in the folder.
+
         # Image View Labels
         self.image_original_title = None  # Indicates Original Image Frame
         self.image_path = None  # Path to the image file.
@@ -137,15 +229,18 @@ class ImageView:
         self.image_edited_title = None  # Indicates Edited Image Frame
         self.image_edited_label = None  # Holds Edited image.
 
-        # Load Button Icons
-        self.load_icons()
-
         # Call create widgets method
         self.create_widgets()
 
+        # Load Button Icons in the background so the window can be shown
+        # straight away. The rotate buttons show text until they are loaded.
+        self.icon_loader = None
+        self.load_icons()
+
         # Bind UI mouse events to methods
         self.bind_mouse_events()
 
+    @traced
     def create_widgets(self):
         """
         Initializes and places all the widgets in the main window.
@@ -176,13 +271,18 @@ class ImageView:
             row=0, column=1, columnspan=3,  sticky="nsew")
         self.image_frame_edited.grid(
             row=0, column=4,  columnspan=3, sticky="nsew")
-        # self.bottom_frame.grid(row=1, column=0, columnspan=7, sticky="ew")
+        self.histogram_frame = ttk.LabelFrame(
+            self.content_frame, text="Histogram", padding=(3, 0, 3, 3))
+        self.histogram_frame.grid(row=0, column=7, sticky="nsew")
+        self.bottom_frame.grid(row=1, column=0, columnspan=8, sticky="ew")
 
         # Create buttons
         self.open_image_button = ttk.Button(
             self.controls_frame, text="Open Image")
         self.save_image_button = ttk.Button(
             self.controls_frame, text="Save Image")
+        self.export_frames_button = ttk.Button(
+            self.controls_frame, text="Export All Frames")
         self.crop_image_button = ttk.Button(
             self.controls_frame, text="Crop Image")
         self.reset_image_button = ttk.Button(
@@ -206,6 +306,7 @@ class ImageView:
         self.kbd_shortcuts_label = ttk.Label(
             self.controls_frame, text=self.KEYBOARD_SHORTCUTS_TEXT
         )
+        self.memory_status_label = ttk.Label(self.controls_frame, text="")
         # Create Sliders
         self.resize_image_label = ttk.Label(
             self.controls_frame, text="Resize Image")
@@ -214,41 +315,102 @@ class ImageView:
         self.resize_image_slider.set(self.DEFAULT_RESIZE_VALUE)
         self.resize_image_slider_value_label = ttk.Label(
             self.controls_frame, text=f"Scale factor: {self.DEFAULT_RESIZE_VALUE}%")
+        # Tonal adjustment sliders - a label and a slider for each
+        self.tone_frame = ttk.LabelFrame(
+            self.controls_frame, text="Adjustments", padding=(3, 0, 3, 3))
+        for row, (name, label, minimum, maximum, default) in \
+                enumerate(self.TONE_SLIDERS):
+            value_label = ttk.Label(self.tone_frame, text=f"{label}: {default}")
+            slider = ttk.Scale(self.tone_frame, from_=minimum, to=maximum,
+                               orient="horizontal")
+            slider.set(default)
+            value_label.grid(row=2 * row, column=0, sticky="nsew")
+            slider.grid(row=2 * row + 1, column=0, sticky="nsew")
+            self.tone_value_labels[name] = value_label
+            self.tone_sliders[name] = slider
+        self.apply_tone_selection_button = ttk.Button(
+            self.tone_frame, text="Apply to Selection")
+        self.apply_tone_selection_button.grid(
+            row=2 * len(self.TONE_SLIDERS), column=0, sticky="nsew")
+        self.tone_frame.columnconfigure(0, weight=1)
+        # Filter list and apply button
+        self.filter_frame = ttk.LabelFrame(
+            self.controls_frame, text="Filters", padding=(3, 0, 3, 3))
+        self.filter_combobox = ttk.Combobox(
+            self.filter_frame, state="readonly",
+            values=list(self.FILTER_LABELS.values()))
+        self.filter_combobox.current(0)
+        self.apply_filter_button = ttk.Button(
+            self.filter_frame, text="Apply Filter")
+        self.selection_only = tk.BooleanVar(value=False)
+        self.selection_only_checkbutton = ttk.Checkbutton(
+            self.filter_frame, text="Selection Only",
+            variable=self.selection_only)
+        self.filter_combobox.grid(row=0, column=0, sticky="nsew")
+        self.selection_only_checkbutton.grid(row=1, column=0, sticky="nsew")
+        self.apply_filter_button.grid(row=2, column=0, sticky="nsew")
+        self.filter_frame.columnconfigure(0, weight=1)
 
         # Layout Control Frame Widgets
         self.open_image_button.grid(
             row=0, column=0, columnspan=2, sticky="nsew")
         self.save_image_button.grid(
             row=1, column=0, columnspan=2, sticky="nsew")
-        self.crop_image_button.grid(
+        self.export_frames_button.grid(
             row=2, column=0, columnspan=2, sticky="nsew")
-        self.reset_image_button.grid(
+        self.crop_image_button.grid(
             row=3, column=0, columnspan=2, sticky="nsew")
-        self.resize_image_label.grid(
+        self.reset_image_button.grid(
             row=4, column=0, columnspan=2, sticky="nsew")
-        self.resize_image_slider.grid(
+        self.resize_image_label.grid(
             row=5, column=0, columnspan=2, sticky="nsew")
-        self.resize_image_slider_value_label.grid(
+        self.resize_image_slider.grid(
             row=6, column=0, columnspan=2, sticky="nsew")
+        self.resize_image_slider_value_label.grid(
+            row=7, column=0, columnspan=2, sticky="nsew")
         self.rotate_image_left_button.grid(
-            row=7, column=0, sticky="nsew")
+            row=8, column=0, sticky="nsew")
         self.rotate_image_right_button.grid(
-            row=7, column=1, sticky="nsew")
-        self.quit_button.grid(row=8, column=0, columnspan=2, sticky="nsew")
+            row=8, column=1, sticky="nsew")
+        self.tone_frame.grid(row=9, column=0, columnspan=2, sticky="nsew")
+        self.filter_frame.grid(row=10, column=0, columnspan=2, sticky="nsew")
+        self.quit_button.grid(row=11, column=0, columnspan=2, sticky="nsew")
         self.kbd_shortcuts_label.grid(
-            row=9, column=0, columnspan=2, sticky="nsew")
+            row=12, column=0, columnspan=2, sticky="nsew")
+        self.memory_status_label.grid(
+            row=13, column=0, columnspan=2, sticky="nsew")
 
         # Create Image Frame Widgets
         self.image_original_title = ttk.Label(
             self.image_frame_original, text="Original Image")
         self.image_canvas_original = tk.Canvas(
             self.image_frame_original, bg="white", cursor="cross", height=0, width=0)
+        # Magnified full size pixels shown beside the cursor while selecting
+        self.loupe = Loupe(self.image_canvas_original)
 
         self.image_edited_title = ttk.Label(
             self.image_frame_edited, text="Edited Image")
         self.image_label_edited = ttk.Label(
             self.image_frame_edited)
 
+        # Create Histogram Panel Widgets
+        self.histogram_canvas = tk.Canvas(
+            self.histogram_frame, bg="white", highlightthickness=0,
+            width=self.HISTOGRAM_WIDTH, height=self.HISTOGRAM_HEIGHT)
+        self.histogram_stats_label = ttk.Label(
+            self.histogram_frame, text="", font=("TkFixedFont", 9),
+            justify="left")
+        self.exact_stats_button = ttk.Button(
+            self.histogram_frame, text="Exact Stats")
+        self.histogram_canvas.grid(row=0, column=0, sticky="n")
+        self.histogram_stats_label.grid(row=1, column=0, sticky="nw")
+        self.exact_stats_button.grid(row=2, column=0, sticky="new")
+
+        # Create Filmstrip - only the thumbnails in view are drawn
+        self.filmstrip = Filmstrip(self.bottom_frame)
+        self.filmstrip.frame.grid(row=0, column=0, sticky="ew")
+        self.bottom_frame.columnconfigure(0, weight=1)
+
         # Layout Image Frame Widgets
         self.image_original_title.grid(row=0, sticky="w")
         self.image_canvas_original.grid(row=1, sticky="nsew")
@@ -277,7 +439,7 @@ class ImageView:
         """
         # Open a file dialog to select an image file
         file_path = filedialog.askopenfilename(
-            initialdir=start_path, title="Select file", filetypes=(("jpeg files", "*.jpg"), ("png files", "*.png"), ("all files", "*.*")))
+            initialdir=start_path, title="Select file", filetypes=(("jpeg files", "*.jpg"), ("png files", "*.png"), ("tiff files", "*.tif *.tiff"), ("video files", "*.mp4 *.avi *.mov *.mkv"), ("all files", "*.*")))
         return file_path
 
     def save_edited_image(self, initial_dir, initial_file) -> str:
@@ -304,6 +466,79 @@ class ImageView:
         )
         return file_path
 
+    def save_frames_file(self, initial_dir, initial_file,
+                         extension) -> str:
+        """
+        Opens a file dialog to choose where to write the edited frames of a
+        video or multi-page image, and returns the file path.
+
+        Parameters
+        initial_dir (str): The initial directory path for the file dialog.
+        initial_file (str): The initial file name.
+        extension (str): The default extension, e.g. ".mp4".
+
+        Returns
+        str: The file path chosen, empty if cancelled.
+        """
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=extension,
+            filetypes=(("video files", "*.mp4 *.avi *.mov *.mkv"),
+                       ("tiff files", "*.tif *.tiff"),
+                       ("numbered image files", "*.png *.jpg"),
+                       ("all files", "*.*")),
+            initialdir=initial_dir or "/",
+            initialfile=initial_file,
+            title="Export all frames",
+        )
+        return file_path
+
+    def save_spec_file(self, initial_dir) -> str:
+        """
+        Opens a file dialog to choose where to save the current edits as an
+        edit spec for the hot folder, and returns the file path.
+
+        Parameters
+        initial_dir (str): The initial directory path for the file dialog.
+
+        Returns
+        str: The file path chosen, empty if cancelled.
+        """
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=(("edit spec files", "*.json"), ("all files", "*.*")),
+            initialdir=initial_dir or "/",
+            initialfile="edits.json",
+            title="Save edits for hot folder",
+        )
+        return file_path
+
+    def ask_yes_no(self, title, message):
+        """
+        Asks the user a yes or no question.
+
+        Parameters
+        title (str): The title of the dialog.
+        message (str): The question.
+
+        Returns
+        bool: True if the user answered yes.
+        """
+        return messagebox.askyesno(title, message, parent=self.root)
+
+    def show_info(self, title, message):
+        """
+        Shows an information message dialog.
+
+        Parameters
+        title (str): The title of the dialog.
+        message (str): The message to display.
+
+        Returns
+        None
+        """
+        messagebox.showinfo(title, message, parent=self.root)
+
+    @traced
     def display_image(self, image):
         """
         Displays the image in the original image frame.
@@ -355,7 +590,8 @@ class ImageView:
 
         When the user clicks on the original image canvas, this method is called.
         It captures the mouse coordinates and marks the start of the selection area.
-        The selection area is shown as a red rectangle on the canvas.
+        The selection area is shown as a red rectangle on the canvas, and the
+        loupe shows the full size pixels under the cursor.
         """
         self.start_x = event.x
         self.start_y = event.y
@@ -363,6 +599,7 @@ class ImageView:
             self.image_canvas_original.delete(self.rect)
         self.rect = self.image_canvas_original.create_rectangle(
             self.start_x, self.start_y, self.start_x, self.start_y, outline="red")
+        self.loupe.show(event.x, event.y)
 
     # Handle mouse drag event
     def on_mouse_drag(self, event):
@@ -370,11 +607,13 @@ class ImageView:
         Handles the mouse drag event for the original image canvas.
 
         When the user drags the mouse on the original image canvas, this method is called.
-        It updates the coordinates of the selection rectangle to show the current drag position.
+        It updates the coordinates of the selection rectangle to show the current drag position,
+        and moves the loupe with the cursor.
         """
         if self.rect:
             self.image_canvas_original.coords(
                 self.rect, self.start_x, self.start_y, event.x, event.y)
+        self.loupe.show(event.x, event.y)
 
     def on_mouse_release(self, event):
         """
@@ -393,7 +632,9 @@ class ImageView:
         """
         self.end_x = event.x
         self.end_y = event.y
+        self.loupe.hide()
 
+    @traced
     def update_edited_image(self, image):
         """
         Updates the edited image in the edited image frame.
@@ -415,6 +656,11 @@ class ImageView:
                                        height=image.height())
         self.image_label_edited.configure(image=image)
         self.image_label_edited.image = image
+        # Tk normally lays out and redraws when idle. When tracing, do it now
+        # so the cost shows up in the trace.
+        if tracer.enabled:
+            with tracer.span("tk.update_idletasks"):
+                self.root.update_idletasks()
 
     # def update_image(self, image):
     #     # Update displayed image
@@ -422,21 +668,59 @@ class ImageView:
 
     def load_icons(self):
         """
-        Loads icon images for the application.
-        """
-        # Load icon images using Pillow
-        try:
-            image = Image.open(self.icon_rotate_left_path)
-            self.icon_rotate_left = ImageTk.PhotoImage(image)
-        except Exception as e:
-            print(f"Error loading image: {e}")
-            self.icon_rotate_left = None
-        try:
-            image = Image.open(self.icon_rotate_right_path)
-            self.icon_rotate_right = ImageTk.PhotoImage(image)
-        except Exception as e:
-            print(f"Error loading image: {e}")
-            self.icon_rotate_right = None
+        Starts loading the icon images for the application in the background.
+
+        The image files are decoded in a worker thread. PhotoImages can only
+        be created in the main thread, so apply_icons() polls for the result
+        from the Tk event loop.
+        """
+        paths = (self.icon_rotate_left_path, self.icon_rotate_right_path)
+        executor = ThreadPoolExecutor(max_workers=1,
+                                      thread_name_prefix="icon-loader")
+        self.icon_loader = executor.submit(self.decode_icons, paths)
+        executor.shutdown(wait=False)
+        self.root.after(self.ICON_POLL_MS, self.apply_icons)
+
+    @staticmethod
+    def decode_icons(paths):
+        """
+        Decodes icon image files using Pillow. Runs in a worker thread.
+
+        Parameters
+        paths (tuple): The icon image file paths.
+
+        Returns
+        list: The decoded PIL images, None for any that could not be loaded.
+        """
+        images = []
+        for path in paths:
+            try:
+                image = Image.open(path)
+                image.load()  # Decode now, not when first used
+                images.append(image)
+            except Exception as e:
+                print(f"Error loading image: {e}")
+                images.append(None)
+        return images
+
+    @traced
+    def apply_icons(self):
+        """
+        Shows the icon images on the rotate buttons once they are loaded.
+        """
+        if not self.icon_loader.done():
+            self.root.after(self.ICON_POLL_MS, self.apply_icons)
+            return
+        left_image, right_image = self.icon_loader.result()
+        if left_image is not None:
+            self.icon_rotate_left = ImageTk.PhotoImage(left_image)
+            self.rotate_image_left_button.config(
+                image=self.icon_rotate_left, text="")
+        if right_image is not None:
+            self.icon_rotate_right = ImageTk.PhotoImage(right_image)
+            self.rotate_image_right_button.config(
+                image=self.icon_rotate_right, text="")
+        profiler.mark("icons loaded")
 
     def get_max_scale_value(self):
         return self.MAX_RESIZE_VALUE
@@ -469,3 +753,146 @@ class ImageView:
         if new_value < self.MIN_RESIZE_VALUE:
             new_value = self.MIN_RESIZE_VALUE
         self.resize_image_slider.set(new_value)
+
+    def set_memory_status(self, text):
+        """
+        Sets the text of the memory status label.
+
+        Parameters
+        text (str): The memory status to display.
+
+        Returns
+        None
+        """
+        self.memory_status_label.config(text=text)
+
+    def show_error(self, title, message):
+        """
+        Shows an error message dialog.
+
+        Parameters
+        title (str): The title of the dialog.
+        message (str): The message to display.
+
+        Returns
+        None
+        """
+        messagebox.showerror(title, message, parent=self.root)
+
+    def get_tone_slider_value(self, name):
+        """
+        Returns the value of a tonal adjustment slider, rounded to a whole number.
+
+        Parameters
+        name (str): The slider name, e.g. "brightness".
+
+        Returns
+        int: The slider value.
+        """
+        return int(round(float(self.tone_sliders[name].get())))
+
+    def set_tone_value_label(self, name, value):
+        """
+        Shows the value of a tonal adjustment slider in its label.
+
+        Parameters
+        name (str): The slider name, e.g. "brightness".
+        value (int): The value to show.
+
+        Returns
+        None
+        """
+        for slider_name, label, _, _, _ in self.TONE_SLIDERS:
+            if slider_name == name:
+                self.tone_value_labels[name].config(text=f"{label}: {value}")
+
+    def set_tone_slider_value(self, name, value):
+        """
+        Moves a tonal adjustment slider and shows its value in its label.
+
+        Parameters
+        name (str): The slider name, e.g. "brightness".
+        value (int): The new value.
+
+        Returns
+        None
+        """
+        self.tone_sliders[name].set(value)
+        self.set_tone_value_label(name, value)
+
+    def reset_tone_sliders(self):
+        """
+        Sets the tonal adjustment sliders back to their defaults.
+
+        Returns
+        None
+        """
+        for name, label, _, _, default in self.TONE_SLIDERS:
+            self.tone_sliders[name].set(default)
+            self.tone_value_labels[name].config(text=f"{label}: {default}")
+
+    def get_selected_filter(self):
+        """
+        Returns the name of the filter chosen in the filter list.
+
+        Returns
+        str: The filter name, e.g. "blur".
+        """
+        label = self.filter_combobox.get()
+        for name, filter_label in self.FILTER_LABELS.items():
+            if filter_label == label:
+                return name
+        return None
+
+    def get_selection_only(self):
+        """
+        Returns True if filters should only be applied to the selected area.
+
+        Returns
+        bool: The state of the Selection Only check box.
+        """
+        return self.selection_only.get()
+
+    @traced
+    def draw_histogram(self, histograms):
+        """
+        Draws the channel histograms as lines on the histogram canvas.
+
+        Each histogram is scaled to the canvas height by its tallest level,
+        ignoring pure black and pure white so a clipped image still shows
+        the shape of its other levels.
+
+        Parameters
+        histograms (list): (channel name, histogram) tuples of 256 counts,
+            or None to clear the canvas.
+
+        Returns
+        None
+        """
+        self.histogram_canvas.delete("all")
+        if not histograms:
+            return
+        height = self.HISTOGRAM_HEIGHT
+        scale = self.HISTOGRAM_WIDTH / 256
+        for name, hist in histograms:
+            colour = self.HISTOGRAM_COLOURS.get(name)
+            if colour is None:
+                continue  # The alpha channel isn't drawn
+            peak = max(hist[1:255].max(), 1)
+            points = []
+            for level, count in enumerate(hist):
+                points.append(level * scale)
+                points.append(height - min(count / peak, 1.0) * (height - 1))
+            self.histogram_canvas.create_line(*points, fill=colour)
+
+    def set_histogram_stats(self, text):
+        """
+        Sets the text of the histogram statistics label.
+
+        Parameters
+        text (str): The statistics to display.
+
+        Returns
+        None
+        """
+        self.histogram_stats_label.config(text=text)
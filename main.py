@@ -11,16 +11,218 @@ File: main.py
 This is the main file for the Assignment 3 Image Editor Application.
 """
 
+# The startup profiler is imported first so it can time the other imports.
+import sys
+from Image_Startup import profiler
+if "--startup-profile" in sys.argv:
+    profiler.start_import_timing()
+
+import argparse
+import json
+import os
+import threading
 import tkinter as tk
-import Image_Model
+from concurrent.futures import ThreadPoolExecutor
 import Image_View
 import Image_Controller
+from Image_Trace import tracer
+from Image_Latency import LatencyMonitor
+from Image_Replay import SessionRecorder, SessionPlayer, load_recording
+
+
+def parse_args():
+    """
+    Parses the command line options.
+
+    Returns
+    argparse.Namespace: The parsed options.
+    """
+    parser = argparse.ArgumentParser(description="HIT137 - Image Editor")
+    parser.add_argument(
+        "--memory-limit", type=float, default=None, metavar="MB",
+        help="maximum memory, in megabytes, the image buffers may use")
+    parser.add_argument(
+        "--trace", default=None, metavar="FILE",
+        help="record timing spans and write them to FILE as a Chrome trace")
+    parser.add_argument(
+        "--latency", action="store_true",
+        help="measure input-to-paint latency and mainloop stalls "
+             "(F12 shows the statistics)")
+    parser.add_argument(
+        "--latency-report", default=None, metavar="FILE",
+        help="measure latency and write the statistics to FILE as JSON on exit")
+    parser.add_argument(
+        "--stall-threshold", type=float, default=100, metavar="MS",
+        help="log mainloop stalls longer than MS milliseconds (default 100)")
+    parser.add_argument(
+        "--record", default=None, metavar="FILE",
+        help="record the session's input events to FILE for replay")
+    parser.add_argument(
+        "--replay", default=None, metavar="FILE",
+        help="replay a recorded session, write the report and quit")
+    parser.add_argument(
+        "--replay-report", default="replay_report.json", metavar="FILE",
+        help="file to write the replay report to (default: %(default)s)")
+    parser.add_argument(
+        "--replay-realtime", action="store_true",
+        help="keep the recorded gaps between events when replaying")
+    parser.add_argument(
+        "--startup-profile", action="store_true",
+        help="report the time to first paint and a breakdown of import times")
+    parser.add_argument(
+        "--processes", type=int, default=0, metavar="N",
+        help="filter large images in N worker processes, sharing the "
+             "pixels through shared memory (default: threads only)")
+    parser.add_argument(
+        "--no-autosave", action="store_true",
+        help="don't autosave the edits for restoring after a crash")
+    parser.add_argument(
+        "--backends", default=None, metavar="SPEC",
+        help="resize, conversion and rotation backends to use instead of "
+             "the fastest found by calibrating: \"reference\" or e.g. "
+             "\"shrink=pil,rotate=numpy\"")
+    parser.add_argument(
+        "--auto-crop", action="store_true",
+        help="crop uniform borders, such as scan margins, off each image "
+             "as it is opened")
+    return parser.parse_args()
+
+
+def load_model(memory_limit, processes=0, autosave=True, calibrate=True):
+    """
+    Imports the Model, with OpenCV and NumPy, and creates it.
+
+    This is run in a background thread once the window has been shown, as
+    importing OpenCV and NumPy is the slowest part of starting up.
+
+    Parameters
+    memory_limit (int): The memory limit in bytes, or None.
+    processes (int): Number of worker processes for filters, 0 for none.
+    autosave (bool): Journal the edits so they can be restored after a crash.
+    calibrate (bool): Calibrate the backends in the background if they
+        haven't been on this machine. Otherwise only cached rankings are
+        used, or the reference backends if there are none.
+
+    Returns
+    ImageModel: The new model.
+    """
+    import Image_Model
+    model = Image_Model.ImageModel(memory_limit=memory_limit)
+    if processes > 0:
+        from Image_SharedMemory import ProcessImageExecutor
+        model.process_executor = ProcessImageExecutor(processes)
+    if autosave:
+        from Image_Journal import EditJournal
+        model.journal = EditJournal()
+    # Choose the fastest backends. The first run on a machine calibrates
+    # them, so don't make the model wait for it.
+    from Image_Backends import backends
+    if calibrate:
+        threading.Thread(target=backends.load_or_calibrate,
+                         name="calibration", daemon=True).start()
+    else:
+        backends.load()
+    profiler.mark("model ready")
+    return model
+
+
+def report_startup(root):
+    """
+    Prints the startup profile once the window has been painted and the
+    model and icons have loaded. Checks again later if they haven't.
+
+    Parameters
+    root (tk.Tk): The main Tkinter window.
+
+    Returns
+    None
+    """
+    if all(profiler.has_milestone(name) for name in
+           ("first paint", "model ready", "icons loaded")):
+        profiler.stop_import_timing()
+        print(profiler.report())
+    else:
+        root.after(50, report_startup, root)
+
+
+def replay_session(view, controller, args):
+    """
+    Replays a recorded session, writes the report and closes the window.
+
+    Parameters
+    view (ImageView): The application view.
+    controller (ImageController): The application controller.
+    args (argparse.Namespace): The command line options.
+
+    Returns
+    None
+    """
+    player = SessionPlayer(view, controller, load_recording(args.replay),
+                           realtime=args.replay_realtime)
+    report = player.play()
+    with open(args.replay_report, "w") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Replay report written to: {args.replay_report}")
+    view.root.destroy()
+
 
 if __name__ == '__main__':
     print("HIT137 - Group Assignment 3")
+    args = parse_args()
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = int(args.memory_limit * 1024 * 1024)
+    if args.trace:
+        tracer.enable()
+    if args.backends is not None:
+        # Read when the model is loaded, and by worker processes
+        os.environ["HIT137_BACKENDS"] = args.backends
     root = tk.Tk()
-    model = Image_Model.ImageModel()
+    root.bind("<Expose>", lambda event: profiler.mark("first paint"), add="+")
     view = Image_View.ImageView(root)
-    controller = Image_Controller.ImageController(model, view)
     root.title("HIT137 - Image Editor")
+    # Show the window, then load the Model in the background. The controller
+    # waits for the model if it is needed before it has loaded.
+    root.update()
+    profiler.mark("window shown")
+    model_loader = ThreadPoolExecutor(max_workers=1,
+                                      thread_name_prefix="model-loader")
+    # Replays must not stop for the restore question, so don't autosave them
+    autosave = not args.no_autosave and not args.replay
+    # Calibrating would load the CPU and change backends while a replay is
+    # timed, so replays use the cached rankings or the reference backends
+    model = model_loader.submit(load_model, memory_limit, args.processes,
+                                autosave, calibrate=not args.replay)
+    model_loader.shutdown(wait=False)
+    latency_monitor = None
+    if args.latency or args.latency_report:
+        latency_monitor = LatencyMonitor(
+            stall_threshold_ms=args.stall_threshold)
+    controller = Image_Controller.ImageController(
+        model, view, latency_monitor=latency_monitor,
+        auto_crop_on_load=args.auto_crop)
+    if args.startup_profile:
+        report_startup(root)
+    recorder = None
+    if args.record:
+        recorder = SessionRecorder(view)
+    if args.replay:
+        root.after(100, replay_session, view, controller, args)
+    elif autosave:
+        root.after(100, controller.offer_restore)
     root.mainloop()
+    view.filmstrip.shutdown()
+    if recorder is not None:
+        recorder.save(args.record)
+        print(f"Session recording written to: {args.record}")
+    if args.trace:
+        tracer.export_chrome_trace(args.trace)
+        print(f"Trace written to: {args.trace}")
+    if args.latency_report:
+        latency_monitor.dump_json(args.latency_report)
+        print(f"Latency report written to: {args.latency_report}")
+    if args.processes > 0:
+        controller.model.process_executor.shutdown()
+    if autosave:
+        # Closed normally, so there is nothing to restore
+        controller.model.journal.close()
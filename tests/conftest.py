@@ -0,0 +1,65 @@
+# Shared test fixtures
+# The application's modules sit at the top of the repository, so the
+# repository is put on the import path for the tests.
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Image_Model import ImageModel  # noqa: E402
+
+
+def make_image(height, width, channels=3, dtype=np.uint8, seed=0):
+    """
+    Returns a random image with smooth and sharp detail, so filters and
+    resizes have something to work on.
+
+    Parameters
+    height (int): The height of the image.
+    width (int): The width of the image.
+    channels (int): 1 for a 2D greyscale image, 3 for BGR, 4 for BGRA.
+    dtype: np.uint8 or np.uint16.
+    seed (int): Seed for the random pixels.
+
+    Returns
+    ndarray: The image.
+    """
+    rng = np.random.default_rng(seed)
+    maximum = np.iinfo(dtype).max
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    noise = rng.integers(0, maximum, shape, dtype=dtype, endpoint=True)
+    ramp = np.linspace(0, maximum, width, dtype=np.float64)
+    ramp = np.broadcast_to(ramp.reshape((1, width) + (1,) * (len(shape) - 2)),
+                           shape)
+    return ((noise.astype(np.float64) + ramp) / 2).astype(dtype)
+
+
+# The pixel formats images are kept in - (channels, dtype)
+NATIVE_FORMATS = [(1, np.uint8), (3, np.uint8), (4, np.uint8),
+                  (1, np.uint16), (3, np.uint16), (4, np.uint16)]
+
+
+@pytest.fixture
+def model():
+    return ImageModel()
+
+
+@pytest.fixture
+def loaded_model():
+    """
+    Returns a function giving an ImageModel with an image set as if it had
+    been loaded from a file.
+    """
+    def load(image):
+        model = ImageModel()
+        model.image = image
+        model.edited_image = image.copy()
+        model.memory.set_usage("image", image.nbytes)
+        model.edited_image_changed()
+        model.update_display_scale()
+        return model
+    return load
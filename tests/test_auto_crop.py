@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from conftest import NATIVE_FORMATS, make_image
+from Image_HotFolder import apply_spec, spec_from_model
+from Image_Stream import FrameEditor
+
+
+def scan(height, width, bounds, channels=3, dtype=np.uint8, specks=()):
+    # Content, well away from the border colour, inside a flat border
+    start_x, start_y, end_x, end_y = bounds
+    maximum = np.iinfo(dtype).max
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    image = np.full(shape, maximum * 9 // 10, dtype)
+    image[start_y:end_y, start_x:end_x] = make_image(
+        end_y - start_y, end_x - start_x, channels, dtype) // 2
+    for x, y in specks:
+        image[y, x] = 0  # Dust on the scanner glass
+    return image
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+@pytest.mark.parametrize("height, width, bounds", [
+    # Smaller than the display proxy, so found on the image itself
+    (300, 400, (20, 20, 370, 270)),
+    # Larger - found on the proxy, then each edge at full size
+    (1800, 2400, (37, 53, 2299, 1793)),
+    (2400, 1500, (1, 333, 1499, 2001)),
+    (1531, 2777, (250, 4, 2770, 1527))])
+def test_bounds_are_exact(loaded_model, channels, dtype, height, width,
+                          bounds):
+    model = loaded_model(scan(height, width, bounds, channels, dtype))
+    assert model.find_content_bounds() == bounds
+
+
+def test_specks_of_dust_are_ignored(loaded_model):
+    bounds = (100, 80, 2100, 1500)
+    model = loaded_model(scan(1600, 2200, bounds,
+                              specks=[(10, 10), (2190, 700), (900, 1590)]))
+    assert model.find_content_bounds() == bounds
+
+
+def test_tolerance_decides_what_is_border(loaded_model):
+    image = scan(300, 400, (50, 40, 350, 260))
+    # A faint frame just inside the border
+    image[30:270, 40:360][image[30:270, 40:360] == 229] = 239
+    model = loaded_model(image)
+    assert model.find_content_bounds(tolerance=24) == (50, 40, 350, 260)
+    assert model.find_content_bounds(tolerance=5) == (40, 30, 360, 270)
+
+
+def test_auto_crop_crops_and_records_the_bounds(loaded_model):
+    image = scan(1800, 2400, (37, 53, 2299, 1793))
+    model = loaded_model(image)
+    assert model.auto_crop()
+    assert model.edit_steps == [("auto_crop", (37, 53, 2299, 1793))]
+    assert np.array_equal(model.edited_image, image[53:1793, 37:2299])
+
+
+@pytest.mark.parametrize("image", [
+    np.full((100, 120, 3), 200, np.uint8),  # All border
+    make_image(100, 120)])  # No border
+def test_nothing_to_crop(loaded_model, image):
+    model = loaded_model(image)
+    assert not model.auto_crop()
+    assert model.edit_steps == []
+    assert np.array_equal(model.edited_image, image)
+
+
+def test_specs_find_each_images_own_border(loaded_model):
+    model = loaded_model(scan(300, 400, (20, 20, 370, 270)))
+    model.auto_crop()
+    spec = spec_from_model(model)
+    assert spec["steps"] == [["auto_crop", None]]
+    other = scan(300, 400, (60, 10, 330, 290))
+    model = loaded_model(other)
+    apply_spec(model, spec)
+    assert np.array_equal(model.edited_image, other[10:290, 60:330])
+
+
+def test_frames_repeat_the_found_crop(loaded_model):
+    image = scan(300, 400, (20, 30, 370, 270))
+    model = loaded_model(image)
+    model.auto_crop()
+    editor = FrameEditor.from_model(model)
+    frame = make_image(300, 400)
+    assert np.array_equal(editor.apply(frame), frame[30:270, 20:370])
+
+
+def test_only_strips_of_the_full_size_image_are_read(loaded_model,
+                                                     monkeypatch):
+    image = scan(3000, 4000, (137, 211, 3803, 2890))
+    model = loaded_model(image)
+    proxy = model.get_original_proxy()
+    counted = []
+    count_content = model.count_content
+
+    def recording_count_content(block, *args):
+        counted.append(block.shape[0] * block.shape[1])
+        return count_content(block, *args)
+
+    monkeypatch.setattr(model, "count_content", recording_count_content)
+    assert model.find_content_bounds() == (137, 211, 3803, 2890)
+    full_size = sum(counted) - 2 * proxy.shape[0] * proxy.shape[1]
+    assert full_size < image.shape[0] * image.shape[1] // 50
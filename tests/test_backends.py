@@ -0,0 +1,223 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import Image_Backends
+from conftest import NATIVE_FORMATS, make_image
+from Image_Backends import (APPROXIMATE_TOLERANCE, BackendRegistry, backends,
+                            get_size_class)
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def copy_image(image, *args):
+    return image.copy()
+
+
+def slow_copy(image, *args):
+    time.sleep(0.002)
+    return image.copy()
+
+
+def wrong_copy(image, *args):
+    return image + 1
+
+
+def make_registry():
+    registry = BackendRegistry()
+    registry.register("copy", "reference", copy_image, reference=True)
+    registry.register("copy", "slow", slow_copy)
+    registry.register("copy", "wrong", wrong_copy)
+    registry.register("copy", "grey", copy_image,
+                      supports=lambda image: image.ndim == 2)
+    return registry
+
+
+@pytest.fixture
+def overrides(monkeypatch):
+    # Restores the shared registry's overrides after the test
+    monkeypatch.setattr(backends, "overrides", dict(backends.overrides))
+    return backends
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+@pytest.mark.parametrize("turns", [0, 1, 2, 3])
+def test_rotations_are_identical(channels, dtype, turns):
+    image = make_image(30, 40, channels, dtype)
+    expected = backends.backends["rotate"]["opencv"].function(image, turns)
+    assert np.array_equal(expected, np.rot90(image, -turns))
+    for backend in backends.backends["rotate"].values():
+        assert np.array_equal(backend.function(image, turns), expected)
+
+
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_pil_conversions_are_identical(channels):
+    image = make_image(30, 40, channels)
+    expected = backends.backends["to_pil"]["opencv"].function(image)
+    for backend in backends.backends["to_pil"].values():
+        converted = backend.function(image)
+        assert converted.mode == expected.mode
+        assert converted.tobytes() == expected.tobytes()
+    # A view, as the model passes when converting part of an image
+    view = make_image(30, 40, channels)[5:25, 3:33]
+    for backend in backends.backends["to_pil"].values():
+        assert backend.function(view).tobytes() == \
+            expected.crop((3, 5, 33, 25)).tobytes()
+
+
+@pytest.mark.parametrize("operation, size", [("shrink", (23, 17)),
+                                             ("enlarge", (91, 67))])
+def test_approximate_resizes_are_close(operation, size):
+    image = cv2.GaussianBlur(make_image(60, 80), (0, 0), 2)
+    expected = backends.backends[operation]["opencv"].function(image, size)
+    for backend in backends.backends[operation].values():
+        if not backend.supports(image):
+            continue
+        result = backend.function(image, size)
+        assert result.shape == expected.shape
+        assert float(np.mean(cv2.absdiff(result, expected))) <= \
+            APPROXIMATE_TOLERANCE
+
+
+def test_size_classes():
+    assert get_size_class(1_000_000) == "small"
+    assert get_size_class(1_000_001) == "medium"
+    assert get_size_class(4_000_001) == "large"
+
+
+def test_calibration_ranks_only_substitutes():
+    registry = make_registry()
+    registry.calibrate(repeat=2)
+    for size_class in ("small", "medium", "large"):
+        ranking = registry.rankings["copy"][size_class]
+        assert sorted(ranking) == ["reference", "slow"]
+        assert ranking == sorted(
+            ranking, key=registry.timings["copy"][size_class].get)
+
+
+def test_choice_follows_the_ranking_and_support():
+    registry = make_registry()
+    registry.rankings = {"copy": {"small": ["grey", "slow", "reference"]}}
+    colour, grey = make_image(10, 10), make_image(10, 10, 1)
+    assert registry.choose("copy", colour).name == "slow"
+    assert registry.choose("copy", grey).name == "grey"
+    # Not ranked for large images
+    assert registry.choose("copy", np.zeros((3000, 2000), np.uint8)).name \
+        == "reference"
+
+
+def test_exact_choices_skip_approximate_backends(overrides):
+    image = make_image(40, 60)
+    overrides.set_overrides("shrink=pil")
+    assert overrides.choose("shrink", image).name == "pil"
+    assert overrides.choose("shrink", image, exact=True).name == "opencv"
+    # Pillow can't resize 16 bit colour, so the reference is used
+    assert overrides.choose("shrink", make_image(40, 60, 3, np.uint16)).name \
+        == "opencv"
+
+
+def test_overrides(overrides):
+    overrides.set_overrides("reference")
+    assert overrides.describe()["rotate"] == {
+        "small": "opencv", "medium": "opencv", "large": "opencv"}
+    overrides.set_overrides(" rotate = numpy , to_pil=pil ")
+    assert overrides.overrides == {"rotate": "numpy", "to_pil": "pil"}
+    overrides.set_overrides("tuned")
+    assert overrides.overrides == {}
+    for text in ["rotate=magic", "blur=opencv", "rotate"]:
+        with pytest.raises(ValueError):
+            overrides.set_overrides(text)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("rotate=numpy", "numpy"), ("reference", "opencv"),
+    ("rotate=magic", None)])
+def test_override_variable(value, expected):
+    code = ("import Image_Backends as b; "
+            "print(b.backends.overrides.get('rotate'))")
+    environment = dict(os.environ, **{Image_Backends.OVERRIDE_VARIABLE: value})
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY,
+                            env=environment, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip() == str(expected)
+    if expected is None:
+        assert "Ignoring" in result.stderr
+
+
+def test_rankings_are_cached_for_this_machine(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache" / "backends.json")
+    registry = make_registry()
+    calls = []
+    calibrate = registry.calibrate
+    monkeypatch.setattr(registry, "calibrate",
+                        lambda: calls.append(1) or calibrate(repeat=1))
+    assert registry.load_or_calibrate(path)
+    assert registry.load_or_calibrate(path) is False
+    assert len(calls) == 1
+    loaded = make_registry()
+    assert loaded.load(path)
+    assert loaded.rankings == registry.rankings
+    # Rankings made on another machine or library version aren't used
+    with open(path) as cache_file:
+        cached = json.load(cache_file)
+    cached["machine"]["opencv"] = "0.0.0"
+    with open(path, "w") as cache_file:
+        json.dump(cached, cache_file)
+    assert not make_registry().load(path)
+    assert not make_registry().load(str(tmp_path / "missing.json"))
+
+
+def test_calibration_is_skipped_when_every_choice_is_overridden(tmp_path,
+                                                                monkeypatch):
+    registry = make_registry()
+    registry.set_overrides("reference")
+    monkeypatch.setattr(registry, "calibrate", lambda: pytest.fail())
+    assert registry.load_or_calibrate(str(tmp_path / "backends.json")) \
+        is False
+
+
+def test_default_cache_path_follows_xdg(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert Image_Backends.get_cache_path() == os.path.join(
+        str(tmp_path), "hit137-image-editor", "backends.json")
+
+
+def test_saved_images_use_the_reference_resize(loaded_model, overrides):
+    image = make_image(60, 80)
+    model = loaded_model(image)
+    model.set_scale_factor(0.37)
+    overrides.set_overrides("shrink=pil")
+    assert np.array_equal(model.get_edited_scaled_image(), cv2.resize(
+        image, (29, 22), interpolation=cv2.INTER_AREA))
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_replays_use_the_cached_rankings_without_calibrating(tmp_path,
+                                                             cached):
+    cache_path = tmp_path / "hit137-image-editor" / "backends.json"
+    rankings = {"rotate": {"small": ["numpy", "opencv"]}}
+    if cached:
+        registry = BackendRegistry()
+        registry.rankings = rankings
+        registry.save(str(cache_path))
+    code = ("import sys, threading; sys.argv = ['main.py']; import main; "
+            "main.load_model(None, autosave=False, calibrate=False); "
+            "from Image_Backends import backends; "
+            "print(any(thread.name == 'calibration' "
+            "for thread in threading.enumerate())); "
+            "print(backends.rankings.get('rotate'))")
+    environment = dict(os.environ, XDG_CACHE_HOME=str(tmp_path))
+    environment.pop(Image_Backends.OVERRIDE_VARIABLE, None)
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY,
+                            env=environment, capture_output=True, text=True,
+                            check=True)
+    calibrating, loaded = result.stdout.split("\n")[-3:-1]
+    assert calibrating == "False"
+    assert loaded == str(rankings["rotate"] if cached else None)
+    assert cache_path.exists() == cached
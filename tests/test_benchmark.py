@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from Image_Benchmark import (compare_results, make_synthetic_image,
+                             run_benchmarks)
+
+
+def result(operation, wall, allocated, megapixels=1):
+    return {"operation": operation, "megapixels": megapixels,
+            "wall_s_median": wall, "allocated_bytes": allocated}
+
+
+def test_synthetic_image_size_and_repeatability():
+    image = make_synthetic_image(0.12)
+    assert image.shape == (300, 400, 3)
+    assert image.dtype == np.uint8
+    assert np.array_equal(image, make_synthetic_image(0.12))
+
+
+def test_compare_flags_only_growth_past_the_threshold():
+    baseline = {"results": [result("load_image", 1.0, 1000),
+                            result("crop_image", 1.0, 1000)]}
+    current = {"results": [result("load_image", 1.05, 1200),
+                           result("crop_image", 0.5, 900),
+                           result("rotate_image", 9.0, 9000)]}
+    regressions = compare_results(current, baseline, threshold=0.10)
+    assert [(r["operation"], r["metric"]) for r in regressions] == \
+        [("load_image", "allocated_bytes")]
+    assert regressions[0]["change"] == pytest.approx(0.2)
+
+
+def test_run_benchmarks_measures_every_operation():
+    results = run_benchmarks([0.01], repeat=1, image_format=".png")
+    operations = {r["operation"] for r in results["results"]}
+    assert {"load_image", "crop_image", "rotate_image", "opencv_to_pil",
+            "get_edited_scaled_image_as_pil",
+            "save_edited_image"} <= operations
+    for measured in results["results"]:
+        assert measured["wall_s_median"] > 0
+        assert measured["peak_rss_bytes"] > 0
+    assert compare_results(results, results) == []
@@ -0,0 +1,243 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image, TiffImagePlugin, TiffTags
+
+import Image_Decode
+from conftest import make_image
+from Image_Decode import (clip_region, get_inverse_orientation, orient_region,
+                          read_region)
+from Image_Model import ImageModel
+
+ORIENTATIONS = range(1, 9)
+# Regions in the image as shown, for a 200 x 300 image turned or not
+REGIONS = [(10, 20, 90, 70), (0, 0, 200, 40), (40, 35, 200, 200),
+           (100, 0, 160, 200), (5, 130, 200, 200)]
+
+
+def exif_bytes(orientation):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return exif.tobytes()
+
+
+def save_tiff(path, image, orientation=1, **options):
+    # Pillow can't hold 16 bit colour, so colour images are 8 bit here
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA if image.shape[2] == 4
+                             else cv2.COLOR_BGR2RGB)
+    Image.fromarray(image).save(path, tiffinfo={274: orientation}, **options)
+
+
+def save_tiled_tiff(path, image, orientation=1, tile=32):
+    # Pillow doesn't write tiles, so the file is put together by hand
+    height, width = image.shape[:2]
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    if channels == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    across, down = -(-width // tile), -(-height // tile)
+    padded = np.zeros((down * tile, across * tile) + image.shape[2:],
+                      image.dtype)
+    padded[:height, :width] = image
+    tiles = [padded[row * tile:(row + 1) * tile,
+                    column * tile:(column + 1) * tile].tobytes()
+             for row in range(down) for column in range(across)]
+    directory = TiffImagePlugin.ImageFileDirectory_v2()
+    for tag, value in [(256, width), (257, height), (259, 1),
+                       (262, 2 if channels == 3 else 1), (274, orientation),
+                       (277, channels), (284, 1), (322, tile), (323, tile)]:
+        directory[tag] = value
+        directory.tagtype[tag] = TiffTags.LONG if tag in (256, 257) \
+            else TiffTags.SHORT
+    directory[258] = (image.itemsize * 8,) * channels
+    directory.tagtype[258] = TiffTags.SHORT
+    offsets, position = [], 0
+    for data in tiles:
+        offsets.append(position)
+        position += len(data)
+    directory[324] = tuple(offsets)
+    directory[325] = tuple(len(data) for data in tiles)
+    directory.tagtype[324] = directory.tagtype[325] = TiffTags.LONG
+    size = len(directory.tobytes(8))
+    directory[324] = tuple(8 + size + offset for offset in offsets)
+    with open(path, "wb") as tiff:
+        tiff.write(b"II*\x00" + struct.pack("<I", 8) + directory.tobytes(8))
+        tiff.write(b"".join(tiles))
+
+
+def load(path, region=None, reduction=1):
+    model = ImageModel()
+    model.load_image(path, region=region, reduction=reduction)
+    return model
+
+
+def crop(image, region):
+    start_x, start_y, end_x, end_y = region
+    return image[start_y:end_y, start_x:end_x]
+
+
+@pytest.fixture
+def partial_only(monkeypatch):
+    # Fails a region decode that falls back to decoding the whole file
+    imread = cv2.imread
+
+    def checked_imread(path, flags=cv2.IMREAD_COLOR):
+        assert flags != cv2.IMREAD_UNCHANGED, "decoded the whole file"
+        return imread(path, flags)
+
+    def use():
+        monkeypatch.setattr(Image_Decode.cv2, "imread", checked_imread)
+
+    return use
+
+
+def assert_regions_match(path, partial_only=None):
+    full = load(path).image
+    expected = {region: crop(full, clip_region(region, full.shape[1],
+                                               full.shape[0]))
+                for region in REGIONS}
+    if partial_only is not None:
+        partial_only()
+    for region, pixels in expected.items():
+        assert np.array_equal(load(path, region).image, pixels), region
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+def test_orient_region_matches_to_native_image(orientation):
+    image = make_image(30, 50)
+    shown = ImageModel.to_native_image(image, orientation)
+    region = (7, 3, 31, 22)
+    oriented = orient_region(region, orientation, 50, 30)
+    assert np.array_equal(
+        ImageModel.to_native_image(crop(image, region), orientation),
+        crop(shown, oriented))
+    # And back again, in the image as shown
+    height, width = shown.shape[:2]
+    assert orient_region(oriented, get_inverse_orientation(orientation),
+                         width, height) == region
+
+
+def test_clip_region():
+    assert clip_region(None, 50, 30) == (0, 0, 50, 30)
+    assert clip_region((-5, 10, 80, 20.0), 50, 30) == (0, 10, 50, 20)
+    for region in [(50, 0, 60, 10), (10, 10, 10, 20), (0, -10, 50, 0)]:
+        with pytest.raises(ValueError):
+            clip_region(region, 50, 30)
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("channels, dtype, options", [
+    (3, np.uint8, {}),
+    (3, np.uint8, {"compression": "tiff_lzw", "strip_size": 4096}),
+    (4, np.uint8, {"compression": "tiff_adobe_deflate", "strip_size": 4096}),
+    (1, np.uint16, {"compression": "tiff_lzw", "strip_size": 4096})])
+def test_tiff_strip_regions_match_the_full_decode(tmp_path, partial_only,
+                                                  channels, dtype, options,
+                                                  orientation):
+    path = str(tmp_path / "strips.tiff")
+    save_tiff(path, make_image(200, 300, channels, dtype), orientation,
+              **options)
+    assert_regions_match(path, partial_only)
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("channels, dtype", [(3, np.uint8), (1, np.uint8),
+                                             (1, np.uint16)])
+def test_tiff_tile_regions_match_the_full_decode(tmp_path, partial_only,
+                                                 channels, dtype,
+                                                 orientation):
+    path = str(tmp_path / "tiles.tiff")
+    save_tiled_tiff(path, make_image(200, 300, channels, dtype), orientation)
+    with Image.open(path) as tiff:
+        assert 322 in tiff.tag_v2
+    assert_regions_match(path, partial_only)
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("channels, dtype", [(3, np.uint8), (4, np.uint8),
+                                             (1, np.uint8), (3, np.uint16)])
+def test_png_regions_match_the_full_decode(tmp_path, channels, dtype,
+                                           orientation):
+    path = str(tmp_path / "image.png")
+    image = make_image(200, 300, channels, dtype)
+    if orientation == 1:
+        assert cv2.imwrite(path, image)
+    else:
+        assert cv2.imwrite(path, image)
+        with Image.open(path) as png:
+            png.load()
+            png.save(path, exif=exif_bytes(orientation))
+    assert_regions_match(path)
+
+
+@pytest.mark.parametrize("region", [(10, 5, 120, 60), (0, 0, 300, 100)])
+def test_png_rows_in_the_top_half_are_decoded_alone(tmp_path, partial_only,
+                                                    region):
+    path = str(tmp_path / "image.png")
+    image = make_image(200, 300, 4, np.uint16)
+    assert cv2.imwrite(path, image)
+    partial_only()
+    assert np.array_equal(load(path, region).image, crop(image, region))
+
+
+def test_palette_png_regions(tmp_path, partial_only):
+    path = str(tmp_path / "palette.png")
+    Image.fromarray(make_image(200, 300, 3)[:, :, ::-1]).quantize(16) \
+        .save(path)
+    full = load(path).image
+    partial_only()
+    assert np.array_equal(load(path, (20, 10, 200, 90)).image,
+                          crop(full, (20, 10, 200, 90)))
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+def test_jpeg_regions_match_the_full_decode(tmp_path, orientation):
+    path = str(tmp_path / "image.jpg")
+    Image.fromarray(make_image(200, 304)[:, :, ::-1]).save(
+        path, quality=95, exif=exif_bytes(orientation))
+    assert_regions_match(path)
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("reduction", [2, 4, 8])
+@pytest.mark.parametrize("grey", [False, True])
+def test_reduced_jpeg_regions(tmp_path, partial_only, orientation, reduction,
+                              grey):
+    path = str(tmp_path / "image.jpg")
+    image = make_image(208, 304)
+    pil_image = Image.fromarray(image[:, :, ::-1])
+    (pil_image.convert("L") if grey else pil_image).save(
+        path, quality=95, exif=exif_bytes(orientation))
+    flags = Image_Decode.REDUCTIONS[reduction][1 if grey else 0]
+    reduced = ImageModel.to_native_image(
+        cv2.imread(path, flags | cv2.IMREAD_IGNORE_ORIENTATION), orientation)
+    partial_only()
+    # Aligned to the reduction, so rounding outwards doesn't matter
+    region = (40, 16, 200, 152)
+    model = load(path, region, reduction)
+    assert model.load_reduction == reduction
+    assert np.array_equal(model.image, crop(reduced, [
+        value // reduction for value in region]))
+    assert model.load_image(path, reduction=reduction) is None
+    assert np.array_equal(model.image, reduced)
+
+
+def test_only_jpegs_are_reduced(tmp_path):
+    path = str(tmp_path / "image.png")
+    image = make_image(64, 96)
+    assert cv2.imwrite(path, image)
+    region_image, reduction = read_region(path, (8, 8, 40, 24), reduction=4)
+    assert reduction == 1
+    assert np.array_equal(region_image, crop(image, (8, 8, 40, 24)))
+    with pytest.raises(ValueError):
+        read_region(path, reduction=3)
+
+
+def test_regions_outside_the_image_raise(tmp_path):
+    path = str(tmp_path / "image.png")
+    assert cv2.imwrite(path, make_image(30, 40))
+    with pytest.raises(ValueError):
+        read_region(path, (40, 0, 60, 10))
+    assert read_region(str(tmp_path / "missing.png"))[0] is None
@@ -0,0 +1,248 @@
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+import Image_Filmstrip
+from Image_Filmstrip import (Filmstrip, get_cache_dir, list_images,
+                             make_thumbnail)
+
+
+class FakeCanvas:
+    # Enough of a tk.Canvas to scroll and draw cells without a display
+    def __init__(self, width):
+        self.width = width
+        self.left = 0
+        self.scroll_width = 1
+        self.items = {}
+        self.pending = []
+
+    def config(self, scrollregion=None, **options):
+        if scrollregion is not None:
+            self.scroll_width = scrollregion[2]
+
+    def xview_moveto(self, fraction):
+        self.left = fraction * self.scroll_width
+
+    def canvasx(self, x):
+        return self.left + x
+
+    def winfo_width(self):
+        return self.width
+
+    def create_item(self, *args, **options):
+        self.items[len(self.items) + 1] = dict(options)
+        return len(self.items)
+
+    create_rectangle = create_image = create_text = create_item
+
+    def coords(self, item, *coords):
+        self.items[item]["coords"] = coords
+
+    def itemconfig(self, item, **options):
+        self.items[item].update(options)
+
+    def after(self, ms, callback):
+        self.pending.append(callback)
+
+
+class FakeExecutor:
+    # Holds the requests without running them
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, path, *args):
+        future = Future()
+        self.submitted.append((path, future))
+        return future
+
+
+def make_filmstrip(paths, width=Filmstrip.CELL_WIDTH * 5):
+    filmstrip = object.__new__(Filmstrip)
+    filmstrip.on_select = None
+    filmstrip.cache_dir = None
+    filmstrip.folder = "folder"
+    filmstrip.paths = paths
+    filmstrip.selected = None
+    filmstrip.cells = {}
+    filmstrip.spare_cells = []
+    filmstrip.thumbnails = OrderedDict()
+    filmstrip.requests = {}
+    filmstrip.results = queue.Queue()
+    filmstrip.generation = 0
+    filmstrip.polling = False
+    filmstrip.executor = FakeExecutor()
+    filmstrip.canvas = FakeCanvas(width)
+    filmstrip.canvas.config(scrollregion=(0, 0, len(paths) *
+                                          Filmstrip.CELL_WIDTH, 1))
+    return filmstrip
+
+
+def save_image(path, size=(300, 200), orientation=None):
+    image = Image.new("RGB", size, (200, 100, 50))
+    if orientation is None:
+        image.save(path)
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(path, exif=exif.tobytes())
+    return str(path)
+
+
+def test_cache_dir_follows_xdg(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert get_cache_dir() == os.path.join(
+        str(tmp_path), "hit137-image-editor", "thumbnails")
+
+
+def test_list_images_sorts_and_filters(tmp_path):
+    for name in ["b.PNG", "a.jpg", "C.tif", ".hidden.png", "notes.txt"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "folder.png").mkdir()
+    assert [os.path.basename(path) for path in list_images(str(tmp_path))] \
+        == ["a.jpg", "b.PNG", "C.tif"]
+    assert list_images(str(tmp_path / "missing")) == []
+
+
+def test_thumbnails_are_oriented_and_fit_the_size(tmp_path):
+    path = save_image(tmp_path / "photo.jpg", orientation=6)
+    thumbnail = make_thumbnail(path, 96)
+    assert thumbnail.mode == "RGB"
+    assert thumbnail.size == (64, 96)
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+    assert make_thumbnail(str(tmp_path / "broken.jpg"), 96) is None
+    assert make_thumbnail(str(tmp_path / "missing.jpg"), 96) is None
+
+
+def test_thumbnails_are_cached_until_the_file_changes(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    path = save_image(tmp_path / "photo.png")
+    first = make_thumbnail(path, 96, cache_dir)
+    cached = [name for _, _, names in os.walk(cache_dir) for name in names]
+    assert len(cached) == 1 and cached[0].endswith(".jpg")
+    opened = []
+    image_open = Image.open
+
+    def recording_open(file, *args, **kwargs):
+        opened.append(str(file))
+        return image_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(Image_Filmstrip.Image, "open", recording_open)
+    assert make_thumbnail(path, 96, cache_dir).size == first.size
+    assert path not in opened
+    os.utime(path, ns=(1, 1))
+    make_thumbnail(path, 96, cache_dir)
+    assert path in opened
+    cached = [name for _, _, names in os.walk(cache_dir) for name in names]
+    assert len(cached) == 2
+
+
+def test_only_cells_near_the_view_are_drawn():
+    paths = [f"image{index:04d}.jpg" for index in range(1000)]
+    filmstrip = make_filmstrip(paths)
+    filmstrip.refresh()
+    # 6 cells partly in view and 4 after them
+    assert sorted(filmstrip.cells) == list(range(10))
+    items = len(filmstrip.canvas.items)
+    filmstrip.canvas.left = 500 * Filmstrip.CELL_WIDTH
+    filmstrip.refresh()
+    assert sorted(filmstrip.cells) == list(range(496, 510))
+    label = filmstrip.cells[500][2]
+    assert filmstrip.canvas.items[label]["text"] == "image0500.jpg"
+    filmstrip.canvas.left = 900 * Filmstrip.CELL_WIDTH
+    filmstrip.refresh()
+    # Cells scrolled out of view are reused, not created again
+    assert len(filmstrip.canvas.items) == items + 4 * 3
+    assert len(filmstrip.cells) == 14
+
+
+def test_requests_for_cells_scrolled_past_are_cancelled():
+    paths = [f"image{index:04d}.jpg" for index in range(1000)]
+    filmstrip = make_filmstrip(paths)
+    filmstrip.refresh()
+    first = dict(filmstrip.executor.submitted)
+    assert sorted(first) == paths[:10]
+    filmstrip.canvas.left = 500 * Filmstrip.CELL_WIDTH
+    filmstrip.refresh()
+    assert all(future.cancelled() for future in first.values())
+    assert sorted(filmstrip.requests) == paths[496:510]
+    assert len(filmstrip.canvas.pending) == 1  # Polled once, not per refresh
+
+
+def test_poll_shows_thumbnails_of_the_current_folder(monkeypatch):
+    monkeypatch.setattr(Image_Filmstrip.ImageTk, "PhotoImage",
+                        lambda image: ("photo", image))
+    monkeypatch.setattr(Filmstrip, "MEMORY_CACHE_SIZE", 3)
+    paths = [f"image{index}.jpg" for index in range(8)]
+    filmstrip = make_filmstrip(paths)
+    filmstrip.refresh()
+    filmstrip.results.put((filmstrip.generation - 1, paths[0], "old"))
+    for path, future in filmstrip.executor.submitted:
+        future.set_result(path)
+    filmstrip.poll_thumbnails()
+    assert not filmstrip.requests
+    assert not filmstrip.polling
+    # Only the most recently used are kept
+    assert list(filmstrip.thumbnails) == paths[-3:]
+    image = filmstrip.cells[7][1]
+    assert filmstrip.canvas.items[image]["image"] == ("photo", paths[7])
+
+
+def test_failed_thumbnails_end_their_request(capsys):
+    paths = [f"image{index}.jpg" for index in range(2)]
+    filmstrip = make_filmstrip(paths)
+    filmstrip.refresh()
+    (_, broken), (_, good) = filmstrip.executor.submitted
+    broken.set_exception(KeyError("bad EXIF"))
+    good.set_result(None)  # Not an image
+    filmstrip.poll_thumbnails()
+    assert not filmstrip.requests
+    assert not filmstrip.polling
+    assert not filmstrip.thumbnails
+    assert "image0.jpg" in capsys.readouterr().out
+
+
+def test_stale_results_keep_the_newer_request(monkeypatch):
+    monkeypatch.setattr(Image_Filmstrip.ImageTk, "PhotoImage",
+                        lambda image: ("photo", image))
+    paths = [f"image{index:04d}.jpg" for index in range(1000)]
+    filmstrip = make_filmstrip(paths)
+    filmstrip.refresh()
+    old = dict(filmstrip.executor.submitted)[paths[0]]
+    # Already being made, so it can't be cancelled
+    assert old.set_running_or_notify_cancel()
+    filmstrip.canvas.left = 500 * Filmstrip.CELL_WIDTH
+    filmstrip.refresh()
+    cancelled = dict(filmstrip.executor.submitted)[paths[1]]
+    assert cancelled.cancelled() and filmstrip.results.empty()
+    # Scrolled back before the old request finishes
+    filmstrip.canvas.left = 0
+    filmstrip.refresh()
+    new = filmstrip.requests[paths[0]]
+    assert new is not old
+    old.set_result("thumbnail")
+    filmstrip.poll_thumbnails()
+    assert filmstrip.requests[paths[0]] is new
+    assert filmstrip.polling
+    # The thumbnail is still used
+    assert filmstrip.thumbnails[paths[0]] == ("photo", "thumbnail")
+
+
+@pytest.mark.parametrize("x, expected", [
+    (10, 0), (Filmstrip.CELL_WIDTH * 2 + 5, 2), (10_000, None)])
+def test_click_opens_the_image(x, expected):
+    paths = [f"image{index}.jpg" for index in range(5)]
+    filmstrip = make_filmstrip(paths)
+    selected = []
+    filmstrip.on_select = selected.append
+
+    class Event:
+        pass
+
+    event = Event()
+    event.x = x
+    filmstrip.on_click(event)
+    assert selected == ([] if expected is None else [paths[expected]])
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from conftest import NATIVE_FORMATS, make_image
+from Image_Filters import FILTERS, StripFilterEngine
+
+# Every filter over its documented parameter range
+FILTER_PARAMS = (
+    [("blur", {"radius": radius}) for radius in (0, 1, 2, 3, 5, 8)] +
+    [("sharpen", {"amount": amount}) for amount in (0.0, 0.5, 1.0, 2.5)] +
+    [("denoise", {"size": size}) for size in (1, 3, 5, 7, 9)] +
+    [("edges", {"size": size}) for size in (1, 3, 5, 7)])
+
+
+def supported(name, params, dtype):
+    # OpenCV's median filter only supports sizes 3 and 5 for 16 bit images
+    return not (name == "denoise" and dtype == np.uint16 and
+                params["size"] not in (3, 5))
+
+
+@pytest.fixture(scope="module")
+def engine():
+    # Small strips, so even a small test image is split into many
+    engine = StripFilterEngine(threads=4, min_strip_rows=4,
+                               min_parallel_pixels=0)
+    yield engine
+    engine.shutdown()
+
+
+def test_every_filter_is_tested():
+    assert {name for name, _ in FILTER_PARAMS} == set(FILTERS)
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+@pytest.mark.parametrize("name, params", FILTER_PARAMS)
+def test_strips_are_identical_to_a_single_pass(engine, name, params,
+                                               channels, dtype):
+    if not supported(name, params, dtype):
+        pytest.skip("size not supported for 16 bit images")
+    # Colour filters run on 3 channels, alpha is split off by the model
+    image = make_image(61, 47, min(channels, 3), dtype)
+    single = engine.apply_single(image, name, **params)
+    strips = engine.apply(image, name, **params)
+    assert strips.dtype == single.dtype
+    assert np.array_equal(strips, single)
+
+
+def test_strips_cover_the_image_with_halos():
+    engine = StripFilterEngine(min_strip_rows=10)
+    strips = engine.get_strips(95, 3, 4)
+    assert [strip[:2] for strip in strips] == \
+        [(0, 24), (24, 48), (48, 72), (72, 95)]
+    assert [strip[2:] for strip in strips] == \
+        [(0, 27), (21, 51), (45, 75), (69, 95)]
+
+
+def test_small_images_are_filtered_in_one_pass():
+    engine = StripFilterEngine(threads=4)
+    image = make_image(20, 20)
+    assert np.array_equal(engine.apply(image, "blur"),
+                          engine.apply_single(image, "blur"))
+    assert engine._executor is None
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError, match="Unknown filter"):
+        StripFilterEngine().apply(make_image(4, 4), "emboss")
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+@pytest.mark.parametrize("name, params", FILTER_PARAMS)
+def test_region_is_identical_to_filtering_the_whole_image(
+        loaded_model, name, params, channels, dtype):
+    if not supported(name, params, dtype):
+        pytest.skip("size not supported for 16 bit images")
+    image = make_image(61, 47, channels, dtype)
+    model = loaded_model(image)
+    x0, y0, x1, y1 = 9, 13, 30, 40
+    model.apply_filter(name, region=(x0, y0, x1, y1), **params)
+    expected = image.copy()
+    expected[y0:y1, x0:x1] = \
+        model.filter_image(image, name, **params)[y0:y1, x0:x1]
+    assert np.array_equal(model.edited_image, expected)
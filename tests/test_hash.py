@@ -0,0 +1,161 @@
+import os
+import random
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from Image_Hash import (DEFAULT_DISTANCE, HashIndex, dhash, get_chunks,
+                        get_neighbours, hamming_distance)
+from Image_HotFolder import LEDGER_NAME, HotFolder, Ledger
+
+SPEC = {"version": 1, "steps": [["rotate", 90]], "tone": {}, "scale": 1.0,
+        "format": ".png"}
+
+
+def flip_bits(value, count, generator):
+    for position in generator.sample(range(64), count):
+        value ^= 1 << position
+    return value
+
+
+def photo(height=240, width=320, seed=0):
+    # Smooth shapes, like a photo, so resizing doesn't change the hash much
+    generator = np.random.default_rng(seed)
+    image = np.zeros((height, width, 3), np.uint8)
+    for _ in range(12):
+        centre = (int(generator.integers(width)),
+                  int(generator.integers(height)))
+        colour = [int(level) for level in generator.integers(256, size=3)]
+        cv2.circle(image, centre, int(generator.integers(20, 120)), colour,
+                   -1)
+    return cv2.GaussianBlur(image, (0, 0), 3)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = HashIndex(str(tmp_path / "hashes.sqlite"))
+    yield index
+    index.close()
+
+
+def test_chunks_and_neighbours():
+    value = 0x0123_4567_89AB_CDEF
+    assert get_chunks(value) == [0x0123, 0x4567, 0x89AB, 0xCDEF]
+    neighbours = get_neighbours(0x00FF, 2)
+    assert len(neighbours) == len(set(neighbours)) == 1 + 16 + 120
+    assert all(hamming_distance(0x00FF, chunk) <= 2 for chunk in neighbours)
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, DEFAULT_DISTANCE, 10])
+def test_find_matches_a_full_scan(index, max_distance):
+    generator = random.Random(max_distance)
+    stored = {}
+    bases = [generator.getrandbits(64) for _ in range(50)]
+    for number in range(1000):
+        base = bases[number % len(bases)]
+        stored[f"file{number}"] = flip_bits(base, generator.randrange(16),
+                                            generator)
+    for key, value in stored.items():
+        index.add(key, value, output=key + ".png")
+    assert index.count() == len(stored)
+    for base in bases[:20]:
+        query = flip_bits(base, generator.randrange(4), generator)
+        expected = sorted(
+            (hamming_distance(query, value), key, key + ".png")
+            for key, value in stored.items()
+            if hamming_distance(query, value) <= max_distance)
+        assert index.find(query, max_distance) == expected
+
+
+def test_entries_are_replaced_removed_and_excluded(index):
+    high = (1 << 63) | 0x1234  # Stored as a negative SQLite integer
+    index.add("a.jpg", high, "a.png")
+    index.add("a.jpg", high ^ 1, "a2.png")
+    index.add("b.jpg", high)
+    assert index.count() == 2
+    assert index.find(high) == [(0, "b.jpg", None), (1, "a.jpg", "a2.png")]
+    assert index.find(high, exclude="b.jpg") == [(1, "a.jpg", "a2.png")]
+    index.remove("a.jpg")
+    assert index.find(high) == [(0, "b.jpg", None)]
+
+
+def test_index_persists_for_the_same_tag(tmp_path):
+    path = str(tmp_path / "hashes.sqlite")
+    index = HashIndex(path, tag="spec1")
+    index.add("a.jpg", 42, "a.png")
+    index.close()
+    index = HashIndex(path, tag="spec1")
+    assert index.find(42) == [(0, "a.jpg", "a.png")]
+    index.close()
+    # Outputs made for another spec don't count
+    index = HashIndex(path, tag="spec2")
+    assert index.count() == 0
+    index.close()
+
+
+def test_re_encoded_and_resized_copies_are_near(tmp_path):
+    image = photo()
+    smaller = cv2.resize(image, (160, 120), interpolation=cv2.INTER_AREA)
+    copies = [("original.png", image, []), ("smaller.png", smaller, []),
+              ("larger.jpg", cv2.resize(image, (960, 720)), []),
+              ("low.jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 40])]
+    hashes = []
+    for name, copy, options in copies:
+        cv2.imwrite(str(tmp_path / name), copy, options)
+        hashes.append(dhash(str(tmp_path / name)))
+    original = hashes[0]
+    for value in hashes[1:]:
+        assert hamming_distance(original, value) <= DEFAULT_DISTANCE
+    other = str(tmp_path / "other.png")
+    cv2.imwrite(other, photo(seed=1))
+    assert hamming_distance(original, dhash(other)) > 2 * DEFAULT_DISTANCE
+
+
+def test_hash_follows_the_exif_orientation(tmp_path):
+    image = photo()
+    turned = str(tmp_path / "turned.png")
+    cv2.imwrite(turned, cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE))
+    tagged = str(tmp_path / "tagged.png")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Shown turned clockwise
+    Image.fromarray(image[:, :, ::-1]).save(tagged, exif=exif.tobytes())
+    assert dhash(tagged) == dhash(turned)
+
+
+def test_unreadable_files_raise(tmp_path):
+    path = tmp_path / "broken.png"
+    path.write_bytes(b"not an image")
+    with pytest.raises(OSError):
+        dhash(str(path))
+
+
+@pytest.mark.parametrize("action", ["skip", "copy"])
+def test_hot_folder_handles_duplicates(tmp_path, action):
+    input_dir, output_dir = str(tmp_path / "input"), str(tmp_path / "output")
+    os.mkdir(input_dir)
+    image = photo()
+    cv2.imwrite(os.path.join(input_dir, "a.png"), image)
+    hot_folder = HotFolder(input_dir, output_dir, SPEC, workers=1, settle=0,
+                           interval=0.01, duplicate_action=action)
+    hot_folder.run(once=True)
+    cv2.imwrite(os.path.join(input_dir, "b.jpg"), image,
+                [cv2.IMWRITE_JPEG_QUALITY, 60])
+    cv2.imwrite(os.path.join(input_dir, "c.png"), photo(seed=1))
+    hot_folder = HotFolder(input_dir, output_dir, SPEC, workers=1, settle=0,
+                           interval=0.01, duplicate_action=action)
+    hot_folder.run(once=True)
+    assert (hot_folder.processed, hot_folder.duplicates) == (1, 1)
+    ledger = Ledger(os.path.join(output_dir, LEDGER_NAME))
+    entry = ledger.entries["b.jpg"]
+    ledger.close()
+    assert entry["status"] == "duplicate"
+    if action == "copy":
+        assert entry["output"] == "b.png"
+        with open(os.path.join(output_dir, "a.png"), "rb") as first, \
+                open(os.path.join(output_dir, "b.png"), "rb") as copy:
+            assert first.read() == copy.read()
+    else:
+        assert entry["output"] is None
+        assert not os.path.exists(os.path.join(output_dir, "b.png"))
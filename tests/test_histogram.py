@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import make_image
+from Image_Controller import ImageController
+from Image_Model import ImageModel
+
+
+def numpy_histograms(image, bins_from):
+    # 256 bin histograms of each channel, counted directly
+    channels = [image] if image.ndim == 2 else \
+        [image[..., channel] for channel in range(image.shape[2])]
+    return [np.bincount((channel // bins_from).ravel(), minlength=256)
+            for channel in channels]
+
+
+@pytest.mark.parametrize("channels, dtype, names", [
+    (1, np.uint8, ["grey"]),
+    (3, np.uint8, ["blue", "green", "red"]),
+    (4, np.uint16, ["blue", "green", "red", "alpha"])])
+def test_calculate_histograms(channels, dtype, names):
+    image = make_image(30, 40, channels, dtype)
+    histograms = ImageModel.calculate_histograms(image)
+    assert [name for name, _ in histograms] == names
+    expected = numpy_histograms(image, 256 if dtype == np.uint16 else 1)
+    for (_, hist), counts in zip(histograms, expected):
+        assert np.array_equal(hist, counts)
+
+
+def test_adjusted_histograms_match_the_adjusted_image(loaded_model):
+    image = make_image(40, 50, 4)
+    model = loaded_model(image)
+    model.set_contrast(1.4)
+    model.set_gamma(0.7)
+    histograms = model.get_histogram()["histograms"]
+    expected = ImageModel.calculate_histograms(model.apply_tone(image))
+    for (name, hist), (expected_name, counts) in zip(histograms, expected):
+        assert name == expected_name
+        assert np.array_equal(hist, counts)
+
+
+def test_statistics():
+    image = make_image(30, 40, 1)
+    stats = ImageModel.histogram_statistics(
+        ImageModel.calculate_histograms(image))["grey"]
+    assert stats["mean"] == pytest.approx(image.mean())
+    assert stats["std"] == pytest.approx(image.std())
+    assert (stats["min"], stats["max"]) == (image.min(), image.max())
+
+
+def test_proxy_histograms_are_reused_until_the_pixels_change(loaded_model):
+    model = loaded_model(make_image(1500, 2000))
+    first = model.get_histogram()
+    assert not first["exact"]
+    cached = model.histogram_cache
+    # Scaling and quarter turns don't change the pixel values
+    model.set_scale_factor(0.5)
+    model.rotate_image(90)
+    assert model.histogram_cache is cached
+    second = model.get_histogram()
+    assert model.histogram_cache is cached
+    for (_, hist), (_, again) in zip(first["histograms"],
+                                     second["histograms"]):
+        assert np.array_equal(hist, again)
+    model.apply_filter("blur")
+    model.get_histogram()
+    assert model.histogram_cache is not cached
+
+
+def test_proxy_histograms_come_from_the_display_proxy(loaded_model):
+    image = make_image(1500, 2000)
+    model = loaded_model(image)
+    proxy = cv2.resize(image, (1024, 768), interpolation=cv2.INTER_AREA)
+    counts = ImageModel.calculate_histograms(proxy)
+    histograms = model.get_histogram()["histograms"]
+    assert sum(hist.sum() for _, hist in histograms) == proxy.size
+    for (_, hist), (_, expected) in zip(histograms, counts):
+        assert np.array_equal(hist, expected)
+
+
+def test_exact_histograms_are_used_when_given(loaded_model):
+    image = make_image(1500, 2000)
+    model = loaded_model(image)
+    exact = ImageModel.calculate_histograms(image)
+    result = model.get_histogram(exact)
+    assert result["exact"]
+    assert result["histograms"][0][1].sum() == 1500 * 2000
+
+
+class FakeRoot:
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback, *args):
+        self.pending.append((ms, callback))
+        return len(self.pending)
+
+
+class FakeView:
+    def __init__(self):
+        self.root = FakeRoot()
+        self.drawn = []
+        self.stats = None
+
+    def draw_histogram(self, histograms):
+        self.drawn.append(histograms)
+
+    def set_histogram_stats(self, text):
+        self.stats = text
+
+
+def test_histogram_updates_are_throttled(loaded_model):
+    controller = object.__new__(ImageController)
+    controller._model = loaded_model(make_image(20, 30))
+    controller.view = FakeView()
+    controller.histogram_update = None
+    controller.exact_histograms = None
+    for _ in range(10):
+        controller.schedule_histogram_update()
+    assert len(controller.view.root.pending) == 1
+    ms, callback = controller.view.root.pending.pop()
+    assert ms == ImageController.HISTOGRAM_INTERVAL_MS
+    callback()
+    assert len(controller.view.drawn) == 1
+    assert controller.view.stats.startswith("preview")
+    controller.schedule_histogram_update()
+    assert len(controller.view.root.pending) == 1
@@ -0,0 +1,219 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import make_image
+from Image_HotFolder import (LEDGER_NAME, MAX_ATTEMPTS, HotFolder, Ledger,
+                             PollingWatcher, apply_spec, load_spec, plan_load,
+                             save_spec, spec_digest, spec_from_model)
+from Image_Model import ImageModel
+
+SPEC = {"version": 1,
+        "steps": [["crop", [4, 6, 44, 36]], ["rotate", 90]],
+        "tone": {"brightness": 10, "contrast": 1.2, "gamma": 1.0,
+                 "black_point": 0, "white_point": 255},
+        "scale": 0.5, "format": ".png"}
+
+
+@pytest.fixture
+def folders(tmp_path):
+    input_dir, output_dir = tmp_path / "input", tmp_path / "output"
+    input_dir.mkdir()
+    return str(input_dir), str(output_dir)
+
+
+def add_image(folder, name, seed=0):
+    path = os.path.join(folder, name)
+    assert cv2.imwrite(path, make_image(40, 50, seed=seed))
+    return path
+
+
+def edit_by_hand(path, spec):
+    model = ImageModel()
+    model.load_image(path)
+    apply_spec(model, spec)
+    return model.get_edited_scaled_image()
+
+
+def run_once(input_dir, output_dir, spec=SPEC, **options):
+    hot_folder = HotFolder(input_dir, output_dir, spec, workers=2, settle=0,
+                           interval=0.01, **options)
+    hot_folder.run(once=True)
+    return hot_folder
+
+
+def test_spec_round_trip(tmp_path, loaded_model):
+    model = loaded_model(make_image(40, 50))
+    model.crop_image(4, 6, 44, 36)
+    model.rotate_image(90)
+    model.set_brightness(10)
+    model.set_contrast(1.2)
+    model.set_scale_factor(0.5)
+    spec = spec_from_model(model, ".png")
+    path = str(tmp_path / "spec.json")
+    save_spec(spec, path)
+    # Saved as JSON, so the crop comes back as a list
+    assert load_spec(path) == SPEC
+    assert spec_digest(spec) == spec_digest(SPEC)
+
+
+def test_load_spec_rejects_other_versions(tmp_path):
+    path = str(tmp_path / "spec.json")
+    save_spec(dict(SPEC, version=2), path)
+    with pytest.raises(ValueError):
+        load_spec(path)
+    with open(path, "w") as spec_file:
+        spec_file.write("{")
+    with pytest.raises(ValueError):
+        load_spec(path)
+
+
+def test_plan_load_decodes_only_the_first_crop():
+    region, reduction, spec = plan_load(SPEC)
+    assert region == (4, 6, 44, 36)
+    assert reduction == 1
+    assert spec["steps"] == [["rotate", 90]]
+    assert plan_load(SPEC, reduced_decode=True)[1] == 2
+    filtered = dict(SPEC, steps=[["filter", ["blur", {}]]], scale=0.25)
+    assert plan_load(filtered, reduced_decode=True)[:2] == (None, 1)
+
+
+def test_ledger_keeps_the_last_entry(tmp_path):
+    path = str(tmp_path / LEDGER_NAME)
+    ledger = Ledger(path)
+    ledger.record("a.png", (10, 1), "spec", "failed", error="bad")
+    ledger.record("a.png", (12, 2), "spec", "done", output="a.png")
+    ledger.record("b.png", (10, 1), "spec", "done", output="b.png")
+    ledger.close()
+    with open(path, "a") as ledger_file:
+        ledger_file.write('{"source": "c.png", "sig')  # Cut off mid write
+    ledger = Ledger(path)
+    assert ledger.is_processed("a.png", (12, 2), "spec")
+    assert not ledger.is_processed("a.png", (10, 1), "spec")
+    assert not ledger.is_processed("b.png", (10, 1), "other spec")
+    assert "c.png" not in ledger.entries
+    ledger.close()
+    with open(path) as ledger_file:
+        assert [json.loads(line)["source"] for line in ledger_file] == \
+            ["a.png", "b.png"]
+
+
+def test_watcher_only_finds_images(folders):
+    input_dir, _ = folders
+    add_image(input_dir, "scan.png")
+    add_image(input_dir, ".hidden.png")
+    open(os.path.join(input_dir, "notes.txt"), "w").close()
+    os.mkdir(os.path.join(input_dir, "folder.png"))
+    watcher = PollingWatcher(input_dir)
+    found = watcher.scan()
+    assert list(found) == ["scan.png"]
+    assert watcher.stat("scan.png") == found["scan.png"]
+    assert watcher.stat("gone.png") is None
+
+
+def test_files_are_edited_like_by_hand(folders):
+    input_dir, output_dir = folders
+    paths = [add_image(input_dir, f"scan{index}.jpg", index)
+             for index in range(3)]
+    hot_folder = run_once(input_dir, output_dir)
+    assert hot_folder.processed == 3
+    for index, path in enumerate(paths):
+        output = cv2.imread(os.path.join(output_dir, f"scan{index}.png"),
+                            cv2.IMREAD_UNCHANGED)
+        assert np.array_equal(output, edit_by_hand(path, SPEC))
+    assert not [name for name in os.listdir(output_dir) if ".partial" in name]
+
+
+def test_restart_only_processes_new_and_changed_files(folders):
+    input_dir, output_dir = folders
+    add_image(input_dir, "a.png")
+    add_image(input_dir, "b.png", 1)
+    assert run_once(input_dir, output_dir).processed == 2
+    assert run_once(input_dir, output_dir).processed == 0
+    add_image(input_dir, "c.png", 2)
+    path = add_image(input_dir, "a.png", 3)
+    os.utime(path, ns=(1, 1))  # Changed, whatever the clock resolution
+    assert run_once(input_dir, output_dir).processed == 2
+    # A different spec redoes everything
+    assert run_once(input_dir, output_dir, dict(SPEC, scale=1.0)).processed \
+        == 3
+    # As does turning reduced decoding on
+    assert run_once(input_dir, output_dir, dict(SPEC, scale=1.0),
+                    reduced_decode=True).processed == 3
+
+
+def test_failed_files_are_retried_by_the_next_runs(folders):
+    input_dir, output_dir = folders
+    path = os.path.join(input_dir, "broken.png")
+    with open(path, "wb") as image_file:
+        image_file.write(b"not an image")
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        hot_folder = run_once(input_dir, output_dir)
+        assert (hot_folder.processed, hot_folder.failed) == (0, 1)
+        ledger = Ledger(os.path.join(output_dir, LEDGER_NAME))
+        assert ledger.entries["broken.png"]["attempts"] == attempt
+        ledger.close()
+    # Given up on until it changes
+    assert run_once(input_dir, output_dir).failed == 0
+    # Written properly this time
+    add_image(input_dir, "broken.png")
+    os.utime(path, ns=(1, 1))
+    assert run_once(input_dir, output_dir).processed == 1
+
+
+def test_failed_saves_leave_no_partial_output(folders, monkeypatch):
+    input_dir, output_dir = folders
+    add_image(input_dir, "scan.png")
+
+    def failing_save(model, path):
+        with open(path, "wb") as image_file:
+            image_file.write(b"half an image")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ImageModel, "save_edited_image", failing_save)
+    assert run_once(input_dir, output_dir).failed == 1
+    assert os.listdir(output_dir) == [LEDGER_NAME]
+
+
+def test_files_wait_until_they_settle(folders, monkeypatch):
+    input_dir, output_dir = folders
+    clock = [100.0]
+    monkeypatch.setattr("Image_HotFolder.time.monotonic", lambda: clock[0])
+    path = add_image(input_dir, "scan.png")
+    hot_folder = HotFolder(input_dir, output_dir, SPEC, workers=1, settle=2)
+    hot_folder.update_pending(hot_folder.watcher.scan())
+    clock[0] += 1.5
+    hot_folder.queue_settled()
+    assert hot_folder.tasks.empty()
+    # Still being written - the settling time starts again
+    with open(path, "ab") as image_file:
+        image_file.write(b"more")
+    hot_folder.update_pending(hot_folder.watcher.scan())
+    clock[0] += 1.5
+    hot_folder.queue_settled()
+    assert hot_folder.tasks.empty()
+    clock[0] += 1.0
+    hot_folder.queue_settled()
+    assert hot_folder.tasks.get_nowait()[0] == "scan.png"
+    assert hot_folder.active == {"scan.png"}
+    hot_folder.ledger.close()
+
+
+def test_queue_is_bounded(folders):
+    input_dir, output_dir = folders
+    hot_folder = HotFolder(input_dir, output_dir, SPEC, workers=3)
+    assert hot_folder.tasks.maxsize == 6
+    hot_folder.ledger.close()
+    hot_folder = HotFolder(input_dir, output_dir, SPEC, workers=3,
+                           queue_size=1)
+    assert hot_folder.tasks.maxsize == 1
+    hot_folder.ledger.close()
+
+
+def test_output_folder_must_differ(folders):
+    input_dir, _ = folders
+    with pytest.raises(ValueError):
+        HotFolder(input_dir, input_dir, SPEC)
@@ -0,0 +1,210 @@
+import json
+import os
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+import pytest
+
+import Image_Journal
+from conftest import make_image
+from Image_Controller import ImageController
+from Image_Journal import (JOURNAL_NAME, EditJournal, find_abandoned_session,
+                           read_journal, restore_session)
+from Image_Model import ImageModel
+
+
+@pytest.fixture
+def autosave_dir(tmp_path):
+    return str(tmp_path / "autosave")
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = str(tmp_path / "source.png")
+    assert cv2.imwrite(path, make_image(60, 80, 4))
+    return path
+
+
+def edit(model, source_path):
+    model.load_image(source_path)
+    model.crop_image(5, 5, 75, 55)
+    model.apply_filter("sharpen", amount=1.5)
+    model.set_brightness(15)
+    model.apply_filter("blur", region=(10, 10, 40, 30), radius=2)
+    model.rotate_image(90)
+    model.set_gamma(1.4)
+    model.set_scale_factor(0.5)
+
+
+def restore(autosave_dir):
+    session = find_abandoned_session(autosave_dir)
+    assert session is not None
+    model = ImageModel()
+    return model, restore_session(model, session)
+
+
+def assert_same_edits(restored, model):
+    assert np.array_equal(restored.edited_image, model.edited_image)
+    assert restored.get_settings() == model.get_settings()
+    assert restored.edit_steps == model.edit_steps
+    assert restored.rotation_angle == model.rotation_angle
+    assert np.array_equal(restored.get_edited_scaled_image(),
+                          model.get_edited_scaled_image())
+
+
+@pytest.mark.parametrize("snapshot_seconds", [60.0, 0.0])
+def test_restore_gives_the_same_edits(autosave_dir, source_path, monkeypatch,
+                                      snapshot_seconds):
+    model = ImageModel()
+    model.journal = EditJournal(autosave_dir, snapshot_seconds)
+    edit(model, source_path)
+    model.journal.close(discard=False)
+    monkeypatch.setattr(Image_Journal, "is_running", lambda pid: False)
+    restored, path = restore(autosave_dir)
+    assert path == source_path
+    assert_same_edits(restored, model)
+
+
+def test_restore_replays_only_the_edits_after_the_snapshot(
+        autosave_dir, source_path, monkeypatch):
+    model = ImageModel()
+    model.journal = EditJournal(autosave_dir, snapshot_seconds=0.0)
+    edit(model, source_path)
+    # Region edits keep undo history, so aren't followed by a snapshot
+    model.apply_filter("blur", region=(5, 5, 25, 25))
+    model.journal.flush()
+    names = [name for name in os.listdir(model.journal.directory)
+             if name.startswith("snapshot-")]
+    assert names == ["snapshot-5.npy"]  # After the rotation
+    model.journal.close(discard=False)
+    monkeypatch.setattr(Image_Journal, "is_running", lambda pid: False)
+    replayed = []
+    apply_filter = ImageModel.apply_filter
+
+    def recording_apply_filter(self, name, *args, **kwargs):
+        replayed.append(name)
+        return apply_filter(self, name, *args, **kwargs)
+
+    monkeypatch.setattr(ImageModel, "apply_filter", recording_apply_filter)
+    restored, _ = restore(autosave_dir)
+    assert replayed == ["blur"]
+    assert_same_edits(restored, model)
+
+
+def test_restored_session_carries_on_autosaving(autosave_dir, source_path,
+                                                tmp_path, monkeypatch):
+    model = ImageModel()
+    model.journal = EditJournal(autosave_dir)
+    edit(model, source_path)
+    model.journal.close(discard=False)
+    monkeypatch.setattr(Image_Journal, "is_running", lambda pid: False)
+    session = find_abandoned_session(autosave_dir)
+    # The restarted editor has the same process id, so another folder
+    restarted_dir = str(tmp_path / "restarted")
+    restored = ImageModel()
+    restored.journal = EditJournal(restarted_dir)
+    restore_session(restored, session)
+    assert not os.path.exists(session)
+    restored.rotate_image(90)
+    model.rotate_image(90)
+    restored.journal.close(discard=False)
+    again, _ = restore(restarted_dir)
+    assert_same_edits(again, model)
+
+
+def test_loading_a_new_image_starts_a_new_journal(autosave_dir, source_path,
+                                                  tmp_path):
+    model = ImageModel()
+    model.journal = EditJournal(autosave_dir, snapshot_seconds=0.0)
+    edit(model, source_path)
+    other_path = str(tmp_path / "other.png")
+    assert cv2.imwrite(other_path, make_image(20, 30))
+    model.load_image(other_path)
+    model.journal.flush()
+    entries = read_journal(model.journal.directory)
+    assert [entry["op"] for entry in entries if "op" in entry] == \
+        ["load_image"]
+    # Only the new image's snapshot is kept
+    assert [name for name in os.listdir(model.journal.directory)
+            if name.startswith("snapshot-")] == ["snapshot-6.npy"]
+    model.journal.close()
+    assert not os.path.exists(model.journal.directory)
+
+
+def test_partly_written_last_line_is_ignored(tmp_path):
+    with open(tmp_path / JOURNAL_NAME, "w") as journal_file:
+        journal_file.write(json.dumps({"seq": 1, "op": "load_image"}) + "\n")
+        journal_file.write('{"seq": 2, "op": "rot')
+    assert read_journal(str(tmp_path)) == [{"seq": 1, "op": "load_image"}]
+
+
+def test_sessions_without_an_image_are_not_offered(autosave_dir,
+                                                   monkeypatch):
+    journal = EditJournal(autosave_dir)
+    journal.close(discard=False)
+    monkeypatch.setattr(Image_Journal, "is_running", lambda pid: False)
+    assert find_abandoned_session(autosave_dir) is None
+    with pytest.raises(ValueError):
+        restore_session(ImageModel(), journal.directory)
+
+
+def test_running_sessions_are_not_offered(autosave_dir, source_path):
+    model = ImageModel()
+    model.journal = EditJournal(autosave_dir)
+    model.load_image(source_path)
+    model.journal.close(discard=False)
+    assert find_abandoned_session(autosave_dir) is None
+
+
+def test_images_being_saved_are_copied_before_changing(autosave_dir,
+                                                       loaded_model):
+    model = loaded_model(make_image(40, 50))
+    model.journal = EditJournal(autosave_dir)
+    image = model.edited_image
+    model.journal.snapshot(image, model.get_snapshot_state())
+    if model.journal.is_saving(image):
+        model.unshare_edited_image()
+        assert model.edited_image is not image
+    model.journal.flush()
+    assert not model.journal.is_saving(image)
+    model.journal.close()
+
+
+class FakeRoot:
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback, *args):
+        self.pending.append(callback)
+
+
+class FakeView:
+    def __init__(self):
+        self.root = FakeRoot()
+        self.asked = 0
+
+    def ask_yes_no(self, title, message):
+        self.asked += 1
+        return False
+
+
+def test_restore_is_offered_once_the_model_has_loaded(tmp_path, monkeypatch):
+    found = []
+    monkeypatch.setattr(Image_Journal, "find_abandoned_session",
+                        lambda: found.append(1) or "session")
+    monkeypatch.setattr(Image_Journal, "discard_session", lambda session: None)
+    controller = object.__new__(ImageController)
+    controller._model = Future()
+    controller.view = FakeView()
+    # Still loading - the window isn't kept waiting
+    controller.offer_restore()
+    assert len(controller.view.root.pending) == 1
+    assert found == []
+    model = ImageModel()
+    model.journal = EditJournal(str(tmp_path / "autosave"))
+    controller._model.set_result(model)
+    controller.view.root.pending.pop()()
+    assert controller.view.root.pending == []
+    assert found == [1] and controller.view.asked == 1
+    model.journal.close()
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+import Image_Latency
+from Image_Latency import LatencyMonitor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRoot:
+    # Records the callbacks queued with after() and after_idle()
+    def __init__(self):
+        self.timers = []
+        self.idle = []
+
+    def after(self, ms, callback):
+        self.timers.append(callback)
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(Image_Latency.time, "perf_counter", clock)
+    return clock
+
+
+def test_inputs_are_matched_to_the_next_paint(clock):
+    monitor = LatencyMonitor()
+    root = FakeRoot()
+    monitor.mark_input("key")
+    clock.now += 0.010
+    monitor.mark_input("slider")
+    monitor.schedule_paint(root)
+    monitor.schedule_paint(root)
+    assert len(root.idle) == 1  # One paint callback for both inputs
+    clock.now += 0.030
+    root.idle.pop()()
+    assert list(monitor.samples["key"]) == pytest.approx([40.0])
+    assert list(monitor.samples["slider"]) == pytest.approx([30.0])
+    assert monitor.pending == []
+
+
+def test_percentiles_are_nearest_rank(clock):
+    monitor = LatencyMonitor()
+    for latency in range(1, 101):
+        monitor._add_sample("key", float(latency))
+    assert monitor.percentiles("key") == {"p50": 50.0, "p95": 95.0,
+                                          "p99": 99.0}
+    assert monitor.percentiles("mouse") == {}
+
+
+@pytest.mark.parametrize("count", [1, 2, 7, 20, 99, 101, 1000])
+def test_percentiles_match_the_definition(clock, count):
+    monitor = LatencyMonitor()
+    for latency in range(count, 0, -1):
+        monitor._add_sample("key", float(latency))
+    for name, value in monitor.percentiles("key").items():
+        percent = int(name[1:])
+        # The smallest sample with at least percent of them at or below it
+        assert value == min(v for v in range(1, count + 1)
+                            if v * 100 >= percent * count)
+
+
+def test_stalls_above_the_threshold_are_logged(clock, capsys):
+    monitor = LatencyMonitor(stall_threshold_ms=100, heartbeat_ms=20)
+    root = FakeRoot()
+    monitor.start(root)
+    clock.now += 0.050  # On time, within the threshold
+    root.timers.pop()()
+    assert not monitor.stalls
+    clock.now += 0.020 + 0.250  # Blocked for 250 ms
+    root.timers.pop()()
+    ((_, duration_ms),) = monitor.stalls
+    assert duration_ms == pytest.approx(250.0)
+    assert "stalled for 250 ms" in capsys.readouterr().out
+
+
+def test_report_and_json_dump(clock, tmp_path):
+    monitor = LatencyMonitor()
+    monitor._add_sample("key", 12.0)
+    monitor._add_sample("mouse", 40.0)
+    path = tmp_path / "latency.json"
+    monitor.dump_json(str(path))
+    report = json.loads(path.read_text())
+    assert report["latency"]["key"]["count"] == 1
+    assert report["latency"]["key"]["histogram_ms"] == {"16": 1}
+    assert report["latency"]["all"]["count"] == 2
+    assert report["stalls"] == []
@@ -0,0 +1,191 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import NATIVE_FORMATS, make_image
+from Image_Controller import ImageController
+from Image_Loupe import Loupe
+from Image_Model import ImageModel
+
+
+class FakeCanvas:
+    # Enough of a tk.Canvas to draw the loupe without a display
+    def __init__(self, width=800, height=600):
+        self.size = {"width": width, "height": height}
+        self.items = {}
+        self.raised = 0
+
+    def cget(self, option):
+        return str(self.size[option])
+
+    def create_item(self, *coords, tags=None, **options):
+        self.items[len(self.items) + 1] = {"coords": coords, "tags": tags,
+                                           **options}
+        return len(self.items)
+
+    create_image = create_rectangle = create_line = create_text = create_item
+
+    def find_withtag(self, tag):
+        return [item for item, options in self.items.items()
+                if options["tags"] == tag]
+
+    def coords(self, item, *coords):
+        self.items[item]["coords"] = coords
+
+    def itemconfigure(self, item, **options):
+        self.items[item].update(options)
+
+    def tag_raise(self, tag):
+        self.raised += 1
+
+    def delete(self, tag):
+        self.items = {item: options for item, options in self.items.items()
+                      if options["tags"] != tag}
+
+
+class FakePhoto:
+    # Records what is pasted into the loupe's one PhotoImage
+    def __init__(self):
+        self.pasted = []
+
+    def paste(self, image):
+        self.pasted.append(np.asarray(image))
+
+
+def make_loupe(get_pixels=None, source_size=8, zoom=3, offset=24,
+               canvas=None):
+    loupe = object.__new__(Loupe)
+    loupe.canvas = canvas or FakeCanvas()
+    loupe.source_size = source_size
+    loupe.zoom = zoom
+    loupe.offset = offset
+    loupe.get_pixels = get_pixels
+    loupe.photo = FakePhoto()
+    loupe.position = None
+    loupe._items = {}
+    return loupe
+
+
+def shown_pixels(model, left, top, size):
+    # The square the loupe should show, from a whole image converted at once
+    image = model.to_8bit(model.image)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    else:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB
+                             if image.shape[2] == 4 else cv2.COLOR_BGR2RGB)
+    height, width = image.shape[:2]
+    padded = np.full((height + 2 * size, width + 2 * size, 3),
+                     ImageModel.LOUPE_BACKGROUND, np.uint8)
+    padded[size:size + height, size:size + width] = image
+    return padded[top + size:top + 2 * size, left + size:left + 2 * size]
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_loupe_pixels_are_the_full_size_pixels(loaded_model, channels, dtype):
+    model = loaded_model(make_image(120, 160, channels, dtype))
+    pixels, position = model.get_loupe_pixels(70, 50, 16)
+    assert position == (70, 50)
+    assert pixels.shape == (16, 16, 3) and pixels.dtype == np.uint8
+    assert np.array_equal(pixels, shown_pixels(model, 62, 42, 16))
+
+
+@pytest.mark.parametrize("view_x, view_y", [(0, 0), (3, 250), (511, 383),
+                                            (600, -20)])
+def test_loupe_is_centred_where_a_selection_corner_goes(loaded_model, view_x,
+                                                        view_y):
+    model = loaded_model(make_image(1500, 2000))
+    assert model.display_scale < 1
+    pixels, position = model.get_loupe_pixels(view_x, view_y, 64)
+    corner = model.view_to_image_coords(view_x, view_y, view_x, view_y)[:2]
+    assert position == corner
+    # Grey beyond the edges of the image
+    assert np.array_equal(pixels, shown_pixels(model, corner[0] - 32,
+                                               corner[1] - 32, 64))
+
+
+def test_only_the_loupe_square_is_converted(loaded_model, monkeypatch):
+    model = loaded_model(make_image(3000, 4000, 3, np.uint16))
+    converted = []
+    to_8bit = model.to_8bit
+    monkeypatch.setattr(model, "to_8bit",
+                        lambda image: converted.append(image.shape) or
+                        to_8bit(image))
+    model.get_loupe_pixels(300, 200, 64)
+    assert converted == [(64, 64, 3)]
+
+
+def test_controller_has_no_pixels_without_an_image():
+    controller = object.__new__(ImageController)
+    controller._model = ImageModel()
+    assert controller.get_loupe_pixels(10, 10, 64) is None
+
+
+@pytest.mark.parametrize("x, y, expected", [
+    (100, 100, (124, 124)),  # Below and to the right
+    (700, 100, (652, 124)),  # Left of the cursor near the right edge
+    (100, 500, (124, 452)),  # Above the cursor near the bottom edge
+    (30, 30, (54, 54)),
+    (700, 590, (652, 542))])
+def test_placement_stays_on_the_canvas(x, y, expected):
+    loupe = make_loupe(source_size=8, zoom=3)  # 24 pixels square
+    loupe.canvas = FakeCanvas(724, 500)
+    assert loupe.get_placement(x, y) == expected
+
+
+def test_placement_on_a_small_canvas():
+    loupe = make_loupe(source_size=64, zoom=3, canvas=FakeCanvas(200, 150))
+    assert loupe.get_placement(100, 100) == (0, 0)
+
+
+def test_show_magnifies_into_the_same_photo():
+    pixels = make_image(8, 8)
+    reads = []
+
+    def get_pixels(x, y, size):
+        reads.append((x, y, size))
+        return pixels, (x // 10, y // 10)
+
+    loupe = make_loupe(get_pixels)
+    photo = loupe.photo
+    loupe.show(100, 100)
+    assert loupe.photo is photo
+    assert np.array_equal(photo.pasted[0],
+                          np.repeat(np.repeat(pixels, 3, 0), 3, 1))
+    assert loupe.position == (10, 10)
+    items = dict(loupe.canvas.items)
+    assert len(items) == 5
+    assert loupe.canvas.items[loupe._items["image"]]["coords"] == (124, 124)
+    assert loupe.canvas.items[loupe._items["label"]]["text"] == "10, 10"
+    # Over the same image pixel - only moved
+    loupe.show(105, 101)
+    assert len(photo.pasted) == 1
+    assert list(loupe.canvas.items) == list(items)
+    assert loupe.canvas.items[loupe._items["border"]]["coords"] == (
+        129, 125, 153, 149)
+    loupe.show(120, 101)
+    assert len(photo.pasted) == 2
+    assert loupe.position == (12, 10)
+    assert reads == [(100, 100, 8), (105, 101, 8), (120, 101, 8)]
+
+
+def test_items_are_made_again_after_the_canvas_is_cleared():
+    loupe = make_loupe(lambda x, y, size: (make_image(8, 8), (x, y)))
+    loupe.show(10, 10)
+    loupe.canvas.delete(Loupe.TAG)
+    loupe.show(20, 20)
+    assert len(loupe.canvas.find_withtag(Loupe.TAG)) == 5
+
+
+def test_hide():
+    results = [(make_image(8, 8), (1, 2))]
+    loupe = make_loupe(lambda x, y, size: results.pop() if results else None)
+    loupe.show(10, 10)
+    assert len(loupe.canvas.items) == 5
+    # No image any more
+    loupe.show(10, 10)
+    assert loupe.canvas.items == {}
+    assert loupe.position is None
+    loupe = make_loupe()  # No callback set
+    loupe.show(10, 10)
+    assert loupe.canvas.items == {}
@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import make_image
+from Image_Memory import MemoryAccountant, MemoryLimitError
+from Image_Model import ImageModel
+
+
+def test_usage_current_and_peak():
+    memory = MemoryAccountant()
+    memory.set_usage("image", 100)
+    memory.set_usage("edited_image", 50)
+    assert memory.get_current() == 150
+    memory.set_usage("edited_image", 10)
+    memory.release("image")
+    assert memory.get_current() == 10
+    assert memory.get_usage("image") == 0
+    assert memory.get_peak() == 150
+    assert memory.report() == {"current": 10, "peak": 150, "ceiling": None,
+                               "usage": {"edited_image": 10}}
+
+
+def test_reserve_without_ceiling_never_refuses():
+    memory = MemoryAccountant()
+    memory.reserve(1 << 50)
+
+
+def test_reserve_counts_replaced_categories():
+    memory = MemoryAccountant(ceiling=100)
+    memory.set_usage("edited_image", 80)
+    memory.reserve(90, replacing=("edited_image",))
+    with pytest.raises(MemoryLimitError):
+        memory.reserve(90)
+
+
+def test_pressure_handlers_run_in_order_until_it_fits():
+    memory = MemoryAccountant(ceiling=100)
+    memory.set_usage("cache", 40)
+    memory.set_usage("proxy", 40)
+    calls = []
+
+    def drop_cache():
+        calls.append("cache")
+        memory.release("cache")
+
+    def drop_proxy():
+        calls.append("proxy")
+        memory.release("proxy")
+
+    memory.add_pressure_handler(drop_cache)
+    memory.add_pressure_handler(drop_proxy)
+    memory.reserve(50)
+    assert calls == ["cache"]
+    assert memory.get_usage("proxy") == 40
+
+
+def test_refusal_message_names_the_limit():
+    memory = MemoryAccountant(ceiling=1024 * 1024)
+    with pytest.raises(MemoryLimitError, match="over the 1.0 MB limit"):
+        memory.reserve(2 * 1024 * 1024)
+
+
+def test_nbytes_of_buffers():
+    array = np.zeros((10, 20, 3), np.uint8)
+    assert MemoryAccountant.nbytes_of(array) == 600
+    assert MemoryAccountant.nbytes_of(None) == 0
+    from PIL import Image
+    assert MemoryAccountant.nbytes_of(Image.new("RGBA", (10, 20))) == 800
+
+
+def test_model_tracks_loaded_and_edited_images(tmp_path):
+    path = str(tmp_path / "image.png")
+    cv2.imwrite(path, make_image(60, 80))
+    model = ImageModel()
+    model.load_image(path)
+    assert model.memory.get_usage("image") == model.image.nbytes
+    assert model.memory.get_usage("edited_image") == \
+        model.edited_image.nbytes
+    model.crop_image(0, 0, 40, 30)
+    assert model.memory.get_usage("edited_image") == 40 * 30 * 3
+
+
+def test_model_refuses_load_over_the_limit(tmp_path):
+    path = str(tmp_path / "image.png")
+    cv2.imwrite(path, make_image(200, 200))
+    model = ImageModel(memory_limit=100_000)
+    with pytest.raises(MemoryLimitError):
+        model.load_image(path)
+    assert model.image is None
+
+
+def test_model_drops_caches_then_lowers_proxy_resolution(loaded_model):
+    image = make_image(2048, 2048)
+    model = loaded_model(image)
+    model.get_original_proxy()
+    assert model.memory.get_usage("cache") > 0
+    # Room for the images and little else
+    model.memory.set_ceiling(2 * image.nbytes + 1)
+    model.memory.relieve_pressure(1)
+    assert model.memory.get_usage("cache") == 0
+    assert model.proxy_max_size == model.DEFAULT_PROXY_MAX_SIZE
+    model.memory.relieve_pressure(2)
+    assert model.proxy_max_size < model.DEFAULT_PROXY_MAX_SIZE
+
+
+def test_refused_reset_keeps_the_edited_image(loaded_model):
+    image = make_image(200, 200)
+    model = loaded_model(image)
+    model.crop_image(0, 0, 100, 100)
+    edited = model.edited_image
+    # Room for the images as they are, but not for a full size copy
+    model.memory.set_ceiling(image.nbytes + edited.nbytes + 1000)
+    with pytest.raises(MemoryLimitError):
+        model.reset_image()
+    assert model.edited_image is edited
+    assert model.memory.get_usage("edited_image") == edited.nbytes
+    assert model.edit_steps == [("crop", (0, 0, 100, 100))]
@@ -0,0 +1,203 @@
+import argparse
+import json
+import math
+import os
+import threading
+
+import cv2
+import pytest
+
+import Image_Metrics
+from conftest import make_image
+from Image_Metrics import (CACHE_REQUESTS, OPERATION_SECONDS, MetricsDumper,
+                           MetricsRegistry, metrics)
+from Image_Model import BYTES_READ, IMAGES_READ, ImageModel
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry()
+    registry.enable()
+    return registry
+
+
+@pytest.fixture
+def enabled():
+    # Records into the shared metrics for one test
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+
+
+def test_nothing_is_recorded_while_disabled():
+    registry = MetricsRegistry()
+    counter = registry.counter("files_total", "Files")
+    histogram = registry.histogram("duration_seconds", "Time")
+    counter.inc()
+    histogram.observe(0.1)
+    assert counter.snapshot() == {}
+    assert histogram.snapshot() == {}
+    assert registry.to_prometheus() == "\n"
+
+
+def test_counters_and_gauges_by_label(registry):
+    counter = registry.counter("files_total", "Files")
+    counter.inc(status="done")
+    counter.inc(2, status="done")
+    counter.inc(status="failed")
+    gauge = registry.gauge("queue_depth", "Queue")
+    gauge.set(5)
+    gauge.set(3)
+    assert counter.snapshot() == {(("status", "done"),): 3,
+                                  (("status", "failed"),): 1}
+    assert gauge.snapshot() == {(): 3}
+
+
+def test_metrics_are_shared_by_name(registry):
+    counter = registry.counter("files_total", "Files")
+    assert registry.counter("files_total", "Files") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("files_total", "Files")
+
+
+def test_histogram_buckets_include_their_upper_bound(registry):
+    histogram = registry.histogram("size", "Sizes", buckets=(1, 10, math.inf))
+    for value in (0.5, 1, 1.5, 10, 11):
+        histogram.observe(value)
+    assert histogram.snapshot() == {(): [[2, 2, 1], 24.0, 5]}
+
+
+def test_prometheus_text(registry):
+    registry.counter("files_total", "Files").inc(status='say "hi"\n')
+    histogram = registry.histogram("duration_seconds", "Time",
+                                   buckets=(0.1, 1, math.inf))
+    histogram.observe(0.05, operation="crop")
+    histogram.observe(0.5, operation="crop")
+    histogram.observe(5, operation="crop")
+    assert registry.to_prometheus() == (
+        "# HELP files_total Files\n"
+        "# TYPE files_total counter\n"
+        'files_total{status="say \\"hi\\"\\n"} 1\n'
+        "# HELP duration_seconds Time\n"
+        "# TYPE duration_seconds histogram\n"
+        'duration_seconds_bucket{operation="crop",le="0.1"} 1\n'
+        'duration_seconds_bucket{operation="crop",le="1"} 2\n'
+        'duration_seconds_bucket{operation="crop",le="+Inf"} 3\n'
+        'duration_seconds_sum{operation="crop"} 5.55\n'
+        'duration_seconds_count{operation="crop"} 3\n')
+
+
+def test_json(registry):
+    registry.gauge("queue_depth", "Queue").set(4)
+    registry.histogram("size", "Sizes", buckets=(1, math.inf)).observe(2)
+    result = registry.to_json()
+    assert result["metrics"] == {
+        "queue_depth": {"type": "gauge",
+                        "values": [{"labels": {}, "value": 4}]},
+        "size": {"type": "histogram", "bounds": [1, None],
+                 "values": [{"labels": {}, "count": 1, "sum": 2,
+                             "buckets": [0, 1]}]}}
+    assert result["uptime"] >= 0
+
+
+def test_collectors_run_before_each_export(registry):
+    gauge = registry.gauge("calls", "Collector calls")
+    calls = []
+
+    def collector():
+        calls.append(1)
+        gauge.set(len(calls))
+
+    registry.add_collector(collector)
+    registry.to_prometheus()
+    assert registry.to_json()["metrics"]["calls"]["values"][0]["value"] == 2
+
+
+def test_counting_from_many_threads(registry):
+    counter = registry.counter("files_total", "Files")
+    histogram = registry.histogram("duration_seconds", "Time")
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+            histogram.observe(0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.snapshot() == {(): 8000}
+    assert histogram.snapshot()[()][2] == 8000
+
+
+def test_dumper_writes_the_final_values(registry, tmp_path):
+    prometheus_path = str(tmp_path / "metrics.prom")
+    json_path = str(tmp_path / "metrics.jsonl")
+    counter = registry.counter("files_total", "Files")
+    dumper = MetricsDumper(registry, prometheus_path, json_path,
+                           interval=0.01)
+    dumper.start()
+    counter.inc()
+    dumper.stop()
+    with open(prometheus_path) as prometheus_file:
+        assert "files_total 1\n" in prometheus_file.read()
+    with open(json_path) as json_file:
+        lines = [json.loads(line) for line in json_file]
+    assert lines[-1]["metrics"]["files_total"]["values"][0]["value"] == 1
+    assert not os.path.exists(prometheus_path + ".tmp")
+
+
+def test_failed_writes_are_reported(registry, tmp_path, capsys):
+    registry.counter("files_total", "Files").inc()
+    dumper = MetricsDumper(registry, str(tmp_path / "missing" / "m.prom"))
+    dumper.dump()
+    assert "Unable to write metrics" in capsys.readouterr().err
+
+
+def test_dumper_is_only_started_when_asked():
+    parser = argparse.ArgumentParser()
+    Image_Metrics.add_arguments(parser)
+    assert Image_Metrics.start_dumper(parser.parse_args([])) is None
+    assert not metrics.enabled
+
+
+def test_process_memory():
+    assert Image_Metrics.get_resident_memory() > 0
+    assert Image_Metrics.get_peak_resident_memory() >= \
+        Image_Metrics.get_resident_memory() // 2
+
+
+def count(metric, **labels):
+    # A counter's value, or a histogram's count, for some labels
+    value = metric.snapshot().get(tuple(sorted(labels.items())), 0)
+    return value[2] if isinstance(value, list) else value
+
+
+def test_model_operations_are_timed(enabled, tmp_path):
+    path = str(tmp_path / "image.png")
+    cv2.imwrite(path, make_image(40, 50))
+    model = ImageModel()
+    loads = count(OPERATION_SECONDS, operation="ImageModel.load_image")
+    crops = count(OPERATION_SECONDS, operation="ImageModel.crop_image")
+    reads, read_bytes = count(IMAGES_READ), count(BYTES_READ)
+    model.load_image(path)
+    model.crop_image(0, 0, 20, 20)
+    assert count(OPERATION_SECONDS, operation="ImageModel.load_image") == \
+        loads + 1
+    assert count(OPERATION_SECONDS, operation="ImageModel.crop_image") == \
+        crops + 1
+    assert count(IMAGES_READ) == reads + 1
+    assert count(BYTES_READ) == read_bytes + os.path.getsize(path)
+
+
+def test_cache_hits_and_misses(enabled, loaded_model):
+    model = loaded_model(make_image(40, 50))
+    misses = count(CACHE_REQUESTS, cache="tone_lut", result="miss")
+    hits = count(CACHE_REQUESTS, cache="tone_lut", result="hit")
+    model.set_brightness(20)
+    model.apply_tone(model.edited_image)
+    model.apply_tone(model.edited_image)
+    assert count(CACHE_REQUESTS, cache="tone_lut", result="miss") == \
+        misses + 1
+    assert count(CACHE_REQUESTS, cache="tone_lut", result="hit") >= hits + 1
@@ -0,0 +1,122 @@
+import cv2
+import numpy as np
+import pytest
+
+from conftest import NATIVE_FORMATS, make_image
+from Image_Model import ImageModel
+
+
+def bordered_image(channels, dtype):
+    # Content inside a flat border, 20 pixels at the top and left and 30
+    # at the bottom and right
+    maximum = np.iinfo(dtype).max
+    shape = (160, 200) if channels == 1 else (160, 200, channels)
+    image = np.full(shape, maximum * 9 // 10, dtype)
+    image[20:130, 20:170] = make_image(110, 150, channels, dtype) // 2
+    return image
+
+
+def save_and_load(tmp_path, image, name="image.png"):
+    path = str(tmp_path / name)
+    assert cv2.imwrite(path, image)
+    model = ImageModel()
+    model.load_image(path)
+    return model
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_load_keeps_channels_and_depth(tmp_path, channels, dtype):
+    image = make_image(30, 40, channels, dtype)
+    model = save_and_load(tmp_path, image)
+    assert model.image.dtype == dtype
+    assert model.image.shape == image.shape
+    assert np.array_equal(model.image, image)
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_crop(tmp_path, channels, dtype):
+    image = make_image(30, 40, channels, dtype)
+    model = save_and_load(tmp_path, image)
+    model.crop_image(5, 3, 25, 20)
+    assert np.array_equal(model.edited_image, image[3:20, 5:25])
+    assert model.memory.get_usage("edited_image") == \
+        model.edited_image.nbytes
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_auto_crop(loaded_model, channels, dtype):
+    image = bordered_image(channels, dtype)
+    model = loaded_model(image)
+    assert model.auto_crop()
+    assert model.edit_steps == [("auto_crop", (20, 20, 170, 130))]
+    assert np.array_equal(model.edited_image, image[20:130, 20:170])
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+@pytest.mark.parametrize("angle", [90, 180, -90, 30])
+def test_rotate(loaded_model, channels, dtype, angle):
+    image = make_image(30, 40, channels, dtype)
+    model = loaded_model(image)
+    model.rotate_image(angle)
+    rotated = model.edited_image
+    assert rotated.dtype == dtype
+    assert rotated.ndim == image.ndim
+    if angle % 90 == 0:
+        assert np.array_equal(rotated, np.rot90(image, -angle // 90))
+    else:
+        matrix, size = ImageModel.get_rotation_matrix(40, 30, angle)
+        assert np.array_equal(rotated, cv2.warpAffine(
+            image, matrix, size, flags=cv2.INTER_NEAREST))
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_resize(loaded_model, channels, dtype):
+    image = make_image(40, 60, channels, dtype)
+    model = loaded_model(image)
+    model.set_scale_factor(0.5)
+    scaled = model.get_edited_scaled_image()
+    assert scaled.dtype == dtype
+    assert scaled.shape == (20, 30) + image.shape[2:]
+    assert np.array_equal(scaled, cv2.resize(
+        image, (30, 20), interpolation=cv2.INTER_AREA))
+    pil_image = model.get_edited_scaled_image_as_pil()
+    assert pil_image.mode == {1: "L", 3: "RGB", 4: "RGBA"}[channels]
+    assert pil_image.size == (30, 20)
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+@pytest.mark.parametrize("name", ["blur", "sharpen", "denoise", "edges"])
+def test_filters(loaded_model, channels, dtype, name):
+    image = make_image(30, 40, channels, dtype)
+    model = loaded_model(image)
+    model.apply_filter(name)
+    filtered = model.edited_image
+    assert filtered.dtype == dtype
+    assert filtered.shape == image.shape
+    colour = image[..., :3] if channels == 4 else image
+    expected = model.filter_engine.apply_single(
+        np.ascontiguousarray(colour), name)
+    if channels == 4:
+        assert np.array_equal(filtered[..., :3], expected)
+        assert np.array_equal(filtered[..., 3], image[..., 3])
+    else:
+        assert np.array_equal(filtered, expected)
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_save_keeps_channels_and_depth(tmp_path, channels, dtype):
+    image = make_image(30, 40, channels, dtype)
+    model = save_and_load(tmp_path, image)
+    path = str(tmp_path / "edited.png")
+    model.save_edited_image(path)
+    assert np.array_equal(cv2.imread(path, cv2.IMREAD_UNCHANGED), image)
+
+
+def test_save_reduces_to_what_the_format_supports(tmp_path):
+    image = make_image(30, 40, 4, np.uint16)
+    model = save_and_load(tmp_path, image)
+    path = str(tmp_path / "edited.jpg")
+    model.save_edited_image(path)
+    saved = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    assert saved.dtype == np.uint8
+    assert saved.shape == (30, 40, 3)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+import Image_Decode
+from conftest import make_image
+from Image_Model import ImageModel
+
+ORIENTATIONS = range(1, 9)
+
+
+def save_oriented(tmp_path, image, file_format, orientation, **options):
+    """
+    Saves a BGR image with an EXIF orientation tag.
+
+    Returns
+    tuple: (path, the image as shown by Pillow with the orientation applied,
+        in BGR order).
+    """
+    path = str(tmp_path / f"oriented.{file_format.lower()}")
+    pil_image = Image.fromarray(image[:, :, ::-1])
+    if file_format == "TIFF":
+        pil_image.save(path, file_format, tiffinfo={274: orientation},
+                       **options)
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        pil_image.save(path, file_format, exif=exif.tobytes(), **options)
+    with Image.open(path) as saved:
+        shown = np.asarray(ImageOps.exif_transpose(saved).convert("RGB"))
+    return path, np.ascontiguousarray(shown[:, :, ::-1])
+
+
+def load(path):
+    model = ImageModel()
+    model.load_image(path)
+    return model.image
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("file_format, options", [
+    ("JPEG", {"quality": 95}), ("PNG", {}), ("TIFF", {}),
+    ("TIFF", {"compression": "tiff_lzw"})])
+def test_load_applies_the_orientation_once(tmp_path, file_format, options,
+                                           orientation):
+    image = make_image(30, 50)
+    path, shown = save_oriented(tmp_path, image, file_format, orientation,
+                                **options)
+    assert np.array_equal(load(path), shown)
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+def test_tiff_orients_16_bit_greyscale(tmp_path, orientation):
+    image = make_image(30, 50, 1, np.uint16)
+    path = str(tmp_path / "oriented.tiff")
+    Image.fromarray(image).save(path, tiffinfo={274: orientation})
+    assert np.array_equal(load(path),
+                          ImageModel.to_native_image(image, orientation))
+
+
+@pytest.mark.parametrize("orientation", [2, 3, 4])
+def test_tiff_decoder_orientation_is_undone(tmp_path, monkeypatch,
+                                            orientation):
+    # Files whose layout read_tiff_region doesn't handle are decoded whole
+    path, shown = save_oriented(tmp_path, make_image(30, 50), "TIFF",
+                                orientation)
+    monkeypatch.setattr(Image_Decode, "read_tiff_region",
+                        lambda path, bounds: (None, None))
+    assert np.array_equal(load(path), shown)
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+def test_to_native_image_orients_like_exif_transpose(orientation):
+    image = make_image(30, 50)
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    pil_image = Image.fromarray(image)
+    pil_image.info["exif"] = exif.tobytes()
+    expected = np.asarray(ImageOps.exif_transpose(pil_image))
+    assert np.array_equal(ImageModel.to_native_image(image, orientation),
+                          expected)
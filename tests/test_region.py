@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from conftest import NATIVE_FORMATS, make_image
+from Image_Memory import MemoryLimitError
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_tone_only_changes_the_region(loaded_model, channels, dtype):
+    image = make_image(50, 60, channels, dtype)
+    model = loaded_model(image)
+    model.set_brightness(30)
+    model.apply_tone_to_region((10, 5, 40, 25))
+    expected = image.copy()
+    expected[5:25, 10:40] = model.apply_tone(image)[5:25, 10:40]
+    assert np.array_equal(model.edited_image, expected)
+
+
+def test_region_edits_are_made_in_place(loaded_model):
+    model = loaded_model(make_image(50, 60))
+    edited = model.edited_image
+    model.apply_filter("sharpen", region=(0, 0, 20, 20))
+    model.set_gamma(1.5)
+    model.apply_tone_to_region((20, 20, 50, 40))
+    assert model.edited_image is edited
+
+
+def test_undo_keeps_only_the_region(loaded_model):
+    image = make_image(50, 60)
+    model = loaded_model(image)
+    model.apply_filter("blur", region=(10, 10, 30, 20))
+    model.set_contrast(2.0)
+    model.apply_tone_to_region((0, 30, 60, 50))
+    assert [patch.shape for _, _, patch in model.undo_history] == \
+        [(10, 20, 3), (20, 60, 3)]
+    assert model.memory.get_usage("undo") == (200 + 1200) * 3
+    assert model.undo()
+    assert model.undo()
+    assert not model.undo()
+    assert np.array_equal(model.edited_image, image)
+    assert model.memory.get_usage("undo") == 0
+
+
+def test_undo_history_is_limited(loaded_model):
+    model = loaded_model(make_image(20, 20))
+    for _ in range(model.MAX_UNDO_STEPS + 5):
+        model.apply_filter("blur", region=(0, 0, 4, 4))
+    assert len(model.undo_history) == model.MAX_UNDO_STEPS
+
+
+def test_memory_needed_depends_on_the_region(loaded_model):
+    image = make_image(1000, 1000)
+    model = loaded_model(image)
+    # Far too little room to filter the whole image, plenty for a corner
+    model.memory.set_ceiling(model.memory.get_current() + 100_000)
+    model.apply_filter("blur", region=(0, 0, 50, 50))
+    with pytest.raises(MemoryLimitError):
+        model.apply_filter("blur")
+
+
+def test_image_to_edited_coords_follows_crops_and_rotations(loaded_model):
+    model = loaded_model(make_image(40, 60))
+    model.crop_image(10, 5, 50, 35)
+    assert model.image_to_edited_coords(20, 10, 30, 20) == (10, 5, 20, 15)
+    model.rotate_image(90)
+    # 40 x 30 crop turned clockwise - x becomes 29 - y
+    assert model.image_to_edited_coords(20, 10, 30, 20) == (15, 10, 25, 20)
+    assert model.image_to_edited_coords(0, 0, 5, 5) is None
@@ -0,0 +1,105 @@
+import os
+
+from Image_Replay import (SessionPlayer, SessionRecorder, load_recording,
+                          portable_path)
+
+
+class FakeWidget:
+    def __init__(self):
+        self.value = None
+        self.generated = []
+        self.invoked = 0
+
+    def set(self, value):
+        self.value = value
+
+    def event_generate(self, sequence, **options):
+        self.generated.append((sequence, options))
+
+    def invoke(self):
+        self.invoked += 1
+
+    def update(self):
+        pass
+
+    def focus_force(self):
+        pass
+
+
+class FakeView:
+    # The parts of ImageView a replay uses. Each displayed image is a frame.
+    def __init__(self):
+        self.root = FakeWidget()
+        self.image_canvas_original = FakeWidget()
+        self.resize_image_slider = FakeWidget()
+        self.tone_sliders = {"gamma": FakeWidget()}
+        self.crop_image_button = FakeWidget()
+        self.filter_combobox = FakeWidget()
+        self.selection_only = FakeWidget()
+
+    def display_image(self, *args):
+        pass
+
+    def update_edited_image(self, *args):
+        pass
+
+
+class FakeController:
+    def __init__(self, view):
+        self.view = view
+        self.loaded = []
+
+    def load_image(self, image_path):
+        self.loaded.append(image_path)
+        self.view.display_image()
+        self.view.update_edited_image()
+
+
+def test_recording_round_trip(tmp_path):
+    recorder = object.__new__(SessionRecorder)
+    recorder.events = []
+    recorder.start_time = 0.0
+    recorder.record("key", keysym="Right", control=False)
+    recorder.record("mouse", action="press", x=10, y=20)
+    path = str(tmp_path / "session.json")
+    recorder.save(path)
+    events = load_recording(path)
+    assert [event["type"] for event in events] == ["key", "mouse"]
+    assert events[1] == {"t": events[1]["t"], "type": "mouse",
+                         "action": "press", "x": 10, "y": 20}
+
+
+def test_portable_path():
+    assert portable_path(os.path.abspath("test_images/a.png")) == \
+        os.path.join("test_images", "a.png")
+    outside = os.path.abspath(os.path.join(os.sep, "elsewhere", "a.png"))
+    assert portable_path(outside) == outside
+
+
+def test_replay_dispatches_in_order_and_counts_frames():
+    view = FakeView()
+    controller = FakeController(view)
+    events = [
+        {"t": 0.0, "type": "open", "path": "test_images/a.png"},
+        {"t": 0.1, "type": "key", "keysym": "z", "control": True},
+        {"t": 0.2, "type": "mouse", "action": "drag", "x": 5, "y": 6},
+        {"t": 0.3, "type": "scale", "value": 0.5},
+        {"t": 0.4, "type": "tone", "name": "gamma", "value": 1.2},
+        {"t": 0.5, "type": "button", "name": "crop_image_button",
+         "filter": "", "selection_only": True},
+    ]
+    report = SessionPlayer(view, controller, events).play()
+    assert controller.loaded == ["test_images/a.png"]
+    assert view.root.generated == [("<Control-z>", {"when": "tail"})]
+    assert view.image_canvas_original.generated == \
+        [("<B1-Motion>", {"x": 5, "y": 6, "when": "tail"})]
+    assert view.resize_image_slider.value == 0.5
+    assert view.tone_sliders["gamma"].value == 1.2
+    assert view.selection_only.value is True
+    assert view.crop_image_button.invoked == 1
+    assert report["events"] == 6
+    assert report["frames"] == 2
+    assert len(report["per_event_ms"]) == 6
+    assert report["latency"]["count"] == 6
+    assert set(report["latency_by_type"]) == \
+        {"open", "key", "mouse", "scale", "tone", "button"}
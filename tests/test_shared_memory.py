@@ -0,0 +1,102 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from conftest import make_image
+from Image_Filters import StripFilterEngine
+from Image_SharedMemory import ProcessImageExecutor, SharedImage
+
+
+def block_exists(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    block.close()
+    return True
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = ProcessImageExecutor(processes=2, min_strip_rows=8)
+    yield executor
+    executor.shutdown()
+
+
+def test_attached_image_shares_the_pixels():
+    image = make_image(20, 30, 4, np.uint16)
+    shared = SharedImage.from_array(image)
+    attached = SharedImage.attach(shared.descriptor())
+    assert np.array_equal(attached.array, image)
+    attached.array[0, 0] = 7
+    assert (shared.array[0, 0] == 7).all()
+    attached.close()
+    shared.release()
+
+
+def test_block_is_unlinked_when_the_last_reference_is_released():
+    shared = SharedImage.create((10, 10), np.uint8).retain()
+    name = shared.name
+    shared.release()
+    assert block_exists(name)
+    shared.release()
+    assert not block_exists(name)
+    assert name not in SharedImage._owned
+
+
+def test_release_all_unlinks_remaining_blocks():
+    shared = SharedImage.create((10, 10), np.uint8).retain().retain()
+    SharedImage.release_all()
+    assert not block_exists(shared.name)
+
+
+@pytest.mark.parametrize("name", ["blur", "sharpen", "denoise", "edges"])
+def test_process_filters_are_identical_to_a_single_pass(executor, name):
+    image = make_image(100, 80)
+    expected = StripFilterEngine().apply_single(image, name)
+    assert np.array_equal(executor.apply_filter(image, name), expected)
+    assert np.array_equal(executor.apply_filter_pickled(image, name),
+                          expected)
+    assert not SharedImage._owned
+
+
+def test_shared_output_is_left_to_the_caller(executor):
+    source = SharedImage.from_array(make_image(100, 80, 1))
+    output = executor.apply_filter_shared(source, "blur", radius=3)
+    expected = StripFilterEngine().apply_single(source.array, "blur",
+                                                radius=3)
+    assert np.array_equal(output.array, expected)
+    source.release()
+    output.release()
+    assert not SharedImage._owned
+
+
+def test_pool_is_replaced_after_a_worker_crashes(executor):
+    with pytest.raises(BrokenProcessPool):
+        executor.run(os._exit, [(1,)])
+    image = make_image(100, 80)
+    assert np.array_equal(executor.apply_filter(image, "blur"),
+                          StripFilterEngine().apply_single(image, "blur"))
+
+
+def test_model_filters_large_images_in_processes(loaded_model, executor,
+                                                 monkeypatch):
+    image = make_image(120, 100, 4)
+    model = loaded_model(image)
+    model.filter_engine.min_parallel_pixels = 0
+    expected = model.filter_image(image, "sharpen")
+    calls = []
+    apply_filter = executor.apply_filter
+
+    def counted_apply_filter(*args, **params):
+        calls.append(args[1])
+        return apply_filter(*args, **params)
+
+    monkeypatch.setattr(executor, "apply_filter", counted_apply_filter)
+    model.process_executor = executor
+    model.apply_filter("sharpen")
+    assert calls == ["sharpen"]
+    assert np.array_equal(model.edited_image, expected)
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+from Image_Startup import StartupProfiler
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_milestones_are_recorded_once_in_order():
+    profiler = StartupProfiler()
+    profiler.mark("first paint")
+    profiler.mark("model ready")
+    profiler.mark("first paint")
+    assert [name for name, _ in profiler.milestones] == \
+        ["first paint", "model ready"]
+    assert profiler.has_milestone("model ready")
+    assert not profiler.has_milestone("icons loaded")
+    assert "first paint" in profiler.report()
+
+
+def test_import_timing_records_new_top_level_modules():
+    profiler = StartupProfiler()
+    sys.modules.pop("colorsys", None)
+    profiler.start_import_timing()
+    try:
+        # Through __import__, which the profiler wraps
+        __import__("colorsys")
+        __import__("os.path")  # Already imported, so not timed
+    finally:
+        profiler.stop_import_timing()
+    assert [module for module, _, _, _ in profiler.imports] == ["colorsys"]
+    _, thread, total, own = profiler.imports[0]
+    assert thread == "MainThread"
+    assert total >= own >= 0
+
+
+def test_gui_modules_import_without_opencv_or_numpy():
+    # main.py paints the window before the Model's heavy imports are loaded
+    code = ("import sys; sys.argv = ['main.py']; import main; "
+            "print(sorted({'cv2', 'numpy', 'Image_Model'} & "
+            "set(sys.modules)))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
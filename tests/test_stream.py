@@ -0,0 +1,118 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import make_image
+from Image_Metrics import metrics
+from Image_Stream import (FRAME_SECONDS, FrameEditor, FrameWriter,
+                          read_frames, stream_edits)
+
+
+def write_pages(path, count, height=24, width=32):
+    # Each page filled with its own number, so the order can be checked
+    writer = FrameWriter(str(path))
+    for page in range(count):
+        writer.write(np.full((height, width, 3), page, np.uint8))
+    writer.close()
+    return str(path)
+
+
+class RecordingEditor:
+    # Returns frames unchanged, slowly and out of order, recording how
+    # many frames were held when each was edited
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.applied = 0
+        self.written = 0
+        self.held = []
+
+    def apply(self, frame):
+        with self.lock:
+            self.applied += 1
+            self.held.append(self.applied - self.written)
+        time.sleep(0.001 * (3 - int(frame[0, 0, 0]) % 3))
+        return frame
+
+    def progress(self, written):
+        with self.lock:
+            self.written = written
+
+
+def test_multi_page_tiff_round_trip(tmp_path):
+    pages = [make_image(20, 30, seed=seed) for seed in range(3)]
+    path = str(tmp_path / "pages.tiff")
+    writer = FrameWriter(path)
+    for page in pages:
+        writer.write(page)
+    writer.close()
+    assert writer.count == 3
+    read = list(read_frames(path))
+    assert len(read) == 3
+    for frame, page in zip(read, pages):
+        assert np.array_equal(frame, page)
+
+
+def test_frames_are_written_in_order(tmp_path):
+    source = write_pages(tmp_path / "source.tiff", 12)
+    output = str(tmp_path / "output.tiff")
+    editor = RecordingEditor()
+    assert stream_edits(source, output, editor, threads=4) == 12
+    assert [int(frame[0, 0, 0]) for frame in read_frames(output)] == \
+        list(range(12))
+
+
+@pytest.mark.parametrize("max_in_flight", [1, 3])
+def test_frames_held_are_limited(tmp_path, max_in_flight):
+    source = write_pages(tmp_path / "source.tiff", 10)
+    output = str(tmp_path / "output.tiff")
+    editor = RecordingEditor()
+    stream_edits(source, output, editor, threads=4,
+                 max_in_flight=max_in_flight, progress=editor.progress)
+    assert max(editor.held) <= max_in_flight
+
+
+def test_editor_repeats_the_model_edits(loaded_model):
+    image = make_image(40, 60)
+    model = loaded_model(image)
+    model.crop_image(5, 4, 55, 36)
+    model.rotate_image(90)
+    model.rotate_image(30)
+    model.set_brightness(20)
+    model.set_gamma(1.3)
+    model.set_scale_factor(0.5)
+    editor = FrameEditor.from_model(model)
+    assert np.array_equal(editor.apply(image),
+                          model.get_edited_scaled_image())
+
+
+def test_editor_skips_filters(loaded_model):
+    image = make_image(30, 40)
+    model = loaded_model(image)
+    model.apply_filter("blur")
+    model.crop_image(0, 0, 20, 10)
+    assert np.array_equal(FrameEditor.from_model(model).apply(image),
+                          image[:10, :20])
+
+
+def test_editor_resizes_frames_to_the_source_size():
+    editor = FrameEditor((40, 30), [("crop", (0, 0, 20, 15))], {})
+    frame = editor.apply(make_image(60, 80))
+    assert frame.shape == (15, 20, 3)
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_frame_times_are_recorded_when_metrics_are_enabled(tmp_path,
+                                                           enabled):
+    source = write_pages(tmp_path / "source.tiff", 4)
+    before = FRAME_SECONDS.snapshot().get((), [None, 0.0, 0])[2]
+    if enabled:
+        metrics.enable()
+    try:
+        stream_edits(source, str(tmp_path / "output.tiff"),
+                     RecordingEditor(), threads=2)
+    finally:
+        metrics.disable()
+    after = FRAME_SECONDS.snapshot().get((), [None, 0.0, 0])[2]
+    assert after - before == (4 if enabled else 0)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from conftest import NATIVE_FORMATS, make_image
+from Image_Model import ImageModel
+
+
+def reference_tone(levels, brightness, contrast, gamma, black, white,
+                   maximum):
+    # Each adjustment in turn, in floating point, rounded once at the end
+    levels = levels.astype(np.float64) * (255.0 / maximum)
+    levels = (levels - black) * (255.0 / (white - black))
+    levels = (levels - 127.5) * contrast + 127.5
+    levels = levels + brightness * 2.55
+    levels = np.clip(levels, 0, 255) / 255.0
+    levels = np.power(levels, 1.0 / gamma) * maximum
+    return np.clip(np.rint(levels), 0, maximum)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_combined_lut_matches_each_adjustment_in_turn(dtype):
+    model = ImageModel()
+    model.set_levels(20, 230)
+    model.set_contrast(1.3)
+    model.set_brightness(-15)
+    model.set_gamma(1.8)
+    maximum = np.iinfo(dtype).max
+    levels = np.arange(maximum + 1)
+    expected = reference_tone(levels, -15, 1.3, 1.8, 20, 230, maximum)
+    lut = model.get_tone_lut(dtype)
+    assert lut.dtype == dtype
+    assert np.array_equal(lut, expected)
+
+
+def test_no_adjustments_skip_the_lookup():
+    model = ImageModel()
+    assert model.get_tone_lut() is None
+    assert not model.has_tone_adjustments()
+    image = make_image(8, 8)
+    assert model.apply_tone(image) is image
+    model.set_brightness(10)
+    model.reset_tone()
+    assert model.get_tone_lut(np.uint16) is None
+
+
+def test_tables_are_cached_until_an_adjustment_changes():
+    model = ImageModel()
+    model.set_gamma(2.0)
+    lut = model.get_tone_lut()
+    assert model.get_tone_lut() is lut
+    model.set_gamma(0.5)
+    assert model.get_tone_lut() is not lut
+
+
+def test_levels_are_limited():
+    model = ImageModel()
+    model.set_levels(300, 10)
+    assert (model.black_point, model.white_point) == (254, 255)
+
+
+@pytest.mark.parametrize("channels, dtype", NATIVE_FORMATS)
+def test_apply_tone_maps_colour_and_keeps_alpha(channels, dtype):
+    model = ImageModel()
+    model.set_contrast(1.5)
+    image = make_image(16, 24, channels, dtype)
+    toned = model.apply_tone(image)
+    lut = model.get_tone_lut(dtype)
+    assert toned.dtype == dtype and toned.shape == image.shape
+    colour = slice(0, 3) if channels == 4 else slice(None)
+    assert np.array_equal(toned[..., colour], lut[image[..., colour]])
+    if channels == 4:
+        assert np.array_equal(toned[..., 3], image[..., 3])
+
+
+def test_preview_uses_the_proxy_and_save_the_full_image(loaded_model):
+    image = make_image(2000, 1500)
+    model = loaded_model(image)
+    model.set_brightness(20)
+    lut = model.get_tone_lut()
+    proxy = model.get_edited_proxy()
+    assert max(proxy.shape[:2]) == model.proxy_max_size
+    # The edited image itself is only adjusted when it is saved
+    assert np.array_equal(model.edited_image, image)
+    assert np.array_equal(model.get_edited_scaled_image(), lut[image])
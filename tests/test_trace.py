@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+from Image_Model import ImageModel
+from Image_Trace import Tracer, describe, traced, tracer
+
+
+@pytest.fixture
+def recording():
+    tracer.clear()
+    tracer.enable()
+    yield tracer
+    tracer.disable()
+    tracer.clear()
+
+
+def test_disabled_tracer_records_nothing():
+    spans = Tracer()
+    with spans.span("load", path="a.png") as span:
+        span.set(bytes=1)
+    assert spans.events == []
+
+
+def test_span_records_name_duration_and_values():
+    spans = Tracer()
+    spans.enable()
+    with spans.span("cv2.imread", path="a.png") as span:
+        span.set(bytes=12)
+    (event,) = spans.events
+    assert event["name"] == "cv2.imread"
+    assert event["cat"] == "cv2"
+    assert event["ph"] == "X"
+    assert event["dur"] >= 0
+    assert event["args"] == {"path": "a.png", "bytes": 12}
+
+
+def test_span_records_errors():
+    spans = Tracer()
+    spans.enable()
+    with pytest.raises(ValueError):
+        with spans.span("load"):
+            raise ValueError("bad file")
+    assert spans.events[0]["args"]["error"] == "ValueError"
+
+
+def test_describe_images():
+    assert describe(np.zeros((20, 30, 3), np.uint8)) == (1800, "30x20")
+    assert describe("not an image") == (0, None)
+
+
+def test_traced_records_bytes_and_dimensions_in_and_out(recording):
+    @traced("halve")
+    def halve(image):
+        return image[::2, ::2].copy()
+
+    halve(np.zeros((40, 60), np.uint8))
+    (event,) = recording.events
+    assert event["name"] == "halve"
+    assert event["args"]["bytes_in"] == 2400
+    assert event["args"]["dims_in"] == "60x40"
+    assert event["args"]["bytes_out"] == 600
+    assert event["args"]["dims_out"] == "30x20"
+
+
+def test_traced_model_methods_record_their_output(recording):
+    model = ImageModel()
+    model.image = np.zeros((40, 60, 3), np.uint8)
+    model.edited_image = model.image.copy()
+    model.crop_image(0, 0, 30, 20)
+    event = next(event for event in recording.events
+                 if event["name"] == "ImageModel.crop_image")
+    assert event["args"]["dims_out"] == "30x20"
+
+
+def test_export_chrome_trace(tmp_path):
+    spans = Tracer()
+    spans.enable()
+    with spans.span("resize"):
+        pass
+    path = tmp_path / "trace.json"
+    spans.export_chrome_trace(str(path))
+    trace = json.loads(path.read_text())
+    names = [event["name"] for event in trace["traceEvents"]]
+    assert names == ["resize", "thread_name"]
+    assert trace["traceEvents"][1]["args"]["name"] == "main"